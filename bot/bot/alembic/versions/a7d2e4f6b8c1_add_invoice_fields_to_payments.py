@@ -0,0 +1,78 @@
+"""add_invoice_fields_to_payments
+
+Revision ID: a7d2e4f6b8c1
+Revises: c3e5a7b9d1f2
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d2e4f6b8c1'
+down_revision: Union[str, None] = 'c3e5a7b9d1f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_INVOICE_COLUMNS = (
+    ('type_pay', sa.String()),
+    ('key_id', sa.Integer()),
+    ('id_prot', sa.Integer()),
+    ('id_loc', sa.Integer()),
+    ('message_id', sa.BigInteger()),
+    ('expires_at', sa.DateTime()),
+)
+
+
+def _column_exists(table: str, column: str) -> bool:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return any(c["name"] == column for c in insp.get_columns(table))
+
+
+def _index_exists(table: str, index_name: str) -> bool:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return any(ix.get('name') == index_name for ix in insp.get_indexes(table))
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        for name, type_ in _INVOICE_COLUMNS:
+            if not _column_exists('payments', name):
+                batch_op.add_column(sa.Column(name, type_, nullable=True))
+    # Until now every row was a completed payment, whatever its status said.
+    # Cryptomus webhook rows keep "pending" until their key is extended.
+    op.execute(
+        """
+        UPDATE payments SET status = 'confirmed'
+        WHERE status IS NULL
+           OR (status = 'pending'
+               AND NOT (payment_system = 'Cryptomus'
+                        AND id_payment IS NOT NULL))
+        """
+    )
+    op.alter_column('payments', 'status', server_default='confirmed')
+    if not _index_exists('payments', 'ix_payments_status_expires_at'):
+        op.create_index(
+            'ix_payments_status_expires_at',
+            'payments',
+            ['status', 'expires_at'],
+            unique=False,
+        )
+
+
+def downgrade() -> None:
+    if _index_exists('payments', 'ix_payments_status_expires_at'):
+        op.drop_index('ix_payments_status_expires_at', table_name='payments')
+    op.execute("DELETE FROM payments WHERE status IN ('pending', 'expired') "
+               "AND expires_at IS NOT NULL")
+    op.alter_column('payments', 'status', server_default='pending')
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        for name, _ in reversed(_INVOICE_COLUMNS):
+            if _column_exists('payments', name):
+                batch_op.drop_column(name)
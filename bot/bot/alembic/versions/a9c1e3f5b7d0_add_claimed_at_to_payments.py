@@ -0,0 +1,42 @@
+"""add_claimed_at_to_payments
+
+Revision ID: a9c1e3f5b7d0
+Revises: f4c6e8a0b2d4
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9c1e3f5b7d0'
+down_revision: Union[str, None] = 'f4c6e8a0b2d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _column_exists(table: str, column: str) -> bool:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return any(c["name"] == column for c in insp.get_columns(table))
+
+
+def upgrade() -> None:
+    if not _column_exists('payments', 'claimed_at'):
+        with op.batch_alter_table('payments', schema=None) as batch_op:
+            batch_op.add_column(
+                sa.Column('claimed_at', sa.DateTime(), nullable=True)
+            )
+
+
+def downgrade() -> None:
+    # A claim whose fulfilment never finished goes back to the sweep.
+    op.execute("UPDATE payments SET status = 'pending' "
+               "WHERE status = 'claimed'")
+    if _column_exists('payments', 'claimed_at'):
+        with op.batch_alter_table('payments', schema=None) as batch_op:
+            batch_op.drop_column('claimed_at')
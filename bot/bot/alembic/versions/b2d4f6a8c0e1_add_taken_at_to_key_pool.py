@@ -0,0 +1,41 @@
+"""add_taken_at_to_key_pool
+
+Revision ID: b2d4f6a8c0e1
+Revises: a9c1e3f5b7d0
+Create Date: 2026-10-18 22:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2d4f6a8c0e1'
+down_revision: Union[str, None] = 'a9c1e3f5b7d0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _column_exists(table: str, column: str) -> bool:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return any(c["name"] == column for c in insp.get_columns(table))
+
+
+def upgrade() -> None:
+    if not _column_exists('key_pool', 'taken_at'):
+        with op.batch_alter_table('key_pool', schema=None) as batch_op:
+            batch_op.add_column(
+                sa.Column('taken_at', sa.DateTime(), nullable=True)
+            )
+
+
+def downgrade() -> None:
+    if _column_exists('key_pool', 'taken_at'):
+        # Taken rows would look like free spares again.
+        op.execute("DELETE FROM key_pool WHERE taken_at IS NOT NULL")
+        with op.batch_alter_table('key_pool', schema=None) as batch_op:
+            batch_op.drop_column('taken_at')
@@ -0,0 +1,66 @@
+"""add_expiry_sync_to_keys
+
+Revision ID: b8e3f5a7c9d2
+Revises: a7d2e4f6b8c1
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8e3f5a7c9d2'
+down_revision: Union[str, None] = 'a7d2e4f6b8c1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _column_exists(table: str, column: str) -> bool:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return any(c["name"] == column for c in insp.get_columns(table))
+
+
+def _index_exists(table: str, index_name: str) -> bool:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return any(ix.get('name') == index_name for ix in insp.get_indexes(table))
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('keys', schema=None) as batch_op:
+        if not _column_exists('keys', 'expiry_sync_due'):
+            batch_op.add_column(
+                sa.Column('expiry_sync_due', sa.BigInteger(), nullable=True)
+            )
+        if not _column_exists('keys', 'expiry_sync_attempts'):
+            batch_op.add_column(
+                sa.Column(
+                    'expiry_sync_attempts',
+                    sa.Integer(),
+                    nullable=False,
+                    server_default='0',
+                )
+            )
+    # Only pending syncs are indexed: almost every key is in sync.
+    if not _index_exists('keys', 'ix_keys_expiry_sync_due'):
+        op.create_index(
+            'ix_keys_expiry_sync_due',
+            'keys',
+            ['expiry_sync_due'],
+            unique=False,
+            postgresql_where=sa.text('expiry_sync_due IS NOT NULL'),
+        )
+
+
+def downgrade() -> None:
+    if _index_exists('keys', 'ix_keys_expiry_sync_due'):
+        op.drop_index('ix_keys_expiry_sync_due', table_name='keys')
+    with op.batch_alter_table('keys', schema=None) as batch_op:
+        for name in ('expiry_sync_attempts', 'expiry_sync_due'):
+            if _column_exists('keys', name):
+                batch_op.drop_column(name)
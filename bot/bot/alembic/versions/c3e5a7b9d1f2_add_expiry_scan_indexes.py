@@ -0,0 +1,48 @@
+"""add_expiry_scan_indexes
+
+Revision ID: c3e5a7b9d1f2
+Revises: f91b3c2d4a10
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e5a7b9d1f2'
+down_revision: Union[str, None] = 'f91b3c2d4a10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _index_exists(table: str, index_name: str) -> bool:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return any(ix.get('name') == index_name for ix in insp.get_indexes(table))
+
+
+def upgrade() -> None:
+    if not _index_exists('keys', 'ix_keys_subscription_notified_free'):
+        op.create_index(
+            'ix_keys_subscription_notified_free',
+            'keys',
+            ['subscription', 'notified_expired', 'free_key'],
+            unique=False,
+        )
+    if not _index_exists('users', 'ix_users_trial_expires_at'):
+        op.create_index(
+            'ix_users_trial_expires_at',
+            'users',
+            ['trial_expires_at'],
+            unique=False,
+        )
+
+
+def downgrade() -> None:
+    if _index_exists('users', 'ix_users_trial_expires_at'):
+        op.drop_index('ix_users_trial_expires_at', table_name='users')
+    if _index_exists('keys', 'ix_keys_subscription_notified_free'):
+        op.drop_index('ix_keys_subscription_notified_free', table_name='keys')
@@ -0,0 +1,63 @@
+"""add_payment_steps
+
+Revision ID: c3e5a7b9d1f2
+Revises: b2d4f6a8c0e1
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e5a7b9d1f2'
+down_revision: Union[str, None] = 'b2d4f6a8c0e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _table_exists(table: str) -> bool:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return table in insp.get_table_names()
+
+
+def _column_exists(table: str, column: str) -> bool:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return any(c["name"] == column for c in insp.get_columns(table))
+
+
+def upgrade() -> None:
+    if not _column_exists('payments', 'fulfil_attempts'):
+        with op.batch_alter_table('payments', schema=None) as batch_op:
+            batch_op.add_column(
+                sa.Column(
+                    'fulfil_attempts',
+                    sa.Integer(),
+                    server_default='0',
+                    nullable=True,
+                )
+            )
+    if not _table_exists('payment_steps'):
+        op.create_table(
+            'payment_steps',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('id_payment', sa.String(), nullable=False),
+            sa.Column('step', sa.String(), nullable=False),
+            sa.Column('key_id', sa.Integer(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('id_payment', 'step')
+        )
+
+
+def downgrade() -> None:
+    if _table_exists('payment_steps'):
+        op.drop_table('payment_steps')
+    if _column_exists('payments', 'fulfil_attempts'):
+        with op.batch_alter_table('payments', schema=None) as batch_op:
+            batch_op.drop_column('fulfil_attempts')
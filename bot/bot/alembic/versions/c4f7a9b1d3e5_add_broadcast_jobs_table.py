@@ -0,0 +1,68 @@
+"""add_broadcast_jobs_table
+
+Revision ID: c4f7a9b1d3e5
+Revises: b8e3f5a7c9d2
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4f7a9b1d3e5'
+down_revision: Union[str, None] = 'b8e3f5a7c9d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _table_exists(table: str) -> bool:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return table in insp.get_table_names()
+
+
+def upgrade() -> None:
+    if not _table_exists('broadcast_jobs'):
+        op.create_table(
+            'broadcast_jobs',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('segment', sa.String(), nullable=False),
+            sa.Column('text', sa.String(), nullable=False),
+            sa.Column('status', sa.String(), nullable=False),
+            sa.Column('cursor', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('total', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('sent', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('failed', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('blocked', sa.Integer(), nullable=False, server_default='0'),
+            sa.Column('created_by', sa.BigInteger(), nullable=False),
+            sa.Column('lang', sa.String(), nullable=True),
+            sa.Column('chat_id', sa.BigInteger(), nullable=True),
+            sa.Column('message_id', sa.BigInteger(), nullable=True),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(
+            op.f('ix_broadcast_jobs_id'),
+            'broadcast_jobs',
+            ['id'],
+            unique=False
+        )
+        op.create_index(
+            'ix_broadcast_jobs_status',
+            'broadcast_jobs',
+            ['status'],
+            unique=False
+        )
+
+
+def downgrade() -> None:
+    if _table_exists('broadcast_jobs'):
+        op.drop_index('ix_broadcast_jobs_status', table_name='broadcast_jobs')
+        op.drop_index(op.f('ix_broadcast_jobs_id'), table_name='broadcast_jobs')
+        op.drop_table('broadcast_jobs')
@@ -0,0 +1,42 @@
+"""add_metrics_snapshot_table
+
+Revision ID: d5a8c2e4f6b7
+Revises: c4f7a9b1d3e5
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5a8c2e4f6b7'
+down_revision: Union[str, None] = 'c4f7a9b1d3e5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _table_exists(table: str) -> bool:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return table in insp.get_table_names()
+
+
+def upgrade() -> None:
+    if not _table_exists('metrics_snapshot'):
+        op.create_table(
+            'metrics_snapshot',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('metrics', sa.JSON(), nullable=False),
+            sa.Column('refreshed_at', sa.DateTime(), nullable=False),
+            sa.Column('duration_ms', sa.Integer(), nullable=False, server_default='0'),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade() -> None:
+    if _table_exists('metrics_snapshot'):
+        op.drop_table('metrics_snapshot')
@@ -0,0 +1,110 @@
+"""add_hot_predicate_indexes
+
+Revision ID: e2b4d6f8a1c3
+Revises: d5a8c2e4f6b7
+Create Date: 2026-10-18 20:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b4d6f8a1c3'
+down_revision: Union[str, None] = 'd5a8c2e4f6b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (name, table, columns, options); kept in sync with the models'
+# __table_args__ and checked by tests/test_query_plans.py.
+INDEXES = (
+    ('ix_keys_user_tgid_subscription', 'keys', ['user_tgid', 'subscription'], {}),
+    ('ix_keys_server_subscription', 'keys', ['server', 'subscription'], {}),
+    (
+        'ix_keys_paid_subscription',
+        'keys',
+        ['subscription', 'user_tgid'],
+        {
+            'postgresql_where': sa.text(
+                'free_key IS false AND trial_period IS false'
+            ),
+        },
+    ),
+    ('ix_payments_user_status', 'payments', ['user', 'status'], {}),
+    (
+        'ix_payments_success_data',
+        'payments',
+        ['data'],
+        {
+            'postgresql_include': ['amount'],
+            'postgresql_where': sa.text(
+                "status IN ('confirmed', 'paid', 'success', 'succeeded')"
+            ),
+        },
+    ),
+    (
+        'ix_users_referral_user_tgid',
+        'users',
+        ['referral_user_tgid'],
+        {'postgresql_where': sa.text('referral_user_tgid IS NOT NULL')},
+    ),
+    ('ix_users_date_registered', 'users', ['date_registered'], {}),
+)
+
+
+def _index_exists(table: str, index_name: str) -> bool:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return any(ix.get('name') == index_name for ix in insp.get_indexes(table))
+
+
+def _index_invalid(index_name: str) -> bool:
+    """True for an index left INVALID by an interrupted CREATE INDEX
+    CONCURRENTLY, which has to be dropped and built again."""
+    return bool(op.get_bind().execute(
+        sa.text(
+            'SELECT NOT i.indisvalid FROM pg_index i '
+            'JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name'
+        ),
+        {'name': index_name},
+    ).scalar())
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        for name, table, columns, options in INDEXES:
+            if not _index_exists(table, name):
+                op.create_index(name, table, columns, unique=False, **options)
+        return
+    # keys, payments and users are the busiest tables: build without
+    # blocking writes, which cannot run inside a transaction.
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in INDEXES:
+            if _index_exists(table, name):
+                if not _index_invalid(name):
+                    continue
+                op.drop_index(
+                    name, table_name=table, postgresql_concurrently=True
+                )
+            op.create_index(
+                name, table, columns, unique=False,
+                postgresql_concurrently=True, **options
+            )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        for name, table, _columns, _options in reversed(INDEXES):
+            if _index_exists(table, name):
+                op.drop_index(name, table_name=table)
+        return
+    with op.get_context().autocommit_block():
+        for name, table, _columns, _options in reversed(INDEXES):
+            if _index_exists(table, name):
+                op.drop_index(
+                    name, table_name=table, postgresql_concurrently=True
+                )
@@ -0,0 +1,52 @@
+"""add_key_pool_table
+
+Revision ID: f4c6e8a0b2d4
+Revises: e2b4d6f8a1c3
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy import inspect
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4c6e8a0b2d4'
+down_revision: Union[str, None] = 'e2b4d6f8a1c3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _table_exists(table: str) -> bool:
+    bind = op.get_bind()
+    insp = inspect(bind)
+    return table in insp.get_table_names()
+
+
+def upgrade() -> None:
+    if not _table_exists('key_pool'):
+        op.create_table(
+            'key_pool',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('server', sa.Integer(), nullable=False),
+            sa.Column('name', sa.String(), nullable=False),
+            sa.Column('client', sa.JSON(), nullable=False),
+            sa.Column('config', sa.String(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=False),
+            sa.ForeignKeyConstraint(
+                ['server'], ['servers.id'], ondelete='CASCADE'
+            ),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('name')
+        )
+        op.create_index(
+            op.f('ix_key_pool_server'), 'key_pool', ['server'], unique=False
+        )
+
+
+def downgrade() -> None:
+    if _table_exists('key_pool'):
+        op.drop_index(op.f('ix_key_pool_server'), table_name='key_pool')
+        op.drop_table('key_pool')
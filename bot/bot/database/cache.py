@@ -0,0 +1,335 @@
+"""
+Read-through cache for the lookups done on almost every Telegram update.
+
+Values are stored in ``cache_region`` (Redis db 1, or memory in DEBUG) as
+small frozen DTOs rather than ORM instances, so they pickle safely, never
+trigger lazy loads and cannot be mutated and flushed by accident.
+
+Keys
+----
+person:{tgid}                              PersonDTO | None
+server:{id}                                ServerDTO | None
+locations:generation                       int, bumped on invalidation
+locations:{generation}:types:{group}       list[int]
+locations:{generation}:free:{group}:{type} list[LocationDTO]
+
+In ``subscription_region`` (SUBSCRIPTION_CACHE_TTL, default 10 min):
+
+subscription:server:{id}:revision                      int, bumped on invalidation
+subscription:{key_id}:{server}:{expiry}:{revision}     RenderedSubscription | None
+
+Per-entity keys are deleted by the mutating helpers in
+``bot.database.methods`` right after they commit.  The location/server
+lists depend on many rows at once, so they are namespaced by a generation
+counter: ``invalidate_locations`` bumps it and every list key written
+before becomes unreachable and expires on its own.  Whatever slips through
+(e.g. rows edited outside the bot) is bounded by the region TTL.
+
+The dogpile regions are synchronous, so every call goes through
+``asyncio.to_thread`` and never blocks the event loop; the Redis sockets
+time out after ``CACHE_REDIS_TIMEOUT`` and the lookup falls back to the DB.
+
+Rendered subscriptions are addressed by the key's revision instead: a key
+switch or extension changes its server or expiry, so the next request misses
+and renders again; an expired key that is deleted has no row to address.
+``invalidate_server`` bumps the server's revision for edits to the server
+itself.
+
+Metrics
+-------
+db_cache_requests_total{entity, result}   Counter   result = hit | miss | error
+db_cache_lookup_seconds{entity, result}   Histogram (miss includes the DB load)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from dogpile.cache.api import NO_VALUE
+from prometheus_client import Counter, Histogram
+
+from bot.database.main import cache_region, subscription_region
+
+log = logging.getLogger(__name__)
+
+# Stored instead of None so that "no such row" is cached too.
+_NONE = '__none__'
+LOCATIONS_GENERATION_KEY = 'locations:generation'
+
+CACHE_REQUESTS = Counter(
+    'db_cache_requests_total',
+    'Read-through cache lookups by entity and result',
+    ['entity', 'result'],
+)
+CACHE_LOOKUP_SECONDS = Histogram(
+    'db_cache_lookup_seconds',
+    'Read-through cache lookup latency, including the DB load on a miss',
+    ['entity', 'result'],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+
+
+@dataclass(frozen=True, slots=True)
+class PersonDTO:
+    id: int
+    tgid: int
+    username: str | None
+    fullname: str | None
+    lang: str | None
+    lang_tg: str | None
+    blocked: bool
+    banned: bool
+    group: str | None
+    status: int | None
+    trial_period: bool
+    trial_used: bool
+    migration_status: str | None
+
+    @classmethod
+    def from_orm(cls, person) -> PersonDTO:
+        return cls(
+            id=person.id,
+            tgid=person.tgid,
+            username=person.username,
+            fullname=person.fullname,
+            lang=person.lang,
+            lang_tg=person.lang_tg,
+            blocked=bool(person.blocked),
+            banned=bool(person.banned),
+            group=person.group,
+            status=person.status,
+            trial_period=bool(person.trial_period),
+            trial_used=bool(person.trial_used),
+            migration_status=person.migration_status,
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class ServerDTO:
+    """Everything ServerManager needs to build a panel client."""
+    id: int
+    type_vpn: int
+    ip: str | None
+    panel: str | None
+    login: str | None
+    password: str | None
+    inbound_id: int | None
+    connection_method: bool | None
+    outline_link: str | None
+    remnawave_squad_id: str | None
+    free_server: bool | None
+    actual_space: int | None
+    work: bool | None
+    auto_work: bool | None
+    vds: int
+    location_name: str | None = None
+
+    @classmethod
+    def from_orm(cls, server) -> ServerDTO:
+        location = getattr(
+            getattr(server, 'vds_table', None), 'location_table', None
+        )
+        return cls(
+            id=server.id,
+            type_vpn=server.type_vpn,
+            ip=server.ip,
+            panel=server.panel,
+            login=server.login,
+            password=server.password,
+            inbound_id=server.inbound_id,
+            connection_method=server.connection_method,
+            outline_link=server.outline_link,
+            remnawave_squad_id=server.remnawave_squad_id,
+            free_server=server.free_server,
+            actual_space=server.actual_space,
+            work=server.work,
+            auto_work=server.auto_work,
+            vds=server.vds,
+            location_name=getattr(location, 'name', None),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class LocationDTO:
+    id: int
+    name: str | None
+    work: bool | None
+    pay_switch: bool | None
+    group: str | None
+
+    @classmethod
+    def from_orm(cls, location) -> LocationDTO:
+        return cls(
+            id=location.id,
+            name=location.name,
+            work=location.work,
+            pay_switch=location.pay_switch,
+            group=location.group,
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class RenderedSubscription:
+    """A key's subscription links and the bodies served for them.
+
+    ``clash`` / ``singbox`` are None when no link could be converted;
+    ``etags`` maps each format (``plain``, ``clash``, ``singbox``) to the
+    strong ETag of its body.
+    """
+    links: tuple[str, ...]
+    plain: str
+    clash: str | None
+    singbox: str | None
+    etags: dict[str, str]
+
+
+def person_cache_key(telegram_id) -> str:
+    return f'person:{telegram_id}'
+
+
+def server_cache_key(id_server) -> str:
+    return f'server:{id_server}'
+
+
+def _observe(entity: str, result: str, start: float) -> None:
+    CACHE_REQUESTS.labels(entity=entity, result=result).inc()
+    CACHE_LOOKUP_SECONDS.labels(entity=entity, result=result).observe(
+        time.perf_counter() - start
+    )
+
+
+async def read_through(
+    entity: str,
+    key: str,
+    loader: Callable[[], Awaitable[Any]],
+    region=None,
+) -> Any:
+    """Return the cached value for *key*, or await *loader* and cache it.
+
+    Cache backend errors never fail the lookup: the value is loaded from
+    the database and the error is counted under ``result="error"``.
+    """
+    region = region or cache_region
+    start = time.perf_counter()
+    try:
+        cached = await asyncio.to_thread(region.get, key)
+    except Exception as e:
+        log.warning(
+            'event=cache.get_failed key=%s error=%s', key, type(e).__name__
+        )
+        value = await loader()
+        _observe(entity, 'error', start)
+        return value
+    if cached is not NO_VALUE:
+        _observe(entity, 'hit', start)
+        return None if cached == _NONE else cached
+    value = await loader()
+    try:
+        await asyncio.to_thread(
+            region.set, key, _NONE if value is None else value
+        )
+    except Exception as e:
+        log.warning(
+            'event=cache.set_failed key=%s error=%s', key, type(e).__name__
+        )
+    _observe(entity, 'miss', start)
+    return value
+
+
+async def invalidate(*keys: str) -> None:
+    if not keys:
+        return
+    try:
+        await asyncio.to_thread(cache_region.delete_multi, list(keys))
+    except Exception as e:
+        log.warning(
+            'event=cache.invalidate_failed keys=%d error=%s',
+            len(keys),
+            type(e).__name__,
+        )
+
+
+_person_listeners: list[Callable[[tuple], None]] = []
+
+
+def on_person_invalidated(listener: Callable[[tuple], None]) -> None:
+    """Call *listener(telegram_ids)* whenever person entries are dropped,
+    so per-update snapshots (misc/user_context.py) go stale too."""
+    _person_listeners.append(listener)
+
+
+async def invalidate_person(*telegram_ids) -> None:
+    await invalidate(*(person_cache_key(tgid) for tgid in telegram_ids))
+    for listener in _person_listeners:
+        listener(telegram_ids)
+
+
+async def invalidate_locations() -> None:
+    """Drop every cached location/server list (bumps the generation)."""
+    try:
+        await asyncio.to_thread(
+            cache_region.set, LOCATIONS_GENERATION_KEY, time.time_ns()
+        )
+    except Exception as e:
+        log.warning(
+            'event=cache.invalidate_failed key=%s error=%s',
+            LOCATIONS_GENERATION_KEY,
+            type(e).__name__,
+        )
+
+
+async def invalidate_server(*server_ids) -> None:
+    """Drop the server entries and the lists they may appear in."""
+    await invalidate(
+        *(server_cache_key(id_server) for id_server in server_ids)
+    )
+    await invalidate_locations()
+    for id_server in server_ids:
+        await _bump_subscription_revision(id_server)
+
+
+async def locations_cache_key(*parts) -> str:
+    try:
+        generation = await asyncio.to_thread(
+            cache_region.get_or_create, LOCATIONS_GENERATION_KEY, time.time_ns
+        )
+    except Exception:
+        generation = 'nogen'
+    return ':'.join(['locations', str(generation), *map(str, parts)])
+
+
+def _subscription_revision_key(id_server) -> str:
+    return f'subscription:server:{id_server}:revision'
+
+
+async def _bump_subscription_revision(id_server) -> None:
+    try:
+        await asyncio.to_thread(
+            subscription_region.set,
+            _subscription_revision_key(id_server),
+            time.time_ns(),
+        )
+    except Exception as e:
+        log.warning(
+            'event=cache.invalidate_failed key=%s error=%s',
+            _subscription_revision_key(id_server),
+            type(e).__name__,
+        )
+
+
+async def subscription_cache_key(key_id, id_server, subscription) -> str:
+    """Key of the rendered subscription of *key_id* at its current server,
+    expiry and server revision."""
+    try:
+        revision = await asyncio.to_thread(
+            subscription_region.get_or_create,
+            _subscription_revision_key(id_server),
+            time.time_ns,
+        )
+    except Exception:
+        revision = 'norev'
+    return f'subscription:{key_id}:{id_server}:{subscription}:{revision}'
@@ -14,16 +14,51 @@ Call ``instrument_engine(engine)`` once after creating the async engine:
 
 All subsequent statement executions will be logged at DEBUG level.
 Slow queries are logged at WARNING level.
+
+Statements can also be counted per unit of work (one Telegram update):
+
+    with count_queries() as counter:
+        await handler(event, data)
+    counter.count  # statements executed inside the block
+
+The counter lives in a ContextVar, which SQLAlchemy's greenlet bridge
+carries into the cursor events, so concurrent updates never mix counts.
 Errors (raised inside execute) are already propagated by SQLAlchemy; the
 caller is responsible for catching and logging them — this module only
 measures timings.
+
+Statements are grouped by fingerprint: the SQL with literals and bind
+parameters (with the ``::TYPE`` casts asyncpg adds to them) replaced by
+``?`` and ``IN``/``VALUES`` lists collapsed, so every call of one query
+function shares it (``statement_fingerprint``).  Only the first
+``MAX_FINGERPRINT_LABELS`` fingerprints get their own Prometheus label;
+later ones are counted under ``fingerprint="other"``.
+
+Metrics
+-------
+db_statement_duration_seconds{fingerprint, operation}  Histogram (calls = _count, total = _sum)
+db_statement_rows_total{fingerprint, operation}        Counter   rows returned or affected
+db_pool_checkout_wait_seconds                          Histogram wait for a pooled connection
+
+``top_statements()`` ranks fingerprints by total time over the last
+``TOP_WINDOW_SEC`` (per-minute buckets, this process only); admins read it
+from the dashboard (handlers/admin_db_stats.py).
 """
 
 from __future__ import annotations
 
+import hashlib
 import logging
+import re
 import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Iterator
 
+from prometheus_client import Counter, Histogram
 from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncEngine
 
@@ -37,6 +72,188 @@ SLOW_QUERY_MS: float = 100.0
 # the start time there so it survives the async boundary.
 _START_ATTR = "_vpnhub_query_start"
 
+# Window and granularity of the top_statements() ranking.
+TOP_WINDOW_SEC = 60 * 60
+_BUCKET_SEC = 60
+
+_OPERATIONS = frozenset({"SELECT", "INSERT", "UPDATE", "DELETE", "WITH"})
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_BIND_PARAM = re.compile(r"\$\d+|%\(\w+\)s|%s|\?")
+# $1::INTEGER, $2::VARCHAR(20), $3::TIMESTAMP WITHOUT TIME ZONE, $4::INTEGER[]
+_BIND_CAST = re.compile(
+    r"\?::\w+(?: WITH(?:OUT)? TIME ZONE)?(?:\(\d+(?:,\s*\d+)?\))?(?:\[\])*"
+)
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUES_ROWS = re.compile(r"(\([?,\s]+\))(?:\s*,\s*\([?,\s]+\))+")
+_WHITESPACE = re.compile(r"\s+")
+
+# Bound on the fingerprint label values (each costs a dozen histogram
+# series); statements first seen after that share OTHER_FINGERPRINT.
+MAX_FINGERPRINT_LABELS = 200
+OTHER_FINGERPRINT = "other"
+_labelled: set[str] = set()
+
+DB_STATEMENT_SECONDS = Histogram(
+    "db_statement_duration_seconds",
+    "DB statement execution time by statement fingerprint",
+    ["fingerprint", "operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0),
+)
+DB_STATEMENT_ROWS = Counter(
+    "db_statement_rows_total",
+    "Rows returned or affected by DB statements, by statement fingerprint",
+    ["fingerprint", "operation"],
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the engine pool",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0),
+)
+
+
+class QueryCounter:
+    __slots__ = ("count",)
+
+    def __init__(self) -> None:
+        self.count = 0
+
+
+_query_counter: ContextVar[QueryCounter | None] = ContextVar(
+    "db_query_counter", default=None
+)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    """Count the statements executed by the current task inside the block."""
+    counter = QueryCounter()
+    token = _query_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _query_counter.reset(token)
+
+
+@lru_cache(maxsize=2048)
+def statement_fingerprint(statement: str) -> tuple[str, str, str]:
+    """``(fingerprint, operation, normalized SQL)`` of a statement."""
+    sql = _STRING_LITERAL.sub("?", statement)
+    sql = _BIND_PARAM.sub("?", sql)
+    sql = _BIND_CAST.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    sql = _IN_LIST.sub("IN (?)", sql)
+    sql = _VALUES_ROWS.sub(r"\1", sql)
+    operation = sql.split(" ", 1)[0].upper()
+    if operation not in _OPERATIONS:
+        operation = "OTHER"
+    fingerprint = hashlib.sha1(sql.encode("utf-8")).hexdigest()[:10]
+    return fingerprint, operation, sql
+
+
+def fingerprint_label(fingerprint: str) -> str:
+    """Prometheus label value for a fingerprint, see MAX_FINGERPRINT_LABELS."""
+    if fingerprint in _labelled:
+        return fingerprint
+    if len(_labelled) >= MAX_FINGERPRINT_LABELS:
+        return OTHER_FINGERPRINT
+    _labelled.add(fingerprint)
+    return fingerprint
+
+
+@dataclass(slots=True)
+class StatementTotals:
+    fingerprint: str
+    sql: str
+    calls: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    rows: int = 0
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_ms / self.calls if self.calls else 0.0
+
+
+# (minute, {fingerprint: totals}) for the last TOP_WINDOW_SEC.
+_buckets: deque[tuple[int, dict[str, StatementTotals]]] = deque()
+
+
+def _record(fingerprint: str, sql: str, elapsed_ms: float, rows: int) -> None:
+    minute = int(time.monotonic() // _BUCKET_SEC)
+    if not _buckets or _buckets[-1][0] != minute:
+        _buckets.append((minute, {}))
+        oldest = minute - TOP_WINDOW_SEC // _BUCKET_SEC
+        while _buckets[0][0] <= oldest:
+            _buckets.popleft()
+    bucket = _buckets[-1][1]
+    totals = bucket.get(fingerprint)
+    if totals is None:
+        totals = bucket[fingerprint] = StatementTotals(fingerprint, sql)
+    totals.calls += 1
+    totals.total_ms += elapsed_ms
+    totals.max_ms = max(totals.max_ms, elapsed_ms)
+    totals.rows += rows
+
+
+def top_statements(limit: int = 10) -> list[StatementTotals]:
+    """Fingerprints with the most total time over the last TOP_WINDOW_SEC."""
+    oldest = int(time.monotonic() // _BUCKET_SEC) - TOP_WINDOW_SEC // _BUCKET_SEC
+    merged: dict[str, StatementTotals] = {}
+    for minute, bucket in list(_buckets):
+        if minute <= oldest:
+            continue
+        for fingerprint, totals in bucket.items():
+            into = merged.get(fingerprint)
+            if into is None:
+                into = merged[fingerprint] = StatementTotals(
+                    fingerprint, totals.sql
+                )
+            into.calls += totals.calls
+            into.total_ms += totals.total_ms
+            into.max_ms = max(into.max_ms, totals.max_ms)
+            into.rows += totals.rows
+    ranked = sorted(merged.values(), key=lambda t: t.total_ms, reverse=True)
+    return ranked[:limit]
+
+
+def reset_statement_stats() -> None:
+    _buckets.clear()
+
+
+def _row_count(cursor) -> int:
+    rowcount = getattr(cursor, "rowcount", -1)
+    if isinstance(rowcount, int) and rowcount >= 0:
+        return rowcount
+    # SELECTs: the async adapters buffer the fetched rows on the cursor.
+    rows = getattr(cursor, "_rows", None)
+    try:
+        return len(rows) if rows is not None else 0
+    except TypeError:
+        return 0
+
+
+def _instrument_pool(pool) -> None:
+    """Time ``pool._do_get``, where a checkout waits for a free connection.
+
+    SQLAlchemy has no "before checkout" event, so the pool's own getter is
+    wrapped once per pool.
+    """
+    if getattr(pool, "_vpnhub_timed", False) or not hasattr(pool, "_do_get"):
+        return
+    do_get = pool._do_get
+
+    def timed_do_get():
+        start = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - start)
+
+    pool._do_get = timed_do_get
+    pool._vpnhub_timed = True
+
 
 def instrument_engine(engine: AsyncEngine) -> None:
     """
@@ -45,9 +262,13 @@ def instrument_engine(engine: AsyncEngine) -> None:
     Safe to call multiple times — SQLAlchemy deduplicates identical listeners.
     """
     sync_engine = engine.sync_engine
+    _instrument_pool(sync_engine.pool)
 
     @event.listens_for(sync_engine, "before_cursor_execute")
     def _before(conn, cursor, statement, parameters, context, executemany):
+        counter = _query_counter.get()
+        if counter is not None:
+            counter.count += 1
         if context is not None:
             setattr(context, _START_ATTR, time.perf_counter())
 
@@ -60,18 +281,32 @@ def instrument_engine(engine: AsyncEngine) -> None:
             return
         elapsed_ms = (time.perf_counter() - start) * 1000
 
+        fingerprint, operation, sql = statement_fingerprint(statement)
+        rows = _row_count(cursor)
+        label = fingerprint_label(fingerprint)
+        DB_STATEMENT_SECONDS.labels(
+            fingerprint=label, operation=operation
+        ).observe(elapsed_ms / 1000)
+        if rows:
+            DB_STATEMENT_ROWS.labels(
+                fingerprint=label, operation=operation
+            ).inc(rows)
+        _record(fingerprint, sql, elapsed_ms, rows)
+
         # Truncate long statements so they don't flood logs.
         stmt_preview = statement.replace("\n", " ").strip()[:200]
 
         if elapsed_ms >= SLOW_QUERY_MS:
             log.warning(
-                "event=db.slow_query elapsed_ms=%.1f stmt=%r",
+                "event=db.slow_query elapsed_ms=%.1f fingerprint=%s stmt=%r",
                 elapsed_ms,
+                fingerprint,
                 stmt_preview,
             )
         else:
             log.debug(
-                "event=db.query elapsed_ms=%.1f stmt=%r",
+                "event=db.query elapsed_ms=%.1f fingerprint=%s stmt=%r",
                 elapsed_ms,
+                fingerprint,
                 stmt_preview,
             )
@@ -29,34 +29,48 @@ else:
         f"@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
     )
 
-if DEBUG:
-    cache_region = make_region().configure(
-        'dogpile.cache.memory',
-        expiration_time=30,
-    )
-else:
+# Rendered subscriptions (database/cache.py) outlive the 30 s entity
+# cache: they are keyed by the key's revision and cost a panel call to build.
+SUBSCRIPTION_CACHE_TTL: int = int(os.getenv('SUBSCRIPTION_CACHE_TTL', '600'))
+# Cache calls run in worker threads (database/cache.py); a stalled Redis
+# costs a lookup at most this many seconds before it falls back to the DB.
+CACHE_REDIS_TIMEOUT: float = float(os.getenv('CACHE_REDIS_TIMEOUT', '0.5'))
+
+
+def _make_region(expiration_time: int):
+    if DEBUG:
+        return make_region().configure(
+            'dogpile.cache.memory',
+            expiration_time=expiration_time,
+        )
     try:
         import redis  # noqa: F401
 
-        cache_region = make_region().configure(
+        return make_region().configure(
             'dogpile.cache.redis',
-            expiration_time=30,
+            expiration_time=expiration_time,
             arguments={
                 'url': REDIS_URL,
-                'redis_expiration_time': 35,
+                'redis_expiration_time': expiration_time + 5,
                 'db': 1,  # separate from FSM on db 0
+                'socket_timeout': CACHE_REDIS_TIMEOUT,
+                'socket_connect_timeout': CACHE_REDIS_TIMEOUT,
             },
         )
     except ModuleNotFoundError:
         log.warning(
             "event=cache.backend_fallback backend=memory reason=redis_module_missing"
         )
-        cache_region = make_region().configure(
+        return make_region().configure(
             'dogpile.cache.memory',
-            expiration_time=30,
+            expiration_time=expiration_time,
         )
 
 
+cache_region = _make_region(30)
+subscription_region = _make_region(SUBSCRIPTION_CACHE_TTL)
+
+
 def async_cache_decorator(cache_key_func):
     def decorator(func):
         @wraps(func)
@@ -1,16 +1,22 @@
 import logging
 
-from sqlalchemy import select, and_
+from sqlalchemy import delete, select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from bot.database.cache import (
+    invalidate_locations,
+    invalidate_person,
+    invalidate_server,
+)
 from bot.database.models.main import (
+    Persons,
     Servers,
     StaticPersons,
     PromoCode,
     Groups,
     Keys,
     Location,
-    Vds, Metric, NotRemoveKey
+    Vds, Metric, NotRemoveKey, PooledClient
 )
 
 
@@ -21,6 +27,7 @@ async def delete_server(session: AsyncSession, id_server):
     if server is not None:
         await session.delete(server)
         await session.commit()
+        await invalidate_server(id_server)
     else:
         raise ModuleNotFoundError
 
@@ -52,8 +59,14 @@ async def delete_group(session: AsyncSession, group_id):
     result = await session.execute(statement)
     group = result.scalar_one_or_none()
     if group is not None:
+        members = await session.execute(
+            select(Persons.tgid).filter(Persons.group == group.name)
+        )
+        member_ids = members.scalars().all()
         await session.delete(group)
         await session.commit()
+        await invalidate_person(*member_ids)
+        await invalidate_locations()
     else:
         raise ModuleNotFoundError
 
@@ -77,6 +90,7 @@ async def delete_location(session: AsyncSession, location_id):
     if location is not None:
         await session.delete(location)
         await session.commit()
+        await invalidate_locations()
     else:
         raise ModuleNotFoundError
 
@@ -88,6 +102,7 @@ async def delete_vds(session: AsyncSession, vds_id):
     if vds is not None:
         await session.delete(vds)
         await session.commit()
+        await invalidate_locations()
     else:
         raise ModuleNotFoundError
 
@@ -119,4 +134,14 @@ async def delete_not_keys(
         await session.delete(key)
     if len(keys) != 0:
         await session.commit()
-    return True
\ No newline at end of file
+    return True
+
+
+async def drop_pooled_clients(session: AsyncSession, ids) -> None:
+    """Forget spare clients that were claimed or removed from the panel."""
+    if not ids:
+        return
+    await session.execute(
+        delete(PooledClient).where(PooledClient.id.in_(list(ids)))
+    )
+    await session.commit()
@@ -3,12 +3,21 @@ import logging
 import os
 from datetime import datetime
 from pathlib import Path
-from typing import Sequence
+from typing import AsyncIterator, Sequence
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload, selectinload, outerjoin, aliased
 from sqlalchemy import and_, select, func, desc, exists, RowMapping, case, or_
 
+from bot.database.cache import (
+    LocationDTO,
+    PersonDTO,
+    ServerDTO,
+    locations_cache_key,
+    person_cache_key,
+    read_through,
+    server_cache_key,
+)
 from bot.database.models.main import (
     Persons,
     Servers,
@@ -22,7 +31,12 @@ from bot.database.models.main import (
     ReferralBonus,
     message_button_association,
     Location,
-    Vds, Metric
+    Vds, Metric, BroadcastJob, PooledClient, PaymentStep,
+    BROADCAST_STATUS_QUEUED,
+    BROADCAST_STATUS_RUNNING,
+    PAYMENT_STATUS_CLAIMED,
+    PAYMENT_STATUS_CONFIRMED,
+    PAYMENT_STATUS_PENDING,
 )
 from bot.misc.util import CONFIG
 
@@ -48,10 +62,6 @@ def _filter_degraded_marzban_servers(servers):
     return [server for server in servers if not _is_degraded_marzban_server(server)]
 
 
-def person_cache_key(telegram_id):
-    return f"person:{telegram_id}"
-
-
 def person_id_cache_key(list_input):
     return f"person:{list_input}"
 
@@ -65,6 +75,17 @@ async def get_person(session: AsyncSession, telegram_id):
     return person
 
 
+async def get_person_dto(session: AsyncSession, telegram_id) -> PersonDTO | None:
+    """Cached snapshot of the user row, without keys."""
+    async def _load():
+        statement = select(Persons).filter(Persons.tgid == telegram_id)
+        result = await session.execute(statement)
+        person = result.scalar_one_or_none()
+        return None if person is None else PersonDTO.from_orm(person)
+
+    return await read_through('person', person_cache_key(telegram_id), _load)
+
+
 async def get_person_id(session: AsyncSession, list_input):
     statement = select(Persons).options(
         joinedload(Persons.keys)
@@ -134,6 +155,160 @@ async def get_all_subscription(session: AsyncSession):
     return persons
 
 
+async def stream_users_for_export(
+    session: AsyncSession,
+    group_name: str | None = None,
+    subscribed: bool = False,
+    batch: int = 1000
+) -> AsyncIterator[Sequence]:
+    """Yield pages of users for the admin exports with their paid key count.
+
+    Rows are ``(fullname, username, tgid, lang_tg, referral_balance, group,
+    paid_keys)``, where free and trial keys are not counted.  *subscribed*
+    keeps only users with a paid key; pages of *batch* rows come from a
+    server-side cursor.
+    """
+    paid_keys = func.count(case((
+        and_(Keys.free_key.is_not(True), Keys.trial_period.is_not(True)),
+        Keys.id,
+    ))).label('paid_keys')
+    statement = select(
+        Persons.fullname,
+        Persons.username,
+        Persons.tgid,
+        Persons.lang_tg,
+        Persons.referral_balance,
+        Persons.group,
+        paid_keys,
+    ).outerjoin(
+        Keys, Keys.user_tgid == Persons.tgid
+    ).group_by(Persons.id).order_by(Persons.id)
+    if group_name is not None:
+        statement = statement.filter(Persons.group == group_name)
+    if subscribed:
+        statement = statement.having(paid_keys > 0)
+    result = await session.stream(
+        statement.execution_options(yield_per=batch)
+    )
+    async for page in result.partitions():
+        yield page
+
+
+async def get_keys_crossed_expiry(
+    session: AsyncSession,
+    until: int,
+    limit: int = 500,
+) -> Sequence[Keys]:
+    """Paid keys whose subscription ended by *until* and that have not
+    been flagged ``notified_expired`` yet, oldest first."""
+    statement = select(Keys).options(
+        joinedload(Keys.person),
+        joinedload(Keys.server_table),
+    ).filter(
+        Keys.subscription <= until,
+        or_(
+            Keys.notified_expired.is_(False),
+            Keys.notified_expired.is_(None),
+        ),
+        or_(
+            Keys.free_key.is_(False),
+            Keys.free_key.is_(None),
+        ),
+    ).order_by(Keys.subscription, Keys.id).limit(limit)
+    result = await session.execute(statement)
+    return result.unique().scalars().all()
+
+
+async def get_keys_expiring_before(
+    session: AsyncSession,
+    until: int,
+    after_id: int = 0,
+    limit: int = 500,
+    person_id_from: int | None = None,
+    person_id_to: int | None = None,
+) -> Sequence[Keys]:
+    """Paid keys with subscription up to *until* that still miss at least
+    one renewal reminder flag, keyset-paginated by ``Keys.id``.
+
+    ``person_id_from``/``person_id_to`` restrict the scan to owners with
+    ``Persons.id`` in ``[from, to)`` (either bound may be open).
+    """
+    statement = select(Keys).options(
+        joinedload(Keys.person),
+        joinedload(Keys.server_table),
+    ).filter(
+        Keys.subscription <= until,
+        Keys.id > after_id,
+        or_(
+            Keys.free_key.is_(False),
+            Keys.free_key.is_(None),
+        ),
+        or_(
+            Keys.notified_expired.is_(False),
+            Keys.notified_expired.is_(None),
+            Keys.notified_1day.is_(False),
+            Keys.notified_1day.is_(None),
+            Keys.notified_3days.is_(False),
+            Keys.notified_3days.is_(None),
+        ),
+    )
+    if person_id_from is not None or person_id_to is not None:
+        statement = statement.join(Persons, Keys.user_tgid == Persons.tgid)
+        if person_id_from is not None:
+            statement = statement.filter(Persons.id >= person_id_from)
+        if person_id_to is not None:
+            statement = statement.filter(Persons.id < person_id_to)
+    statement = statement.order_by(Keys.id).limit(limit)
+    result = await session.execute(statement)
+    return result.unique().scalars().all()
+
+
+async def get_max_person_id(session: AsyncSession) -> int:
+    result = await session.execute(select(func.max(Persons.id)))
+    return int(result.scalar() or 0)
+
+
+async def get_keys_pending_deletion(
+    session: AsyncSession,
+    until: int,
+    limit: int = 500,
+) -> Sequence[Keys]:
+    """Paid keys that are expired and were already notified about it."""
+    statement = select(Keys).filter(
+        Keys.subscription <= until,
+        Keys.notified_expired.is_(True),
+        or_(
+            Keys.free_key.is_(False),
+            Keys.free_key.is_(None),
+        ),
+    ).order_by(Keys.subscription, Keys.id).limit(limit)
+    result = await session.execute(statement)
+    return result.scalars().all()
+
+
+async def get_count_key_user(session: AsyncSession, telegram_id) -> int:
+    statement = select(func.count(Keys.id)).filter(
+        Keys.user_tgid == telegram_id
+    )
+    result = await session.execute(statement)
+    return int(result.scalar() or 0)
+
+
+async def get_expired_trial_persons(
+    session: AsyncSession,
+    now: datetime,
+    limit: int = 500,
+) -> Sequence[Persons]:
+    statement = select(Persons).options(
+        joinedload(Persons.keys)
+    ).filter(
+        Persons.trial_period.is_(True),
+        Persons.trial_expires_at <= now,
+    ).order_by(Persons.trial_expires_at).limit(limit)
+    result = await session.execute(statement)
+    return result.unique().scalars().all()
+
+
 async def get_no_subscription(session: AsyncSession):
     statement = select(Persons).options(
         joinedload(Persons.keys)
@@ -146,6 +321,8 @@ async def get_no_subscription(session: AsyncSession):
 async def get_payments(session: AsyncSession):
     statement = select(Payments).options(
         joinedload(Payments.payment_id)
+    ).filter(
+        Payments.status == PAYMENT_STATUS_CONFIRMED
     ).order_by(Payments.id)
     result = await session.execute(statement)
     payments = result.scalars().all()
@@ -156,6 +333,51 @@ async def get_payments(session: AsyncSession):
     return payments
 
 
+async def get_pending_payments(
+    session: AsyncSession,
+    limit: int
+) -> Sequence[Payments]:
+    """Open invoices, soonest to expire first, with their person loaded."""
+    statement = select(Payments).options(
+        joinedload(Payments.payment_id)
+    ).filter(
+        Payments.status == PAYMENT_STATUS_PENDING,
+        Payments.expires_at.is_not(None),
+    ).order_by(Payments.expires_at).limit(limit)
+    result = await session.execute(statement)
+    return result.scalars().all()
+
+
+async def get_stale_claimed_payments(
+    session: AsyncSession,
+    claimed_before: datetime,
+    limit: int
+) -> Sequence[str]:
+    """Invoices whose fulfilment was claimed before ``claimed_before`` and
+    never confirmed."""
+    statement = select(Payments.id_payment).filter(
+        Payments.status == PAYMENT_STATUS_CLAIMED,
+        Payments.expires_at.is_not(None),
+        Payments.claimed_at < claimed_before,
+    ).order_by(Payments.claimed_at).limit(limit)
+    result = await session.execute(statement)
+    return result.scalars().all()
+
+
+async def get_payment_step(
+    session: AsyncSession,
+    id_payment,
+    step: str
+) -> PaymentStep | None:
+    """The record of *step* if it already took effect for *id_payment*."""
+    statement = select(PaymentStep).filter(
+        PaymentStep.id_payment == str(id_payment),
+        PaymentStep.step == step,
+    )
+    result = await session.execute(statement)
+    return result.scalar_one_or_none()
+
+
 async def get_payment(session: AsyncSession, id_payment):
     statement = select(Payments).options(
         joinedload(Payments.payment_id)
@@ -204,7 +426,156 @@ async def get_server_id(session: AsyncSession, id_server) -> Servers:
     return server
 
 
+async def get_server_dto(session: AsyncSession, id_server) -> ServerDTO | None:
+    """Cached connection details of a server, for building panel clients."""
+    async def _load():
+        server = await get_server_id(session, id_server)
+        return None if server is None else ServerDTO.from_orm(server)
+
+    return await read_through('server', server_cache_key(id_server), _load)
+
+
+async def get_servers_for_reconcile(
+    session: AsyncSession,
+    server_ids=None,
+    types_vpn=None
+) -> Sequence[Servers]:
+    statement = select(Servers).order_by(Servers.id)
+    if server_ids:
+        statement = statement.filter(Servers.id.in_(list(server_ids)))
+    if types_vpn:
+        statement = statement.filter(Servers.type_vpn.in_(list(types_vpn)))
+    result = await session.execute(statement)
+    return result.scalars().all()
+
+
+async def get_pool_servers(session: AsyncSession, types_vpn) -> Sequence[Servers]:
+    """Servers of *types_vpn* that new keys can be put on, by the same
+    rules as ``get_free_servers``, so spares are only made where they can
+    be issued."""
+    statement = select(Servers).join(Servers.vds_table).join(
+        Vds.location_table
+    ).filter(
+        Location.work == True,  # noqa
+        Vds.work == True,  # noqa
+        Servers.work == True,  # noqa
+        Servers.auto_work == True,  # noqa
+        Servers.actual_space < Vds.max_space,
+        Servers.type_vpn.in_(list(types_vpn)),
+    ).order_by(Servers.id)
+    result = await session.execute(statement)
+    return result.scalars().all()
+
+
+async def get_key_pool_levels(session: AsyncSession) -> dict[int, int]:
+    """Spare clients per server id, for servers that have any."""
+    statement = select(
+        PooledClient.server, func.count(PooledClient.id)
+    ).filter(
+        PooledClient.taken_at.is_(None)
+    ).group_by(PooledClient.server)
+    result = await session.execute(statement)
+    return dict(result.all())
+
+
+async def get_stale_pooled_clients(
+    session: AsyncSession,
+    taken_before: datetime
+) -> Sequence[PooledClient]:
+    """Spare clients taken before *taken_before* and never dropped: the
+    issuer crashed, or a failed claim could not delete the client."""
+    statement = select(PooledClient).filter(
+        PooledClient.taken_at < taken_before
+    ).order_by(PooledClient.server, PooledClient.id)
+    result = await session.execute(statement)
+    return result.scalars().all()
+
+
+async def stream_server_keys(
+    session: AsyncSession,
+    id_server,
+    batch: int = 1000
+) -> AsyncIterator:
+    """Yield the server's keys as light rows, fetched *batch* at a time."""
+    statement = select(
+        Keys.id,
+        Keys.user_tgid,
+        Keys.subscription,
+        Keys.free_key,
+        Keys.wg_public_key,
+    ).filter(Keys.server == id_server).execution_options(yield_per=batch)
+    result = await session.stream(statement)
+    async for row in result:
+        yield row
+
+
+async def get_server_client_refs(
+    session: AsyncSession,
+    server_ids,
+    key_ids,
+    wg_public_keys
+) -> tuple[set[int], set[str]]:
+    """Which of *key_ids* / *wg_public_keys* still belong to one of the
+    servers, counting static users' WireGuard keys too."""
+    server_ids = list(server_ids)
+    ids, public_keys = set(), set()
+    if key_ids:
+        result = await session.execute(
+            select(Keys.id).filter(
+                Keys.server.in_(server_ids), Keys.id.in_(list(key_ids))
+            )
+        )
+        ids = set(result.scalars().all())
+    if wg_public_keys:
+        wg_public_keys = list(wg_public_keys)
+        result = await session.execute(
+            select(Keys.wg_public_key).filter(
+                Keys.server.in_(server_ids),
+                Keys.wg_public_key.in_(wg_public_keys),
+            ).union(
+                select(StaticPersons.wg_public_key).filter(
+                    StaticPersons.server.in_(server_ids),
+                    StaticPersons.wg_public_key.in_(wg_public_keys),
+                )
+            )
+        )
+        public_keys = set(result.scalars().all())
+    return ids, public_keys
+
+
+async def get_due_expiry_syncs(
+    session: AsyncSession,
+    now: int,
+    limit: int
+) -> Sequence[RowMapping]:
+    """Keys whose panel expiry push is due, oldest first, with the type
+    of their server (None for keys without one)."""
+    statement = select(
+        Keys.id,
+        Keys.user_tgid,
+        Keys.subscription,
+        Keys.server,
+        Keys.expiry_sync_due,
+        Keys.expiry_sync_attempts,
+        Servers.type_vpn,
+    ).outerjoin(Servers, Keys.server == Servers.id).filter(
+        Keys.expiry_sync_due.is_not(None),
+        Keys.expiry_sync_due <= now,
+    ).order_by(Keys.expiry_sync_due).limit(limit)
+    result = await session.execute(statement)
+    return result.mappings().all()
+
+
 async def get_type_vpn(session: AsyncSession, group_name):
+    async def _load():
+        return list(await _get_type_vpn(session, group_name))
+
+    return await read_through(
+        'type_vpn', await locations_cache_key('types', group_name), _load
+    )
+
+
+async def _get_type_vpn(session: AsyncSession, group_name):
     result = await session.execute(
         select(Servers.type_vpn).join(Servers.vds_table).join(
             Vds.location_table)
@@ -265,7 +636,30 @@ async def get_name_location_server(session: AsyncSession, server_id):
     return server.vds_table.location_table.name
 
 
-async def get_free_servers(session: AsyncSession, group_name, type_vpn):
+async def get_free_servers(
+    session: AsyncSession,
+    group_name,
+    type_vpn
+) -> list[LocationDTO]:
+    async def _load():
+        return [
+            LocationDTO.from_orm(location)
+            for location in await _get_free_servers(
+                session, group_name, type_vpn
+            )
+        ]
+
+    locations = await read_through(
+        'free_servers',
+        await locations_cache_key('free', group_name, int(type_vpn)),
+        _load,
+    )
+    if not locations:
+        raise FileNotFoundError('Server not found')
+    return locations
+
+
+async def _get_free_servers(session: AsyncSession, group_name, type_vpn):
     base_query = select(Location).join(Location.vds).join(
         Vds.servers).filter(
         and_(
@@ -293,8 +687,6 @@ async def get_free_servers(session: AsyncSession, group_name, type_vpn):
                 getattr(location, 'name', None)
             )
         ]
-    if not locations:
-        raise FileNotFoundError('Server not found')
     return locations
 
 
@@ -474,9 +866,7 @@ async def get_application_referral_check_false(session: AsyncSession):
 
 
 async def get_person_lang(session: AsyncSession, telegram_id):
-    statement = select(Persons).filter(Persons.tgid == telegram_id)
-    result = await session.execute(statement)
-    person = result.scalar_one_or_none()
+    person = await get_person_dto(session, telegram_id)
     if person is None:
         return CONFIG.languages
     return person.lang
@@ -532,6 +922,21 @@ async def get_count_groups(session: AsyncSession):
     return count
 
 
+async def get_key_summary(session: AsyncSession, telegram_id) -> RowMapping:
+    """Counts and latest expiry of the user's paid keys in one aggregate."""
+    now_ts = int(datetime.now().timestamp())
+    statement = select(
+        func.count(Keys.id).label('total'),
+        func.count(Keys.id).filter(Keys.subscription > now_ts).label('active'),
+        func.max(Keys.subscription).label('latest_subscription'),
+    ).filter(
+        Keys.user_tgid == telegram_id,
+        Keys.free_key == False # noqa
+    )
+    result = await session.execute(statement)
+    return result.mappings().one()
+
+
 async def get_key_user(session: AsyncSession, telegram_id, free_key=False):
     statement = select(Keys).options(
         joinedload(Keys.server_table)
@@ -559,6 +964,16 @@ async def get_key_id(session: AsyncSession, key_id) -> Keys:
     return key
 
 
+async def get_key_revision(session: AsyncSession, key_id):
+    """``(user_tgid, server, subscription)`` of the key, or None: what a
+    rendered subscription of it depends on."""
+    statement = select(
+        Keys.user_tgid, Keys.server, Keys.subscription
+    ).filter(Keys.id == key_id)
+    result = await session.execute(statement)
+    return result.one_or_none()
+
+
 async def get_key_id_server(session: AsyncSession, telegram_id, server_id):
     statement = select(Keys).options(
         joinedload(Keys.server_table)
@@ -657,6 +1072,7 @@ async def get_users_payments_metric(
 ) -> Sequence[Payments]:
     statement = select(Payments).join(Payments.payment_id).filter(
         Persons.metric == id_metric,
+        Payments.status == PAYMENT_STATUS_CONFIRMED,
     ).options(
         selectinload(Payments.payment_id)
     ).order_by(Payments.id)
@@ -674,6 +1090,7 @@ async def get_users_payments_tariff_metric(
         func.count(Payments.amount).label('user_count')
     ).join(Persons).filter(
         Persons.metric == id_metric,
+        Payments.status == PAYMENT_STATUS_CONFIRMED,
     ).group_by(
         Payments.amount
     ).order_by(
@@ -694,7 +1111,8 @@ async def get_paying_users_count(
     statement = select(
         func.count(Payments.user.distinct())
     ).join(Persons).filter(
-        Persons.metric == id_metric
+        Persons.metric == id_metric,
+        Payments.status == PAYMENT_STATUS_CONFIRMED,
     )
     result = await session.execute(statement)
     paying_users_count = result.scalar()
@@ -737,7 +1155,10 @@ async def get_metric_stats(session: AsyncSession) ->  Sequence[RowMapping]:
             select(func.count(Persons.id))
             .where(and_(
                 Persons.metric == Metric.id,
-                exists().where(Payments.user == Persons.id)
+                exists().where(and_(
+                    Payments.user == Persons.id,
+                    Payments.status == PAYMENT_STATUS_CONFIRMED,
+                ))
             ))
             .correlate(Metric)
             .scalar_subquery()
@@ -746,7 +1167,10 @@ async def get_metric_stats(session: AsyncSession) ->  Sequence[RowMapping]:
             select(func.count(Persons.id))
             .where(and_(
                 Persons.metric == Metric.id,
-                exists().where(Payments.user == Persons.id),
+                exists().where(and_(
+                    Payments.user == Persons.id,
+                    Payments.status == PAYMENT_STATUS_CONFIRMED,
+                )),
                 ~exists().where(Keys.user_tgid == Persons.tgid)
             ))
             .correlate(Metric)
@@ -802,11 +1226,13 @@ async def get_ref_bord(session: AsyncSession) -> Sequence[RowMapping]:
         func.sum(case((
             exists().where(and_(
                 Payments.user == Persons.id,
+                Payments.status == PAYMENT_STATUS_CONFIRMED,
             )), 1), else_=0)).label('subscribed'),
         func.sum(case((
             and_(
                 exists().where(and_(
                     Payments.user == Persons.id,
+                    Payments.status == PAYMENT_STATUS_CONFIRMED,
                 )),
                 ~exists().where(and_(
                     Keys.user_tgid == Persons.tgid,
@@ -847,3 +1273,22 @@ async def get_user_tg_ids_by_wg_keys(session, wg_public_keys: list):
     result = await session.execute(query)
     user_tg_ids = [row[0] for row in result.all()]
     return user_tg_ids
+
+
+async def get_broadcast_job(session: AsyncSession, job_id) -> BroadcastJob | None:
+    statement = select(BroadcastJob).filter(BroadcastJob.id == job_id)
+    result = await session.execute(statement)
+    return result.scalar_one_or_none()
+
+
+async def get_unfinished_broadcast_jobs(
+    session: AsyncSession,
+) -> Sequence[BroadcastJob]:
+    """Queued and interrupted broadcasts, oldest first."""
+    statement = select(BroadcastJob).filter(
+        BroadcastJob.status.in_(
+            (BROADCAST_STATUS_QUEUED, BROADCAST_STATUS_RUNNING)
+        )
+    ).order_by(BroadcastJob.id)
+    result = await session.execute(statement)
+    return result.scalars().all()
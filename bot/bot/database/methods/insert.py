@@ -2,8 +2,10 @@ import datetime
 import logging
 import time
 
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from bot.database.cache import invalidate_locations, invalidate_person
 from bot.database.methods.get import _get_person, get_metric_code
 from bot.database.models.main import (
     Persons,
@@ -13,7 +15,12 @@ from bot.database.models.main import (
     WithdrawalRequests,
     Groups,
     Keys,
-    Donate, Metric, NotRemoveKey, ReferralBonus
+    Donate, Metric, NotRemoveKey, ReferralBonus, BroadcastJob, PooledClient,
+    PaymentStep,
+    BROADCAST_STATUS_QUEUED,
+    PAYMENT_STATUS_CLAIMED,
+    PAYMENT_STATUS_CONFIRMED,
+    PAYMENT_STATUS_PENDING,
 )
 from bot.misc.util import CONFIG
 from bot.services.random_service import generate_random_string
@@ -37,6 +44,7 @@ async def add_new_person(
     )
     session.add(tom)
     await session.commit()
+    await invalidate_person(from_user.id)
 
 
 async def add_payment(
@@ -45,19 +53,29 @@ async def add_payment(
     deposit,
     payment_system,
     id_payment=None,
-    month_count=None
+    month_count=None,
+    status=PAYMENT_STATUS_CONFIRMED
 ):
     person = await _get_person(session, telegram_id)
     if person is not None:
-        payment = Payments(
-            amount=deposit,
-            data=datetime.datetime.now(),
-            payment_system=payment_system,
-            id_payment=id_payment,
-            month_count=month_count
-        )
-        payment.user = person.id
-        session.add(payment)
+        payment = None
+        if id_payment is not None:
+            # An invoice registered by add_pending_payment is completed in
+            # place instead of being recorded twice.
+            payment = await session.scalar(
+                select(Payments).filter(Payments.id_payment == id_payment)
+            )
+        if payment is None:
+            payment = Payments(id_payment=id_payment)
+            payment.user = person.id
+            session.add(payment)
+        payment.amount = deposit
+        payment.data = datetime.datetime.now()
+        payment.payment_system = payment_system
+        payment.month_count = month_count
+        # complete_invoice confirms a claimed invoice after fulfilment.
+        if payment.status != PAYMENT_STATUS_CLAIMED:
+            payment.status = status
         await session.commit()
     logging.info(
         f'Add DB payment '
@@ -69,6 +87,44 @@ async def add_payment(
     )
 
 
+async def add_pending_payment(
+    session: AsyncSession,
+    telegram_id,
+    deposit,
+    payment_system,
+    id_payment,
+    expires_at,
+    month_count=None,
+    type_pay=None,
+    key_id=None,
+    id_prot=None,
+    id_loc=None,
+    message_id=None,
+):
+    """Store an open invoice for payment_reconciliation_service."""
+    person = await _get_person(session, telegram_id)
+    if person is None:
+        return None
+    payment = Payments(
+        user=person.id,
+        id_payment=str(id_payment),
+        amount=deposit,
+        data=datetime.datetime.now(),
+        payment_system=payment_system,
+        month_count=month_count,
+        status=PAYMENT_STATUS_PENDING,
+        type_pay=type_pay,
+        key_id=key_id,
+        id_prot=id_prot,
+        id_loc=id_loc,
+        message_id=message_id,
+        expires_at=expires_at,
+    )
+    session.add(payment)
+    await session.commit()
+    return payment
+
+
 async def add_donate(session: AsyncSession, username, price):
     donate = Donate(
         username=username,
@@ -98,6 +154,7 @@ async def add_key(
     )
     session.add(key)
     await session.commit()
+    await invalidate_person(telegram_id)
     await session.refresh(key)
     logging.info(
         f'Add DB key '
@@ -113,16 +170,19 @@ async def add_key(
 async def add_server(session: AsyncSession, server):
     session.add(server)
     await session.commit()
+    await invalidate_locations()
 
 
 async def add_location(session: AsyncSession, location):
     session.add(location)
     await session.commit()
+    await invalidate_locations()
 
 
 async def add_vds(session: AsyncSession, vds):
     session.add(vds)
     await session.commit()
+    await invalidate_locations()
 
 
 async def add_static_user(session: AsyncSession, name, server):
@@ -183,6 +243,22 @@ async def add_group(session: AsyncSession, group_name):
     await session.commit()
 
 
+def stage_payment_step(
+    session: AsyncSession,
+    id_payment,
+    step: str,
+    key_id: int | None = None
+) -> None:
+    """Record that a fulfilment step of *id_payment* took effect.
+
+    Only added to the session: the caller's next commit, the one that
+    writes the step itself, stores both.
+    """
+    session.add(
+        PaymentStep(id_payment=str(id_payment), step=step, key_id=key_id)
+    )
+
+
 async def add_referral_bonus(
     session: AsyncSession,
     referrer_id: int,
@@ -231,3 +307,38 @@ async def add_not_remove_key(
     key = NotRemoveKey(name_key=name_key, key_id=key_id, server_id=server_id)
     session.add(key)
     await session.commit()
+
+
+async def add_broadcast_job(
+    session: AsyncSession,
+    segment: str,
+    text: str,
+    created_by: int,
+    total: int,
+    lang: str | None = None,
+    chat_id: int | None = None,
+    message_id: int | None = None,
+) -> BroadcastJob:
+    job = BroadcastJob(
+        segment=segment,
+        text=text,
+        status=BROADCAST_STATUS_QUEUED,
+        created_by=created_by,
+        total=total,
+        lang=lang,
+        chat_id=chat_id,
+        message_id=message_id,
+    )
+    session.add(job)
+    await session.commit()
+    return job
+
+
+async def add_pooled_clients(session: AsyncSession, server_id, clients):
+    """Store spare clients; *clients* maps panel name to
+    ``(client entry, config)``."""
+    session.add_all([
+        PooledClient(server=server_id, name=name, client=client, config=config)
+        for name, (client, config) in clients.items()
+    ])
+    await session.commit()
@@ -1,9 +1,15 @@
 import time
+from datetime import datetime, timedelta
 
-from sqlalchemy import select, update
+from sqlalchemy import bindparam, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
 
+from bot.database.cache import (
+    invalidate_locations,
+    invalidate_person,
+    invalidate_server,
+)
 from bot.database.methods.get import _get_person, _get_server
 from bot.database.models.main import (
     Persons,
@@ -14,9 +20,26 @@ from bot.database.models.main import (
     Location,
     Vds,
     StaticPersons,
-    Servers
+    Servers,
+    Payments,
+    BroadcastJob,
+    PooledClient,
+    BROADCAST_STATUS_QUEUED,
+    POOL_RETIRED_AT,
+    BROADCAST_STATUS_RUNNING,
+    PAYMENT_STATUS_CLAIMED,
+    PAYMENT_STATUS_CONFIRMED,
+    PAYMENT_STATUS_EXPIRED,
+    PAYMENT_STATUS_FAILED,
+    PAYMENT_STATUS_PENDING,
 )
-from bot.services.remnawave_expire_service import sinc_time
+
+
+def _queue_expiry_sync(key: Keys) -> None:
+    """Have the expiry_sync job push the key's new subscription to its
+    panel; committed together with the change itself."""
+    key.expiry_sync_due = int(time.time())
+    key.expiry_sync_attempts = 0
 
 
 def _pick_manageable_key(person: Persons) -> Keys | None:
@@ -86,6 +109,7 @@ async def add_time_person(session: AsyncSession, tgid, count_time):
         if person.banned:
             person.banned = False
         await session.commit()
+        await invalidate_person(tgid)
         return True
     return False
 
@@ -97,9 +121,11 @@ async def person_trial_period(session: AsyncSession, telegram_id):
             person.banned = False
             person.trial_period = True
             person.trial_used = True
+            person.special_offer = True
         else:
             return
         await session.commit()
+        await invalidate_person(telegram_id)
         return True
     return False
 
@@ -125,6 +151,7 @@ async def set_user_migration_status(
         return True
     person.migration_status = status
     await session.commit()
+    await invalidate_person(telegram_id)
     return True
 
 
@@ -140,6 +167,7 @@ async def person_banned_true(session: AsyncSession, tgid):
             key.notified_3days = False
             key.notified_expired = False
         await session.commit()
+        await invalidate_person(tgid)
         return True
     return False
 
@@ -178,6 +206,47 @@ async def key_expired_true(session: AsyncSession, key_id):
     return False
 
 
+KEY_NOTIFICATION_FLAGS = {
+    'three_days': {'notified_3days': True},
+    'one_day': {'notion_oneday': True, 'notified_1day': True},
+    'expired': {'notified_expired': True},
+}
+
+
+async def keys_notified_bulk(session: AsyncSession, key_ids, stage) -> int:
+    """Set the notification flags of *stage* on all *key_ids* in one UPDATE."""
+    key_ids = list(key_ids)
+    if not key_ids:
+        return 0
+    statement = (
+        update(Keys)
+        .where(Keys.id.in_(key_ids))
+        .values(**KEY_NOTIFICATION_FLAGS[stage])
+    )
+    result = await session.execute(statement)
+    await session.commit()
+    return result.rowcount
+
+
+async def set_users_migration_status_bulk(
+    session: AsyncSession,
+    telegram_ids,
+    status: str,
+) -> int:
+    telegram_ids = list(telegram_ids)
+    if not telegram_ids:
+        return 0
+    statement = (
+        update(Persons)
+        .where(Persons.tgid.in_(telegram_ids))
+        .values(migration_status=status)
+    )
+    result = await session.execute(statement)
+    await session.commit()
+    await invalidate_person(*telegram_ids)
+    return result.rowcount
+
+
 async def update_key_wg(session: AsyncSession, key_id, wg_public_key):
     statement = select(Keys).filter(Keys.id == key_id)
     result = await session.execute(statement)
@@ -231,11 +300,19 @@ async def update_server_key(
     return False
 
 
+async def _server_edited(session: AsyncSession, *server_ids) -> None:
+    """Drop the cached server and retire its spare clients, whose links
+    may not match the server any more."""
+    await invalidate_server(*server_ids)
+    await retire_pooled_clients(session, server_ids)
+
+
 async def server_work_update(session: AsyncSession, id_server, work):
     server = await _get_server(session, id_server)
     if server is not None:
         server.work = work
         await session.commit()
+        await _server_edited(session, id_server)
         return True
     return False
 
@@ -245,10 +322,26 @@ async def server_auto_work_update(session: AsyncSession, id_server, work):
     if server is not None:
         server.auto_work = work
         await session.commit()
+        await _server_edited(session, id_server)
         return True
     return False
 
 
+async def bulk_update_server_health(session: AsyncSession, rows) -> int:
+    """Apply many ``{'id', 'actual_space'?, 'auto_work'?}`` rows in one
+    executemany UPDATE (server_control_service health sweep)."""
+    rows = list(rows)
+    if not rows:
+        return 0
+    await session.execute(update(Servers), rows)
+    await session.commit()
+    await invalidate_server(*(row['id'] for row in rows))
+    flipped = [row['id'] for row in rows if 'auto_work' in row]
+    if flipped:
+        await retire_pooled_clients(session, flipped)
+    return len(rows)
+
+
 async def location_switch_update(
     session: AsyncSession,
     id_location,
@@ -260,6 +353,7 @@ async def location_switch_update(
     if location is not None:
         location.pay_switch = pay_switch
         await session.commit()
+        await invalidate_locations()
         return True
     return False
 
@@ -269,6 +363,7 @@ async def server_space_update(session: AsyncSession, id_server, new_space):
     if server is not None:
         server.actual_space = new_space
         await session.commit()
+        await invalidate_server(id_server)
         return True
     return False
 
@@ -327,7 +422,7 @@ async def update_key_users_server(session: AsyncSession, telegram_id):
     else:
         return False
 
-@sinc_time
+
 async def add_time_key(
     session: AsyncSession,
     key_id,
@@ -346,12 +441,13 @@ async def add_time_key(
         key.notified_expired = False
         if key.trial_period:
             key.trial_period = False
+        _queue_expiry_sync(key)
         await session.commit()
         return True
     else:
         return False
 
-@sinc_time
+
 async def new_time_key(session: AsyncSession, key_id, time_sub):
     statement = select(Keys).filter(Keys.id == key_id)
     result = await session.execute(statement)
@@ -364,6 +460,7 @@ async def new_time_key(session: AsyncSession, key_id, time_sub):
         key.notified_expired = False
         if key.trial_period:
             key.trial_period = False
+        _queue_expiry_sync(key)
         await session.commit()
         return True
     else:
@@ -404,6 +501,7 @@ async def update_lang(session: AsyncSession, lang, tgid):
     if person is not None:
         person.lang = lang
         await session.commit()
+        await invalidate_person(tgid)
         return True
     return False
 
@@ -430,6 +528,7 @@ async def persons_add_group(
         for person in persons:
             person.group = name_group
         await session.commit()
+        await invalidate_person(*list_input)
         return len(persons)
     return 0
 
@@ -464,10 +563,31 @@ async def block_state_person(session: AsyncSession, telegram_id, block_state):
     if person is not None:
         person.blocked = block_state
         await session.commit()
+        await invalidate_person(telegram_id)
         return True
     return False
 
 
+async def block_state_persons(
+    session: AsyncSession,
+    telegram_ids,
+    block_state
+) -> int:
+    """``block_state_person`` for many users in one UPDATE."""
+    telegram_ids = list(telegram_ids)
+    if not telegram_ids:
+        return 0
+    result = await session.execute(
+        update(Persons)
+        .where(Persons.tgid.in_(telegram_ids))
+        .values(blocked=block_state)
+    )
+    await session.commit()
+    for telegram_id in telegram_ids:
+        await invalidate_person(telegram_id)
+    return result.rowcount
+
+
 async def status_state_person(
     session: AsyncSession,
     telegram_id,
@@ -479,6 +599,7 @@ async def status_state_person(
         person.status = int(status)
         person.referral_percent = int(percent)
         await session.commit()
+        await invalidate_person(telegram_id)
         return True
     return False
 
@@ -489,6 +610,7 @@ async def new_name_location(session: AsyncSession, location_id, new_name):
     location = result.unique().scalar_one_or_none()
     location.name = new_name
     await session.commit()
+    await invalidate_locations()
 
 
 async def edit_work_location(session: AsyncSession, location_id):
@@ -498,6 +620,7 @@ async def edit_work_location(session: AsyncSession, location_id):
     location.work = not location.work
     work = location.work
     await session.commit()
+    await invalidate_locations()
     return work
 
 
@@ -508,6 +631,7 @@ async def edit_work_vds(session: AsyncSession, vds_id):
     vds.work = not vds.work
     work = vds.work
     await session.commit()
+    await invalidate_locations()
     return work
 
 
@@ -541,6 +665,7 @@ async def new_limit_vds(session: AsyncSession, vds_id, new_limit):
     vds = result.unique().scalar_one_or_none()
     vds.max_space = new_limit
     await session.commit()
+    await invalidate_locations()
 
 
 async def new_squad_server(
@@ -553,6 +678,7 @@ async def new_squad_server(
     server = result.unique().scalar_one_or_none()
     server.remnawave_squad_id = squad_uui
     await session.commit()
+    await _server_edited(session, server_id)
 
 
 async def update_payment_status(
@@ -575,3 +701,227 @@ async def update_payment_status(
     if payment:
         payment.status = status
         await session.commit()
+
+
+async def claim_pending_payment(
+    session: AsyncSession,
+    id_payment,
+    lease_sec: int,
+) -> int:
+    """Move a paid invoice from pending (or expired, when the provider
+    confirms the payment late) to claimed.
+
+    The conditional UPDATE is the idempotency guard: of every replica,
+    webhook and sweep that sees the invoice paid, only one gets a claim.  A
+    claim older than ``lease_sec`` belongs to a fulfilment that failed or
+    died, and can be taken over.  Returns the attempt number of this claim
+    (1 for the first), or 0 when the invoice was not claimed.
+    """
+    now = datetime.now()
+    statement = update(Payments).where(
+        Payments.id_payment == str(id_payment),
+        Payments.status.in_([PAYMENT_STATUS_PENDING, PAYMENT_STATUS_EXPIRED])
+        | (
+            (Payments.status == PAYMENT_STATUS_CLAIMED)
+            & (Payments.claimed_at < now - timedelta(seconds=lease_sec))
+        ),
+    ).values(
+        status=PAYMENT_STATUS_CLAIMED,
+        claimed_at=now,
+        fulfil_attempts=func.coalesce(Payments.fulfil_attempts, 0) + 1,
+    ).returning(Payments.fulfil_attempts)
+    attempt = (await session.execute(statement)).scalar_one_or_none()
+    await session.commit()
+    return attempt or 0
+
+
+async def confirm_claimed_payment(session: AsyncSession, id_payment) -> None:
+    """Mark a claimed invoice confirmed once its order was fulfilled."""
+    statement = update(Payments).where(
+        Payments.id_payment == str(id_payment),
+        Payments.status == PAYMENT_STATUS_CLAIMED,
+    ).values(status=PAYMENT_STATUS_CONFIRMED)
+    await session.execute(statement)
+    await session.commit()
+
+
+async def fail_claimed_payment(session: AsyncSession, id_payment) -> bool:
+    """Park a claimed invoice whose fulfilment kept failing; returns
+    False if it was no longer claimed."""
+    statement = update(Payments).where(
+        Payments.id_payment == str(id_payment),
+        Payments.status == PAYMENT_STATUS_CLAIMED,
+    ).values(status=PAYMENT_STATUS_FAILED).returning(Payments.id)
+    failed = (await session.execute(statement)).scalar_one_or_none()
+    await session.commit()
+    return failed is not None
+
+
+async def expire_pending_payments(session: AsyncSession, ids) -> list[int]:
+    """Mark the given invoices expired; returns the ids that were pending."""
+    if not ids:
+        return []
+    statement = update(Payments).where(
+        Payments.id.in_(list(ids)),
+        Payments.status == PAYMENT_STATUS_PENDING,
+    ).values(status=PAYMENT_STATUS_EXPIRED).returning(Payments.id)
+    expired = list((await session.execute(statement)).scalars().all())
+    await session.commit()
+    return expired
+
+
+async def finish_expiry_syncs(session: AsyncSession, synced: dict) -> None:
+    """Clear the pending sync of keys (``{key_id: subscription pushed}``)
+    whose subscription has not changed again since it was pushed."""
+    if not synced:
+        return
+    statement = update(Keys.__table__).where(
+        Keys.__table__.c.id == bindparam('b_id'),
+        Keys.__table__.c.subscription == bindparam('b_subscription'),
+    ).values(expiry_sync_due=None, expiry_sync_attempts=0)
+    await session.execute(statement, [
+        {'b_id': key_id, 'b_subscription': subscription}
+        for key_id, subscription in synced.items()
+    ])
+    await session.commit()
+
+
+async def reschedule_expiry_syncs(session: AsyncSession, rows) -> None:
+    """Apply ``{'id', 'subscription', 'due', 'expiry_sync_due',
+    'expiry_sync_attempts'}`` rows in one executemany UPDATE (failed pushes
+    of the expiry_sync job).
+
+    ``subscription`` and ``due`` are the values read when the push started:
+    a key changed again since keeps the fresh mark of that change.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    statement = update(Keys.__table__).where(
+        Keys.__table__.c.id == bindparam('b_id'),
+        Keys.__table__.c.subscription == bindparam('b_subscription'),
+        Keys.__table__.c.expiry_sync_due == bindparam('b_due'),
+    ).values(
+        expiry_sync_due=bindparam('b_expiry_sync_due'),
+        expiry_sync_attempts=bindparam('b_expiry_sync_attempts'),
+    )
+    await session.execute(statement, [
+        {
+            'b_id': row['id'],
+            'b_subscription': row['subscription'],
+            'b_due': row['due'],
+            'b_expiry_sync_due': row['expiry_sync_due'],
+            'b_expiry_sync_attempts': row['expiry_sync_attempts'],
+        }
+        for row in rows
+    ])
+    await session.commit()
+
+
+async def start_broadcast_job(session: AsyncSession, job_id) -> bool:
+    """Mark a queued or interrupted broadcast as running; False if it was
+    finished or cancelled meanwhile."""
+    result = await session.execute(
+        update(BroadcastJob)
+        .where(
+            BroadcastJob.id == job_id,
+            BroadcastJob.status.in_(
+                (BROADCAST_STATUS_QUEUED, BROADCAST_STATUS_RUNNING)
+            ),
+        )
+        .values(
+            status=BROADCAST_STATUS_RUNNING,
+            started_at=func.coalesce(BroadcastJob.started_at, datetime.now()),
+        )
+    )
+    await session.commit()
+    return result.rowcount == 1
+
+
+async def checkpoint_broadcast_job(
+    session: AsyncSession,
+    job_id,
+    cursor: int,
+    sent: int,
+    failed: int,
+    blocked: int
+) -> bool:
+    """Move the cursor past a handled chunk and add its counters; False if
+    the broadcast is no longer running (cancelled)."""
+    result = await session.execute(
+        update(BroadcastJob)
+        .where(
+            BroadcastJob.id == job_id,
+            BroadcastJob.status == BROADCAST_STATUS_RUNNING,
+        )
+        .values(
+            cursor=cursor,
+            sent=BroadcastJob.sent + sent,
+            failed=BroadcastJob.failed + failed,
+            blocked=BroadcastJob.blocked + blocked,
+        )
+    )
+    await session.commit()
+    return result.rowcount == 1
+
+
+async def finish_broadcast_job(session: AsyncSession, job_id, status) -> bool:
+    """Set the final *status* of a broadcast that is not finished yet."""
+    result = await session.execute(
+        update(BroadcastJob)
+        .where(
+            BroadcastJob.id == job_id,
+            BroadcastJob.status.in_(
+                (BROADCAST_STATUS_QUEUED, BROADCAST_STATUS_RUNNING)
+            ),
+        )
+        .values(status=status, finished_at=datetime.now())
+    )
+    await session.commit()
+    return result.rowcount == 1
+
+
+async def take_pooled_client(
+    session: AsyncSession,
+    server_id
+) -> PooledClient | None:
+    """Mark the oldest spare client of the server taken and return it.
+
+    The row is dropped once the client was renamed to its key
+    (``drop_pooled_clients``), so a spare is never lost track of.
+    Concurrent issuers skip rows another transaction already holds.
+    """
+    statement = select(PooledClient).filter(
+        PooledClient.server == server_id,
+        PooledClient.taken_at.is_(None),
+    ).order_by(PooledClient.id).limit(1).with_for_update(skip_locked=True)
+    result = await session.execute(statement)
+    pooled = result.scalar_one_or_none()
+    if pooled is not None:
+        pooled.taken_at = datetime.now()
+        await session.commit()
+    return pooled
+
+
+async def retire_pooled_clients(
+    session: AsyncSession,
+    server_ids=None,
+    created_before: datetime | None = None
+) -> int:
+    """Mark the free spares of *server_ids* (or those created before
+    *created_before*) taken long ago, so no key gets them and the key_pool
+    job deletes them from the panel and makes fresh ones."""
+    statement = update(PooledClient).filter(
+        PooledClient.taken_at.is_(None)
+    ).values(taken_at=POOL_RETIRED_AT)
+    if server_ids is not None:
+        statement = statement.filter(
+            PooledClient.server.in_(list(server_ids))
+        )
+    if created_before is not None:
+        statement = statement.filter(
+            PooledClient.created_at < created_before
+        )
+    result = await session.execute(statement)
+    await session.commit()
+    return result.rowcount
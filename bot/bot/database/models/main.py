@@ -6,11 +6,13 @@ from sqlalchemy import (
     Integer,
     String,
     ForeignKey,
+    Index,
     Table,
     UniqueConstraint,
-    BigInteger
+    BigInteger,
+    text,
 )
-from sqlalchemy import Float, DateTime, Boolean
+from sqlalchemy import Float, DateTime, Boolean, JSON
 
 from bot.misc.util import CONFIG
 
@@ -31,6 +33,16 @@ class Groups(Base):
 
 class Persons(Base):
     __tablename__ = 'users'
+    __table_args__ = (
+        # Referral counts and the referral board: only invited users.
+        Index(
+            'ix_users_referral_user_tgid',
+            'referral_user_tgid',
+            postgresql_where=text('referral_user_tgid IS NOT NULL'),
+        ),
+        # New-user windows of the admin statistics.
+        Index('ix_users_date_registered', 'date_registered'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     tgid = Column(BigInteger, unique=True)
     banned = Column(Boolean, default=False)
@@ -51,7 +63,7 @@ class Persons(Base):
     migration_status = Column(String, default='none')
     date_registered = Column(DateTime, default=current_time)
     trial_activated_at = Column(DateTime, nullable=True)
-    trial_expires_at = Column(DateTime, nullable=True)
+    trial_expires_at = Column(DateTime, nullable=True, index=True)
     group = Column(
         String,
         ForeignKey("groups.name", ondelete='SET NULL'),
@@ -81,6 +93,36 @@ class Persons(Base):
 
 class Keys(Base):
     __tablename__ = 'keys'
+    __table_args__ = (
+        # Serves the expiry engine in misc/loop.py: range scans on
+        # subscription filtered by the notification and free-key flags.
+        Index(
+            'ix_keys_subscription_notified_free',
+            'subscription',
+            'notified_expired',
+            'free_key',
+        ),
+        # Pending panel expiry syncs (services/expiry_sync_service.py).
+        Index(
+            'ix_keys_expiry_sync_due',
+            'expiry_sync_due',
+            postgresql_where=text('expiry_sync_due IS NOT NULL'),
+        ),
+        # A user's keys (get_key_user, get_key_summary, "has an active
+        # key" EXISTS) and their latest expiry without a heap visit.
+        Index('ix_keys_user_tgid_subscription', 'user_tgid', 'subscription'),
+        # A server's keys (stream_server_keys, per-server active counts).
+        Index('ix_keys_server_subscription', 'server', 'subscription'),
+        # Paid keys by expiry: active / expiring paid subscriptions.
+        Index(
+            'ix_keys_paid_subscription',
+            'subscription',
+            'user_tgid',
+            postgresql_where=text(
+                'free_key IS false AND trial_period IS false'
+            ),
+        ),
+    )
     id = Column(Integer, primary_key=True, index=True)
     person = relationship(Persons, back_populates="keys")
     user_tgid = Column(BigInteger, ForeignKey("users.tgid"))
@@ -99,6 +141,9 @@ class Keys(Base):
         ForeignKey("servers.id", ondelete='SET NULL'),
         nullable=True)
     server_table = relationship("Servers", back_populates="keys")
+    # Unix time the panel expiry should next be pushed; NULL when in sync.
+    expiry_sync_due = Column(BigInteger, nullable=True)
+    expiry_sync_attempts = Column(Integer, default=0, server_default='0')
 
 
 class Donate(Base):
@@ -177,8 +222,40 @@ class Location(Base):
         return cls(**data)
 
 
+PAYMENT_STATUS_PENDING = 'pending'
+# Paid and being fulfilled; see claim_pending_payment.
+PAYMENT_STATUS_CLAIMED = 'claimed'
+PAYMENT_STATUS_CONFIRMED = 'confirmed'
+PAYMENT_STATUS_EXPIRED = 'expired'
+# Fulfilment kept failing; left to the admin (see complete_invoice).
+PAYMENT_STATUS_FAILED = 'failed'
+
+
 class Payments(Base):
+    """A completed payment, or an invoice still waiting for one.
+
+    Invoices are stored with status ``pending`` together with the order
+    (type_pay .. message_id) so payment_reconciliation_service can complete
+    them after a restart.  A paid invoice is ``claimed`` while its order is
+    fulfilled and ``confirmed`` once that succeeded; only ``confirmed`` rows
+    are revenue.  ``fulfil_attempts`` counts the claims; an invoice that
+    still fails after the last one is parked ``failed``.
+    """
     __tablename__ = 'payments'
+    __table_args__ = (
+        Index('ix_payments_status_expires_at', 'status', 'expires_at'),
+        # "Has paid" EXISTS per user (referral board, paid referrals).
+        Index('ix_payments_user_status', 'user', 'status'),
+        # Revenue windows: successful payments by date, amount included.
+        Index(
+            'ix_payments_success_data',
+            'data',
+            postgresql_include=['amount'],
+            postgresql_where=text(
+                "status IN ('confirmed', 'paid', 'success', 'succeeded')"
+            ),
+        ),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user = Column(Integer, ForeignKey("users.id"))
     payment_id = relationship(Persons, back_populates="payment")
@@ -187,7 +264,39 @@ class Payments(Base):
     payment_system = Column(String)
     amount = Column(Float)
     data = Column(DateTime)
-    status = Column(String, default='pending')
+    status = Column(String, default=PAYMENT_STATUS_CONFIRMED)
+    type_pay = Column(String, nullable=True)
+    key_id = Column(Integer, nullable=True)
+    id_prot = Column(Integer, nullable=True)
+    id_loc = Column(Integer, nullable=True)
+    message_id = Column(BigInteger, nullable=True)
+    expires_at = Column(DateTime, nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+    fulfil_attempts = Column(Integer, default=0, server_default='0')
+
+
+PAYMENT_STEP_REFERRAL_BONUS = 'referral_bonus'
+# A key created or renewed for a new subscription.
+PAYMENT_STEP_KEY_ISSUED = 'key_issued'
+PAYMENT_STEP_KEY_EXTENDED = 'key_extended'
+PAYMENT_STEP_DONATE = 'donate'
+
+
+class PaymentStep(Base):
+    """A fulfilment step of a paid invoice that already took effect.
+
+    ``PaymentSystem.successful_payment`` stages the row so it is committed
+    together with the step's own write (``stage_payment_step``); a retried
+    fulfilment finds it and skips the step.  ``key_id`` is the key the step
+    created or extended.
+    """
+    __tablename__ = 'payment_steps'
+    __table_args__ = (UniqueConstraint('id_payment', 'step'),)
+    id = Column(Integer, primary_key=True)
+    id_payment = Column(String, nullable=False)
+    step = Column(String, nullable=False)
+    key_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime, default=current_time, nullable=False)
 
 
 class ReferralBonus(Base):
@@ -263,3 +372,82 @@ class NotRemoveKey(Base):
     name_key = Column(String, nullable=False)
     key_id = Column(Integer, nullable=False)
     server_id = Column(Integer, nullable=False)
+
+
+BROADCAST_STATUS_QUEUED = 'queued'
+BROADCAST_STATUS_RUNNING = 'running'
+BROADCAST_STATUS_DONE = 'done'
+BROADCAST_STATUS_CANCELLED = 'cancelled'
+
+
+class BroadcastJob(Base):
+    """A broadcast and its progress (services/broadcast_job_service.py).
+
+    ``cursor`` is the last ``Persons.id`` of the segment already handled;
+    it moves forward with the counters in one UPDATE, so a job interrupted
+    by a restart is resumed after it.
+    """
+    __tablename__ = 'broadcast_jobs'
+    __table_args__ = (
+        Index('ix_broadcast_jobs_status', 'status'),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    segment = Column(String, nullable=False)
+    text = Column(String, nullable=False)
+    status = Column(String, nullable=False, default=BROADCAST_STATUS_QUEUED)
+    cursor = Column(Integer, nullable=False, default=0, server_default='0')
+    total = Column(Integer, nullable=False, default=0, server_default='0')
+    sent = Column(Integer, nullable=False, default=0, server_default='0')
+    failed = Column(Integer, nullable=False, default=0, server_default='0')
+    blocked = Column(Integer, nullable=False, default=0, server_default='0')
+    created_by = Column(BigInteger, nullable=False)
+    lang = Column(String, nullable=True)
+    # Admin message edited with the live progress.
+    chat_id = Column(BigInteger, nullable=True)
+    message_id = Column(BigInteger, nullable=True)
+    created_at = Column(DateTime, default=current_time, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class MetricsSnapshot(Base):
+    """Admin dashboard figures (services/metrics_snapshot_service.py).
+
+    A single row (``id`` 1) rewritten by the ``metrics_snapshot`` job, so
+    the dashboard screens read one row instead of aggregating the tables.
+    """
+    __tablename__ = 'metrics_snapshot'
+    id = Column(Integer, primary_key=True)
+    metrics = Column(JSON, nullable=False)
+    refreshed_at = Column(DateTime, nullable=False)
+    duration_ms = Column(Integer, nullable=False, default=0, server_default='0')
+
+
+# ``taken_at`` of spares retired after a server edit: long past the
+# key_pool job's timeout, so it deletes them on its next run.
+POOL_RETIRED_AT = datetime(2000, 1, 1)
+
+
+class PooledClient(Base):
+    """A spare panel client created ahead of demand (key_pool_service).
+
+    ``name`` is the client's panel name (``pool.<token>.<postfix>``),
+    ``client`` its settings entry as sent to the panel and ``config`` the
+    connection link rendered for it.  Issuing a key marks one row
+    ``taken_at``, renames the client to the key's name and only then drops
+    the row; a row left taken is cleaned up by the key_pool job.  Server
+    edits retire the free rows (``POOL_RETIRED_AT``) the same way.
+    """
+    __tablename__ = 'key_pool'
+    id = Column(Integer, primary_key=True)
+    server = Column(
+        Integer,
+        ForeignKey("servers.id", ondelete='CASCADE'),
+        nullable=False,
+        index=True
+    )
+    name = Column(String, nullable=False, unique=True)
+    client = Column(JSON, nullable=False)
+    config = Column(String, nullable=False)
+    created_at = Column(DateTime, default=current_time, nullable=False)
+    taken_at = Column(DateTime, nullable=True)
@@ -4,9 +4,11 @@ from aiogram.filters import Filter
 from aiogram.types import Message, CallbackQuery
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from bot.database.methods.get import get_person
+from bot.database.methods.get import get_person_dto
 from bot.keyboards.inline.user_inline import check_follow_chanel
+from bot.misc.channel_membership import is_channel_member
 from bot.misc.language import Localization
+from bot.misc.user_context import current_user_context
 from bot.misc.util import CONFIG
 
 _ = Localization.text
@@ -23,10 +25,17 @@ class IsAdmin(Filter):
         return message.from_user.id == self.id_admin
 
 
+async def _person(session: AsyncSession, telegram_id):
+    ctx = current_user_context(telegram_id)
+    if ctx is not None:
+        return ctx.person
+    return await get_person_dto(session, telegram_id)
+
+
 class IsBlocked(Filter):
 
     async def __call__(self, message: Message, session: AsyncSession) -> bool:
-        user = await get_person(session, message.from_user.id)
+        user = await _person(session, message.from_user.id)
         if user is not None and user.blocked:
             return False
         if await check_subs(message, message.from_user.id, message.bot):
@@ -37,7 +46,7 @@ class IsBlocked(Filter):
 class IsBlockedCall(Filter):
 
     async def __call__(self, call: CallbackQuery, session: AsyncSession) -> bool:
-        user = await get_person(session, call.from_user.id)
+        user = await _person(session, call.from_user.id)
         await call.answer()
         if user is not None and user.blocked:
             return False
@@ -50,16 +59,12 @@ async def check_subs(message, user_telegram_id, bot):
     if not CONFIG.check_follow:
         return True
     try:
-        user_channel_status = await bot.get_chat_member(
-            chat_id=CONFIG.id_channel,
-            user_id=user_telegram_id
-        )
+        check = await is_channel_member(bot, user_telegram_id)
     except Exception as e:
         await message.answer(
             _('error_check_follow', CONFIG.languages),
         )
         return True
-    check = user_channel_status.status != 'left'
     if not check:
         await message.answer(
             _('no_follow', CONFIG.languages),
@@ -13,7 +13,8 @@ from bot.database.methods.get import (
     get_all_groups,
     get_users_group,
     get_person_id,
-    get_group, get_group_name, get_count_groups, get_server_id
+    get_group, get_group_name, get_count_groups, get_server_id,
+    stream_users_for_export
 )
 from bot.database.methods.insert import add_group
 from bot.database.methods.update import (
@@ -26,9 +27,12 @@ from bot.keyboards.reply.admin_reply import admin_group_menu, back_admin_menu
 from bot.misc.callbackData import GroupAction
 from bot.misc.language import Localization, get_lang
 from bot.misc.remove_key_servise.publisher import remove_key_server
-from bot.services.admin_user_export_service import list_user, list_columns_user
+from bot.services.admin_user_export_service import (
+    list_columns_user,
+    user_export_pages
+)
 from bot.misc.util import CONFIG
-from bot.services.report_export_service import get_excel_file
+from bot.services.report_export_service import export_rows
 
 log = logging.getLogger(__name__)
 
@@ -216,24 +220,27 @@ async def action_show_group_user(
     id_group: int,
     lang: str
 ):
-    users = await get_users_group(session, id_group)
-    if len(users) == 0:
+    group = await get_group(session, id_group)
+    if group is None:
         await message.answer(
             _('admin_group_list_groups_none', lang),
             show_alert=True
         )
         return
-    list_users = []
-    count = 1
-    for user in users:
-        list_users.append(await list_user(user, count))
-        count += 1
-    file = await get_excel_file(
+    file = await export_rows(
         await list_columns_user(lang),
-        list_users,
+        user_export_pages(
+            stream_users_for_export(session, group_name=group.name)
+        ),
         'Users Group'
     )
     try:
+        if file.rows == 0:
+            await message.answer(
+                _('admin_group_list_groups_none', lang),
+                show_alert=True
+            )
+            return
         await message.answer_document(
             file,
             caption=_('admin_group_list_groups_file', lang)
@@ -243,6 +250,8 @@ async def action_show_group_user(
             _('error_list_of_all_users_file', lang)
         )
         log.error('error send file all_user.txt', exc_info=e)
+    finally:
+        file.close()
 
 
 async def action_update_users_group(
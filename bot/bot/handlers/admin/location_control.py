@@ -806,6 +806,8 @@ async def location_callback(
         )
     except Exception as e:
         log.error('error send file locations', exc_info=e)
+    finally:
+        file.close()
 
 
 
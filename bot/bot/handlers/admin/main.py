@@ -20,6 +20,7 @@ from bot.handlers.admin_servers import admin_servers_router
 from bot.handlers.admin_connections import admin_connections_router
 from bot.handlers.admin_migration import admin_migration_router
 from bot.handlers.admin_errors import admin_errors_router
+from bot.handlers.admin_db_stats import admin_db_stats_router
 from bot.handlers.admin.group_mangment import group_management
 from bot.handlers.admin.keys_control import keys_control_router
 from bot.handlers.admin.location_control import location_control
@@ -80,6 +81,7 @@ admin_router.include_routers(
     admin_connections_router,
     admin_migration_router,
     admin_errors_router,
+    admin_db_stats_router,
     user_management_router,
     admin_broadcast_router,
     location_control,
@@ -194,6 +196,8 @@ async def admin_panel_callback(
         'admin_dash:connections',
         'admin_dash:migration',
         'admin_dash:errors',
+        'admin_dash:db',
+        'admin_dash:refresh',
     })
 )
 async def admin_dashboard_sections(
@@ -238,6 +238,8 @@ async def callback_show_list_metrics(
     except Exception as e:
         await call.message.answer(_('error_list_of_metric_file', lang))
         log.error(e, 'error send file metrics.excel')
+    finally:
+        file.close()
 
 
 @metric_management_router.callback_query(F.data == 'admin_metrics:stats')
@@ -423,8 +423,11 @@ async def protocol_control_call(
     space = 0
     name = protocol.remnawave_squad_id
     try:
-        client_server = await get_static_client(protocol)
-        space = len(client_server)
+        server_manager = ServerManager(protocol)
+        await server_manager.login()
+        space = await server_manager.count_users(fresh=True)
+        if space is None:
+            raise ConnectionError('Panel did not return a client count')
         if protocol.type_vpn == CONFIG.TypeVpn.REMNAWAVE.value:
             try:
                 server_manager = Remnawave(protocol, timeout=10)
@@ -710,6 +713,8 @@ async def call_list_server(
     except Exception as e:
         await call.message.answer(_('error_file_list_users_server', lang))
         log.error(e, 'error file send Clients_server.txt')
+    finally:
+        file.close()
     await call.answer()
 
 
@@ -14,11 +14,10 @@ from nats.js import JetStreamContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.database.methods.get import (
-    get_all_user,
-    get_all_subscription,
     get_payments,
     get_person,
-    get_key_user, get_name_location_server, get_ref_bord
+    get_key_user, get_name_location_server, get_ref_bord,
+    stream_users_for_export
 )
 from bot.database.methods.update import (
     add_time_person,
@@ -49,8 +48,11 @@ from bot.misc.callbackData import (
 from bot.misc.language import Localization, get_lang
 from bot.misc.loop import delete_key
 from bot.misc.util import CONFIG
-from bot.services.admin_user_export_service import list_user, list_columns_user
-from bot.services.report_export_service import get_excel_file
+from bot.services.admin_user_export_service import (
+    list_columns_user,
+    user_export_pages
+)
+from bot.services.report_export_service import export_rows, get_excel_file
 from bot.services.users_stats_service import get_users_stats
 
 log = logging.getLogger(__name__)
@@ -166,21 +168,15 @@ async def export_all_users_report(
     session: AsyncSession,
     lang: str,
 ) -> None:
-    all_users = await get_all_user(session)
-    list_users = []
-    count = 1
-    for user in all_users:
-        list_users.append(await list_user(user, count))
-        count += 1
-    if len(list_users) == 0:
-        await message.answer(_('error_list_of_all_users_file', lang))
-        return
-    file = await get_excel_file(
+    file = await export_rows(
         await list_columns_user(lang),
-        list_users,
+        user_export_pages(stream_users_for_export(session)),
         'All Users'
     )
     try:
+        if file.rows == 0:
+            await message.answer(_('error_list_of_all_users_file', lang))
+            return
         await message.answer_document(
             file,
             caption=_('list_of_all_users_file', lang)
@@ -188,6 +184,8 @@ async def export_all_users_report(
     except Exception as e:
         await message.answer(_('error_list_of_all_users_file', lang))
         log.error('error send file All Users', exc_info=e)
+    finally:
+        file.close()
 
 
 async def export_ref_board_report(
@@ -234,6 +232,8 @@ async def export_ref_board_report(
     except Exception as e:
         await message.answer(_('error_list_of_ref_bord_file', lang))
         log.error(e, 'error send file refbord.excel')
+    finally:
+        file.close()
 
 
 async def export_subscribed_users_report(
@@ -241,29 +241,15 @@ async def export_subscribed_users_report(
     session: AsyncSession,
     lang: str,
 ) -> None:
-    sub_users = await get_all_subscription(session)
-    list_users = []
-    count = 1
-    keys_user = []
-    for user in sub_users:
-        for key in user.keys:
-            if not key.free_key and not key.trial_period:
-                keys_user.append(key)
-        user.keys = keys_user
-        keys_user = []
-        if len(user.keys) == 0:
-            continue
-        list_users.append(await list_user(user, count))
-        count += 1
-    if len(list_users) == 0:
-        await message.answer(_('none_list_of_sub_users_file', lang))
-        return
-    file = await get_excel_file(
+    file = await export_rows(
         await list_columns_user(lang),
-        list_users,
+        user_export_pages(stream_users_for_export(session, subscribed=True)),
         'Subscribe Users'
     )
     try:
+        if file.rows == 0:
+            await message.answer(_('none_list_of_sub_users_file', lang))
+            return
         await message.answer_document(
             file,
             caption=_('list_of_sub_users_file', lang)
@@ -271,6 +257,8 @@ async def export_subscribed_users_report(
     except Exception as e:
         await message.answer(_('error_list_of_sub_users_file', lang))
         log.error('error send file subscription_user.txt', exc_info=e)
+    finally:
+        file.close()
 
 
 async def export_payments_report(
@@ -315,6 +303,8 @@ async def export_payments_report(
     except Exception as e:
         await message.answer(_('error_list_of_payments_file', lang))
         log.error(e, 'error send file payments.txt')
+    finally:
+        file.close()
 
 
 @user_management_router.message(
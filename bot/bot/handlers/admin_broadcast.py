@@ -1,22 +1,36 @@
 from aiogram import Router
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import CallbackQuery, Message
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from bot.database.methods.update import block_state_person
+from bot.database.methods.get import get_broadcast_job
+from bot.database.methods.insert import add_broadcast_job
+from bot.database.methods.update import finish_broadcast_job
+from bot.database.models.main import (
+    BROADCAST_STATUS_CANCELLED,
+    BROADCAST_STATUS_QUEUED,
+    BROADCAST_STATUS_RUNNING,
+)
 from bot.filters.main import IsAdmin
 from bot.keyboards.admin_keyboard import (
     broadcast_audience_keyboard,
     broadcast_confirm_keyboard,
+    broadcast_progress_keyboard,
     broadcast_waiting_text_keyboard,
     admin_dashboard_back_keyboard,
 )
-from bot.misc.callbackData import BroadcastAction, BroadcastAudience
+from bot.misc.callbackData import (
+    BroadcastAction,
+    BroadcastAudience,
+    BroadcastJobAction,
+)
 from bot.misc.language import Localization, get_lang
 from bot.misc.util import CONFIG
 from bot.services import broadcast_service
+from bot.services.broadcast_job_service import broadcast_progress_text
 
 admin_broadcast_router = Router()
 admin_broadcast_router.message.filter(IsAdmin())
@@ -73,11 +87,11 @@ async def broadcast_choose_audience(
     if not CONFIG.is_admin(call.from_user.id):
         return
     lang = await get_lang(session, call.from_user.id, state)
-    users = await broadcast_service.get_broadcast_users(
+    users_count = await broadcast_service.count_broadcast_users(
         session,
         callback_data.segment,
     )
-    await state.update_data(segment=callback_data.segment, users_count=len(users))
+    await state.update_data(segment=callback_data.segment, users_count=users_count)
     await state.set_state(BroadcastStates.waiting_text)
     await call.message.edit_text(
         _("admin_broadcast_waiting_text_screen", lang).format(
@@ -85,7 +99,7 @@ async def broadcast_choose_audience(
                 'admin_broadcast_segment_' + SEGMENT_TITLE.get(callback_data.segment, 'all'),
                 lang,
             ),
-            users_count=len(users),
+            users_count=users_count,
         ),
         reply_markup=await broadcast_waiting_text_keyboard(lang),
     )
@@ -104,15 +118,15 @@ async def broadcast_input_text(
         return
     data = await state.get_data()
     segment = data.get("segment", broadcast_service.BROADCAST_SEGMENT_ALL)
-    users = await broadcast_service.get_broadcast_users(session, segment)
-    await state.update_data(text=message.text, users_count=len(users))
+    users_count = await broadcast_service.count_broadcast_users(session, segment)
+    await state.update_data(text=message.text, users_count=users_count)
     await state.set_state(BroadcastStates.waiting_confirm)
     preview = broadcast_service.format_broadcast_preview(
         segment_title=_(
             'admin_broadcast_segment_' + SEGMENT_TITLE.get(segment, 'all'),
             lang,
         ),
-        users_count=len(users),
+        users_count=users_count,
         text=message.text,
     )
     await message.answer(
@@ -154,15 +168,15 @@ async def broadcast_action(
         await state.set_state(BroadcastStates.waiting_text)
         data = await state.get_data()
         segment = data.get("segment", broadcast_service.BROADCAST_SEGMENT_ALL)
-        users = await broadcast_service.get_broadcast_users(session, segment)
-        await state.update_data(users_count=len(users))
+        users_count = await broadcast_service.count_broadcast_users(session, segment)
+        await state.update_data(users_count=users_count)
         await call.message.edit_text(
             _('admin_broadcast_waiting_text_screen', lang).format(
                 segment_title=_(
                     'admin_broadcast_segment_' + SEGMENT_TITLE.get(segment, 'all'),
                     lang,
                 ),
-                users_count=len(users),
+                users_count=users_count,
             ),
             reply_markup=await broadcast_waiting_text_keyboard(lang),
         )
@@ -174,38 +188,68 @@ async def broadcast_action(
     text = data.get("text")
     if not text:
         await state.set_state(BroadcastStates.waiting_text)
-        users = await broadcast_service.get_broadcast_users(session, segment)
-        await state.update_data(users_count=len(users))
+        users_count = await broadcast_service.count_broadcast_users(session, segment)
+        await state.update_data(users_count=users_count)
         await call.message.edit_text(
             _('admin_broadcast_waiting_text_screen', lang).format(
                 segment_title=_(
                     'admin_broadcast_segment_' + SEGMENT_TITLE.get(segment, 'all'),
                     lang,
                 ),
-                users_count=len(users),
+                users_count=users_count,
             ),
             reply_markup=await broadcast_waiting_text_keyboard(lang),
         )
         await call.answer()
         return
 
-    users = await broadcast_service.get_broadcast_users(session, segment)
-    await call.message.edit_text(
-        f"{_('admin_broadcast_running', lang)}\n"
-        f"{_('admin_broadcast_recipients_label', lang)} {len(users)}"
-    )
-    stats = await broadcast_service.send_broadcast(
-        bot=call.bot,
-        users=users,
+    users_count = await broadcast_service.count_broadcast_users(session, segment)
+    job = await add_broadcast_job(
+        session,
+        segment=segment,
         text=text,
-        delay_seconds=0.05,
+        created_by=call.from_user.id,
+        total=users_count,
+        lang=lang,
+        chat_id=call.message.chat.id,
+        message_id=call.message.message_id,
     )
-    for user_id in stats.blocked_user_ids or []:
-        await block_state_person(session, user_id, True)
     await state.clear()
-    await call.message.answer(
-        f"{_('admin_broadcast_done', lang)}\n\n"
-        f"{_('admin_broadcast_sent_label', lang)} {stats.sent}\n"
-        f"{_('admin_broadcast_failed_label', lang)} {stats.failed}"
+    await call.message.edit_text(
+        broadcast_progress_text(job, lang),
+        reply_markup=await broadcast_progress_keyboard(lang, job.id, True),
     )
     await call.answer()
+
+
+@admin_broadcast_router.callback_query(BroadcastJobAction.filter())
+async def broadcast_job_action(
+    call: CallbackQuery,
+    session: AsyncSession,
+    callback_data: BroadcastJobAction,
+    state: FSMContext,
+) -> None:
+    if not CONFIG.is_admin(call.from_user.id):
+        return
+    lang = await get_lang(session, call.from_user.id, state)
+    if callback_data.action == "cancel":
+        await finish_broadcast_job(
+            session, callback_data.job_id, BROADCAST_STATUS_CANCELLED
+        )
+    job = await get_broadcast_job(session, callback_data.job_id)
+    if job is None:
+        await call.answer(_('admin_broadcast_not_found', lang), show_alert=True)
+        return
+    try:
+        await call.message.edit_text(
+            broadcast_progress_text(job, lang),
+            reply_markup=await broadcast_progress_keyboard(
+                lang,
+                job.id,
+                job.status in (BROADCAST_STATUS_QUEUED, BROADCAST_STATUS_RUNNING),
+            ),
+        )
+    except TelegramBadRequest:
+        # Progress unchanged since the last refresh.
+        pass
+    await call.answer()
@@ -8,7 +8,12 @@ from bot.keyboards.admin_keyboard import admin_dashboard_keyboard
 from bot.misc.language import Localization, get_lang
 from bot.misc.util import CONFIG
 from bot.services.message_render_service import edit_message
-from bot.services.dashboard_service import get_dashboard_metrics
+from bot.services.dashboard_service import DashboardMetrics
+from bot.services.metrics_snapshot_service import (
+    get_metrics_snapshot,
+    metrics_as,
+    snapshot_age_seconds,
+)
 
 _ = Localization.text
 
@@ -40,7 +45,9 @@ async def _safe_edit_or_send(
         )
 
 
-@admin_dashboard_router.callback_query(F.data.in_({"admin_dash:dashboard", "admin_dash:home"}))
+@admin_dashboard_router.callback_query(
+    F.data.in_({"admin_dash:dashboard", "admin_dash:home", "admin_dash:refresh"})
+)
 async def dashboard_handler(
     call: CallbackQuery,
     session: AsyncSession,
@@ -49,7 +56,10 @@ async def dashboard_handler(
     if not CONFIG.is_admin(call.from_user.id):
         return
     lang = await get_lang(session, call.from_user.id, state)
-    metrics = await get_dashboard_metrics(session)
+    snapshot = await get_metrics_snapshot(
+        session, force=call.data == "admin_dash:refresh"
+    )
+    metrics = metrics_as(DashboardMetrics, snapshot)
     text = _('admin_dashboard_metrics_text', lang).format(
         total_users=metrics.total_users,
         active_users=metrics.active_users,
@@ -63,6 +73,9 @@ async def dashboard_handler(
         revenue_7_days=_money(metrics.revenue_7_days),
         revenue_30_days=_money(metrics.revenue_30_days),
     )
+    text += "\n\n" + _('admin_dashboard_snapshot_age', lang).format(
+        age=snapshot_age_seconds(snapshot)
+    )
     await _safe_edit_or_send(
         call,
         text=text,
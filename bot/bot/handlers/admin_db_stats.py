@@ -0,0 +1,63 @@
+import html
+
+from aiogram import F, Router
+from aiogram.fsm.context import FSMContext
+from aiogram.types import CallbackQuery
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.database.db_logging import TOP_WINDOW_SEC, top_statements
+from bot.filters.main import IsAdmin
+from bot.keyboards.admin_keyboard import admin_dashboard_keyboard
+from bot.misc.language import Localization, get_lang
+from bot.misc.util import CONFIG
+from bot.services.message_render_service import edit_message
+
+_ = Localization.text
+
+admin_db_stats_router = Router()
+admin_db_stats_router.message.filter(IsAdmin())
+
+DB_TOP_LIMIT = 10
+# Keeps ten entries well under Telegram's 4096-character limit.
+SQL_PREVIEW_CHARS = 160
+
+
+def db_top_text(lang: str, limit: int = DB_TOP_LIMIT) -> str:
+    statements = top_statements(limit)
+    text = _('admin_db_top_title', lang).format(
+        minutes=TOP_WINDOW_SEC // 60, count=len(statements)
+    )
+    if not statements:
+        return text + "\n\n" + _('admin_db_top_empty', lang)
+    for rank, totals in enumerate(statements, start=1):
+        sql = totals.sql
+        if len(sql) > SQL_PREVIEW_CHARS:
+            sql = sql[:SQL_PREVIEW_CHARS] + "…"
+        text += "\n\n" + _('admin_db_top_line', lang).format(
+            rank=rank,
+            fingerprint=totals.fingerprint,
+            total_ms=f"{totals.total_ms:.0f}",
+            calls=totals.calls,
+            mean_ms=f"{totals.mean_ms:.1f}",
+            max_ms=f"{totals.max_ms:.0f}",
+            rows=totals.rows,
+            sql=html.escape(sql),
+        )
+    return text
+
+
+@admin_db_stats_router.callback_query(F.data == "admin_dash:db")
+async def admin_db_top_handler(
+    call: CallbackQuery,
+    session: AsyncSession,
+    state: FSMContext,
+) -> None:
+    if not CONFIG.is_admin(call.from_user.id):
+        return
+    lang = await get_lang(session, call.from_user.id, state)
+    await edit_message(
+        call.message,
+        text=db_top_text(lang),
+        reply_markup=await admin_dashboard_keyboard(lang),
+    )
+    await call.answer()
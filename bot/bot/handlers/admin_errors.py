@@ -6,12 +6,20 @@ from aiogram.types import CallbackQuery
 from sqlalchemy import and_, func, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from bot.database.models.main import Keys, Payments, Persons, Servers
+from bot.database.models.main import (
+    Keys,
+    Payments,
+    Persons,
+    Servers,
+    PAYMENT_STATUS_CLAIMED,
+    PAYMENT_STATUS_PENDING,
+)
 from bot.filters.main import IsAdmin
 from bot.keyboards.admin_keyboard import admin_dashboard_keyboard
 from bot.misc.language import Localization, get_lang
 from bot.misc.util import CONFIG
 from bot.services.message_render_service import edit_message
+from bot.services.payment_reconciliation_service import CLAIM_LEASE_SEC
 
 _ = Localization.text
 
@@ -47,6 +55,10 @@ async def admin_errors_stats_handler(
     )
 
     # Proxy metric: payment rows with problematic status for last 24h.
+    # An open invoice is not an error (most are abandoned checkouts); one
+    # still open past its expiry, or paid but not delivered within the
+    # claim lease, is.
+    local_now = datetime.now()
     subscription_errors = await session.scalar(
         select(func.count(Payments.id)).where(
             and_(
@@ -54,7 +66,16 @@ async def admin_errors_stats_handler(
                 Payments.data >= start_24h,
                 or_(
                     Payments.status.is_(None),
-                    Payments.status.in_(["pending", "failed", "error"]),
+                    Payments.status.in_(["failed", "error"]),
+                    and_(
+                        Payments.status == PAYMENT_STATUS_PENDING,
+                        Payments.expires_at < local_now,
+                    ),
+                    and_(
+                        Payments.status == PAYMENT_STATUS_CLAIMED,
+                        Payments.claimed_at
+                        < local_now - timedelta(seconds=CLAIM_LEASE_SEC),
+                    ),
                 ),
             )
         )
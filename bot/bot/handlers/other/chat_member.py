@@ -0,0 +1,23 @@
+import logging
+
+from aiogram import F, Router
+from aiogram.types import ChatMemberUpdated
+
+from bot.misc.channel_membership import is_member_status, remember
+from bot.misc.util import CONFIG
+
+log = logging.getLogger(__name__)
+
+chat_member_router = Router()
+
+
+@chat_member_router.chat_member(F.chat.id == CONFIG.id_channel)
+async def channel_member_changed(event: ChatMemberUpdated) -> None:
+    """Keep the check_subs cache in step with joins and leaves."""
+    member = is_member_status(event.new_chat_member.status)
+    await remember(event.new_chat_member.user.id, member)
+    log.info(
+        'event=follow_cache.chat_member user_id=%s member=%s',
+        event.new_chat_member.user.id,
+        member,
+    )
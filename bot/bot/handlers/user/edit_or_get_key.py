@@ -46,6 +46,7 @@ from bot.misc.callbackData import (
 )
 from bot.misc.remove_key_servise.publisher import remove_key_server
 from bot.services.file_service import str_to_file
+from bot.services.key_pool_service import issue_pooled_key
 from bot.services.message_render_service import edit_message
 from bot.services.subscription_service import get_user_subscription_link
 from bot.utils.key_message_format import (
@@ -221,7 +222,10 @@ async def select_location_callback(
             key.server_table.id
         )
         await server_manager.login()
-        if key.server_table.type_vpn == CONFIG.TypeVpn.WIREGUARD.value:
+        pooled_config = await issue_pooled_key(session, server_manager, key)
+        if pooled_config is not None:
+            config = pooled_config
+        elif key.server_table.type_vpn == CONFIG.TypeVpn.WIREGUARD.value:
             config = await server_manager.get_key(
                 key.wg_public_key,
                 name_key=name_location,
@@ -235,12 +239,11 @@ async def select_location_callback(
                 key_id=key.id,
                 subscription_timestamp=key.subscription
             )
-        server_parameters = await server_manager.get_all_user()
-        await server_space_update(
-            session,
-            server.id,
-            len(server_parameters)
-        )
+        # A spare already counted towards the server's load.
+        if pooled_config is None:
+            users_count = await server_manager.count_users()
+            if users_count is not None:
+                await server_space_update(session, server.id, users_count)
     except Exception as e:
         await update_server_key(session, key.id)
         await server_not_found(call.message, e, lang)
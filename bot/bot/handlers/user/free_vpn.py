@@ -95,13 +95,9 @@ async def free_vpn_btn(
                 name_key=name_location,
                 key_id=key.id
             )
-        server_parameters = await server_manager.get_all_user()
-
-        await server_space_update(
-            session,
-            free_protocol.id,
-            len(server_parameters)
-        )
+        users_count = await server_manager.count_users()
+        if users_count is not None:
+            await server_space_update(session, free_protocol.id, users_count)
         await download.delete()
         await post_key_telegram(session, call, key, config, lang)
     except Exception as e:
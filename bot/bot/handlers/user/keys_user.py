@@ -43,6 +43,7 @@ from bot.misc.callbackData import (
 )
 from bot.misc.util import CONFIG
 from bot.misc.tariffs import get_trial_data_limit_gb
+from bot.services.key_pool_service import issue_pooled_key
 from bot.services.migration_service import MIGRATION_STATUS_MIGRATED
 from bot.services.message_render_service import edit_message
 
@@ -207,8 +208,6 @@ async def get_trial_period(
         await call.answer()
         return
     await person_trial_period(session, person.tgid)
-    person.trial_period = True
-    person.special_offer = True
     trial_duration_seconds = trial_seconds if trial_seconds is not None else CONFIG.trial_period
     key = await add_key(
         session,
@@ -226,7 +225,12 @@ async def get_trial_period(
             session,
             key.server_table.id
         )
-        if key.server_table.type_vpn == CONFIG.TypeVpn.WIREGUARD.value:
+        pooled_config = await issue_pooled_key(
+            session, server_manager, key, get_trial_data_limit_gb()
+        )
+        if pooled_config is not None:
+            config = pooled_config
+        elif key.server_table.type_vpn == CONFIG.TypeVpn.WIREGUARD.value:
             config = await server_manager.get_key(
                 key.wg_public_key,
                 name_key=name_location,
@@ -241,13 +245,11 @@ async def get_trial_period(
                 subscription_timestamp=key.subscription,
                 limit_gb=get_trial_data_limit_gb(),
             )
-        server_parameters = await server_manager.get_all_user()
-
-        await server_space_update(
-            session,
-            server.id,
-            len(server_parameters)
-        )
+        # A spare already counted towards the server's load.
+        if pooled_config is None:
+            users_count = await server_manager.count_users()
+            if users_count is not None:
+                await server_space_update(session, server.id, users_count)
     except Exception as e:
         await update_server_key(session, key.id)
         await message.answer(_('server_not_connected', lang))
@@ -42,6 +42,8 @@ from bot.keyboards.inline.user_inline import (
     choose_type_vpn_help,
 )
 from bot.misc.language import Localization, get_lang
+from bot.misc.channel_membership import is_channel_member
+from bot.misc.user_context import UserContext
 from bot.misc.callbackData import (
     ChoosingLang,
     ChooseTypeVpn,
@@ -75,11 +77,7 @@ user_router.include_routers(
 
 
 async def check_follow(user_id, bot):
-    user_channel_status = await bot.get_chat_member(
-        chat_id=CONFIG.id_channel,
-        user_id=user_id
-    )
-    return user_channel_status.status != 'left'
+    return await is_channel_member(bot, user_id, fresh=True)
 
 
 @registered_router.callback_query(F.data == 'check_follow_chanel')
@@ -211,12 +209,14 @@ async def command(
 async def back_main_menu(
     message: Message,
     session: AsyncSession,
-    state: FSMContext
+    state: FSMContext,
+    user_ctx: UserContext
 ) -> None:
     lang = await get_lang(session, message.from_user.id, state)
     await state.clear()
-    person = await get_person(session, message.from_user.id)
-    caption = await build_status_caption(session, person, lang)
+    caption = await build_status_caption(
+        session, user_ctx.person, lang, keys=await user_ctx.keys()
+    )
     await message.answer_photo(
         photo=FSInputFile('bot/img/main_menu.jpg'),
         caption=caption,
@@ -230,12 +230,14 @@ async def back_main_menu(
 async def back_main_menu(
     call: CallbackQuery,
     session: AsyncSession,
-    state: FSMContext
+    state: FSMContext,
+    user_ctx: UserContext
 ) -> None:
     lang = await get_lang(session, call.from_user.id, state)
     await state.clear()
-    person = await get_person(session, call.from_user.id)
-    caption = await build_status_caption(session, person, lang)
+    caption = await build_status_caption(
+        session, user_ctx.person, lang, keys=await user_ctx.keys()
+    )
     await edit_message(
         call.message,
         photo='bot/img/main_menu.jpg',
@@ -310,9 +312,15 @@ async def back_help_menu_callback(
     )
 
 
-async def build_status_caption(session: AsyncSession, person, lang) -> str:
-    """Build personalized status block for the main menu."""
-    keys = await get_key_user(session, person.tgid)
+async def build_status_caption(
+    session: AsyncSession, person, lang, keys=None
+) -> str:
+    """Build personalized status block for the main menu.
+
+    *keys* may be passed when already loaded (``await user_ctx.keys()``).
+    """
+    if keys is None:
+        keys = await get_key_user(session, person.tgid)
     fullname = person.fullname or person.username or ''
     user_id = int(getattr(person, 'tgid', 0) or 0)
     now_ts = int(datetime.now().timestamp())
@@ -547,11 +555,11 @@ async def call_choose_server(
     js: JetStreamContext,
     remove_key_subject: str,
     callback_data: BackTypeVpn,
-    state: FSMContext
+    state: FSMContext,
+    user_ctx: UserContext
 ) -> None:
     lang = await get_lang(session, call.from_user.id, state)
-    user = await get_person(session, call.from_user.id)
-    all_types_vpn = await get_type_vpn(session, user.group)
+    all_types_vpn = await get_type_vpn(session, user_ctx.group)
     if len(all_types_vpn) == 1:
         await state.clear()
         await edit_message(
@@ -580,13 +588,13 @@ async def choose_server_free(
     js: JetStreamContext,
     remove_key_subject: str,
     callback_data: ChooseTypeVpn,
-    state: FSMContext
+    state: FSMContext,
+    user_ctx: UserContext
 ) -> None:
     lang = await get_lang(session, call.from_user.id, state)
-    user = await get_person(session, call.from_user.id)
     try:
         all_active_location = await get_free_servers(
-            session, user.group, callback_data.type_vpn
+            session, user_ctx.group, callback_data.type_vpn
         )
     except FileNotFoundError:
         log.info('Not free servers -- OK')
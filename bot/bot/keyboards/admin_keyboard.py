@@ -1,7 +1,11 @@
 from aiogram.types import InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-from bot.misc.callbackData import BroadcastAction, BroadcastAudience
+from bot.misc.callbackData import (
+    BroadcastAction,
+    BroadcastAudience,
+    BroadcastJobAction,
+)
 from bot.misc.language import Localization
 
 _ = Localization.text
@@ -60,6 +64,14 @@ async def admin_dashboard_keyboard(lang: str) -> InlineKeyboardMarkup:
         text=_t("admin_dash_btn_migration", lang, "🔄 Миграция"),
         callback_data="admin_dash:migration",
     )
+    kb.button(
+        text=_t("admin_dash_btn_db", lang, "🐢 Медленные запросы"),
+        callback_data="admin_dash:db",
+    )
+    kb.button(
+        text=_t("admin_dash_btn_refresh", lang, "🔃 Обновить метрики"),
+        callback_data="admin_dash:refresh",
+    )
     kb.adjust(1)
     return kb.as_markup()
 
@@ -266,3 +278,26 @@ async def broadcast_confirm_keyboard(lang: str) -> InlineKeyboardMarkup:
     )
     kb.adjust(2, 1, 1)
     return kb.as_markup()
+
+
+async def broadcast_progress_keyboard(
+    lang: str,
+    job_id: int,
+    running: bool,
+) -> InlineKeyboardMarkup:
+    kb = InlineKeyboardBuilder()
+    if running:
+        kb.button(
+            text=_t("admin_broadcast_refresh_btn", lang, "🔄 Обновить"),
+            callback_data=BroadcastJobAction(action="refresh", job_id=job_id),
+        )
+        kb.button(
+            text=_t("admin_broadcast_stop_btn", lang, "⛔ Остановить"),
+            callback_data=BroadcastJobAction(action="cancel", job_id=job_id),
+        )
+    kb.button(
+        text=_t("admin_broadcast_back_admin_btn", lang, "⬅️ В админ-панель"),
+        callback_data="admin_dash:home",
+    )
+    kb.adjust(2, 1)
+    return kb.as_markup()
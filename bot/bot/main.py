@@ -15,6 +15,7 @@ from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from bot.database import engine
 from bot.filters.is_private import PrivateFilter
+from bot.handlers.other.chat_member import chat_member_router
 from bot.handlers.other.main import other_router
 from bot.handlers.user.edit_or_get_key import get_key_router
 from bot.handlers.user.main import user_router, registered_router
@@ -26,20 +27,56 @@ from bot.middlewares.update_logging import (
     UpdateLoggingMiddleware,
 )
 from bot.middlewares.conversion_events import ConversionEventsMiddleware
+from bot.middlewares.user_context import (
+    PersonContextMiddleware,
+    QueryCountMiddleware,
+)
 from bot.misc.commands import set_commands
 from bot.misc.loop import (
     loop as scheduler_loop_job,
     daily_expiry_notifications,
 )
 from bot.misc.distributed_lock import LockAcquireError, distributed_lock
+from bot.misc.job_runner import locked_job
+from bot.misc.language import Localization
 from bot.misc.nats_connect import connect_to_nats
+from bot.misc.update_stream import ShardedUpdateConsumer
 from bot.misc.util import CONFIG
+from bot.misc.VPN.ServerManager import close_panel_clients
 from bot.services.backup_service import send_dump
+from bot.services.broadcast_job_service import (
+    BROADCAST_JOB_INTERVAL_SEC,
+    run_broadcast_jobs,
+)
+from bot.services.expiry_sync_service import (
+    EXPIRY_SYNC_INTERVAL_SEC,
+    sync_expiries,
+)
+from bot.services.key_pool_service import (
+    KEY_POOL_INTERVAL_SEC,
+    top_up_key_pools,
+)
+from bot.services.metrics_snapshot_service import (
+    METRICS_SNAPSHOT_INTERVAL_SEC,
+    refresh_dashboard_metrics,
+)
+from bot.services.panel_reconciliation_service import (
+    RECONCILE_INTERVAL_SEC as PANEL_RECONCILE_INTERVAL_SEC,
+    reconcile_panels,
+)
+from bot.services.payment_reconciliation_service import (
+    RECONCILE_INTERVAL_SEC,
+    reconcile_payments,
+)
 from bot.services.server_control_service import server_control_manager
 from bot.webhooks import app as fastapi_app
 
 log = logging.getLogger(__name__)
 
+# daily_expiry_notifications is idempotent per day; polling it lets another
+# replica finish the shards of one that crashed.
+DAILY_EXPIRY_CHECK_SEC = 300
+
 
 async def run_polling_with_retries(
     dp: Dispatcher,
@@ -91,6 +128,7 @@ async def run_polling_with_retries(
 
 async def start_bot():
     shutdown_event = asyncio.Event()
+    Localization.preload()
     bot = Bot(
         token=CONFIG.tg_token,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
@@ -100,11 +138,18 @@ async def start_bot():
     nc, js = await connect_to_nats(servers=CONFIG.nats_servers)
     log.info("event=startup.nats_connected servers=%s", CONFIG.nats_servers)
 
-    # ── Distributed single-instance lock ─────────────────────────────────────
-    # Prevents two bot processes from running simultaneously across hosts/pods.
-    # wait_timeout=0 → non-blocking: fail fast if another instance is live.
-    # ttl=60 → stale lock cleared after 60 s if this process crashes hard.
     try:
+        if CONFIG.telegram_mode == 'webhook':
+            # Any number of replicas may run; updates are sharded through
+            # NATS and scheduler jobs take per-job locks.
+            log.info("event=startup.mode mode=webhook shards=%d", CONFIG.update_shards)
+            await _run_bot_inner(shutdown_event, bot, js)
+            return
+        # ── Distributed single-instance lock ─────────────────────────────────
+        # Prevents two polling processes from running simultaneously across
+        # hosts/pods.
+        # wait_timeout=0 → non-blocking: fail fast if another instance is live.
+        # ttl=60 → stale lock cleared after 60 s if this process crashes hard.
         try:
             async with distributed_lock(js, "bot-instance", ttl=60, wait_timeout=0):
                 log.info("event=startup.distributed_lock_acquired")
@@ -124,6 +169,21 @@ async def start_bot():
     return
 
 
+async def register_webhook(dp: Dispatcher, bot: Bot, js) -> None:
+    """Point Telegram at this deployment; one replica does it per rollout."""
+    try:
+        async with distributed_lock(js, "bot-webhook-setup", ttl=60, wait_timeout=0):
+            await bot.set_webhook(
+                url=f"{CONFIG.webhook_base_url}{CONFIG.webhook_path}",
+                secret_token=CONFIG.webhook_secret,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+            await set_commands(bot)
+            log.info("event=startup.webhook_registered path=%s", CONFIG.webhook_path)
+    except LockAcquireError:
+        log.info("event=startup.webhook_registration_skipped reason=locked")
+
+
 async def _run_bot_inner(shutdown_event, bot, js):
     dp = Dispatcher(
         storage=RedisStorage.from_url(CONFIG.redis_url),
@@ -136,6 +196,9 @@ async def _run_bot_inner(shutdown_event, bot, js):
         admin_router,
         other_router
     )
+    if CONFIG.check_follow:
+        # Subscribing to chat_member updates keeps the follow cache fresh.
+        dp.include_router(chat_member_router)
     dp.message.filter(PrivateFilter())
 
     if CONFIG.import_bd:
@@ -147,39 +210,99 @@ async def _run_bot_inner(shutdown_event, bot, js):
         engine_instance,
         expire_on_commit=False
     )
+    dp.update.outer_middleware(QueryCountMiddleware())
     dp.update.outer_middleware(DbSessionMiddleware(sessionmaker))
+    dp.update.outer_middleware(PersonContextMiddleware())
     dp.update.outer_middleware(UpdateLoggingMiddleware())
     dp.update.outer_middleware(ConversionEventsMiddleware())
     dp.message.middleware(RouteLoggingMiddleware())
     dp.callback_query.middleware(RouteLoggingMiddleware())
     scheduler = AsyncIOScheduler(timezone="Europe/Moscow")
 
-    await set_commands(bot)
+    webhook_mode = CONFIG.telegram_mode == 'webhook'
+    if not webhook_mode:
+        await set_commands(bot)
+    # Every replica schedules every job; locked_job/run_sharded make sure
+    # each tick (or each Persons.id shard) is executed by one of them.
     scheduler.add_job(
-        scheduler_loop_job,
+        locked_job(js, 'expiry_tick', scheduler_loop_job, min_interval=30),
         "interval",
         seconds=60,
         args=(bot,sessionmaker, js, CONFIG.nats_remove_consumer_subject)
     )
     scheduler.add_job(
         daily_expiry_notifications,
-        CronTrigger(hour=10, minute=0, timezone='UTC'),
-        args=(bot, sessionmaker),
+        "interval",
+        seconds=DAILY_EXPIRY_CHECK_SEC,
+        args=(bot, sessionmaker, js),
         replace_existing=True,
     )
     scheduler.add_job(
-        send_dump,
+        locked_job(js, 'send_dump', send_dump, min_interval=3600),
         CronTrigger(hour=0, minute=0),
         args=(bot,),
         replace_existing=True,
     )
     scheduler.add_job(
-        server_control_manager,
+        locked_job(
+            js, 'server_control', server_control_manager, min_interval=450
+        ),
         "interval",
         seconds=900,
         args=(bot, sessionmaker),
         replace_existing=True
     )
+    scheduler.add_job(
+        locked_job(js, 'payment_reconcile', reconcile_payments),
+        "interval",
+        seconds=RECONCILE_INTERVAL_SEC,
+        args=(bot, sessionmaker),
+        max_instances=1,
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        locked_job(js, 'broadcast_jobs', run_broadcast_jobs),
+        "interval",
+        seconds=BROADCAST_JOB_INTERVAL_SEC,
+        args=(bot, sessionmaker),
+        max_instances=1,
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        locked_job(js, 'metrics_snapshot', refresh_dashboard_metrics),
+        "interval",
+        seconds=METRICS_SNAPSHOT_INTERVAL_SEC,
+        args=(sessionmaker,),
+        max_instances=1,
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        locked_job(js, 'key_pool', top_up_key_pools),
+        "interval",
+        seconds=KEY_POOL_INTERVAL_SEC,
+        args=(sessionmaker,),
+        max_instances=1,
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        locked_job(js, 'expiry_sync', sync_expiries),
+        "interval",
+        seconds=EXPIRY_SYNC_INTERVAL_SEC,
+        args=(sessionmaker,),
+        max_instances=1,
+        replace_existing=True,
+    )
+    scheduler.add_job(
+        locked_job(
+            js, 'panel_reconcile', reconcile_panels,
+            min_interval=PANEL_RECONCILE_INTERVAL_SEC / 2,
+        ),
+        "interval",
+        seconds=PANEL_RECONCILE_INTERVAL_SEC,
+        args=(sessionmaker,),
+        max_instances=1,
+        replace_existing=True,
+    )
     logging.getLogger('apscheduler.executors.default').setLevel(
         logging.WARNING
     )
@@ -202,22 +325,42 @@ async def _run_bot_inner(shutdown_event, bot, js):
     wait_shutdown_task: asyncio.Task | None = None
     try:
         allowed_updates = dp.resolve_used_update_types()
-        log.info("event=startup.polling_ready allowed_updates=%s", allowed_updates)
-        # NATS consumer moved to standalone worker service (worker_main.py)
-        tasks = [
-            asyncio.create_task(
-                run_polling_with_retries(
-                    dp=dp,
-                    bot=bot,
-                    js=js,
-                    remove_key_subject=CONFIG.nats_remove_consumer_subject,
-                    allowed_updates=allowed_updates,
-                    shutdown_event=shutdown_event,
+        if webhook_mode:
+            log.info("event=startup.webhook_ready allowed_updates=%s", allowed_updates)
+            update_consumer = ShardedUpdateConsumer(
+                js,
+                dp,
+                bot,
+                workflow_data={
+                    'js': js,
+                    'remove_key_subject': CONFIG.nats_remove_consumer_subject,
+                },
+            )
+            await register_webhook(dp, bot, js)
+            tasks = [
+                asyncio.create_task(update_consumer.run(), name="update_consumer"),
+            ]
+        else:
+            # A webhook left over from webhook mode makes getUpdates fail.
+            await bot.delete_webhook()
+            log.info("event=startup.polling_ready allowed_updates=%s", allowed_updates)
+            tasks = [
+                asyncio.create_task(
+                    run_polling_with_retries(
+                        dp=dp,
+                        bot=bot,
+                        js=js,
+                        remove_key_subject=CONFIG.nats_remove_consumer_subject,
+                        allowed_updates=allowed_updates,
+                        shutdown_event=shutdown_event,
+                    ),
+                    name="polling",
                 ),
-                name="polling",
-            ),
-            asyncio.create_task(run_fastapi(bot, sessionmaker, js), name="fastapi"),
-        ]
+            ]
+        # NATS consumer moved to standalone worker service (worker_main.py)
+        tasks.append(
+            asyncio.create_task(run_fastapi(bot, sessionmaker, js), name="fastapi")
+        )
         wait_shutdown_task = asyncio.create_task(shutdown_event.wait(), name="shutdown_wait")
         done, pending = await asyncio.wait(
             [*tasks, wait_shutdown_task],
@@ -247,6 +390,7 @@ async def _run_bot_inner(shutdown_event, bot, js):
             log.info("event=scheduler.stopped")
         await engine_instance.dispose()
         log.info("event=shutdown.db_disposed")
+        await close_panel_clients()
 
 
 async def run_fastapi(bot: Bot, session_maker: async_sessionmaker, js):
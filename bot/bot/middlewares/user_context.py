@@ -0,0 +1,74 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+from prometheus_client import Histogram
+
+from bot.database.db_logging import count_queries
+from bot.misc.user_context import (
+    UserContext,
+    reset_user_context,
+    set_user_context,
+)
+
+log = logging.getLogger(__name__)
+
+UPDATE_DB_QUERIES = Histogram(
+    'telegram_update_db_queries',
+    'SQL statements executed while handling one Telegram update',
+    ['event_type'],
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50),
+)
+
+
+class QueryCountMiddleware(BaseMiddleware):
+    """Observe how many statements each update costs; register first."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not isinstance(event, Update):
+            return await handler(event, data)
+        event_type = getattr(event, 'event_type', None) or 'unknown'
+        with count_queries() as counter:
+            try:
+                return await handler(event, data)
+            finally:
+                UPDATE_DB_QUERIES.labels(event_type=event_type).observe(
+                    counter.count
+                )
+                log.debug(
+                    'event=update.db_queries id=%s type=%s count=%d',
+                    event.update_id,
+                    event_type,
+                    counter.count,
+                )
+
+
+class PersonContextMiddleware(BaseMiddleware):
+    """Resolve the sender once per update into ``data['user_ctx']``.
+
+    Must run after DbSessionMiddleware; see bot/misc/user_context.py.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get('event_from_user')
+        session = data.get('session')
+        if user is None or session is None:
+            return await handler(event, data)
+        ctx = await UserContext.load(session, user.id)
+        data['user_ctx'] = ctx
+        token = set_user_context(ctx)
+        try:
+            return await handler(event, data)
+        finally:
+            reset_user_context(token)
@@ -1,4 +1,3 @@
-import asyncio
 import logging
 
 from aiocryptopay import AioCryptoPay, Networks
@@ -13,6 +12,7 @@ _ = Localization.text
 
 
 class CryptoBot(PaymentSystem):
+    NAME = 'CryptoBot'
     CRYPTO: type(AioCryptoPay)
 
     def __init__(
@@ -32,51 +32,54 @@ class CryptoBot(PaymentSystem):
             id_prot, id_loc,
             price, month_count
         )
-        self.CRYPTO = AioCryptoPay(
+        self.CRYPTO = self._client(config)
+
+    @staticmethod
+    def _client(config) -> AioCryptoPay:
+        return AioCryptoPay(
             token=config.crypto_bot_api,
             network=Networks.MAIN_NET
         )
 
-    async def check_pay_wallet(self, order):
-        tic = 0
-        while tic < self.CHECK_PERIOD:
-            order_preview = await self.CRYPTO.get_invoices(
-                invoice_ids=order.invoice_id
+    @classmethod
+    async def paid_invoices(cls, config, invoice_ids):
+        client = cls._client(config)
+        try:
+            invoices = await client.get_invoices(
+                invoice_ids=[int(invoice_id) for invoice_id in invoice_ids]
             )
-            if order_preview.status == "paid":
-                await self.successful_payment(
-                    self.price,
-                    'CryptoBot'
-                )
-                return
-            tic += self.STEP
-            await asyncio.sleep(self.STEP)
-            if self.CHECK_PERIOD - tic <= self.TIME_DELETE:
-                await self.delete_pay_button('CryptoBot')
-        await self.CRYPTO.delete_invoice(
-            invoice_id=order.invoice_id
-        )
-        return
+        finally:
+            await client.close()
+        return {
+            str(invoice.invoice_id)
+            for invoice in invoices or []
+            if invoice.status == "paid"
+        }
+
+    @classmethod
+    async def cancel_invoices(cls, config, invoice_ids):
+        client = cls._client(config)
+        try:
+            for invoice_id in invoice_ids:
+                await client.delete_invoice(invoice_id=int(invoice_id))
+        finally:
+            await client.close()
 
     async def to_pay(self):
-        order = await self.CRYPTO.create_invoice(
-            amount=self.price,
-            fiat='RUB',
-            currency_type='fiat'
-        )
+        try:
+            order = await self.CRYPTO.create_invoice(
+                amount=self.price,
+                fiat='RUB',
+                currency_type='fiat'
+            )
+        finally:
+            await self.CRYPTO.close()
         await self.pay_button(order.mini_app_invoice_url, webapp=False)
         log.info(
             f'Create payment link CryptoBot '
             f'User: ID: {self.user_id}'
         )
-        try:
-            await self.check_pay_wallet(order)
-        except BaseException as e:
-            log.error(e, 'The payment period has expired')
-        finally:
-            await self.delete_pay_button('CryptoBot')
-            await self.CRYPTO.close()
-            log.info('exit check payment CryptoBot')
+        await self.register_invoice(order.invoice_id)
 
     def __str__(self):
         return 'Платежная система CryptoBot'
@@ -15,6 +15,7 @@ _ = Localization.text
 
 
 class Cryptomus(PaymentSystem):
+    NAME = 'Cryptomus'
     PAYMENT: Payment
     ID: str
 
@@ -52,23 +53,18 @@ class Cryptomus(PaymentSystem):
             'lifetime': self.CHECK_PERIOD - 30,
         }
 
-    async def check_pay_wallet(self, uuid_order):
-        tic = 0
-        while tic < self.CHECK_PERIOD:
-            order_info = self.PAYMENT.info(
-                {'uuid': uuid_order}
+    @classmethod
+    async def paid_invoices(cls, config, invoice_ids):
+        client = Client.payment(config.cryptomus_key, config.cryptomus_uuid)
+
+        async def is_paid(uuid_order):
+            # The SDK is synchronous; keep its HTTP call off the event loop.
+            order_info = await asyncio.to_thread(
+                client.info, {'uuid': uuid_order}
             )
-            if order_info['status'] == "paid":
-                await self.successful_payment(
-                    self.price,
-                    'Cryptomus'
-                )
-                return
-            tic += self.STEP
-            await asyncio.sleep(self.STEP)
-            if self.CHECK_PERIOD - tic <= self.TIME_DELETE:
-                await self.delete_pay_button('Cryptomus')
-        return
+            return order_info['status'] == "paid"
+
+        return await cls._paid_by_lookup(invoice_ids, is_paid)
 
     async def to_pay(self):
         await self.create_id()
@@ -79,19 +75,14 @@ class Cryptomus(PaymentSystem):
             f'Create payment link Cryptomus '
             f'User: ID: {self.user_id}'
         )
-        try:
-            await self.check_pay_wallet(result['uuid'])
-        except BaseException as e:
-            log.error(e, 'The payment period has expired')
-        finally:
-            await self.delete_pay_button('Cryptomus')
-            log.info('exit check payment Cryptomus')
+        await self.register_invoice(result['uuid'])
 
     def __str__(self):
         return 'Платежная система Cryptomus'
 
 
 class Heleket(PaymentSystem):
+    NAME = 'Heleket'
     PAYMENT: Payment
     ID: str
 
@@ -129,23 +120,18 @@ class Heleket(PaymentSystem):
             'lifetime': self.CHECK_PERIOD - 30,
         }
 
-    async def check_pay_wallet(self, uuid_order):
-        tic = 0
-        while tic < self.CHECK_PERIOD:
-            order_info = self.PAYMENT.info(
-                {'uuid': uuid_order}
+    @classmethod
+    async def paid_invoices(cls, config, invoice_ids):
+        client = Client.payment(config.heleket_key, config.heleket_uuid)
+        client.requestBuilder.api_url = 'https://api.heleket.com/'
+
+        async def is_paid(uuid_order):
+            order_info = await asyncio.to_thread(
+                client.info, {'uuid': uuid_order}
             )
-            if order_info['status'] == "paid":
-                await self.successful_payment(
-                    self.price,
-                    'Heleket'
-                )
-                return
-            tic += self.STEP
-            await asyncio.sleep(self.STEP)
-            if self.CHECK_PERIOD - tic <= self.TIME_DELETE:
-                await self.delete_pay_button('Heleket')
-        return
+            return order_info['status'] == "paid"
+
+        return await cls._paid_by_lookup(invoice_ids, is_paid)
 
     async def to_pay(self):
         await self.create_id()
@@ -156,13 +142,7 @@ class Heleket(PaymentSystem):
             f'Create payment link Heleket '
             f'User: ID: {self.user_id}'
         )
-        try:
-            await self.check_pay_wallet(result['uuid'])
-        except BaseException as e:
-            log.error('The payment period has expired', exc_info=e)
-        finally:
-            await self.delete_pay_button('Heleket')
-            log.info('exit check payment Heleket')
+        await self.register_invoice(result['uuid'])
 
     def __str__(self):
         return 'Платежная система Heleket'
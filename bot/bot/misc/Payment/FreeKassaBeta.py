@@ -1,4 +1,3 @@
-import asyncio
 import logging
 import uuid
 
@@ -52,13 +51,6 @@ class FreeKassa(PaymentSystem):
         list_p = self.FK.create_order(payment_system_id, email, ip, amount)
         return list_p
 
-    async def check_payment(self):
-        tic = 0
-        while tic < self.CHECK_PERIOD:
-
-            await asyncio.sleep(self.STEP)
-        return
-
     async def to_pay(self):
         await self.message.delete()
         await self.create_id()
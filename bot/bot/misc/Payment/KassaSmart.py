@@ -16,6 +16,8 @@ _ = Localization.text
 
 
 class KassaSmart(PaymentSystem):
+    NAME = 'YooKassaSmart'
+    RECURRING = True
     CHECK_ID: str = None
     ID: str = None
     EMAIL: str
@@ -47,24 +49,16 @@ class KassaSmart(PaymentSystem):
     async def create(self):
         self.ID = str(uuid.uuid4())
 
-    async def check_payment(self):
-        Configuration.account_id = self.ACCOUNT_ID
-        Configuration.secret_key = self.SECRET_KEY
-        tic = 0
-        while tic < self.CHECK_PERIOD:
-            res = await Payment.find_one(self.ID)
-            if res.status == 'succeeded':
-                await self.successful_payment(
-                    self.price,
-                    'YooKassaSmart',
-                    id_payment=self.ID
-                )
-                return
-            tic += self.STEP
-            await asyncio.sleep(self.STEP)
-            if self.CHECK_PERIOD - tic <= self.TIME_DELETE:
-                await self.delete_pay_button('YooKassaSmart')
-        return
+    @classmethod
+    async def paid_invoices(cls, config, invoice_ids):
+        Configuration.account_id = int(config.yookassa_shop_id)
+        Configuration.secret_key = config.yookassa_secret_key
+
+        async def is_paid(payment_id):
+            res = await Payment.find_one(payment_id)
+            return res.status == 'succeeded'
+
+        return await cls._paid_by_lookup(invoice_ids, is_paid)
 
     async def invoice(self, lang_user):
         bot = await self.message.bot.me()
@@ -151,13 +145,7 @@ class KassaSmart(PaymentSystem):
             f'Create payment link YooKassaSmart '
             f'User: (ID: {self.user_id}'
         )
-        try:
-            await self.check_payment()
-        except BaseException as e:
-            log.error('The payment period has expired', exc_info=e)
-        finally:
-            await self.delete_pay_button('YooKassaSmart')
-            log.info('exit check payment YooKassaSmart')
+        await self.register_invoice(self.ID)
 
     def __str__(self):
         return 'YooKassaSmart payment system'
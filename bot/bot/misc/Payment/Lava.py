@@ -1,4 +1,3 @@
-import asyncio
 import logging
 import uuid
 
@@ -13,6 +12,7 @@ _ = Localization.text
 
 
 class Lava(PaymentSystem):
+    NAME = 'Lava'
     CHECK_ID: str = None
     ID: str = None
 
@@ -57,18 +57,18 @@ class Lava(PaymentSystem):
         )
         return invoice
 
-    async def check_payment(self):
-        tic = 0
-        while tic < self.CHECK_PERIOD:
-            status = await self.CLIENT.check_invoice_status(order_id=self.ID)
-            if status.data.status == 'success':
-                await self.successful_payment(self.price, 'Lava')
-                return
-            tic += self.STEP
-            await asyncio.sleep(self.STEP)
-            if self.CHECK_PERIOD - tic <= self.TIME_DELETE:
-                await self.delete_pay_button('Lava')
-        return
+    @classmethod
+    async def paid_invoices(cls, config, invoice_ids):
+        client = LavaBusinessClient(
+            private_key=config.lava_token_secret,
+            shop_id=config.lava_id_project
+        )
+
+        async def is_paid(order_id):
+            status = await client.check_invoice_status(order_id=order_id)
+            return status.data.status == 'success'
+
+        return await cls._paid_by_lookup(invoice_ids, is_paid)
 
     async def to_pay(self):
         await self.create_id()
@@ -78,13 +78,7 @@ class Lava(PaymentSystem):
             f'Create payment link Lava '
             f'User: ID: {self.user_id}'
         )
-        try:
-            await self.check_payment()
-        except BaseException as e:
-            log.error(e, 'The payment period has expired')
-        finally:
-            await self.delete_pay_button('Lava')
-            log.info('exit check payment Lava')
+        await self.register_invoice(self.ID)
 
     def __str__(self):
         return 'Lava payment system'
@@ -1,4 +1,3 @@
-import asyncio
 import logging
 import uuid
 
@@ -13,7 +12,7 @@ _ = Localization.text
 
 
 class TinkoffPay(PaymentSystem):
-
+    NAME = 'TinkoffPay'
     CLIENT: TinkoffAcquiringAPIClient
 
     def __init__(
@@ -44,21 +43,17 @@ class TinkoffPay(PaymentSystem):
             description=_('description_payment', lang_user),
         )
 
-    async def check_pay_wallet(self, payment_id):
-        tic = 0
-        while tic < self.CHECK_PERIOD:
-            order_preview = await self.CLIENT.get_payment_state(payment_id)
-            if order_preview['Status'] == "CONFIRMED":
-                await self.successful_payment(
-                    self.price,
-                    'TinkoffPay'
-                )
-                return
-            tic += self.STEP
-            await asyncio.sleep(self.STEP)
-            if self.CHECK_PERIOD - tic <= self.TIME_DELETE:
-                await self.delete_pay_button('TinkoffPay')
-        return
+    @classmethod
+    async def paid_invoices(cls, config, invoice_ids):
+        client = TinkoffAcquiringAPIClient(
+            config.tinkoff_terminal_key, config.tinkoff_secret
+        )
+
+        async def is_paid(payment_id):
+            state = await client.get_payment_state(payment_id)
+            return state['Status'] == "CONFIRMED"
+
+        return await cls._paid_by_lookup(invoice_ids, is_paid)
 
     async def to_pay(self):
         lang_user = await get_lang(self.session, self.user_id)
@@ -70,13 +65,7 @@ class TinkoffPay(PaymentSystem):
             f'Create payment link TinkoffPay '
             f'User: ID: {self.user_id}'
         )
-        try:
-            await self.check_pay_wallet(payment_id)
-        except BaseException as e:
-            log.error(e, 'The payment period has expired')
-        finally:
-            await self.delete_pay_button('TinkoffPay')
-            log.info('exit check payment TinkoffPay')
+        await self.register_invoice(payment_id)
 
     def __str__(self):
         return 'Платежная система TinkoffPay'
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from datetime import datetime, timezone, timedelta
 
@@ -11,6 +12,7 @@ from bot.database.methods.get import (
     get_free_server_id,
     get_first_marzban_server,
     get_payment_servers,
+    get_payment_step,
     get_server_id,
     get_key_id,
     get_key_user,
@@ -18,9 +20,11 @@ from bot.database.methods.get import (
 )
 from bot.database.methods.insert import (
     add_payment,
+    add_pending_payment,
     add_donate,
     add_key,
     add_referral_bonus,
+    stage_payment_step,
 )
 from bot.database.methods.update import (
     add_time_key,
@@ -29,6 +33,12 @@ from bot.database.methods.update import (
     server_space_update,
     update_server_key, update_key_wg,
 )
+from bot.database.models.main import (
+    PAYMENT_STEP_DONATE,
+    PAYMENT_STEP_KEY_EXTENDED,
+    PAYMENT_STEP_KEY_ISSUED,
+    PAYMENT_STEP_REFERRAL_BONUS,
+)
 from bot.handlers.user.edit_or_get_key import get_img_type_vpn
 
 from bot.keyboards.inline.user_inline import (
@@ -40,6 +50,7 @@ from bot.misc.VPN.ServerManager import ServerManager
 from bot.misc.language import Localization, get_lang
 from bot.misc.tariffs import get_paid_data_limit_gb
 from bot.misc.util import CONFIG
+from bot.services.key_pool_service import issue_pooled_key
 from bot.services.migration_service import MIGRATION_STATUS_MIGRATED
 from bot.services.file_service import str_to_file
 from bot.services.message_render_service import edit_message
@@ -52,11 +63,19 @@ _ = Localization.text
 
 class PaymentSystem:
     TOKEN: str
+    # Provider name stored in Payments.payment_system.
+    NAME: str = None
+    # How long an invoice is watched by payment_reconciliation_service.
     CHECK_PERIOD = 50 * 60
     STEP = 5
-    TIME_DELETE: int = 5 * 60
+    # Parallel status requests for providers without a batch lookup.
+    STATUS_CONCURRENCY = 10
+    # Keys remember the provider payment id so it can be charged again
+    # (see loop.auto_pay_yookassa).
+    RECURRING = False
     TYPE_PAYMENT: str
     KEY_ID: int
+    INVOICE_ID: str = None
     MESSAGE_ID_PAYMENT: Message = None
     session: AsyncSession = None
 
@@ -86,6 +105,69 @@ class PaymentSystem:
     async def to_pay(self):
         raise NotImplementedError()
 
+    async def register_invoice(self, invoice_id):
+        """Hand the invoice over to payment_reconciliation_service.
+
+        Call after pay_button: the stored message id lets the sweep remove
+        the button once the invoice is paid or expired.
+        """
+        self.INVOICE_ID = str(invoice_id)
+        message_id = getattr(self.MESSAGE_ID_PAYMENT, 'message_id', None)
+        await add_pending_payment(
+            self.session,
+            self.user_id,
+            self.price,
+            self.NAME,
+            self.INVOICE_ID,
+            expires_at=datetime.now() + timedelta(seconds=self.CHECK_PERIOD),
+            month_count=self.month_count,
+            type_pay=self.TYPE_PAYMENT,
+            key_id=self.KEY_ID,
+            id_prot=self.ID_PROT,
+            id_loc=self.ID_LOC,
+            message_id=message_id,
+        )
+        log.info(
+            'event=payment.invoice_registered user_id=%s payment=%s invoice_id=%s',
+            self.user_id,
+            self.NAME,
+            self.INVOICE_ID,
+        )
+
+    @classmethod
+    async def paid_invoices(cls, config, invoice_ids: list[str]) -> set[str]:
+        """Ids among *invoice_ids* the provider reports as paid.
+
+        Providers that confirm through a webhook keep this default.
+        """
+        return set()
+
+    @classmethod
+    async def cancel_invoices(cls, config, invoice_ids: list[str]) -> None:
+        """Called for invoices that expired unpaid."""
+        return None
+
+    @classmethod
+    async def _paid_by_lookup(cls, invoice_ids, is_paid) -> set[str]:
+        """Run ``is_paid(invoice_id)`` for every id, a few at a time."""
+        semaphore = asyncio.Semaphore(cls.STATUS_CONCURRENCY)
+
+        async def check(invoice_id):
+            async with semaphore:
+                try:
+                    return invoice_id if await is_paid(invoice_id) else None
+                except Exception as e:
+                    log.warning(
+                        'event=payment.status_failed payment=%s invoice_id=%s',
+                        cls.NAME,
+                        invoice_id,
+                        exc_info=e,
+                    )
+                    return None
+
+        results = await asyncio.gather(*(check(i) for i in invoice_ids))
+        return {invoice_id for invoice_id in results if invoice_id is not None}
+
     async def pay_button(self, link_pay, delete=True, webapp=False):
         lang_user = await get_lang(self.session, self.user_id)
         if delete:
@@ -139,16 +221,17 @@ class PaymentSystem:
             f'Type payment {self.TYPE_PAYMENT}'
         )
         lang_user = await get_lang(self.session, self.user_id)
+        invoice_id = id_payment or self.INVOICE_ID
         await add_payment(
             self.session,
             self.user_id,
             total_amount,
             name_payment,
-            id_payment=id_payment,
+            id_payment=invoice_id,
             month_count=self.month_count
         )
         person = await get_person(self.session, self.user_id)
-        await self._process_referral_cashback(person, id_payment)
+        await self._process_referral_cashback(person, id_payment, invoice_id)
         await self._notify_admin_payment(person, total_amount)
         if self.TYPE_PAYMENT == CONFIG.type_payment.get(0):
             await self.message.answer(
@@ -171,30 +254,48 @@ class PaymentSystem:
             extension_seconds = self.month_count * CONFIG.COUNT_SECOND_MOTH
             created_new_key = False
             key = None
-            if int(server.type_vpn) == CONFIG.TypeVpn.MARZBAN.value:
-                key = await self._get_user_best_marzban_key(person.tgid)
-            if key is not None:
-                key = await self._extend_or_renew_existing_key(
-                    key=key,
-                    extension_seconds=extension_seconds,
-                    id_payment=id_payment,
-                    server_id=server.id,
-                )
+            issued = await self._step_done(invoice_id, PAYMENT_STEP_KEY_ISSUED)
+            if issued is not None:
+                # A retried fulfilment: the key is already paid for.
+                key = await get_key_id(self.session, issued.key_id)
+                server = key.server_table
                 log.info(
-                    'event=payment.marzban_key_reused user_id=%s key_id=%s server_id=%s',
+                    'event=payment.key_already_issued user_id=%s key_id=%s',
                     self.user_id,
                     key.id,
-                    server.id,
                 )
             else:
-                key = await add_key(
-                    self.session,
-                    person.tgid,
-                    extension_seconds,
-                    id_payment=id_payment,
-                    server_id=server.id
-                )
-                created_new_key = True
+                if int(server.type_vpn) == CONFIG.TypeVpn.MARZBAN.value:
+                    key = await self._get_user_best_marzban_key(person.tgid)
+                if key is not None:
+                    self._stage_step(
+                        invoice_id, PAYMENT_STEP_KEY_ISSUED, key.id
+                    )
+                    key = await self._extend_or_renew_existing_key(
+                        key=key,
+                        extension_seconds=extension_seconds,
+                        id_payment=id_payment,
+                        server_id=server.id,
+                    )
+                    log.info(
+                        'event=payment.marzban_key_reused user_id=%s key_id=%s server_id=%s',
+                        self.user_id,
+                        key.id,
+                        server.id,
+                    )
+                else:
+                    key = await add_key(
+                        self.session,
+                        person.tgid,
+                        extension_seconds,
+                        id_payment=id_payment,
+                        server_id=server.id
+                    )
+                    self._stage_step(
+                        invoice_id, PAYMENT_STEP_KEY_ISSUED, key.id
+                    )
+                    await self.session.commit()
+                    created_new_key = True
             try:
                 download = await self.message.answer(
                     _('download', lang_user)
@@ -206,7 +307,15 @@ class PaymentSystem:
                     self.session,
                     key.server_table.id
                 )
-                if key.server_table.type_vpn == CONFIG.TypeVpn.WIREGUARD.value:
+                pooled_config = await issue_pooled_key(
+                    self.session,
+                    server_manager,
+                    key,
+                    get_paid_data_limit_gb(self.month_count),
+                )
+                if pooled_config is not None:
+                    config = pooled_config
+                elif key.server_table.type_vpn == CONFIG.TypeVpn.WIREGUARD.value:
                     config = await server_manager.get_key(
                         key.wg_public_key,
                         name_key=name_location,
@@ -223,14 +332,15 @@ class PaymentSystem:
                         subscription_timestamp=key.subscription,
                         limit_gb=get_paid_data_limit_gb(self.month_count),
                     )
-                server_parameters = await server_manager.get_all_user()
-                server_users_count = len(server_parameters) if server_parameters is not None else 0
-
-                await server_space_update(
-                    self.session,
-                    server.id,
-                    server_users_count
-                )
+                # A spare already counted towards the server's load.
+                if pooled_config is None:
+                    server_users_count = await server_manager.count_users() or 0
+
+                    await server_space_update(
+                        self.session,
+                        server.id,
+                        server_users_count
+                    )
             except Exception as e:
                 if created_new_key:
                     await update_server_key(self.session, key.id)
@@ -263,12 +373,18 @@ class PaymentSystem:
             )
             await self.send_admin_new_pay(person)
         elif self.TYPE_PAYMENT == CONFIG.type_payment.get(1):
-            await add_time_key(
-                self.session,
-                int(self.KEY_ID),
-                self.month_count * CONFIG.COUNT_SECOND_MOTH,
-                id_payment=id_payment
-            )
+            if await self._step_done(
+                invoice_id, PAYMENT_STEP_KEY_EXTENDED
+            ) is None:
+                self._stage_step(
+                    invoice_id, PAYMENT_STEP_KEY_EXTENDED, int(self.KEY_ID)
+                )
+                await add_time_key(
+                    self.session,
+                    int(self.KEY_ID),
+                    self.month_count * CONFIG.COUNT_SECOND_MOTH,
+                    id_payment=id_payment
+                )
             await self.message.answer(
                 _('payment_success_extend', lang_user)
                 .format(total_month=self.month_count)
@@ -292,7 +408,9 @@ class PaymentSystem:
             )
             return
         elif self.TYPE_PAYMENT == CONFIG.type_payment.get(2):
-            await add_donate(self.session, person.username, self.price)
+            if await self._step_done(invoice_id, PAYMENT_STEP_DONATE) is None:
+                self._stage_step(invoice_id, PAYMENT_STEP_DONATE)
+                await add_donate(self.session, person.username, self.price)
             await self.message.answer(
                 _('donate_successful', lang_user)
             )
@@ -548,7 +666,23 @@ class PaymentSystem:
         await self.session.commit()
         return await get_key_id(self.session, key.id)
 
-    async def _process_referral_cashback(self, person, payment_id: str | None):
+    async def _step_done(self, invoice_id: str | None, step: str):
+        """The record of *step* if it already took effect for this invoice
+        (an earlier attempt of a retried fulfilment), else None."""
+        if invoice_id is None:
+            return None
+        return await get_payment_step(self.session, invoice_id, step)
+
+    def _stage_step(
+        self, invoice_id: str | None, step: str, key_id: int | None = None
+    ) -> None:
+        """Record *step* with the next commit, the one of its own write."""
+        if invoice_id is not None:
+            stage_payment_step(self.session, invoice_id, step, key_id)
+
+    async def _process_referral_cashback(
+        self, person, payment_id: str | None, invoice_id: str | None = None
+    ):
         if person is None or person.referral_user_tgid is None:
             return
         referrer_id = int(person.referral_user_tgid)
@@ -557,11 +691,18 @@ class PaymentSystem:
         bonus_days = 3
         bonus_seconds = bonus_days * 24 * 60 * 60
         try:
+            if await self._step_done(
+                invoice_id, PAYMENT_STEP_REFERRAL_BONUS
+            ) is not None:
+                return
             ref_keys = await get_key_user(self.session, referrer_id)
             if not ref_keys:
                 return
             # Extend the key with the latest expiry to maximize bonus usefulness.
             best_key = max(ref_keys, key=lambda key: int(key.subscription or 0))
+            self._stage_step(
+                invoice_id, PAYMENT_STEP_REFERRAL_BONUS, best_key.id
+            )
             await add_time_key(
                 self.session,
                 best_key.id,
@@ -32,7 +32,9 @@ class AmneziaWGClient:
         Аутентификация и создание сессии.
         :return: bool
         """
-        self.session = aiohttp.ClientSession()
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        self.cookies = None
         payload = {
             "password": self.password,
             "remember": True
@@ -1,13 +1,14 @@
 import json
 
 from bot.misc.VPN.AmneziaWireGuardClients import AmneziaWGClient
-from bot.misc.VPN.BaseVpn import BaseVpn
+from bot.misc.VPN.BaseVpn import BaseVpn, BulkResult
 from bot.misc.util import CONFIG
 
 
 class AmneziaWG(BaseVpn):
     NAME_VPN = 'AmneziaWG 🐉'
     POST_FIX = 'am'
+    SESSION_TTL = 900
     client: AmneziaWGClient
 
     def __init__(self, server, timeout):
@@ -17,14 +18,39 @@ class AmneziaWG(BaseVpn):
         self.free_server = server.free_server
 
     async def login(self):
-        self.client = AmneziaWGClient(
-            url=self.url, password=self.password, timeout=30
-        )
+        # Re-authenticate on the existing aiohttp session instead of leaking
+        # a new one on every login.
+        if getattr(self, 'client', None) is None:
+            self.client = AmneziaWGClient(
+                url=self.url, password=self.password, timeout=30
+            )
         await self.client.authenticate()
 
+    def is_auth_error(self, exc: Exception) -> bool:
+        return isinstance(exc, RuntimeError) and 'Not logged in' in str(exc)
+
+    async def close(self):
+        client = getattr(self, 'client', None)
+        if client is not None:
+            await client.close()
+            client.session = None
+
     async def get_all_user_server(self):
         return await self.client.get_clients()
 
+    async def list_clients(self) -> dict[str, int | None]:
+        # get_clients() turns errors into an empty list, which would read
+        # as "every client is missing": request the listing directly.
+        client = self.client
+        async with client.session.get(
+            f'{client.api_url}/api/wireguard/client',
+            cookies=client.cookies,
+            timeout=client.timeout,
+        ) as resp:
+            resp.raise_for_status()
+            data = await resp.json()
+        return {item['name']: None for item in data if item.get('name')}
+
     async def get_client(self, name):
         return await self.client.get_client(name)
 
@@ -41,6 +67,40 @@ class AmneziaWG(BaseVpn):
             return await self.client.delete_client(client.id)
         return True
 
+    async def get_clients_bulk(self, names) -> BulkResult:
+        """Resolve all names from a single client listing."""
+        names = list(dict.fromkeys(names))
+        result = BulkResult()
+        try:
+            clients = {
+                client.name: client
+                for client in await self.client.get_clients()
+            }
+        except Exception as e:
+            for name in names:
+                result.add_failure(name, e)
+            return result
+        for name in names:
+            result.add_success(name, clients.get(name))
+        return result
+
+    async def delete_clients_bulk(self, names) -> BulkResult:
+        """List clients once, then delete the matching ids in parallel."""
+        lookup = await self.get_clients_bulk(names)
+        result = BulkResult(failed=dict(lookup.failed))
+        present = {}
+        for name, client in lookup.succeeded.items():
+            if client is None:
+                result.add_success(name, True)
+            else:
+                present[name] = client.id
+        deleted = await self._gather_bulk(
+            present, lambda name: self.client.delete_client(present[name])
+        )
+        result.succeeded.update(deleted.succeeded)
+        result.failed.update(deleted.failed)
+        return result
+
     async def get_user_devices(self, name):
         return None
 
@@ -1,10 +1,44 @@
+import asyncio
+import time
 from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Iterable
+
+
+@dataclass(slots=True)
+class BulkResult:
+    """Per-item outcome of a bulk panel operation, keyed by client name."""
+    succeeded: dict[str, Any] = field(default_factory=dict)
+    failed: dict[str, str] = field(default_factory=dict)
+
+    def add_success(self, name, value=None) -> None:
+        self.succeeded[name] = value
+
+    def add_failure(self, name, error) -> None:
+        if isinstance(error, Exception):
+            error = f'{type(error).__name__}: {error}'
+        self.failed[name] = str(error)
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
 
 
 class BaseVpn(ABC):
 
     NAME_VPN: str
     POST_FIX: str
+    # Seconds a login stays reusable by the client pool in ServerManager;
+    # None means the credentials do not expire (static API tokens).
+    SESSION_TTL: int | None = None
+    # Parallel requests per panel for bulk operations without a native
+    # batch endpoint.
+    BULK_CONCURRENCY = 5
+    # Seconds the fallback count_users() reuses a full client listing.
+    COUNT_CACHE_TTL = 60
+
+    # (monotonic time, clients) of the last listing done by count_users().
+    _count_cache: tuple[float, int] | None = None
 
     @abstractmethod
     async def get_all_user_server(self):
@@ -33,3 +67,102 @@ class BaseVpn(ABC):
     @abstractmethod
     async def get_key_user(self, name, name_key, **kwargs):
         pass
+
+    def is_auth_error(self, exc: Exception) -> bool:
+        """True if *exc* means the panel session/token is no longer valid."""
+        return False
+
+    async def close(self):
+        """Release network resources held by the client."""
+        pass
+
+    async def count_users(self, fresh: bool = False) -> int | None:
+        """Number of clients on this server (its inbound/squad on shared
+        panels), or None if the panel could not say.
+
+        Backends override this with the cheapest count their API offers.
+        This fallback lists every client and reuses the count for
+        COUNT_CACHE_TTL seconds unless *fresh* is set.
+        """
+        now = time.monotonic()
+        cached = self._count_cache
+        if (
+            not fresh
+            and cached is not None
+            and now - cached[0] < self.COUNT_CACHE_TTL
+        ):
+            return cached[1]
+        users = await self.get_all_user_server()
+        if users is None:
+            return None
+        self._count_cache = (now, len(users))
+        return len(users)
+
+    @abstractmethod
+    async def list_clients(self) -> dict[str, int | None]:
+        """Every client of this server in one pass, for reconciliation.
+
+        Keys are client names as passed to add/get/delete_client
+        (``<name>.<key_id>.<POST_FIX>``; WireGuard uses the peer's public
+        key).  Values are the client's expiry as a unix timestamp, or None
+        when the panel does not track it.  Unlike get_all_user_server this
+        raises instead of returning a partial list.
+        """
+
+    def forget_count(self) -> None:
+        """Drop any cached count after clients were added or removed."""
+        self._count_cache = None
+
+    async def _gather_bulk(
+        self,
+        names: Iterable[str],
+        func: Callable[[str], Awaitable[Any]],
+        reject_false: bool = True,
+    ) -> BulkResult:
+        """Run *func* for every name with at most BULK_CONCURRENCY in flight.
+
+        A ``False`` return counts as a failure unless *reject_false* is off.
+        """
+        result = BulkResult()
+        semaphore = asyncio.Semaphore(self.BULK_CONCURRENCY)
+
+        async def _one(name):
+            async with semaphore:
+                try:
+                    value = await func(name)
+                except Exception as e:
+                    result.add_failure(name, e)
+                    return
+            if reject_false and value is False:
+                result.add_failure(name, 'rejected by panel')
+            else:
+                result.add_success(name, value)
+
+        await asyncio.gather(*(_one(name) for name in dict.fromkeys(names)))
+        return result
+
+    async def add_clients_bulk(self, names, limit_ip, limit_gb) -> BulkResult:
+        return await self._gather_bulk(
+            names, lambda name: self.add_client(name, limit_ip, limit_gb)
+        )
+
+    async def delete_clients_bulk(self, names) -> BulkResult:
+        return await self._gather_bulk(names, self.delete_client)
+
+    async def get_clients_bulk(self, names) -> BulkResult:
+        """Look up clients; a missing client succeeds with ``None``."""
+        return await self._gather_bulk(
+            names, self.get_client, reject_false=False
+        )
+
+    async def update_expire_bulk(self, expiries) -> BulkResult:
+        """Set the expiry of many clients (``{name: datetime}``).
+
+        Only for backends with ``update_user_expire``; a client the panel
+        does not know counts as a failure.
+        """
+        async def _update(name):
+            if await self.update_user_expire(name, expiries[name]) is None:
+                raise LookupError('client not found')
+
+        return await self._gather_bulk(expiries, _update, reject_false=False)
@@ -1,11 +1,11 @@
 import datetime
 import logging
-from urllib.parse import parse_qsl, quote, unquote, urlencode, urlsplit, urlunsplit
 
 import httpx
 
 from bot.database.models.main import Servers
-from bot.misc.VPN.BaseVpn import BaseVpn
+from bot.misc.VPN.BaseVpn import BaseVpn, BulkResult
+from bot.misc.VPN.parsed_link import ParsedLink
 from bot.misc.util import CONFIG
 
 log = logging.getLogger(__name__)
@@ -15,6 +15,11 @@ class Marzban(BaseVpn):
     NAME_VPN = 'Marzban'
     POST_FIX = 'mz'
     DEFAULT_INBOUND_TAG = 'VLESS_REALITY'
+    SESSION_TTL = 900
+    # Usernames per /api/users?username=... lookup in get_clients_bulk.
+    LOOKUP_CHUNK_SIZE = 50
+    # Users per /api/users page in list_clients.
+    LIST_PAGE_SIZE = 100
     DEGRADED_EXPORT_HOSTS = {
         '45.77.176.143',
         '138.124.64.192',
@@ -42,29 +47,37 @@ class Marzban(BaseVpn):
         self.inbound_tag: str = self.DEFAULT_INBOUND_TAG
 
     async def login(self):
-        async with httpx.AsyncClient(
-            base_url=self.base_url,
-            timeout=self.timeout,
-            verify=False
-        ) as tmp:
-            resp = await tmp.post(
-                '/api/admin/token',
-                data={
-                    'username': self.username,
-                    'password': self.password,
-                    'grant_type': 'password',
-                }
+        # One keep-alive client per panel: re-login only swaps the token.
+        if self.client is None or self.client.is_closed:
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                verify=False
             )
-            resp.raise_for_status()
-            self.token = resp.json()['access_token']
+        self.client.headers.pop('Authorization', None)
+        resp = await self.client.post(
+            '/api/admin/token',
+            data={
+                'username': self.username,
+                'password': self.password,
+                'grant_type': 'password',
+            }
+        )
+        resp.raise_for_status()
+        self.token = resp.json()['access_token']
+        self.client.headers['Authorization'] = f'Bearer {self.token}'
 
-        self.client = httpx.AsyncClient(
-            base_url=self.base_url,
-            headers={'Authorization': f'Bearer {self.token}'},
-            timeout=self.timeout,
-            verify=False
+    def is_auth_error(self, exc: Exception) -> bool:
+        return (
+            isinstance(exc, httpx.HTTPStatusError)
+            and exc.response.status_code in (401, 403)
         )
 
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
     def _make_username(self, name: str) -> str:
         return name.replace('.', '_')
 
@@ -76,49 +89,53 @@ class Marzban(BaseVpn):
         return value
 
     @classmethod
-    def normalize_export_link(cls, link: str) -> str:
+    def normalize_parsed_link(cls, link: ParsedLink) -> ParsedLink:
         """
-        Normalize Marzban-exported REALITY links for client compatibility.
+        Normalize a Marzban-exported REALITY link for client compatibility.
 
         The panel can emit `host`/`sni` values like `github.com:443`, while
         clients expect plain hostname values there.
         """
-        if not isinstance(link, str) or not link.strip():
-            return link
-        parts = urlsplit(link)
-        query = dict(parse_qsl(parts.query, keep_blank_values=True))
+        query = link.query
         # Some clients expect explicit VLESS encryption field.
         if 'encryption' not in query or not str(query.get('encryption') or '').strip():
             query['encryption'] = 'none'
         for key in ('host', 'sni'):
             if key in query:
                 query[key] = cls._strip_default_port(query[key])
-        fragment = str(parts.fragment or '')
-        if fragment:
-            decoded_fragment = unquote(fragment)
-            for old_value, new_value in cls.EXPORT_LABEL_RENAMES.items():
-                decoded_fragment = decoded_fragment.replace(old_value, new_value)
-            fragment = quote(decoded_fragment, safe='()[] -_')
-        return urlunsplit(
-            (
-                parts.scheme,
-                parts.netloc,
-                parts.path,
-                urlencode(query, doseq=True),
-                fragment,
-            )
-        )
+        for old_value, new_value in cls.EXPORT_LABEL_RENAMES.items():
+            link.label = link.label.replace(old_value, new_value)
+        link.rebuild()
+        return link
 
     @classmethod
-    def _is_degraded_export_link(cls, link: str) -> bool:
-        if not isinstance(link, str) or not link.strip():
-            return True
-        parts = urlsplit(link)
-        host = str(parts.hostname or '').strip().lower()
+    def normalize_export_link(cls, link: str) -> str:
+        parsed = ParsedLink.parse(link)
+        if parsed is None:
+            return link
+        return cls.normalize_parsed_link(parsed).text
+
+    @classmethod
+    def is_degraded_link(cls, link: ParsedLink) -> bool:
+        host = str(link.hostname or '').strip().lower()
         if host in cls.DEGRADED_EXPORT_HOSTS:
             return True
-        fragment = str(parts.fragment or '').strip().lower()
-        return any(marker in fragment for marker in cls.DEGRADED_EXPORT_FRAGMENTS)
+        label = link.label.strip().lower()
+        return any(marker in label for marker in cls.DEGRADED_EXPORT_FRAGMENTS)
+
+    @classmethod
+    def _is_degraded_export_link(cls, link: str) -> bool:
+        parsed = ParsedLink.parse(link)
+        return parsed is None or cls.is_degraded_link(parsed)
+
+    @classmethod
+    def parse_export_links(cls, links) -> list[ParsedLink]:
+        """Parse and normalize the panel's links, each exactly once."""
+        return [
+            cls.normalize_parsed_link(parsed)
+            for link in links or ()
+            if (parsed := ParsedLink.parse(link)) is not None
+        ]
 
     @staticmethod
     def _is_vision_flow(user_payload: dict) -> bool:
@@ -165,26 +182,75 @@ class Marzban(BaseVpn):
             return []
         return users
 
+    async def count_users(self, fresh: bool = False) -> int | None:
+        """``total`` of a one-user page instead of listing every user."""
+        if self.client is None:
+            return None
+        resp = await self.client.get(
+            '/api/users', params={'offset': 0, 'limit': 1}
+        )
+        resp.raise_for_status()
+        return int(resp.json()['total'])
+
+    async def list_clients(self) -> dict[str, int | None]:
+        clients = {}
+        offset = 0
+        while True:
+            resp = await self.client.get(
+                '/api/users',
+                params={'offset': offset, 'limit': self.LIST_PAGE_SIZE}
+            )
+            resp.raise_for_status()
+            batch = resp.json().get('users', [])
+            for user in batch:
+                clients[user['username'].replace('_', '.')] = user.get('expire')
+            if len(batch) < self.LIST_PAGE_SIZE:
+                return clients
+            offset += self.LIST_PAGE_SIZE
+
     async def get_client(self, name: str) -> dict:
         username = self._make_username(name)
         resp = await self.client.get(f'/api/user/{username}')
         resp.raise_for_status()
         return resp.json()
 
+    async def get_clients_bulk(self, names) -> BulkResult:
+        """Fetch users through the list endpoint's ``username`` filter."""
+        names = list(dict.fromkeys(names))
+        result = BulkResult()
+        for start in range(0, len(names), self.LOOKUP_CHUNK_SIZE):
+            chunk = names[start:start + self.LOOKUP_CHUNK_SIZE]
+            try:
+                resp = await self.client.get(
+                    '/api/users',
+                    params=[
+                        ('username', self._make_username(name))
+                        for name in chunk
+                    ]
+                )
+                resp.raise_for_status()
+                users = {
+                    user.get('username'): user
+                    for user in resp.json().get('users', [])
+                }
+            except Exception as e:
+                for name in chunk:
+                    result.add_failure(name, e)
+                continue
+            for name in chunk:
+                result.add_success(name, users.get(self._make_username(name)))
+        return result
+
     async def get_primary_link(self, name: str) -> str:
         user = await self.get_client(name)
         links = user.get('links') or []
         if not isinstance(links, list) or not links:
             return ''
-        normalized_links = [
-            self.normalize_export_link(str(link))
-            for link in links
-            if isinstance(link, str) and link.strip()
-        ]
-        for link in normalized_links:
-            if not self._is_degraded_export_link(link):
-                return link
-        return normalized_links[0] if normalized_links else ''
+        parsed_links = self.parse_export_links(links)
+        for link in parsed_links:
+            if not self.is_degraded_link(link):
+                return link.text
+        return parsed_links[0].text if parsed_links else ''
 
     async def get_nodes(self) -> list[dict]:
         resp = await self.client.get('/api/nodes')
@@ -1,8 +1,8 @@
 import json
 
-from outline_vpn import OutlineVPN
+from outline_vpn import OutlineServerErrorException, OutlineVPN
 
-from bot.misc.VPN.BaseVpn import BaseVpn
+from bot.misc.VPN.BaseVpn import BaseVpn, BulkResult
 from bot.misc.util import CONFIG
 
 
@@ -16,14 +16,53 @@ class Outline(BaseVpn):
         self.api_url = api_cert['apiUrl']
         self.cert_sha256 = api_cert['certSha256']
         self.free_server = server.free_server
+        # (ETag, count) of the last /access-keys/ listing.
+        self._keys_etag: tuple[str, int] | None = None
 
     async def login(self):
+        # The API URL carries the secret, so there is no session to renew:
+        # keep the open connection pool other callers may be using.
+        client = getattr(self, 'client_outline', None)
+        if (
+            client is not None
+            and client.session is not None
+            and not client.session.closed
+        ):
+            return
         self.client_outline = OutlineVPN(api_url=self.api_url)
         await self.client_outline.init(self.cert_sha256)
 
+    async def close(self):
+        client = getattr(self, 'client_outline', None)
+        if client is not None and client.session is not None:
+            await client.session.close()
+
     async def get_all_user_server(self):
         return await self.client_outline.get_keys()
 
+    async def count_users(self, fresh: bool = False) -> int | None:
+        """Count keys with a conditional GET of /access-keys/, skipping the
+        transfer metrics request that get_keys() adds."""
+        headers = {}
+        if self._keys_etag is not None:
+            headers['If-None-Match'] = self._keys_etag[0]
+        async with self.client_outline.session.get(
+            url=f'{self.api_url}/access-keys/', headers=headers
+        ) as resp:
+            if resp.status == 304 and self._keys_etag is not None:
+                return self._keys_etag[1]
+            data = await resp.json()
+            if resp.status != 200 or 'accessKeys' not in data:
+                raise OutlineServerErrorException('Unable to retrieve keys')
+            count = len(data['accessKeys'])
+            etag = resp.headers.get('ETag')
+        self._keys_etag = (etag, count) if etag else None
+        return count
+
+    async def list_clients(self) -> dict[str, int | None]:
+        keys = await self.client_outline._get_raw_keys()
+        return {key.name: None for key in keys if key.name}
+
     async def get_client(self, name):
         all_user = await self.get_all_user_server()
         for user in all_user:
@@ -34,6 +73,20 @@ class Outline(BaseVpn):
     async def get_client_traffic(self, name):
         return 0.0
 
+    async def get_clients_bulk(self, names) -> BulkResult:
+        """Resolve all names from a single key listing."""
+        names = list(dict.fromkeys(names))
+        result = BulkResult()
+        try:
+            keys = {key.name: key for key in await self.get_all_user_server()}
+        except Exception as e:
+            for name in names:
+                result.add_failure(name, e)
+            return result
+        for name in names:
+            result.add_success(name, keys.get(str(name)))
+        return result
+
     async def add_client(self, name, limit_ip, limit_gb):
         try:
             key = await self.client_outline.create_key(key_name=name)
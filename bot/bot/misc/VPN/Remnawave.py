@@ -7,7 +7,12 @@ from uuid import UUID
 
 from remnawave import RemnawaveSDK
 from remnawave.enums import TrafficLimitStrategy
-from remnawave.exceptions import NotFoundError, ConflictError
+from remnawave.exceptions import (
+    AuthenticationError,
+    ConflictError,
+    NotFoundError,
+    UnauthorizedError,
+)
 from remnawave.models import (
     UsersResponseDto,
     UserResponseDto,
@@ -16,15 +21,20 @@ from remnawave.models import (
     GetAllInternalSquadsResponseDto, UpdateUserRequestDto
 )
 from remnawave.models.hwid import HwidDeviceDto, DeleteUserHwidDeviceRequestDto
+from remnawave.models.users_bulk_actions import BulkDeleteUsersRequestDto
 
 from bot.database.models.main import Servers
-from bot.misc.VPN.BaseVpn import BaseVpn
+from bot.misc.VPN.BaseVpn import BaseVpn, BulkResult
 from bot.misc.util import CONFIG
 
 
 class Remnawave(BaseVpn):
     NAME_VPN = 'Remnawave 🌊'
     POST_FIX = 're'
+    # Upper bound of uuids accepted by /users/bulk/delete.
+    BULK_DELETE_CHUNK = 500
+    # Users per /users page in list_clients.
+    LIST_PAGE_SIZE = 500
     BASE_URL: str
     TOKEN: str
     URL_LOGIN: str
@@ -40,11 +50,15 @@ class Remnawave(BaseVpn):
         self.SQUAD_ID = server.remnawave_squad_id
 
     async def login(self):
+        # One keep-alive client per panel: the token is static, and a
+        # re-login only repeats the login URL request on that client.
+        sdk = getattr(self, 'CLIENT', None)
+        if sdk is not None and not sdk._client.is_closed:
+            if self.URL_LOGIN is not None:
+                await sdk._client.get(self._login_path())
+            return
         if self.URL_LOGIN is not None:
             url = urlparse(self.URL_LOGIN)
-            result = url.path
-            if url.query:
-                result += "?" + url.query
             if "caddy=" not in url.query:
                 params = {url.query.split('=')[0]: url.query.split('=')[1]}
             else:
@@ -55,13 +69,29 @@ class Remnawave(BaseVpn):
                 timeout=self.timeout,
                 params=params
             )
-            await client.get(result)
+            await client.get(self._login_path())
             self.CLIENT = RemnawaveSDK(client=client)
         else:
             self.CLIENT = RemnawaveSDK(
                 base_url=self.BASE_URL, token=self.TOKEN
             )
 
+    def _login_path(self) -> str:
+        url = urlparse(self.URL_LOGIN)
+        result = url.path
+        if url.query:
+            result += "?" + url.query
+        return result
+
+    def is_auth_error(self, exc: Exception) -> bool:
+        return isinstance(exc, (UnauthorizedError, AuthenticationError))
+
+    async def close(self):
+        sdk = getattr(self, 'CLIENT', None)
+        if sdk is not None:
+            await sdk._client.aclose()
+            self.CLIENT = None
+
     async def get_all_user_server(self) -> list[UserResponseDto]:
         all_users = []
         batch_size = 500
@@ -92,6 +122,39 @@ class Remnawave(BaseVpn):
             return internal_squad_user
         return all_users
 
+    async def count_users(self, fresh: bool = False) -> int | None:
+        """Read the total from a one-user page (or the squad's member
+        count) instead of paging through every user."""
+        if self.SQUAD_ID is not None:
+            squad = await self.CLIENT.internal_squads.get_internal_squad_by_uuid(
+                self.SQUAD_ID
+            )
+            if squad.info is None:
+                return await super().count_users(fresh)
+            return squad.info.members_count
+        response = await self.CLIENT.users.get_all_users(start=0, size=1)
+        return response.total
+
+    async def list_clients(self) -> dict[str, int | None]:
+        clients = {}
+        start = 0
+        while True:
+            response = await self.CLIENT.users.get_all_users(
+                start=start, size=self.LIST_PAGE_SIZE
+            )
+            for user in response.users:
+                if self.SQUAD_ID is not None and not any(
+                    str(squad.uuid) == self.SQUAD_ID
+                    for squad in user.active_internal_squads
+                ):
+                    continue
+                clients[user.username.replace('_', '.')] = int(
+                    user.expire_at.timestamp()
+                )
+            start += self.LIST_PAGE_SIZE
+            if not response.users or start >= response.total:
+                return clients
+
     async def get_client(self, name) -> UserResponseDto:
         username = name.replace(".", "_")
         return await self.CLIENT.users.get_user_by_username(username)
@@ -181,6 +244,42 @@ class Remnawave(BaseVpn):
         except NotFoundError:
             return True
 
+    async def get_clients_bulk(self, names) -> BulkResult:
+        async def _get(name):
+            try:
+                return await self.get_client(name)
+            except NotFoundError:
+                return None
+
+        return await self._gather_bulk(names, _get, reject_false=False)
+
+    async def delete_clients_bulk(self, names) -> BulkResult:
+        """Resolve uuids in parallel, then delete them via the bulk endpoint."""
+        lookup = await self.get_clients_bulk(names)
+        result = BulkResult(failed=dict(lookup.failed))
+        uuids = {}
+        for name, user in lookup.succeeded.items():
+            if user is None:
+                result.add_success(name, True)
+            else:
+                uuids[name] = user.uuid
+        pending = list(uuids)
+        for start in range(0, len(pending), self.BULK_DELETE_CHUNK):
+            chunk = pending[start:start + self.BULK_DELETE_CHUNK]
+            try:
+                await self.CLIENT.users_bulk_actions.bulk_delete_users(
+                    BulkDeleteUsersRequestDto(
+                        uuids=[uuids[name] for name in chunk]
+                    )
+                )
+            except Exception as e:
+                for name in chunk:
+                    result.add_failure(name, e)
+                continue
+            for name in chunk:
+                result.add_success(name, True)
+        return result
+
     async def get_user_devices(self, name) -> list[HwidDeviceDto]:
         user = await self.get_client(name)
         hwid_user = await self.CLIENT.hwid.get_hwid_user(str(user.uuid))
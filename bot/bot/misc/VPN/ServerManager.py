@@ -1,7 +1,11 @@
+import asyncio
 import logging
+import time
+from dataclasses import dataclass, field
 from datetime import timezone, timedelta, datetime
 
 from bot.misc.VPN.Amnezia_wg import AmneziaWG
+from bot.misc.VPN.BaseVpn import BulkResult
 from bot.misc.VPN.Marzban import Marzban
 from bot.misc.VPN.Remnawave import Remnawave
 from bot.misc.VPN.Xui.Trojan import Trojan
@@ -13,6 +17,90 @@ from bot.misc.util import CONFIG
 
 log = logging.getLogger(__name__)
 
+_FINGERPRINT_FIELDS = (
+    'type_vpn',
+    'ip',
+    'panel',
+    'login',
+    'password',
+    'outline_link',
+    'inbound_id',
+    'connection_method',
+    'remnawave_squad_id',
+    'free_server',
+)
+
+
+@dataclass(slots=True)
+class _PooledClient:
+    fingerprint: tuple
+    client: object
+    loop: asyncio.AbstractEventLoop
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    logged_in_at: float | None = None
+
+    def is_fresh(self) -> bool:
+        if self.logged_in_at is None:
+            return False
+        ttl = self.client.SESSION_TTL
+        return ttl is None or time.monotonic() - self.logged_in_at < ttl
+
+
+# (server id, timeout) -> logged-in panel client shared by every
+# ServerManager built for that server in this process.
+_client_pool: dict[tuple, _PooledClient] = {}
+
+
+def _fingerprint(server) -> tuple:
+    return tuple(getattr(server, name, None) for name in _FINGERPRINT_FIELDS)
+
+
+async def _close_client(client) -> None:
+    try:
+        await client.close()
+    except Exception as e:
+        log.debug('event=panel_pool.close_failed error=%s', e)
+
+
+def _pooled_client(vpn_type, server, timeout) -> _PooledClient | None:
+    server_id = getattr(server, 'id', None)
+    if server_id is None:
+        return None
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    pool_key = (server_id, timeout)
+    fingerprint = _fingerprint(server)
+    entry = _client_pool.get(pool_key)
+    if entry is not None and (
+        entry.fingerprint != fingerprint or entry.loop is not running_loop
+    ):
+        # Server credentials/address were edited (or the pool outlived its
+        # event loop): drop the stale client.
+        del _client_pool[pool_key]
+        if entry.loop is running_loop:
+            running_loop.create_task(_close_client(entry.client))
+        entry = None
+    if entry is None:
+        entry = _PooledClient(
+            fingerprint=fingerprint,
+            client=vpn_type(server, timeout),
+            loop=running_loop,
+        )
+        _client_pool[pool_key] = entry
+    return entry
+
+
+async def close_panel_clients() -> None:
+    """Close every pooled panel client; call once on process shutdown."""
+    entries = list(_client_pool.values())
+    _client_pool.clear()
+    for entry in entries:
+        await _close_client(entry.client)
+    if entries:
+        log.info('event=panel_pool.closed clients=%d', len(entries))
+
 
 class ServerManager:
     VPN_TYPES = {
@@ -27,32 +115,73 @@ class ServerManager:
     }
 
     def __init__(self, server, timeout=30):
+        self._pooled = None
         try:
-            self.client = self.VPN_TYPES.get(server.type_vpn)(server, timeout)
+            vpn_type = self.VPN_TYPES.get(server.type_vpn)
+            self._pooled = _pooled_client(vpn_type, server, timeout)
+            if self._pooled is not None:
+                self.client = self._pooled.client
+            else:
+                self.client = vpn_type(server, timeout)
         except Exception as e:
             log.error('Error initializing ServerManager: ', exc_info=e)
 
     async def login(self):
-        await self.client.login()
+        pooled = self._pooled
+        if pooled is None:
+            await self.client.login()
+            return
+        if pooled.is_fresh():
+            return
+        async with pooled.lock:
+            if pooled.is_fresh():
+                return
+            await self.client.login()
+            pooled.logged_in_at = time.monotonic()
+
+    async def _call(self, method, *args, **kwargs):
+        """Run a panel call, re-logging in once if the session expired."""
+        try:
+            return await method(*args, **kwargs)
+        except Exception as e:
+            if self._pooled is None or not self.client.is_auth_error(e):
+                raise
+            log.info(
+                'event=panel_pool.relogin vpn=%s',
+                type(self.client).__name__,
+            )
+            self._pooled.logged_in_at = None
+            await self.login()
+            return await method(*args, **kwargs)
 
     async def get_all_user(self):
         try:
-            return await self.client.get_all_user_server()
+            return await self._call(self.client.get_all_user_server)
         except Exception as e:
             log.error('Error get all user server', exc_info=e)
             return None
 
+    async def count_users(self, fresh=False):
+        """Client count via the backend's cheapest API; None on failure."""
+        try:
+            return await self._call(self.client.count_users, fresh)
+        except Exception as e:
+            log.error('Error count users server', exc_info=e)
+            return None
+
     async def get_user(self, name, key_id):
         try:
             name_str = f'{name}.{key_id}.{self.client.POST_FIX}'
-            return await self.client.get_client(str(name_str))
+            return await self._call(self.client.get_client, str(name_str))
         except Exception as e:
             log.error('Error get user server', exc_info=e)
 
     async def get_client_traffic(self, name, key_id):
         try:
             name_str = f'{name}.{key_id}.{self.client.POST_FIX}'
-            return await self.client.get_client_traffic(str(name_str))
+            return await self._call(
+                self.client.get_client_traffic, str(name_str)
+            )
         except Exception as e:
             log.error('Error get user server', exc_info=e)
 
@@ -65,23 +194,133 @@ class ServerManager:
     ):
         try:
             name_str = f'{name}.{key_id}.{self.client.POST_FIX}'
-            return await self.client.add_client(str(name_str), limit_ip, limit_gb)
+            self.client.forget_count()
+            return await self._call(
+                self.client.add_client, str(name_str), limit_ip, limit_gb
+            )
         except Exception as e:
             log.error('Error add client server', exc_info=e)
 
     async def delete_client(self, name, key_id):
         try:
             name_str = f'{name}.{key_id}.{self.client.POST_FIX}'
-            await self.client.delete_client(str(name_str))
+            self.client.forget_count()
+            await self._call(self.client.delete_client, str(name_str))
             return True
         except Exception as e:
             log.error('Error delete client server', exc_info=e)
             return False
 
+    def _client_names(self, items) -> dict[str, tuple]:
+        return {
+            f'{name}.{key_id}.{self.client.POST_FIX}': (name, key_id)
+            for name, key_id in items
+        }
+
+    async def _bulk(self, method, items, *args) -> BulkResult:
+        """Run a bulk client method for ``(name, key_id)`` pairs.
+
+        The returned report is keyed by the same ``(name, key_id)`` pairs.
+        """
+        names = self._client_names(items)
+        self.client.forget_count()
+        try:
+            result = await self._call(method, list(names), *args)
+        except Exception as e:
+            log.error('Error bulk operation server', exc_info=e)
+            result = BulkResult()
+            for name_str in names:
+                result.add_failure(name_str, e)
+        return BulkResult(
+            succeeded={
+                names[name_str]: value
+                for name_str, value in result.succeeded.items()
+            },
+            failed={
+                names[name_str]: error
+                for name_str, error in result.failed.items()
+            },
+        )
+
+    async def add_clients_bulk(
+        self,
+        items,
+        limit_ip=CONFIG.limit_ip,
+        limit_gb=CONFIG.limit_GB
+    ) -> BulkResult:
+        return await self._bulk(
+            self.client.add_clients_bulk, items, limit_ip, limit_gb
+        )
+
+    async def delete_clients_bulk(self, items) -> BulkResult:
+        return await self._bulk(self.client.delete_clients_bulk, items)
+
+    async def get_clients_bulk(self, items) -> BulkResult:
+        return await self._bulk(self.client.get_clients_bulk, items)
+
+    async def update_expire_bulk(self, expiries) -> BulkResult:
+        """Set many clients' expiry; *expiries* maps ``(name, key_id)`` to
+        a datetime."""
+        by_name = {
+            f'{name}.{key_id}.{self.client.POST_FIX}': expire_at
+            for (name, key_id), expire_at in expiries.items()
+        }
+        return await self._bulk(
+            lambda names: self.client.update_expire_bulk(
+                {name: by_name[name] for name in names}
+            ),
+            list(expiries),
+        )
+
+    @property
+    def supports_pool(self) -> bool:
+        return getattr(self.client, 'SUPPORTS_POOL', False)
+
+    def pool_client_name(self, token) -> str:
+        # Never matches the "<tgid>.<key_id>.<postfix>" names of real keys.
+        return f'pool.{token}.{self.client.POST_FIX}'
+
+    def _require_pool(self) -> None:
+        if not self.supports_pool:
+            raise TypeError(f'{self.client.NAME_VPN} has no key pool')
+
+    async def add_pool_clients(self, names, name_key) -> BulkResult:
+        """Create spare clients *names*; raises if the panel call fails."""
+        self._require_pool()
+        self.client.forget_count()
+        return await self._call(
+            self.client.add_pool_clients,
+            [str(name) for name in names],
+            CONFIG.name + ' | ' + name_key,
+        )
+
+    async def claim_pool_client(
+        self,
+        client,
+        name,
+        key_id,
+        limit_gb: int | None = None
+    ) -> None:
+        """Rename the spare *client* to the key's client name; raises on
+        failure."""
+        self._require_pool()
+        name_str = f'{name}.{key_id}.{self.client.POST_FIX}'
+        await self._call(
+            self.client.claim_pool_client, client, name_str, limit_gb
+        )
+
+    async def delete_pool_clients(self, names) -> BulkResult:
+        self.client.forget_count()
+        return await self._call(
+            self.client.delete_clients_bulk, [str(name) for name in names]
+        )
+
     async def get_user_devices(self, name, key_id):
         try:
             name_str = f'{name}.{key_id}.{self.client.POST_FIX}'
-            return await self.client.get_user_devices(str(name_str))
+            return await self._call(
+                self.client.get_user_devices, str(name_str)
+            )
         except Exception as e:
             log.error('Error get devices client server', exc_info=e)
             return None
@@ -89,7 +328,7 @@ class ServerManager:
     async def get_nodes(self):
         try:
             if hasattr(self.client, 'get_nodes'):
-                return await self.client.get_nodes()
+                return await self._call(self.client.get_nodes)
             return None
         except Exception as e:
             log.error('Error get nodes server', exc_info=e)
@@ -99,7 +338,8 @@ class ServerManager:
     async def remove_user_devices(self, name, key_id, device_id):
         try:
             name_str = f'{name}.{key_id}.{self.client.POST_FIX}'
-            return await self.client.remove_user_devices(
+            return await self._call(
+                self.client.remove_user_devices,
                 str(name_str), device_id
             )
         except Exception as e:
@@ -132,7 +372,10 @@ class ServerManager:
                 kwargs['expire_at'] = expire_at
             if limit_gb is not None:
                 kwargs['limit_gb'] = int(limit_gb)
-            return await self.client.get_key_user(
+            # Backends create the client here when it does not exist yet.
+            self.client.forget_count()
+            return await self._call(
+                self.client.get_key_user,
                 str(name_str), str(name_key), **kwargs
             )
         except Exception as e:
@@ -143,7 +386,8 @@ class ServerManager:
         try:
             if hasattr(self.client, 'update_user_expire'):
                 name_str = f'{name}.{key_id}.{self.client.POST_FIX}'
-                return await self.client.update_user_expire(
+                return await self._call(
+                    self.client.update_user_expire,
                     str(name_str), expire_at
                 )
             return None
@@ -2,14 +2,13 @@ import base64
 import json
 import os
 
-import pyxui_async.errors
-from pyxui_async import ClientSettings, Client
+from pyxui_async import Client
 
-from bot.misc.VPN.Xui.XuiBase import XuiBase
+from bot.misc.VPN.Xui.XuiBase import XuiClientBase
 from bot.misc.util import CONFIG
 
 
-class Trojan(XuiBase):
+class Trojan(XuiClientBase):
     NAME_VPN = 'Trojan 🏇'
     POST_FIX = 'tr'
     adress: str
@@ -17,27 +16,24 @@ class Trojan(XuiBase):
     def __init__(self, server, timeout):
         super().__init__(server, timeout)
 
-    async def add_client(self, name, limit_ip, limit_gb):
-        try:
-            response = await self.xui.add_clients(
-                inbound_id=self.inbound_id,
-                client_settings=ClientSettings(
-                    clients=[
-                        Client(
-                            email=str(name),
-                            limitIp=limit_ip,
-                            totalGB=limit_gb * 1073741824,
-                            subId=self.random_lower_and_num(16),
-                            password=self.random_lower_and_num(10),
-                        )
-                    ]
-                )
-            )
-            if response.success:
-                return True
-            return False
-        except pyxui_async.errors.NotFound:
-            return False
+    def _new_client(self, name, limit_ip, limit_gb, flow='') -> Client:
+        return Client(
+            email=str(name),
+            limitIp=limit_ip,
+            totalGB=limit_gb * 1073741824,
+            subId=self.random_lower_and_num(16),
+            password=self.random_lower_and_num(10),
+        )
+
+    def _client_id(self, client: dict) -> str:
+        return client['password']
+
+    async def _client_link(self, name, name_key) -> str:
+        return await self.xui.get_key_trojan(
+            inbound_id=self.inbound_id,
+            email=name,
+            custom_remark=name_key
+        )
 
     async def get_key_user(self, name, name_key, limit_gb: int | None = None):
         client = await self.get_client(name)
@@ -51,8 +47,4 @@ class Trojan(XuiBase):
                 await self.add_client(
                     name, CONFIG.limit_ip, resolved_limit_gb or CONFIG.limit_GB
                 )
-        return await self.xui.get_key_trojan(
-            inbound_id=self.inbound_id,
-            email=name,
-            custom_remark=name_key
-        )
+        return await self._client_link(name, name_key)
@@ -1,47 +1,30 @@
 import uuid
 
-import pyxui_async.errors
-from pyxui_async import ClientSettings, Client
+from pyxui_async import Client
 
-from bot.misc.VPN.Xui.XuiBase import XuiBase
+from bot.misc.VPN.Xui.XuiBase import XuiClientBase
 from bot.misc.util import CONFIG
 
 
-class Vless(XuiBase):
+class Vless(XuiClientBase):
     NAME_VPN = 'Vless 🐊'
     POST_FIX = 'vl'
 
     def __init__(self, server, timeout):
         super().__init__(server, timeout)
 
-    async def add_client(self, name, limit_ip, limit_gb):
-        try:
-            try:
-                new_id = await self.xui.get_new_uuid()
-                new_id = new_id.obj.uuid
-            except Exception as e:
-                new_id = str(uuid.uuid4())
-            flow = await self.get_flow()
-            response = await self.xui.add_clients(
-                inbound_id=self.inbound_id,
-                client_settings=ClientSettings(
-                    clients=[
-                        Client(
-                            id=new_id,
-                            email=str(name),
-                            limitIp=limit_ip,
-                            totalGB=limit_gb * 1073741824,
-                            flow=flow,
-                            subId=self.random_lower_and_num(16)
-                        )
-                    ]
-                )
-            )
-            if response.success:
-                return True
-            return False
-        except pyxui_async.errors.NotFound:
-            return False
+    def _new_client(self, name, limit_ip, limit_gb, flow='') -> Client:
+        return Client(
+            id=str(uuid.uuid4()),
+            email=str(name),
+            limitIp=limit_ip,
+            totalGB=limit_gb * 1073741824,
+            flow=flow,
+            subId=self.random_lower_and_num(16)
+        )
+
+    async def _client_flow(self) -> str:
+        return await self.get_flow()
 
     async def get_flow(self):
         inbound = await self.get_inbound()
@@ -55,6 +38,13 @@ class Vless(XuiBase):
             return ''
         return 'xtls-rprx-vision'
 
+    async def _client_link(self, name, name_key) -> str:
+        return await self.xui.get_key_vless(
+            inbound_id=self.inbound_id,
+            email=name,
+            custom_remark=name_key
+        )
+
     async def get_key_user(self, name, name_key, limit_gb: int | None = None):
         client = await self.get_client(name)
         if client is None:
@@ -67,8 +57,4 @@ class Vless(XuiBase):
                 await self.add_client(
                     name, CONFIG.limit_ip, resolved_limit_gb or CONFIG.limit_GB
                 )
-        return await self.xui.get_key_vless(
-            inbound_id=self.inbound_id,
-            email=name,
-            custom_remark=name_key
-        )
+        return await self._client_link(name, name_key)
@@ -1,5 +1,8 @@
+import json
+
 from pydantic import BaseModel
 
+from bot.misc.VPN.BaseVpn import BulkResult
 from bot.misc.VPN.Xui.XuiBase import XuiBase
 
 
@@ -55,9 +58,44 @@ class WireGuard(XuiBase):
         except IndexError:
             return None
 
+    async def count_users(self, fresh: bool = False) -> int | None:
+        inbound = await self._raw_inbound()
+        if inbound is None:
+            return None
+        settings = json.loads(inbound.get('settings') or '{}')
+        return len(settings.get('peers') or [])
+
+    async def list_clients(self) -> dict[str, int | None]:
+        inbound = await self._raw_inbound()
+        if inbound is None:
+            raise LookupError(f'Inbound {self.inbound_id} not found')
+        settings = json.loads(inbound.get('settings') or '{}')
+        return {
+            peer['publicKey']: None
+            for peer in settings.get('peers') or []
+            if peer.get('publicKey')
+        }
+
     async def get_client_traffic(self, name):
         return None
 
+    async def get_clients_bulk(self, names) -> BulkResult:
+        """Resolve all names (``public_key...``) from a single inbound read."""
+        names = list(dict.fromkeys(names))
+        result = BulkResult()
+        try:
+            peers = await self.get_all_user_server()
+            if peers is None:
+                raise LookupError(f'Inbound {self.inbound_id} not found')
+        except Exception as e:
+            for name in names:
+                result.add_failure(name, e)
+            return result
+        by_key = {peer.publicKey: peer for peer in peers}
+        for name in names:
+            result.add_success(name, by_key.get(name.split('.')[0]))
+        return result
+
     async def get_key_user(
         self,
         name,
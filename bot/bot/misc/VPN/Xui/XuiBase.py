@@ -1,18 +1,54 @@
+import json
 import random
 import string
 
-from abc import ABC
+from abc import ABC, abstractmethod
 
-from pyxui_async import XUI
+from pyxui_async import XUI, Client, ClientSettings
+from pyxui_async.models import GET, POST, ResponseBase
 import pyxui_async.errors
 
-from bot.misc.VPN.BaseVpn import BaseVpn
+from bot.misc.VPN.BaseVpn import BaseVpn, BulkResult
+from bot.misc.util import CONFIG
+
+
+class KeepAliveXUI(XUI):
+    """XUI client that keeps its aiohttp session between requests.
+
+    pyxui_async opens a new session for every request and closes it right
+    after, so each call paid a fresh TCP/TLS handshake.
+    """
+
+    async def close(self):
+        # Called by pyxui_async after every request: keep the session open.
+        return None
+
+    async def aclose(self):
+        await super().close()
+        self._session = None
+        self.cookies = {}
+
+    async def login(self, username=None, password=None):
+        # Same request as pyxui_async, minus the AlreadyLogin guard, so a
+        # session refresh reuses the open connection pool.
+        result = await self.request(
+            method=POST,
+            endpoint='/login/',
+            data={
+                'username': username or self.username,
+                'password': password or self.password,
+            },
+        )
+        if result.get('success', False):
+            return ResponseBase(**result)
+        raise pyxui_async.errors.BadLogin()
 
 
 class XuiBase(BaseVpn, ABC):
 
     NAME_VPN: str
     POST_FIX: str
+    SESSION_TTL = 900
 
     def __init__(self, server, timeout):
         if server.connection_method:
@@ -20,7 +56,7 @@ class XuiBase(BaseVpn, ABC):
         else:
             self.type_con = 'http://'
         full_address = f'{self.type_con}{server.ip}'
-        self.xui = XUI(
+        self.xui = KeepAliveXUI(
             full_address=full_address,
             panel='sanaei',
             https=server.connection_method,
@@ -34,6 +70,12 @@ class XuiBase(BaseVpn, ABC):
     async def login(self):
         await self.xui.login(username=self.login_user, password=self.password)
 
+    def is_auth_error(self, exc: Exception) -> bool:
+        return isinstance(exc, ValueError) and str(exc).startswith('HTTP 401')
+
+    async def close(self):
+        await self.xui.aclose()
+
     async def get_inbound(self):
         try:
             return await self.xui.get_inbound(inbound_id=self.inbound_id)
@@ -50,6 +92,34 @@ class XuiBase(BaseVpn, ABC):
         except IndexError:
             return None
 
+    async def _raw_inbound(self) -> dict | None:
+        """This server's inbound as plain JSON: one inbound instead of all
+        of them, and no model parsing of every client."""
+        result = await self.xui.request(
+            method=GET,
+            endpoint=f'/panel/api/inbounds/get/{self.inbound_id}',
+        )
+        if not result.get('success', False):
+            return None
+        return result.get('obj')
+
+    async def count_users(self, fresh: bool = False) -> int | None:
+        inbound = await self._raw_inbound()
+        if inbound is None:
+            return None
+        return len(inbound.get('clientStats') or [])
+
+    async def list_clients(self) -> dict[str, int | None]:
+        inbound = await self._raw_inbound()
+        if inbound is None:
+            raise LookupError(f'Inbound {self.inbound_id} not found')
+        settings = json.loads(inbound.get('settings') or '{}')
+        return {
+            client['email']: None
+            for client in settings.get('clients') or []
+            if client.get('email')
+        }
+
     async def get_client_traffic(self, name):
         try:
             client_stats =  await self.xui.get_client_stat(
@@ -72,6 +142,26 @@ class XuiBase(BaseVpn, ABC):
         except pyxui_async.errors.NotFound:
             return None
 
+    async def get_clients_bulk(self, names) -> BulkResult:
+        """Resolve all names from a single inbound read."""
+        names = list(dict.fromkeys(names))
+        result = BulkResult()
+        try:
+            inbound = await self.get_inbound()
+            if inbound is None:
+                raise LookupError(f'Inbound {self.inbound_id} not found')
+            clients = {
+                client.email: client
+                for client in inbound.obj.settings.clients or []
+            }
+        except Exception as e:
+            for name in names:
+                result.add_failure(name, e)
+            return result
+        for name in names:
+            result.add_success(name, clients.get(name))
+        return result
+
 
     async def delete_client(self, telegram_id):
         try:
@@ -93,3 +183,137 @@ class XuiBase(BaseVpn, ABC):
         seq = string.ascii_lowercase + string.digits
         result = ''.join(random.choice(seq) for _ in range(length))
         return result
+
+
+class XuiClientBase(XuiBase, ABC):
+    """Inbounds whose clients are plain settings entries (VLESS, Trojan,
+    Shadowsocks): many can be added in one addClient call, and spares can
+    be renamed in place, so these support the key pool."""
+
+    # Spare clients can be created ahead of demand and handed out by
+    # renaming them in place (services/key_pool_service.py).
+    SUPPORTS_POOL = True
+    # Clients per addClient payload in add_clients_bulk.
+    ADD_CHUNK_SIZE = 100
+
+    @abstractmethod
+    def _new_client(self, name, limit_ip, limit_gb, flow='') -> Client:
+        """Client entry for the inbound settings payload."""
+
+    async def _client_flow(self) -> str:
+        return ''
+
+    def _client_id(self, client: dict) -> str:
+        """The client's identifier in the updateClient/<id> route."""
+        return client['id']
+
+    @abstractmethod
+    async def _client_link(self, name, name_key) -> str:
+        """Connection link of client *name*, titled *name_key*."""
+
+    def _default_limit_gb(self) -> int:
+        return CONFIG.limit_gb_free if self.free_server else CONFIG.limit_GB
+
+    async def add_client(self, name, limit_ip, limit_gb):
+        try:
+            flow = await self._client_flow()
+            response = await self.xui.add_clients(
+                inbound_id=self.inbound_id,
+                client_settings=ClientSettings(
+                    clients=[self._new_client(name, limit_ip, limit_gb, flow)]
+                )
+            )
+            if response.success:
+                return True
+            return False
+        except pyxui_async.errors.NotFound:
+            return False
+
+    async def add_clients_bulk(self, names, limit_ip, limit_gb) -> BulkResult:
+        """Add clients with one addClient call per ADD_CHUNK_SIZE names."""
+        names = list(dict.fromkeys(names))
+        result = BulkResult()
+        if not names:
+            return result
+        flow = await self._client_flow()
+        for start in range(0, len(names), self.ADD_CHUNK_SIZE):
+            chunk = names[start:start + self.ADD_CHUNK_SIZE]
+            settings = ClientSettings(clients=[
+                self._new_client(name, limit_ip, limit_gb, flow)
+                for name in chunk
+            ])
+            try:
+                response = await self.xui.add_clients(
+                    inbound_id=self.inbound_id,
+                    client_settings=settings,
+                )
+            except pyxui_async.errors.Duplicate:
+                # 3x-ui rejects the whole payload if one email exists:
+                # redo this chunk per client to get item-level outcomes.
+                chunk_result = await BaseVpn.add_clients_bulk(
+                    self, chunk, limit_ip, limit_gb
+                )
+                result.succeeded.update(chunk_result.succeeded)
+                result.failed.update(chunk_result.failed)
+                continue
+            except Exception as e:
+                for name in chunk:
+                    result.add_failure(name, e)
+                continue
+            for name in chunk:
+                if response.success:
+                    result.add_success(name, True)
+                else:
+                    result.add_failure(name, response.msg or 'rejected by panel')
+        return result
+
+    async def add_pool_clients(self, names, name_key) -> BulkResult:
+        """Add the spares in one addClient call, then render their links."""
+        names = list(dict.fromkeys(names))
+        result = BulkResult()
+        if not names:
+            return result
+        flow = await self._client_flow()
+        clients = {
+            name: self._new_client(
+                name, CONFIG.limit_ip, self._default_limit_gb(), flow
+            )
+            for name in names
+        }
+        response = await self.xui.add_clients(
+            inbound_id=self.inbound_id,
+            client_settings=ClientSettings(clients=list(clients.values())),
+        )
+        if not response.success:
+            raise LookupError(response.msg or 'rejected by panel')
+        for name, client in clients.items():
+            try:
+                link = await self._client_link(name, name_key)
+            except Exception as e:
+                result.add_failure(name, e)
+                continue
+            result.add_success(
+                name, (client.model_dump(exclude_none=True), link)
+            )
+        if result.failed:
+            # Spares without a link are of no use: do not leave them behind.
+            await self.delete_clients_bulk(list(result.failed))
+        return result
+
+    async def claim_pool_client(self, client, name, limit_gb=None) -> None:
+        """Rename and re-limit a spare with one updateClient request."""
+        entry = dict(client, email=str(name))
+        if limit_gb is not None:
+            entry['totalGB'] = int(limit_gb) * 1073741824
+        result = await self.xui.request(
+            method=POST,
+            endpoint=(
+                f'/panel/api/inbounds/updateClient/{self._client_id(client)}'
+            ),
+            json={
+                'id': self.inbound_id,
+                'settings': json.dumps({'clients': [entry]}),
+            },
+        )
+        if not result.get('success', False):
+            raise LookupError(result.get('msg') or 'rejected by panel')
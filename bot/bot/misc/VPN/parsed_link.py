@@ -0,0 +1,77 @@
+"""
+Connection links parsed once per subscription render.
+
+A Marzban export link used to be re-parsed by every step it went through
+(normalization, REALITY parameter repair, the degraded-node filter, then
+the Clash and sing-box converters).  ``ParsedLink.parse`` splits it once;
+those steps read and edit the parsed fields, and ``text`` holds the link
+as served: the raw link until a step changes it, then the rebuilt one.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from urllib.parse import parse_qsl, quote, unquote, urlencode, urlsplit, urlunsplit
+
+# Never replaced by an empty duplicate: clients cannot connect without them.
+REALITY_PARAMS = ('sid', 'pbk')
+_LABEL_SAFE = '()[] -_'
+
+
+@dataclass(slots=True)
+class ParsedLink:
+    scheme: str
+    netloc: str
+    username: str | None
+    hostname: str | None
+    port: int | None
+    path: str
+    query: dict[str, str]
+    # Decoded fragment, i.e. the name clients show for the link.
+    label: str
+    text: str
+
+    @classmethod
+    def parse(cls, link: str) -> ParsedLink | None:
+        if not isinstance(link, str) or not link.strip():
+            return None
+        try:
+            parts = urlsplit(link)
+        except ValueError:
+            return None
+        try:
+            port = parts.port
+        except ValueError:
+            port = None
+        query = {}
+        for key, value in parse_qsl(parts.query, keep_blank_values=True):
+            if key in REALITY_PARAMS and query.get(key) and not value.strip():
+                continue
+            query[key] = value
+        return cls(
+            scheme=parts.scheme,
+            netloc=parts.netloc,
+            username=parts.username,
+            hostname=parts.hostname,
+            port=port,
+            path=parts.path,
+            query=query,
+            label=unquote(parts.fragment) if parts.fragment else '',
+            text=link,
+        )
+
+    def param(self, key: str, default: str = '') -> str:
+        return self.query.get(key, default)
+
+    def rebuild(self) -> str:
+        """Re-render ``text`` from the (edited) fields."""
+        self.text = urlunsplit(
+            (
+                self.scheme,
+                self.netloc,
+                self.path,
+                urlencode(self.query, doseq=True),
+                quote(self.label, safe=_LABEL_SAFE) if self.label else '',
+            )
+        )
+        return self.text
@@ -210,6 +210,11 @@ class BroadcastAction(CallbackData, prefix='broadcast_action'):
     action: str
 
 
+class BroadcastJobAction(CallbackData, prefix='broadcast_job'):
+    action: str
+    job_id: int
+
+
 class EditKeysAdmin(CallbackData, prefix='edit_keys_admin'):
     action: str
     id_user: int
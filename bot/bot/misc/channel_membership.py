@@ -0,0 +1,155 @@
+"""
+Cached channel-subscription checks for ``CONFIG.check_follow``.
+
+``check_subs`` runs in IsBlocked/IsBlockedCall, i.e. on every message and
+callback.  Without a cache each of them costs a ``getChatMember`` call.
+
+Entries
+-------
+member      kept ``CONFIG.follow_cache_ttl`` seconds.  After half of that a
+            hit still answers immediately but schedules one background
+            re-check, so active subscribers never wait on the Bot API.
+not member  kept ``CONFIG.follow_cache_negative_ttl`` seconds, so a user who
+            just joined is let in quickly even without a chat_member update.
+API errors are never cached.
+
+With ``FOLLOW_CACHE_REDIS=1`` (default) entries live in Redis under
+``follow:<user_id>`` and are shared by all replicas; otherwise, or when Redis
+is unreachable, each process keeps its own dict.  ``chat_member`` updates for
+the channel overwrite the entry (handlers/other/chat_member.py), which needs
+the bot to be a channel admin.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+
+from bot.misc.util import CONFIG
+
+log = logging.getLogger(__name__)
+
+_KEY_PREFIX = 'follow:'
+
+_local: dict[int, tuple[bool, float]] = {}
+_refreshing: set[int] = set()
+_background: set[asyncio.Task] = set()
+_redis = None
+
+
+def is_member_status(status) -> bool:
+    return getattr(status, 'value', status) != 'left'
+
+
+def _ttl(member: bool) -> int:
+    if member:
+        return CONFIG.follow_cache_ttl
+    return CONFIG.follow_cache_negative_ttl
+
+
+def _redis_client():
+    global _redis
+    if not CONFIG.follow_cache_redis:
+        return None
+    if _redis is None:
+        from redis.asyncio import Redis
+        _redis = Redis.from_url(CONFIG.redis_url)
+    return _redis
+
+
+async def _load(user_id: int) -> tuple[bool, float] | None:
+    """(member, checked_at) of a live entry, or None."""
+    client = _redis_client()
+    if client is not None:
+        try:
+            raw = await client.get(f'{_KEY_PREFIX}{user_id}')
+        except Exception as e:
+            log.warning(
+                'event=follow_cache.get_failed error=%s', type(e).__name__
+            )
+        else:
+            if raw is None:
+                return None
+            member, checked_at = raw.decode().split(':', 1)
+            return member == '1', float(checked_at)
+    entry = _local.get(user_id)
+    if entry is None:
+        return None
+    member, checked_at = entry
+    if time.time() - checked_at >= _ttl(member):
+        _local.pop(user_id, None)
+        return None
+    return entry
+
+
+async def remember(user_id: int, member: bool) -> None:
+    now = time.time()
+    client = _redis_client()
+    if client is not None:
+        try:
+            await client.set(
+                f'{_KEY_PREFIX}{user_id}',
+                f'{int(member)}:{now}',
+                ex=_ttl(member),
+            )
+            return
+        except Exception as e:
+            log.warning(
+                'event=follow_cache.set_failed error=%s', type(e).__name__
+            )
+    _local[user_id] = (member, now)
+
+
+async def _fetch(bot: Bot, user_id: int) -> bool:
+    chat_member = await bot.get_chat_member(
+        chat_id=CONFIG.id_channel,
+        user_id=user_id
+    )
+    member = is_member_status(chat_member.status)
+    await remember(user_id, member)
+    return member
+
+
+async def _refresh(bot: Bot, user_id: int) -> None:
+    try:
+        await _fetch(bot, user_id)
+    except Exception as e:
+        log.debug(
+            'event=follow_cache.refresh_failed user_id=%s error=%s',
+            user_id,
+            type(e).__name__,
+        )
+    finally:
+        _refreshing.discard(user_id)
+
+
+def _schedule_refresh(bot: Bot, user_id: int) -> None:
+    if user_id in _refreshing:
+        return
+    _refreshing.add(user_id)
+    task = asyncio.create_task(_refresh(bot, user_id))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def is_channel_member(
+    bot: Bot,
+    user_id: int,
+    fresh: bool = False,
+) -> bool:
+    """Whether *user_id* follows ``CONFIG.id_channel``.
+
+    Raises whatever ``get_chat_member`` raises when the answer is not
+    cached; *fresh* skips the cache (the "I subscribed" button).
+    """
+    if not fresh:
+        entry = await _load(user_id)
+        if entry is not None:
+            member, checked_at = entry
+            if member and time.time() - checked_at >= CONFIG.follow_cache_ttl / 2:
+                _schedule_refresh(bot, user_id)
+            return member
+    return await _fetch(bot, user_id)
@@ -0,0 +1,212 @@
+"""
+Scheduler jobs that are safe to schedule on every bot replica.
+
+Usage
+-----
+    scheduler.add_job(
+        locked_job(js, "send_dump", send_dump),
+        CronTrigger(hour=0, minute=0),
+        args=(bot,),
+    )
+
+    await run_sharded(
+        js, "daily_expiry", run_id="2026-10-18",
+        session_pool=session_pool, process_batch=notify_range,
+    )
+
+Semantics
+---------
+- ``locked_job`` wraps a job so each tick runs under the distributed lock
+  ``job:<name>``.  Every replica fires the trigger; the first one to take
+  the lock runs the job and the others skip that tick.
+- ``run_sharded`` splits ``Persons.id`` into ``CONFIG.job_shards`` ranges.
+  The bounds are fixed once per run (``<name>.plan`` in the job_state KV
+  bucket) so late sign-ups cannot shift ranges mid-run; the last range is
+  open-ended.  Each shard runs under its own lock ``job:<name>:shard:<i>``,
+  so replicas that fire together take different shards.
+- ``process_batch(lo, hi, after)`` handles one page of shard ``[lo, hi)``
+  after cursor *after* and returns the new cursor, or ``None`` when the
+  shard is finished.  The cursor is checkpointed in ``<name>.shard.<i>``
+  after every page: a shard whose holder crashed is resumed from its last
+  page by the next replica that runs the job for the same *run_id*.
+- Without JetStream (``js is None``, e.g. tests or one-off scripts) jobs
+  run unlocked and shards are not checkpointed.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from functools import wraps
+from typing import Awaitable, Callable
+
+from nats.js import JetStreamContext
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.database.methods.get import get_max_person_id
+from bot.misc.distributed_lock import LockAcquireError, distributed_lock
+from bot.misc.job_state import load_job_state, save_job_state
+from bot.misc.util import CONFIG
+
+log = logging.getLogger(__name__)
+
+JOB_LOCK_TTL = 60
+# Plan creation is short; waiting a little lets concurrent replicas reuse
+# the first replica's plan instead of skipping the run.
+PLAN_LOCK_WAIT = 10
+
+ShardBatch = Callable[[int, int | None, int], Awaitable[int | None]]
+
+
+def locked_job(
+    js: JetStreamContext | None,
+    name: str,
+    func,
+    min_interval: float = 0,
+):
+    """Return *func* wrapped so one replica at a time runs it.
+
+    With *min_interval*, a tick is also skipped if any replica started the
+    job less than that many seconds ago, so replicas whose triggers fire a
+    little apart do not run the same tick back to back.
+    """
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        if js is None:
+            return await func(*args, **kwargs)
+        try:
+            async with distributed_lock(
+                js, f'job:{name}', ttl=JOB_LOCK_TTL, wait_timeout=0
+            ):
+                now = time.time()
+                if min_interval:
+                    state = await load_job_state(js, f'{name}.last_run') or {}
+                    if now - float(state.get('started_at') or 0) < min_interval:
+                        log.debug('event=job.skipped job=%s reason=recent', name)
+                        return None
+                    await save_job_state(
+                        js, f'{name}.last_run', {'started_at': now}
+                    )
+                return await func(*args, **kwargs)
+        except LockAcquireError:
+            log.debug('event=job.skipped job=%s reason=locked', name)
+            return None
+    return wrapper
+
+
+def split_ranges(max_id: int, shards: int) -> list[list[int | None]]:
+    """``shards`` contiguous ``[lo, hi)`` ranges covering ``1..max_id``;
+    the last range has no upper bound."""
+    width = max(1, -(-max_id // shards))
+    bounds: list[list[int | None]] = []
+    for index in range(shards):
+        lo = 1 + index * width
+        hi = None if index == shards - 1 else lo + width
+        bounds.append([lo, hi])
+    return bounds
+
+
+async def _load_plan(
+    js: JetStreamContext | None,
+    name: str,
+    run_id: str,
+    session_pool: async_sessionmaker,
+) -> list[list[int | None]]:
+    plan = await load_job_state(js, f'{name}.plan')
+    if plan and plan.get('run') == run_id:
+        return plan['bounds']
+    async with session_pool() as session:
+        max_id = await get_max_person_id(session)
+    bounds = split_ranges(max_id, CONFIG.job_shards)
+    await save_job_state(
+        js, f'{name}.plan', {'run': run_id, 'bounds': bounds}
+    )
+    log.info(
+        'event=job.plan_created job=%s run=%s shards=%d max_person_id=%d',
+        name, run_id, len(bounds), max_id,
+    )
+    return bounds
+
+
+async def _run_shard(
+    js: JetStreamContext | None,
+    name: str,
+    run_id: str,
+    index: int,
+    lo: int,
+    hi: int | None,
+    process_batch: ShardBatch,
+) -> bool:
+    """Run one shard to completion; False if it was already done."""
+    key = f'{name}.shard.{index}'
+    state = await load_job_state(js, key) or {}
+    if state.get('run') == run_id:
+        if state.get('done'):
+            return False
+        cursor = int(state.get('cursor') or 0)
+        log.info(
+            'event=job.shard_resumed job=%s run=%s shard=%d cursor=%d',
+            name, run_id, index, cursor,
+        )
+    else:
+        cursor = 0
+    while True:
+        next_cursor = await process_batch(lo, hi, cursor)
+        done = next_cursor is None
+        if not done:
+            cursor = next_cursor
+        await save_job_state(
+            js, key, {'run': run_id, 'cursor': cursor, 'done': done}
+        )
+        if done:
+            log.info(
+                'event=job.shard_done job=%s run=%s shard=%d range=%s-%s',
+                name, run_id, index, lo, hi,
+            )
+            return True
+
+
+async def run_sharded(
+    js: JetStreamContext | None,
+    name: str,
+    run_id: str,
+    session_pool: async_sessionmaker,
+    process_batch: ShardBatch,
+) -> int:
+    """Process every shard of *run_id* this replica can lock.
+
+    Returns the number of shards completed by this call.
+    """
+    if js is None:
+        bounds = split_ranges(0, 1)
+    else:
+        try:
+            async with distributed_lock(
+                js, f'job:{name}:plan', ttl=JOB_LOCK_TTL,
+                wait_timeout=PLAN_LOCK_WAIT,
+            ):
+                bounds = await _load_plan(js, name, run_id, session_pool)
+        except LockAcquireError:
+            log.warning('event=job.skipped job=%s reason=plan_locked', name)
+            return 0
+    completed = 0
+    for index, (lo, hi) in enumerate(bounds):
+        if js is None:
+            completed += await _run_shard(
+                None, name, run_id, index, lo, hi, process_batch
+            )
+            continue
+        try:
+            async with distributed_lock(
+                js, f'job:{name}:shard:{index}', ttl=JOB_LOCK_TTL,
+                wait_timeout=0,
+            ):
+                completed += await _run_shard(
+                    js, name, run_id, index, lo, hi, process_batch
+                )
+        except LockAcquireError:
+            log.debug(
+                'event=job.shard_skipped job=%s shard=%d reason=locked',
+                name, index,
+            )
+    return completed
@@ -0,0 +1,101 @@
+"""
+Persistent scheduler job state backed by NATS JetStream Key-Value store.
+
+Usage
+-----
+    state = await load_job_state(js, "daily_expiry.last_run")
+    ...
+    await save_job_state(js, "daily_expiry.last_run", {"started_at": now})
+
+Semantics
+---------
+- Values are small JSON documents keyed by a dotted job slug.
+- The bucket has no TTL: state survives restarts and leader changes, so
+  whichever replica runs the job next picks up where the last one stopped.
+- Both helpers are best-effort.  A failed load returns ``None`` and a failed
+  save is logged; callers must treat missing state as "start from scratch"
+  and keep their work idempotent.
+
+Bucket
+------
+Bucket name: ``"job_state"``
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+
+from nats.js import JetStreamContext
+from nats.js.errors import KeyNotFoundError, NotFoundError
+from nats.js.kv import KeyValue
+
+log = logging.getLogger(__name__)
+
+STATE_BUCKET = "job_state"
+
+
+async def _get_or_create_bucket(js: JetStreamContext) -> KeyValue:
+    """Return existing KV bucket or create it (idempotent)."""
+    try:
+        return await js.key_value(STATE_BUCKET)
+    except (NotFoundError, Exception):
+        try:
+            from nats.js.kv import KeyValueConfig  # type: ignore[attr-defined]
+        except Exception:
+            from nats.js.api import KeyValueConfig  # type: ignore
+        cfg = KeyValueConfig(
+            bucket=STATE_BUCKET,
+            max_value_size=64 * 1024,
+            history=1,
+        )
+        return await js.create_key_value(cfg)
+
+
+async def load_job_state(js: JetStreamContext | None, key: str) -> dict | None:
+    """Return the stored state for *key*, or ``None`` if absent/unavailable."""
+    if js is None:
+        return None
+    try:
+        kv = await _get_or_create_bucket(js)
+        entry = await kv.get(key)
+    except KeyNotFoundError:
+        return None
+    except Exception:
+        log.exception("event=job_state.load_failed key=%s", key)
+        return None
+    try:
+        return json.loads(entry.value.decode())
+    except Exception:
+        log.warning("event=job_state.decode_failed key=%s", key)
+        return None
+
+
+async def save_job_state(
+    js: JetStreamContext | None,
+    key: str,
+    state: dict,
+) -> bool:
+    """Persist *state* under *key*.  Returns False if the write failed."""
+    if js is None:
+        return False
+    try:
+        kv = await _get_or_create_bucket(js)
+        await kv.put(key, json.dumps(state).encode())
+        return True
+    except Exception:
+        log.exception("event=job_state.save_failed key=%s", key)
+        return False
+
+
+async def delete_job_state(js: JetStreamContext | None, key: str) -> None:
+    """Drop the stored state for *key*; missing keys are ignored."""
+    if js is None:
+        return
+    try:
+        kv = await _get_or_create_bucket(js)
+        await kv.delete(key)
+    except KeyNotFoundError:
+        return
+    except Exception:
+        log.exception("event=job_state.delete_failed key=%s", key)
@@ -1,12 +1,15 @@
 import gettext
 import re
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
+from typing import ClassVar
 
 from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.database.methods.get import get_person_lang
+from bot.misc.user_context import current_user_context
 from bot.misc.util import CONFIG
 
 default_font = (
@@ -22,11 +25,33 @@ async def get_lang(session: AsyncSession, user_id: int, state: FSMContext=None):
         data = await state.get_data()
         lang = data.get('lang')
         if lang is None:
-            lang = await get_person_lang(session, user_id)
+            lang = await _person_lang(session, user_id)
             await state.update_data(lang=lang)
         return lang
     else:
-        return await get_person_lang(session, user_id)
+        return await _person_lang(session, user_id)
+
+
+async def _person_lang(session: AsyncSession, user_id: int):
+    ctx = current_user_context(user_id)
+    if ctx is not None:
+        return ctx.lang
+    return await get_person_lang(session, user_id)
+
+
+def _font_map() -> dict[int, int]:
+    if CONFIG.font_template != '':
+        template = CONFIG.font_template
+    else:
+        template = default_font
+    return str.maketrans(default_font, template)
+
+
+_FONT_MAP = _font_map()
+_FONT_SPLIT = re.compile(r'<[^>]*>|{[^}]*}|[^<{]+')
+# Memoized (key, language, font) lookups; the catalog is finite, the bound
+# only guards against callers passing free-form text through ``_``.
+TEXT_CACHE_SIZE = 8192
 
 
 @dataclass
@@ -36,50 +61,65 @@ class Localization:
         'ru': '🇷🇺 Ꮲуᴄᴄᴋий'
     }
     PATH = Path(__file__).resolve().parent.parent / 'locale'
+    _catalogs: ClassVar[dict[str, gettext.NullTranslations]] = {}
 
     @classmethod
-    def font_text(cls, text):
-        if CONFIG.font_template != '':
-            template = CONFIG.font_template
-        else:
-            template = default_font
-        font_map = str.maketrans(
-            default_font,
-            template
-        )
+    def catalog(cls, language) -> gettext.NullTranslations:
+        """Parsed .mo catalog for *language*, loaded once per process."""
+        catalog = cls._catalogs.get(language)
+        if catalog is None:
+            catalog = gettext.translation(
+                'bot',
+                localedir=cls.PATH,
+                languages=[language]
+            )
+            cls._catalogs[language] = catalog
+        return catalog
+
+    @classmethod
+    def preload(cls) -> None:
+        """Load every catalog up front so the first update pays nothing."""
+        for lang_key in cls.ALL_Languages:
+            cls.catalog(lang_key)
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        cls._catalogs.clear()
+        _translate.cache_clear()
+        _reply_button.cache_clear()
 
+    @classmethod
+    def font_text(cls, text):
         def replace(match):
             content = match.group(0)
             if content.startswith('<') and content.endswith('>'):
                 return content
             if content.startswith('{') and content.endswith('}'):
                 return content
-            return content.translate(font_map)
+            return content.translate(_FONT_MAP)
 
-        return re.sub(r'<[^>]*>|{[^}]*}|[^<{]+', replace, text)
+        return _FONT_SPLIT.sub(replace, text)
 
     @classmethod
     def get_reply_button(cls, key_text) -> list:
-        buttons_text = []
-        for lang_key in cls.ALL_Languages.keys():
-            lang = gettext.translation(
-                'bot',
-                localedir=cls.PATH,
-                languages=[lang_key]
-            )
-            lang.install()
-            buttons_text.append(cls.font_text(lang.gettext(key_text)))
-        return buttons_text
+        return list(_reply_button(key_text))
 
     @classmethod
     def text(cls, key_text, language=CONFIG.languages, font=True):
-        lang = gettext.translation(
-            'bot',
-            localedir=cls.PATH,
-            languages=[language]
-        )
-        lang.install()
-        if font:
-            return cls.font_text(lang.gettext(key_text))
-        else:
-            return lang.gettext(key_text)
+        return _translate(key_text, language, font)
+
+
+@lru_cache(maxsize=TEXT_CACHE_SIZE)
+def _translate(key_text, language, font) -> str:
+    text = Localization.catalog(language).gettext(key_text)
+    if font:
+        return Localization.font_text(text)
+    return text
+
+
+@lru_cache(maxsize=None)
+def _reply_button(key_text) -> tuple[str, ...]:
+    return tuple(
+        _translate(key_text, lang_key, True)
+        for lang_key in Localization.ALL_Languages
+    )
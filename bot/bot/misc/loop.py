@@ -1,31 +1,40 @@
 import logging
 import time
+from datetime import datetime, timezone
+from functools import partial
 from time import perf_counter
 
 from aiogram import Bot
 from aiogram.types import FSInputFile
 from nats.js import JetStreamContext
+from prometheus_client import Counter, Histogram
 from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
 
+from bot.database.cache import invalidate_person
 from bot.database.methods.delete import delete_key_in_user
 from bot.database.methods.insert import add_payment
 from bot.database.methods.get import (
-    get_all_subscription,
-    get_server_id,
+    get_count_key_user,
+    get_expired_trial_persons,
+    get_keys_crossed_expiry,
+    get_keys_expiring_before,
+    get_keys_pending_deletion,
+    get_server_dto,
     get_payment
 )
 from bot.database.methods.update import (
+    KEY_NOTIFICATION_FLAGS,
     person_banned_true,
-    key_one_day_true,
-    key_three_days_true,
-    key_expired_true,
+    keys_notified_bulk,
     add_time_key,
-    set_user_migration_status,
+    set_users_migration_status_bulk,
 )
 from bot.keyboards.inline.user_inline import mailing_button_message
 from bot.handlers.migration import send_migration_prompt
+from bot.misc.job_runner import run_sharded
 from bot.misc.Payment.KassaSmart import KassaSmart
 from bot.misc.language import Localization
+from bot.misc.notify_dispatcher import Notification, NotificationDispatcher
 from bot.misc.remove_key_servise.publisher import remove_key_server
 from bot.misc.util import CONFIG
 from bot.services.migration_service import (
@@ -41,6 +50,21 @@ _ = Localization.text
 COUNT_SECOND_DAY = 86400
 COUNT_SECOND_3DAYS = 86400 * 3
 
+DAILY_EXPIRY_JOB = 'daily_expiry'
+DAILY_EXPIRY_HOUR_UTC = 10
+EXPIRY_BATCH_SIZE = 500
+
+EXPIRY_TICK_DURATION = Histogram(
+    'expiry_tick_duration_seconds',
+    'Expiry engine tick wall time in seconds',
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 15.0, 60.0),
+)
+EXPIRY_TICK_ROWS = Counter(
+    'expiry_tick_rows_total',
+    'Rows handled by the expiry engine, by counter',
+    ['counter'],
+)
+
 
 month_count_amount = {
     12: CONFIG.month_cost[3],
@@ -56,168 +80,303 @@ async def loop(
     js: JetStreamContext,
     remove_key_subject: str
 ):
+    """Expiry engine tick.
+
+    Instead of walking every person, each tick runs three index range scans:
+    keys that are expired and already notified (deleted now), keys whose
+    subscription crossed ``now`` and are not flagged yet (flagged and
+    notified now, deleted next tick) and persons whose trial ended.  The tick cost follows the number of expiries, not the user count.
+    """
     start = perf_counter()
+    now = int(time.time())
     counters = {
+        'keys_scanned': 0,
+        'keys_notified': 0,
         'keys_expired_processed': 0,
         'keys_deleted': 0,
+        'persons_banned': 0,
         'trials_expired_processed': 0,
     }
     log.debug('job.loop.start')
     try:
         async with session_pool() as session:
-            all_persons = await get_all_subscription(session)
-            for person in all_persons:
-                # Check regular subscription expiry
-                await check_date(person, bot, session, js, remove_key_subject, counters)
-                # Check trial expiry
-                await check_trial_expiry(person, bot, session, counters)
+            await process_pending_deletions(
+                session, js, remove_key_subject, now, counters
+            )
+            await process_crossed_expiry(bot, session, now, counters)
+            await process_expired_trials(bot, session, counters)
     except Exception as e:
         log.error('job.loop.error', exc_info=e)
     finally:
         duration = perf_counter() - start
-        log.debug(
+        EXPIRY_TICK_DURATION.observe(duration)
+        for name, value in counters.items():
+            if value:
+                EXPIRY_TICK_ROWS.labels(counter=name).inc(value)
+        log_method = log.info if any(counters.values()) else log.debug
+        log_method(
             'job.loop.done',
             extra={
                 'duration_s': round(duration, 3),
-                'keys_expired_processed': counters['keys_expired_processed'],
-                'keys_deleted': counters['keys_deleted'],
-                'trials_expired_processed': counters['trials_expired_processed']
+                **counters,
             }
         )
 
 
-async def check_date(
-    person,
-    bot: Bot,
+async def process_pending_deletions(
     session: AsyncSession,
     js: JetStreamContext,
     remove_key_subject: str,
-    counters: dict | None = None
+    now: int,
+    counters: dict,
+) -> None:
+    """Delete keys that expired and were notified on an earlier tick."""
+    keys = await get_keys_pending_deletion(
+        session, now, limit=EXPIRY_BATCH_SIZE
+    )
+    counters['keys_scanned'] += len(keys)
+    for key in keys:
+        counters['keys_expired_processed'] += 1
+        key_id = key.id
+        user_tgid = key.user_tgid
+        server_id = key.server
+        days_left = max(0, (key.subscription - now) // COUNT_SECOND_DAY)
+        log.info('event=subscription_expiry action=delete_attempt', extra={
+            'user_id': user_tgid,
+            'key_id': key_id,
+            'server_id': server_id,
+            'days_left': int(days_left)
+        })
+        try:
+            await delete_key(session, js, remove_key_subject, key)
+        except Exception as e:
+            log.error(
+                'event=subscription_expiry action=delete_failed key_id=%s',
+                key_id,
+                exc_info=e
+            )
+            # Rolling back expires the remaining rows of this batch, so stop
+            # here; they are still pending and the next tick retries them.
+            await session.rollback()
+            break
+        counters['keys_deleted'] += 1
+        log.info('event=subscription_expiry action=deleted', extra={
+            'user_id': user_tgid,
+            'key_id': key_id,
+            'server_id': server_id,
+            'days_left': int(days_left)
+        })
+        if await get_count_key_user(session, user_tgid) == 0:
+            await person_banned_true(session, user_tgid)
+            counters['persons_banned'] += 1
+
+
+async def process_crossed_expiry(
+    bot: Bot,
+    session: AsyncSession,
+    now: int,
+    counters: dict,
+) -> None:
+    """Flag and notify keys whose subscription ended and that are not
+    flagged yet.
+
+    There is deliberately no lower time bound: a key can become unflagged
+    long after it expired (``add_time_key`` resets ``notified_expired``,
+    backdated admin edits, imports), and the ``notified_expired`` predicate
+    already keeps the scan to that delta.  Rows beyond
+    ``EXPIRY_BATCH_SIZE`` stay unflagged and are picked up next tick.
+    """
+    keys = await get_keys_crossed_expiry(
+        session, until=now, limit=EXPIRY_BATCH_SIZE
+    )
+    counters['keys_scanned'] += len(keys)
+    batch = ExpiryNotificationBatch(bot)
+    for key in keys:
+        await batch.add(key, 'expired')
+    counters['keys_notified'] += await batch.flush(session)
+
+
+async def process_expired_trials(
+    bot: Bot,
+    session: AsyncSession,
+    counters: dict,
+) -> None:
+    persons = await get_expired_trial_persons(
+        session, datetime.now(), limit=EXPIRY_BATCH_SIZE
+    )
+    for person in persons:
+        await check_trial_expiry(person, bot, session, counters)
+
+
+async def daily_expiry_notifications(
+    bot: Bot,
+    session_pool: async_sessionmaker,
+    js: JetStreamContext | None = None,
 ):
-    try:
-        for key in person.keys:
-            if key.free_key:
-                continue
-            if key.subscription <= int(time.time()):
-                if not key.notified_expired:
-                    await key_expired_true(session, key_id=key.id)
-                    try:
-                        await send_expired_notification(bot, session, person, key)
-                    except Exception:
-                        log.info(f'User {person.tgid} blocked bot')
-                    continue
-                # count attempted expired key processing
-                if counters is not None:
-                    counters['keys_expired_processed'] += 1
-
-                # structured log before deletion attempt
-                days_left = max(
-                    0,
-                    (key.subscription - int(time.time())) // COUNT_SECOND_DAY
-                )
-                server_id = getattr(key, 'server', None)
-                log.info('event=subscription_expiry action=delete_attempt', extra={
-                    'user_id': person.tgid,
-                    'key_id': key.id,
-                    'server_id': server_id,
-                    'days_left': int(days_left)
-                })
-
-                try:
-                    await delete_key(session, js, remove_key_subject, key)
-                    # successful delete
-                    if counters is not None:
-                        counters['keys_deleted'] += 1
-                    log.info('event=subscription_expiry action=deleted', extra={
-                        'user_id': person.tgid,
-                        'key_id': key.id,
-                        'server_id': server_id,
-                        'days_left': int(days_left)
-                    })
-                except Exception as e:
-                    log.error('event=subscription_expiry action=delete_failed key_id=%s', key.id, exc_info=e)
-                    raise
-                person.keys.remove(key)
-                if len(person.keys) == 0:
-                    await person_banned_true(session, person.tgid)
-    except Exception as e:
-        log.error(
-            "Error in the user date verification cycle: %s", exc_info=e
-        )
+    """Send the day's renewal reminders, sharded by ``Persons.id``.
+
+    Scheduled on an interval on every replica; it is a no-op before
+    ``DAILY_EXPIRY_HOUR_UTC`` and once every shard of today's run is done,
+    so a shard interrupted by a crash is finished by the next tick.
+    """
+    now_utc = datetime.now(timezone.utc)
+    if now_utc.hour < DAILY_EXPIRY_HOUR_UTC:
         return
+    notified = 0
 
+    async def notify_range(lo, hi, after_id):
+        nonlocal notified
+        now = int(time.time())
+        async with session_pool() as session:
+            keys = await get_keys_expiring_before(
+                session,
+                now + COUNT_SECOND_3DAYS,
+                after_id=after_id,
+                limit=EXPIRY_BATCH_SIZE,
+                person_id_from=lo,
+                person_id_to=hi,
+            )
+            batch = ExpiryNotificationBatch(bot)
+            for key in keys:
+                seconds_left = int(key.subscription) - now
+                if seconds_left <= 0:
+                    if not key.notified_expired:
+                        await batch.add(key, 'expired')
+                elif seconds_left <= COUNT_SECOND_DAY:
+                    if not (key.notified_1day or key.notion_oneday):
+                        await batch.add(key, 'one_day')
+                elif not key.notified_3days:
+                    await batch.add(key, 'three_days')
+            notified += await batch.flush(session)
+        if len(keys) < EXPIRY_BATCH_SIZE:
+            return None
+        return keys[-1].id
 
-async def daily_expiry_notifications(bot: Bot, session_pool: async_sessionmaker):
-    now = int(time.time())
     try:
-        async with session_pool() as session:
-            all_persons = await get_all_subscription(session)
-            for person in all_persons:
-                for key in person.keys:
-                    if key.free_key:
-                        continue
-                    seconds_left = int(key.subscription) - now
-                    try:
-                        if seconds_left <= 0:
-                            if key.notified_expired:
-                                continue
-                            await key_expired_true(session, key_id=key.id)
-                            await send_expired_notification(bot, session, person, key)
-                        elif seconds_left <= COUNT_SECOND_DAY:
-                            if key.notified_1day or key.notion_oneday:
-                                continue
-                            await key_one_day_true(session, key_id=key.id)
-                            await bot.send_message(
-                                person.tgid,
-                                _('alert_to_renew_sub_1day', person.lang),
-                                disable_web_page_preview=True,
-                                reply_markup=await mailing_button_message(
-                                    person.lang, CONFIG.type_buttons_mailing[0]
-                                )
-                            )
-                        elif seconds_left <= COUNT_SECOND_3DAYS:
-                            if key.notified_3days:
-                                continue
-                            await key_three_days_true(session, key_id=key.id)
-                            await bot.send_message(
-                                person.tgid,
-                                _('alert_to_renew_sub_3days', person.lang),
-                                disable_web_page_preview=True,
-                                reply_markup=await mailing_button_message(
-                                    person.lang, CONFIG.type_buttons_mailing[0]
-                                )
-                            )
-                    except Exception:
-                        log.info(f'User {person.tgid} blocked bot')
+        shards = await run_sharded(
+            js,
+            DAILY_EXPIRY_JOB,
+            now_utc.date().isoformat(),
+            session_pool,
+            notify_range,
+        )
     except Exception as e:
         log.error('event=daily_expiry_notifications status=failed', exc_info=e)
+        return
+    if shards:
+        log.info(
+            'event=daily_expiry_notifications status=done shards=%d notified=%d',
+            shards,
+            notified,
+        )
 
 
-async def send_expired_notification(
-    bot: Bot,
-    session: AsyncSession,
-    person,
-    key,
-) -> None:
-    type_vpn = int(getattr(getattr(key, 'server_table', None), 'type_vpn', -1))
-    if is_legacy_backend_type(type_vpn):
-        if not should_send_migration_prompt(getattr(person, "migration_status", None)):
+class ExpiryNotificationBatch:
+    """Collects renewal reminders for a batch of keys.
+
+    ``flush`` sets the notification flags of the whole batch with one UPDATE
+    per stage before anything is sent, so an interrupted run never notifies
+    twice, then fans the messages out through ``NotificationDispatcher``.
+    Keyboards are built once per language, and a user with several legacy
+    keys gets a single migration prompt per run.
+    """
+
+    _STAGE_TEXT = {
+        'three_days': 'alert_to_renew_sub_3days',
+        'one_day': 'alert_to_renew_sub_1day',
+    }
+
+    def __init__(self, bot: Bot) -> None:
+        self.bot = bot
+        self.dispatcher = NotificationDispatcher()
+        self.key_ids = {stage: [] for stage in KEY_NOTIFICATION_FLAGS}
+        self.notifications: list[Notification] = []
+        self._markups: dict = {}
+        self._prompted: set[int] = set()
+
+    async def _mailing_markup(self, lang):
+        markup = self._markups.get(lang)
+        if markup is None:
+            markup = await mailing_button_message(
+                lang, CONFIG.type_buttons_mailing[0]
+            )
+            self._markups[lang] = markup
+        return markup
+
+    async def add(self, key, stage: str) -> None:
+        self.key_ids[stage].append(key.id)
+        person = key.person
+        if person is None:
             return
-        await send_migration_prompt(bot, person.tgid, person.lang)
-        await set_user_migration_status(
-            session,
-            person.tgid,
-            MIGRATION_STATUS_PROMPT_SENT,
+        if stage == 'expired':
+            notification = await self._expired_notification(person, key)
+        else:
+            notification = Notification(
+                chat_id=person.tgid,
+                send=partial(
+                    self.bot.send_message,
+                    person.tgid,
+                    _(self._STAGE_TEXT[stage], person.lang),
+                    disable_web_page_preview=True,
+                    reply_markup=await self._mailing_markup(person.lang),
+                ),
+                tag=('alert', person.tgid),
+            )
+        if notification is not None:
+            self.notifications.append(notification)
+
+    async def _expired_notification(self, person, key) -> Notification | None:
+        type_vpn = int(
+            getattr(getattr(key, 'server_table', None), 'type_vpn', -1)
         )
-        return
-    await bot.send_message(
-        person.tgid,
-        _('alert_expired_sub', person.lang),
-        disable_web_page_preview=True,
-        reply_markup=await mailing_button_message(
-            person.lang, CONFIG.type_buttons_mailing[0]
+        if is_legacy_backend_type(type_vpn):
+            if not should_send_migration_prompt(
+                getattr(person, "migration_status", None)
+            ):
+                return None
+            if person.tgid in self._prompted:
+                return None
+            self._prompted.add(person.tgid)
+            return Notification(
+                chat_id=person.tgid,
+                send=partial(
+                    send_migration_prompt, self.bot, person.tgid, person.lang
+                ),
+                tag=('migration', person.tgid),
+            )
+        return Notification(
+            chat_id=person.tgid,
+            send=partial(
+                self.bot.send_message,
+                person.tgid,
+                _('alert_expired_sub', person.lang),
+                disable_web_page_preview=True,
+                reply_markup=await self._mailing_markup(person.lang),
+            ),
+            tag=('alert', person.tgid),
         )
-    )
+
+    async def flush(self, session: AsyncSession) -> int:
+        """Persist flags, send the collected messages and reset the batch.
+
+        Returns the number of keys flagged.
+        """
+        flagged = 0
+        for stage, key_ids in self.key_ids.items():
+            flagged += len(key_ids)
+            await keys_notified_bulk(session, key_ids, stage)
+            key_ids.clear()
+        notifications, self.notifications = self.notifications, []
+        if not notifications:
+            return flagged
+        report = await self.dispatcher.dispatch(notifications)
+        prompted = [
+            tgid for kind, tgid in report.delivered if kind == 'migration'
+        ]
+        await set_users_migration_status_bulk(
+            session, prompted, MIGRATION_STATUS_PROMPT_SENT
+        )
+        return flagged
 
 
 async def delete_key(
@@ -233,7 +392,7 @@ async def delete_key(
     """
     await delete_key_in_user(session, key.id)
     if key.server is not None:
-        server = await get_server_id(session, key.server)
+        server = await get_server_dto(session, key.server)
         try:
             await remove_key_server(
                 js,
@@ -311,8 +470,6 @@ async def check_trial_expiry(
     - Mark trial keys as work = False OR delete them
     - Notify user
     """
-    from datetime import datetime
-    
     try:
         if not person.trial_period:
             return
@@ -342,6 +499,7 @@ async def check_trial_expiry(
         person.trial_period = False
         person.trial_expires_at = None
         await session.commit()
+        await invalidate_person(person.tgid)
         
         # Delete trial keys or mark them as expired
         trial_keys_count = 0
@@ -0,0 +1,298 @@
+"""
+Rate-limited, concurrent fan-out of Telegram messages.
+
+Usage
+-----
+    dispatcher = NotificationDispatcher()
+    report = await dispatcher.dispatch(
+        Notification(
+            chat_id=tgid,
+            send=partial(bot.send_message, tgid, text),
+            tag=key_id,
+        )
+        for tgid, text, key_id in rows
+    )
+    report.delivered  # tags of messages Telegram accepted
+
+Semantics
+---------
+- Up to ``concurrency`` sends are in flight at once.
+- Every send takes a token from a bucket shared by the whole process, so
+  concurrent jobs together stay under Telegram's global bot limit
+  (``CONFIG.telegram_send_rate`` messages per second).  With
+  ``TELEGRAM_SEND_RATE_REDIS=1`` (default) the bucket also counts sends per
+  second in Redis, so all replicas together stay under the same limit, and
+  a flood-control pause on one replica pauses them all.  If Redis is
+  unreachable each process falls back to its own budget.
+- Messages to the same chat are spaced ``PER_CHAT_INTERVAL_SEC`` apart.
+- ``TelegramRetryAfter`` pauses the shared bucket for the requested time and
+  retries the message, up to ``MAX_SEND_ATTEMPTS`` attempts.
+- ``TelegramForbiddenError`` (bot blocked / user deactivated) is reported in
+  ``blocked`` and never retried; any other error is reported in ``failed``.
+- ``dispatch`` accepts plain or async iterables and pulls from them lazily,
+  so callers can stream very large audiences.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from bot.misc.util import CONFIG
+
+log = logging.getLogger(__name__)
+
+PER_CHAT_INTERVAL_SEC = 1.0
+MAX_SEND_ATTEMPTS = 3
+# A stalled Redis delays a send at most this long before the process
+# falls back to its own budget.
+REDIS_TIMEOUT_SEC = 0.5
+# Seconds sends use only the local budget after a Redis error.
+REDIS_RETRY_SEC = 30
+
+
+class TokenBucket:
+    """Asyncio token bucket; ``acquire`` waits until a token is available."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def pause(self, seconds: float) -> None:
+        """Block all acquirers for *seconds* (Telegram flood control)."""
+        until = time.monotonic() + max(0.0, float(seconds))
+        if until > self._paused_until:
+            self._paused_until = until
+            self._tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if self._paused_until > now:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RedisTokenBucket(TokenBucket):
+    """TokenBucket whose budget is also counted in Redis, per second and
+    per bot, so every replica sending with the same token shares it."""
+
+    def __init__(self, redis, rate: float, prefix: str) -> None:
+        super().__init__(rate)
+        self.redis = redis
+        self.prefix = prefix
+        self._down_until = 0.0
+
+    def _redis_failed(self, error: Exception) -> None:
+        log.warning(
+            'event=notify.budget_failed error=%s', type(error).__name__
+        )
+        self._down_until = time.monotonic() + REDIS_RETRY_SEC
+
+    def pause(self, seconds: float) -> None:
+        super().pause(seconds)
+        task = asyncio.create_task(self._share_pause(seconds))
+        _background.add(task)
+        task.add_done_callback(_background.discard)
+
+    async def _share_pause(self, seconds: float) -> None:
+        until = time.time() + max(0.0, float(seconds))
+        try:
+            await self.redis.set(
+                f'{self.prefix}:paused_until',
+                str(until),
+                px=max(1, int(seconds * 1000)),
+            )
+        except Exception as e:
+            self._redis_failed(e)
+
+    async def _take_shared(self) -> float:
+        """Seconds to wait before sending, 0 once a send is granted."""
+        now = time.time()
+        paused_until = await self.redis.get(f'{self.prefix}:paused_until')
+        if paused_until is not None and float(paused_until) > now:
+            return float(paused_until) - now
+        window = int(now)
+        key = f'{self.prefix}:{window}'
+        async with self.redis.pipeline(transaction=True) as pipe:
+            sent, _ = await pipe.incr(key).expire(key, 2).execute()
+        if sent <= self.rate:
+            return 0.0
+        return window + 1 - now
+
+    async def acquire(self) -> None:
+        await super().acquire()
+        while time.monotonic() >= self._down_until:
+            try:
+                wait = await self._take_shared()
+            except Exception as e:
+                self._redis_failed(e)
+                return
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+_shared_bucket: TokenBucket | None = None
+_background: set[asyncio.Task] = set()
+
+
+def shared_bucket() -> TokenBucket:
+    """Bucket for the bot token's global send limit: shared through Redis
+    by all replicas, or by this process only."""
+    global _shared_bucket
+    if _shared_bucket is None:
+        if CONFIG.telegram_send_rate_redis:
+            from redis.asyncio import Redis
+            redis = Redis.from_url(
+                CONFIG.redis_url,
+                socket_timeout=REDIS_TIMEOUT_SEC,
+                socket_connect_timeout=REDIS_TIMEOUT_SEC,
+            )
+            _shared_bucket = RedisTokenBucket(
+                redis,
+                CONFIG.telegram_send_rate,
+                f'notify:budget:{CONFIG.tg_token.split(":", 1)[0]}',
+            )
+        else:
+            _shared_bucket = TokenBucket(CONFIG.telegram_send_rate)
+    return _shared_bucket
+
+
+@dataclass(slots=True)
+class Notification:
+    chat_id: int
+    send: Callable[[], Awaitable[Any]]
+    tag: Any = None
+
+
+@dataclass(slots=True)
+class DispatchReport:
+    delivered: list = field(default_factory=list)
+    blocked: list = field(default_factory=list)
+    failed: list = field(default_factory=list)
+    retry_after_hits: int = 0
+
+    @property
+    def total(self) -> int:
+        return len(self.delivered) + len(self.blocked) + len(self.failed)
+
+
+class NotificationDispatcher:
+    def __init__(
+        self,
+        concurrency: int | None = None,
+        bucket: TokenBucket | None = None,
+        per_chat_interval: float = PER_CHAT_INTERVAL_SEC,
+        max_attempts: int = MAX_SEND_ATTEMPTS,
+    ) -> None:
+        self.concurrency = concurrency or CONFIG.telegram_send_concurrency
+        self.bucket = bucket or shared_bucket()
+        self.per_chat_interval = per_chat_interval
+        self.max_attempts = max_attempts
+        self._chat_next_slot: dict[int, float] = {}
+
+    async def _wait_chat_slot(self, chat_id: int) -> None:
+        now = time.monotonic()
+        slot = max(now, self._chat_next_slot.get(chat_id, 0.0))
+        self._chat_next_slot[chat_id] = slot + self.per_chat_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _deliver(self, item: Notification, report: DispatchReport) -> None:
+        for attempt in range(1, self.max_attempts + 1):
+            await self._wait_chat_slot(item.chat_id)
+            await self.bucket.acquire()
+            try:
+                await item.send()
+            except TelegramRetryAfter as e:
+                report.retry_after_hits += 1
+                self.bucket.pause(e.retry_after)
+                log.warning(
+                    "event=notify.retry_after chat_id=%s retry_after=%s attempt=%d",
+                    item.chat_id,
+                    e.retry_after,
+                    attempt,
+                )
+                continue
+            except TelegramForbiddenError:
+                log.info(f'User {item.chat_id} blocked bot')
+                report.blocked.append(item.tag)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.info(
+                    "event=notify.failed chat_id=%s error=%s",
+                    item.chat_id,
+                    type(e).__name__,
+                )
+                report.failed.append(item.tag)
+                return
+            report.delivered.append(item.tag)
+            return
+        report.failed.append(item.tag)
+
+    async def dispatch(
+        self,
+        notifications: Iterable[Notification] | AsyncIterable[Notification],
+    ) -> DispatchReport:
+        report = DispatchReport()
+        source_lock = asyncio.Lock()
+        if hasattr(notifications, '__aiter__'):
+            async_source = notifications.__aiter__()
+
+            async def _next() -> Notification | None:
+                async with source_lock:
+                    try:
+                        return await async_source.__anext__()
+                    except StopAsyncIteration:
+                        return None
+        else:
+            sync_source = iter(notifications)
+
+            async def _next() -> Notification | None:
+                return next(sync_source, None)
+
+        async def _worker() -> None:
+            while True:
+                item = await _next()
+                if item is None:
+                    return
+                await self._deliver(item, report)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(_worker() for _ in range(self.concurrency)))
+        if report.total:
+            log.info(
+                "event=notify.dispatched total=%d delivered=%d blocked=%d "
+                "failed=%d retry_after=%d duration_s=%.2f",
+                report.total,
+                len(report.delivered),
+                len(report.blocked),
+                len(report.failed),
+                report.retry_after_hits,
+                time.perf_counter() - start,
+            )
+        return report
@@ -14,7 +14,7 @@ from nats.js import JetStreamContext, api
 from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from bot.database.methods.delete import delete_not_keys
-from bot.database.methods.get import get_server_id
+from bot.database.methods.get import get_server_dto
 from bot.database.methods.update import server_space_update
 from bot.misc.VPN.ServerManager import ServerManager
 from bot.misc.remove_key_servise.remove_task import TaskRemove
@@ -86,87 +86,142 @@ class RemoveKeyConsumer:
     async def worker(self):
         while True:
             try:
-                msgs = await self.stream_sub.fetch(1, timeout=5)
+                msgs = await self.stream_sub.fetch(
+                    CONFIG.remove_key_batch_size, timeout=5
+                )
             except asyncio.CancelledError:
                 logger.info("event=remove_key_consumer.worker_cancel signal=task_cancel")
                 raise
             except TimeoutError:
                 continue
 
-            for msg in msgs:
-                try:
-                    await self.on_message(msg)
-                except asyncio.CancelledError:
-                    logger.info(
-                        "event=remove_key_consumer.message_cancel signal=task_cancel"
-                    )
-                    raise
-                except Exception:
-                    logger.exception("Unhandled error in consumer")
+            try:
+                await self.process_batch(msgs)
+            except asyncio.CancelledError:
+                logger.info(
+                    "event=remove_key_consumer.message_cancel signal=task_cancel"
+                )
+                raise
+            except Exception:
+                logger.exception("Unhandled error in consumer")
 
-    async def on_message(self, msg: Msg):
-        data = json.loads(msg.data.decode())
-        if data.get("wg_public_key") is None:
-            data['wg_public_key'] = ''
-        task = TaskRemove(**data)
+    async def process_batch(self, msgs: list[Msg]) -> None:
+        """Group a fetched batch by server and drain the servers in parallel.
+
+        Every message is still acked or nak'd on its own.
+        """
+        by_server: dict[int, list[tuple[Msg, TaskRemove]]] = {}
+        for msg in msgs:
+            try:
+                data = json.loads(msg.data.decode())
+                if data.get("wg_public_key") is None:
+                    data['wg_public_key'] = ''
+                task = TaskRemove(**data)
+            except Exception:
+                logger.exception("Unhandled error in consumer")
+                continue
+            by_server.setdefault(task.server_id, []).append((msg, task))
+        if not by_server:
+            return
         async with self.session_pool() as session:
-            server = await get_server_id(session, task.server_id)
-            if server is None:
+            servers = {
+                server_id: await get_server_dto(session, server_id)
+                for server_id in by_server
+            }
+        await asyncio.gather(*(
+            self.process_server(servers[server_id], server_id, items)
+            for server_id, items in by_server.items()
+        ))
+        logger.info(
+            "event=remove_key_consumer.batch_done messages=%d servers=%d",
+            len(msgs),
+            len(by_server),
+        )
+
+    async def process_server(
+        self,
+        server,
+        server_id: int,
+        items: list[tuple[Msg, TaskRemove]],
+    ) -> None:
+        """Delete one server's keys with a single panel session."""
+        if server is None:
+            for msg, task in items:
                 logger.info(
                     f'The server where the key {task.name_key}.{task.key_id}'
                     f'should have been deleted was not found'
                 )
                 await msg.ack()
-                return
+            return
+        # Several messages may target the same panel client (redeliveries).
+        clients: dict[tuple, list[tuple[Msg, TaskRemove]]] = {}
+        for msg, task in items:
+            if server.type_vpn == CONFIG.TypeVpn.WIREGUARD.value:
+                client = (task.wg_public_key, task.key_id)
+            else:
+                client = (task.name_key, task.key_id)
+            clients.setdefault(client, []).append((msg, task))
         try:
             server_manager = ServerManager(server)
             await server_manager.login()
-            if server.type_vpn == CONFIG.TypeVpn.WIREGUARD.value:
-                success = await server_manager.delete_client(
-                    task.wg_public_key, task.key_id
-                )
-            else:
-                success = await server_manager.delete_client(
-                    task.name_key, task.key_id
-                )
-            if success:
-                logger.info(
-                    f'The key {task.name_key}.{task.key_id} '
-                    f'deleted from the server id {server.id}'
-                )
+            result = await server_manager.delete_clients_bulk(list(clients))
+        except Exception as e:
+            logger.error(
+                f"Not delete {len(items)} keys from the server id {server.id} "
+                f"Next attempt in {CONFIG.delay_remove_key} seconds",
+                exc_info=e
+            )
+            for msg, _ in items:
+                await msg.nak(delay=CONFIG.delay_remove_key)
+            return
+
+        deleted = 0
+        for client, entries in clients.items():
+            if client in result.succeeded:
+                deleted += 1
                 async with self.session_pool() as session:
-                    await delete_not_keys(
-                        session,
-                        str(task.name_key),
-                        int(task.key_id),
-                        int(task.server_id)
+                    for msg, task in entries:
+                        logger.info(
+                            f'The key {task.name_key}.{task.key_id} '
+                            f'deleted from the server id {server.id}'
+                        )
+                        await delete_not_keys(
+                            session,
+                            str(task.name_key),
+                            int(task.key_id),
+                            int(task.server_id)
+                        )
+                for msg, _ in entries:
+                    await msg.ack()
+            else:
+                for msg, task in entries:
+                    logger.error(
+                        f"Not delete the key {task.name_key}.{task.key_id} "
+                        f"from the server id {server.id} "
+                        f"Next attempt in {CONFIG.delay_remove_key} seconds"
                     )
-                try:
-                    server_parameters = await server_manager.get_all_user()
+                    logger.error(result.failed.get(client))
+                    await msg.nak(delay=CONFIG.delay_remove_key)
+
+        if deleted:
+            try:
+                users_count = await server_manager.count_users()
+                if users_count is not None:
                     async with self.session_pool() as session:
                         await server_space_update(
                             session,
                             server.id,
-                            len(server_parameters)
+                            users_count
                         )
                     logger.info(f'Server id {server.id} space updated')
-                except Exception as e:
-                    logger.error(
-                        f'Error update server id {server.id} space',
-                        exc_info=e
-                    )
-                finally:
-                    await msg.ack()
-            else:
-                raise ConnectionError()
-        except Exception as e:
-            logger.error(
-                f"Not delete the key {task.name_key}.{task.key_id} "
-                f"from the server id {server.id} "
-                f"Next attempt in {CONFIG.delay_remove_key} seconds"
-            )
-            logger.error(e)
-            await msg.nak(delay=CONFIG.delay_remove_key)
+            except Exception as e:
+                logger.error(
+                    f'Error update server id {server.id} space',
+                    exc_info=e
+                )
+
+    async def on_message(self, msg: Msg):
+        await self.process_batch([msg])
 
     async def stop(self) -> None:
         if self.stream_sub:
@@ -6,7 +6,7 @@ from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from bot.database import engine
 from bot.database.methods.delete import delete_not_keys
-from bot.database.methods.get import get_server_id
+from bot.database.methods.get import get_server_dto
 from bot.database.methods.insert import add_not_remove_key
 from bot.database.methods.update import server_space_update
 from bot.misc.VPN.ServerManager import ServerManager
@@ -88,7 +88,7 @@ async def try_direct_delete(
     wg_public_key: str = None
 ) -> bool:
     """Пытается удалить ключ напрямую, возвращает True если успешно"""
-    server = await get_server_id(session, server_id)
+    server = await get_server_dto(session, server_id)
     if server is None:
         logging.info(
             f'Server {server_id} not found for key {name_key}.{key_id}'
@@ -122,10 +122,11 @@ async def try_direct_delete(
                 int(server_id)
             )
             try:
-                all_client = await server_manager.get_all_user()
-                await server_space_update(
-                    session, server.id, len(all_client)
-                )
+                users_count = await server_manager.count_users()
+                if users_count is not None:
+                    await server_space_update(
+                        session, server.id, users_count
+                    )
             except Exception as e:
                 logging.error('Error updating server space after direct delete', exc_info=e)
             return True
@@ -0,0 +1,198 @@
+"""
+Webhook-mode ingestion of Telegram updates through a sharded JetStream queue.
+
+Flow
+----
+    Telegram ──POST──▶ any replica (FastAPI, hook_telegram.py)
+                          │ publish_update(): subject aiogram.updates.<shard>
+                          ▼
+                   TelegramUpdateStream (work queue)
+                          │ one durable pull consumer per shard
+                          ▼
+    ShardedUpdateConsumer on every replica ──▶ dp.feed_update()
+
+Ordering
+--------
+``shard = user_id % CONFIG.update_shards``, so all updates of one user land
+on the same subject.  Every shard consumer is a single durable shared by all
+replicas with ``max_ack_pending=1``: JetStream hands out the next update of a
+shard only after the previous one was acked, whichever replica handled it.
+Different shards are processed in parallel across the whole deployment, so
+throughput grows with replicas up to ``update_shards`` concurrent updates.
+
+Delivery
+--------
+The webhook answers 200 only after JetStream accepted the update, and
+publishes with ``Nats-Msg-Id = update_id`` so Telegram retries are deduped.
+Handler errors are logged and acked (as aiogram does in polling mode); a
+replica crash before the ack redelivers the update after ``ACK_WAIT_SEC``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import TYPE_CHECKING, Any
+
+from aiogram.types import Update
+from nats.js import JetStreamContext, api
+from nats.js.errors import NotFoundError
+
+from bot.misc.util import CONFIG
+
+if TYPE_CHECKING:
+    from aiogram import Bot, Dispatcher
+
+log = logging.getLogger(__name__)
+
+# Updates older than this are dropped from the stream unprocessed.
+STREAM_MAX_AGE_SEC = 60 * 60
+# Telegram redelivers unanswered updates; dedupe them for this long.
+DUPLICATE_WINDOW_SEC = 10 * 60
+# Longest a handler may run before the update is redelivered elsewhere.
+ACK_WAIT_SEC = 5 * 60
+MAX_DELIVER = 3
+
+
+def update_user_id(payload: dict) -> int | None:
+    """Telegram id of the user that caused the update, if there is one."""
+    for field_name, value in payload.items():
+        if field_name == 'update_id' or not isinstance(value, dict):
+            continue
+        for actor in ('from', 'user'):
+            user = value.get(actor)
+            if isinstance(user, dict) and 'id' in user:
+                return int(user['id'])
+        chat = value.get('chat')
+        if isinstance(chat, dict) and 'id' in chat:
+            return int(chat['id'])
+    return None
+
+
+def shard_for(payload: dict, shards: int | None = None) -> int:
+    shards = shards or CONFIG.update_shards
+    user_id = update_user_id(payload)
+    if user_id is None:
+        user_id = int(payload['update_id'])
+    return user_id % shards
+
+
+def shard_subject(shard: int) -> str:
+    return f'{CONFIG.nats_updates_subject}.{shard}'
+
+
+async def ensure_update_stream(js: JetStreamContext) -> None:
+    """Create the update stream on first start (idempotent)."""
+    try:
+        await js.stream_info(CONFIG.nats_updates_stream)
+        return
+    except NotFoundError:
+        pass
+    await js.add_stream(
+        api.StreamConfig(
+            name=CONFIG.nats_updates_stream,
+            subjects=[f'{CONFIG.nats_updates_subject}.*'],
+            retention=api.RetentionPolicy.WORK_QUEUE,
+            storage=api.StorageType.FILE,
+            max_age=STREAM_MAX_AGE_SEC,
+            duplicate_window=DUPLICATE_WINDOW_SEC,
+        )
+    )
+    log.info(
+        'event=update_stream.created stream=%s', CONFIG.nats_updates_stream
+    )
+
+
+async def publish_update(
+    js: JetStreamContext,
+    payload: dict,
+    raw: bytes | None = None,
+) -> int:
+    """Queue one webhook update on its user's shard; returns the shard."""
+    shard = shard_for(payload)
+    await js.publish(
+        shard_subject(shard),
+        raw if raw is not None else json.dumps(payload).encode(),
+        stream=CONFIG.nats_updates_stream,
+        headers={'Nats-Msg-Id': str(payload['update_id'])},
+    )
+    return shard
+
+
+class ShardedUpdateConsumer:
+    def __init__(
+        self,
+        js: JetStreamContext,
+        dp: Dispatcher,
+        bot: Bot,
+        workflow_data: dict[str, Any] | None = None,
+        shards: int | None = None,
+    ) -> None:
+        self.js = js
+        self.dp = dp
+        self.bot = bot
+        # Extra handler kwargs, as passed to dp.start_polling in polling mode.
+        self.workflow_data = workflow_data or {}
+        self.shards = shards or CONFIG.update_shards
+        self._tasks: list[asyncio.Task] = []
+
+    async def run(self) -> None:
+        """Consume every shard until cancelled."""
+        await ensure_update_stream(self.js)
+        consumer_config = api.ConsumerConfig(
+            ack_wait=ACK_WAIT_SEC,
+            max_deliver=MAX_DELIVER,
+            max_ack_pending=1,
+        )
+        for shard in range(self.shards):
+            sub = await self.js.pull_subscribe(
+                subject=shard_subject(shard),
+                durable=f'{CONFIG.nats_updates_durable_name}_{shard}',
+                stream=CONFIG.nats_updates_stream,
+                config=consumer_config,
+            )
+            self._tasks.append(
+                asyncio.create_task(
+                    self._worker(shard, sub), name=f'update-shard:{shard}'
+                )
+            )
+        log.info(
+            'event=update_consumer.started stream=%s shards=%d',
+            CONFIG.nats_updates_stream,
+            self.shards,
+        )
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            self._tasks.clear()
+
+    async def _worker(self, shard: int, sub) -> None:
+        while True:
+            try:
+                msgs = await sub.fetch(1, timeout=5)
+            except TimeoutError:
+                continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception('event=update_consumer.fetch_failed shard=%d', shard)
+                await asyncio.sleep(1)
+                continue
+            for msg in msgs:
+                await self.handle(msg)
+
+    async def handle(self, msg) -> None:
+        try:
+            update = Update.model_validate(
+                json.loads(msg.data), context={'bot': self.bot}
+            )
+            await self.dp.feed_update(self.bot, update, **self.workflow_data)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception('event=update_consumer.update_failed')
+        await msg.ack()
@@ -0,0 +1,139 @@
+"""
+Per-update view of the Telegram user, built once by PersonContextMiddleware.
+
+Filters, ``get_lang`` and handlers used to load the same ``Persons`` row
+three or four times per button press.  The middleware now resolves it once
+(through the person read-through cache) and exposes it two ways:
+
+- as the ``user_ctx`` handler argument;
+- through ``current_user_context()`` for helpers that only get a session
+  and a telegram id, such as ``get_lang``.
+
+A write to the user's row during the update (e.g. a language change) marks
+the context stale; ``get_lang`` then falls back to the cache/database.
+
+Keys are never loaded up front.  ``await user_ctx.key_summary()`` runs one
+aggregate query and ``await user_ctx.keys()`` loads the key rows; both are
+memoized for the rest of the update.
+"""
+
+from __future__ import annotations
+
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Sequence
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.database.cache import PersonDTO, on_person_invalidated
+from bot.database.methods.get import (
+    get_key_summary,
+    get_key_user,
+    get_person_dto,
+)
+from bot.database.models.main import Keys
+from bot.misc.util import CONFIG
+
+
+@dataclass(frozen=True, slots=True)
+class KeySummary:
+    total: int
+    active: int
+    latest_subscription: int | None
+
+
+@dataclass(slots=True)
+class UserContext:
+    telegram_id: int
+    person: PersonDTO | None
+    session: AsyncSession
+    stale: bool = False
+    _key_summary: KeySummary | None = None
+    _keys: Sequence[Keys] | None = None
+
+    @classmethod
+    async def load(cls, session: AsyncSession, telegram_id: int) -> UserContext:
+        return cls(
+            telegram_id=telegram_id,
+            person=await get_person_dto(session, telegram_id),
+            session=session,
+        )
+
+    @property
+    def registered(self) -> bool:
+        return self.person is not None
+
+    @property
+    def lang(self) -> str | None:
+        """Same value get_person_lang returns for this user."""
+        if self.person is None:
+            return CONFIG.languages
+        return self.person.lang
+
+    @property
+    def blocked(self) -> bool:
+        return self.person is not None and self.person.blocked
+
+    @property
+    def group(self) -> str | None:
+        return None if self.person is None else self.person.group
+
+    async def keys(self) -> Sequence[Keys]:
+        """Paid keys with server and location loaded (get_key_user)."""
+        if self._keys is None:
+            self._keys = await get_key_user(self.session, self.telegram_id)
+        return self._keys
+
+    async def key_summary(self) -> KeySummary:
+        if self._key_summary is not None:
+            return self._key_summary
+        if self._keys is not None:
+            now_ts = int(datetime.now().timestamp())
+            subscriptions = [int(key.subscription or 0) for key in self._keys]
+            self._key_summary = KeySummary(
+                total=len(subscriptions),
+                active=sum(1 for sub in subscriptions if sub > now_ts),
+                latest_subscription=max(subscriptions, default=None),
+            )
+        else:
+            row = await get_key_summary(self.session, self.telegram_id)
+            self._key_summary = KeySummary(
+                total=row['total'],
+                active=row['active'],
+                latest_subscription=row['latest_subscription'],
+            )
+        return self._key_summary
+
+
+_current: ContextVar[UserContext | None] = ContextVar(
+    'user_context', default=None
+)
+
+
+def current_user_context(telegram_id: int | None = None) -> UserContext | None:
+    """The up-to-date context of the update being handled, if it belongs
+    to *telegram_id*."""
+    ctx = _current.get()
+    if ctx is None or ctx.stale:
+        return None
+    if telegram_id is not None and ctx.telegram_id != telegram_id:
+        return None
+    return ctx
+
+
+def _mark_stale(telegram_ids: tuple) -> None:
+    ctx = _current.get()
+    if ctx is not None and ctx.telegram_id in telegram_ids:
+        ctx.stale = True
+
+
+on_person_invalidated(_mark_stale)
+
+
+def set_user_context(ctx: UserContext | None):
+    return _current.set(ctx)
+
+
+def reset_user_context(token) -> None:
+    _current.reset(token)
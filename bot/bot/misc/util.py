@@ -1,3 +1,4 @@
+import hashlib
 import os
 import time
 import logging
@@ -98,12 +99,36 @@ class Config:
     nats_remove_consumer_stream: str = 'DeleteKeyStream'
     nats_remove_consumer_durable_name: str = 'remove_key_consumer'
     delay_remove_key: int = 300
+    remove_key_batch_size: int = 50
     alert_server_space: int = 20
     public_subscription_base: str = ''
     subscription_signing_key: str = ''
     # server check protections
     server_check_timeout_sec: int = 8
     server_check_concurrency: int = 5
+    # outgoing Telegram message fan-out
+    telegram_send_rate: int = 25
+    telegram_send_concurrency: int = 20
+    # update ingestion: 'polling' (single instance) or 'webhook' (replicas)
+    telegram_mode: str = 'polling'
+    webhook_base_url: str = ''
+    webhook_path: str = '/telegram/webhook'
+    webhook_secret: str = ''
+    update_shards: int = 32
+    nats_updates_subject: str = 'aiogram.updates'
+    nats_updates_stream: str = 'TelegramUpdateStream'
+    nats_updates_durable_name: str = 'telegram_updates'
+    # Persons.id ranges user-iterating scheduler jobs are split into
+    job_shards: int = 4
+    # check_subs membership cache (seconds); Redis shares it across replicas
+    follow_cache_ttl: int = 600
+    follow_cache_negative_ttl: int = 30
+    follow_cache_redis: bool = True
+    export_format: str = 'xlsx'
+    # Spare panel clients kept per server for instant issuance; 0 disables
+    key_pool_size: int = 5
+    # Keep the TELEGRAM_SEND_RATE budget in Redis, shared by all replicas
+    telegram_send_rate_redis: bool = True
 
     class TypeVpn(Enum):
         OUTLINE = 0
@@ -339,6 +364,126 @@ class Config:
                 raise ValueError('SERVER_CHECK_CONCURRENCY must be > 0')
             self.server_check_concurrency = val
 
+        remove_batch_env = os.getenv('REMOVE_KEY_BATCH_SIZE')
+        if remove_batch_env not in (None, ''):
+            try:
+                val = int(remove_batch_env)
+            except Exception:
+                raise ValueError('Invalid REMOVE_KEY_BATCH_SIZE')
+            if val <= 0:
+                raise ValueError('REMOVE_KEY_BATCH_SIZE must be > 0')
+            self.remove_key_batch_size = val
+
+        send_rate_env = os.getenv('TELEGRAM_SEND_RATE')
+        if send_rate_env not in (None, ''):
+            try:
+                val = int(send_rate_env)
+            except Exception:
+                raise ValueError('Invalid TELEGRAM_SEND_RATE')
+            if val <= 0:
+                raise ValueError('TELEGRAM_SEND_RATE must be > 0')
+            self.telegram_send_rate = val
+
+        send_concurrency_env = os.getenv('TELEGRAM_SEND_CONCURRENCY')
+        if send_concurrency_env not in (None, ''):
+            try:
+                val = int(send_concurrency_env)
+            except Exception:
+                raise ValueError('Invalid TELEGRAM_SEND_CONCURRENCY')
+            if val <= 0:
+                raise ValueError('TELEGRAM_SEND_CONCURRENCY must be > 0')
+            self.telegram_send_concurrency = val
+
+        mode_env = os.getenv('TELEGRAM_MODE')
+        if mode_env not in (None, ''):
+            mode = mode_env.strip().lower()
+            if mode not in ('polling', 'webhook'):
+                raise ValueError('TELEGRAM_MODE must be polling or webhook')
+            self.telegram_mode = mode
+        self.webhook_base_url = os.getenv('WEBHOOK_BASE_URL', '').rstrip('/')
+        if self.telegram_mode == 'webhook' and self.webhook_base_url == '':
+            raise ValueError('Write your public bot URL to WEBHOOK_BASE_URL')
+        webhook_path_env = os.getenv('WEBHOOK_PATH')
+        if webhook_path_env not in (None, ''):
+            self.webhook_path = '/' + webhook_path_env.strip('/')
+        # Telegram allows only [A-Za-z0-9_-] in the secret; derive a stable
+        # one from the token so every replica agrees without extra config.
+        self.webhook_secret = (
+            os.getenv('WEBHOOK_SECRET', '')
+            or hashlib.sha256(self.tg_token.encode()).hexdigest()
+        )
+
+        shards_env = os.getenv('UPDATE_SHARDS')
+        if shards_env not in (None, ''):
+            try:
+                val = int(shards_env)
+            except Exception:
+                raise ValueError('Invalid UPDATE_SHARDS')
+            if val <= 0:
+                raise ValueError('UPDATE_SHARDS must be > 0')
+            self.update_shards = val
+
+        job_shards_env = os.getenv('JOB_SHARDS')
+        if job_shards_env not in (None, ''):
+            try:
+                val = int(job_shards_env)
+            except Exception:
+                raise ValueError('Invalid JOB_SHARDS')
+            if val <= 0:
+                raise ValueError('JOB_SHARDS must be > 0')
+            self.job_shards = val
+
+        follow_ttl_env = os.getenv('FOLLOW_CACHE_TTL')
+        if follow_ttl_env not in (None, ''):
+            try:
+                val = int(follow_ttl_env)
+            except Exception:
+                raise ValueError('Invalid FOLLOW_CACHE_TTL')
+            if val <= 0:
+                raise ValueError('FOLLOW_CACHE_TTL must be > 0')
+            self.follow_cache_ttl = val
+
+        follow_negative_env = os.getenv('FOLLOW_CACHE_NEGATIVE_TTL')
+        if follow_negative_env not in (None, ''):
+            try:
+                val = int(follow_negative_env)
+            except Exception:
+                raise ValueError('Invalid FOLLOW_CACHE_NEGATIVE_TTL')
+            if val <= 0:
+                raise ValueError('FOLLOW_CACHE_NEGATIVE_TTL must be > 0')
+            self.follow_cache_negative_ttl = val
+
+        follow_redis_env = os.getenv('FOLLOW_CACHE_REDIS')
+        if follow_redis_env not in (None, ''):
+            try:
+                self.follow_cache_redis = bool(int(follow_redis_env))
+            except Exception:
+                raise ValueError('Invalid FOLLOW_CACHE_REDIS')
+
+        export_format_env = os.getenv('EXPORT_FORMAT')
+        if export_format_env not in (None, ''):
+            val = export_format_env.strip().lower()
+            if val not in ('xlsx', 'csv'):
+                raise ValueError('EXPORT_FORMAT must be xlsx or csv')
+            self.export_format = val
+
+        key_pool_env = os.getenv('KEY_POOL_SIZE')
+        if key_pool_env not in (None, ''):
+            try:
+                val = int(key_pool_env)
+            except Exception:
+                raise ValueError('Invalid KEY_POOL_SIZE')
+            if val < 0:
+                raise ValueError('KEY_POOL_SIZE must be >= 0')
+            self.key_pool_size = val
+
+        send_rate_redis_env = os.getenv('TELEGRAM_SEND_RATE_REDIS')
+        if send_rate_redis_env not in (None, ''):
+            try:
+                self.telegram_send_rate_redis = bool(int(send_rate_redis_env))
+            except Exception:
+                raise ValueError('Invalid TELEGRAM_SEND_RATE_REDIS')
+
 
 CONFIG = Config()
 # Admin alert throttling
@@ -35,3 +35,24 @@ async def list_user(client, count, not_key=False):
         client.group if client.group is not None else '',
         count_key
     ]
+
+
+async def user_export_pages(pages):
+    """Number the rows of ``stream_users_for_export`` pages as
+    ``list_user`` lays them out."""
+    count = 1
+    async for page in pages:
+        rows = []
+        for user in page:
+            rows.append([
+                count,
+                user.fullname,
+                user.username,
+                int(user.tgid),
+                user.lang_tg or '❌',
+                user.referral_balance,
+                user.group if user.group is not None else '',
+                user.paid_keys,
+            ])
+            count += 1
+        yield rows
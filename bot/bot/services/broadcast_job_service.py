@@ -0,0 +1,188 @@
+"""
+Durable broadcasts.
+
+Confirming a broadcast in the admin panel only stores a ``BroadcastJob``
+(segment, text, recipient count, the admin message to report to).  The
+``broadcast_jobs`` scheduler job, on whichever replica holds its lock, then
+sends every queued job in order:
+
+1. recipients are read in keyset pages of ``BROADCAST_CHUNK_SIZE`` after
+   ``BroadcastJob.cursor`` (``broadcast_service.get_broadcast_page``);
+2. each page is fanned out by ``NotificationDispatcher``: concurrent sends
+   under the process-wide Telegram token bucket, ``TelegramRetryAfter``
+   pauses the bucket and retries;
+3. users who blocked the bot are marked blocked in one UPDATE, and the
+   cursor moves past the page together with the counters.
+
+A job interrupted by a restart stays ``running`` and is resumed from its
+cursor by the next run, so at most one page is sent twice.  Stopping a job
+(``cancelled``) is noticed at the next checkpoint.  The admin message is
+edited with the progress every ``BROADCAST_PROGRESS_INTERVAL_SEC``.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from functools import partial
+
+from aiogram import Bot
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.database.methods.get import (
+    get_broadcast_job,
+    get_unfinished_broadcast_jobs,
+)
+from bot.database.methods.update import (
+    block_state_persons,
+    checkpoint_broadcast_job,
+    finish_broadcast_job,
+    start_broadcast_job,
+)
+from bot.database.models.main import (
+    BROADCAST_STATUS_DONE,
+    BROADCAST_STATUS_QUEUED,
+    BROADCAST_STATUS_RUNNING,
+    BroadcastJob,
+)
+from bot.keyboards.admin_keyboard import broadcast_progress_keyboard
+from bot.misc.language import Localization
+from bot.misc.notify_dispatcher import Notification, NotificationDispatcher
+from bot.misc.util import CONFIG
+from bot.services.broadcast_service import get_broadcast_page
+
+log = logging.getLogger(__name__)
+
+_ = Localization.text
+
+BROADCAST_JOB_INTERVAL_SEC = 5
+BROADCAST_CHUNK_SIZE = 50
+BROADCAST_PROGRESS_INTERVAL_SEC = 5
+
+
+def broadcast_progress_text(job: BroadcastJob, lang: str) -> str:
+    return _('admin_broadcast_progress', lang).format(
+        job_id=job.id,
+        status=_(f'admin_broadcast_status_{job.status}', lang),
+        handled=job.sent + job.failed + job.blocked,
+        total=job.total,
+        sent=job.sent,
+        failed=job.failed,
+        blocked=job.blocked,
+    )
+
+
+async def show_broadcast_progress(bot: Bot, job: BroadcastJob) -> None:
+    """Edit the admin's broadcast message with the job's progress."""
+    if job.chat_id is None or job.message_id is None:
+        return
+    lang = job.lang or CONFIG.languages
+    try:
+        await bot.edit_message_text(
+            broadcast_progress_text(job, lang),
+            chat_id=job.chat_id,
+            message_id=job.message_id,
+            reply_markup=await broadcast_progress_keyboard(
+                lang,
+                job.id,
+                job.status in (BROADCAST_STATUS_QUEUED, BROADCAST_STATUS_RUNNING),
+            ),
+        )
+    except Exception as e:
+        # "message is not modified", or the admin deleted it.
+        log.debug(
+            'event=broadcast.progress_failed job_id=%s error=%s',
+            job.id,
+            type(e).__name__,
+        )
+
+
+async def run_broadcast_job(
+    bot: Bot,
+    session_pool: async_sessionmaker,
+    job: BroadcastJob,
+    dispatcher: NotificationDispatcher | None = None,
+) -> None:
+    """Send one job from its cursor to the end of its segment."""
+    async with session_pool() as session:
+        if not await start_broadcast_job(session, job.id):
+            return
+    log.info(
+        'event=broadcast.start job_id=%s segment=%s cursor=%s total=%s',
+        job.id,
+        job.segment,
+        job.cursor,
+        job.total,
+    )
+    job.status = BROADCAST_STATUS_RUNNING
+    dispatcher = dispatcher or NotificationDispatcher()
+    last_progress = 0.0
+    running = True
+    while running:
+        async with session_pool() as session:
+            page = await get_broadcast_page(
+                session, job.segment, job.cursor, BROADCAST_CHUNK_SIZE
+            )
+        if not page:
+            break
+        report = await dispatcher.dispatch(
+            Notification(
+                chat_id=row.tgid,
+                send=partial(bot.send_message, row.tgid, job.text),
+                tag=row.tgid,
+            )
+            for row in page
+        )
+        async with session_pool() as session:
+            await block_state_persons(session, report.blocked, True)
+            running = await checkpoint_broadcast_job(
+                session,
+                job.id,
+                page[-1].id,
+                len(report.delivered),
+                len(report.failed),
+                len(report.blocked),
+            )
+        job.cursor = page[-1].id
+        job.sent += len(report.delivered)
+        job.failed += len(report.failed)
+        job.blocked += len(report.blocked)
+        if len(page) < BROADCAST_CHUNK_SIZE:
+            break
+        if time.monotonic() - last_progress >= BROADCAST_PROGRESS_INTERVAL_SEC:
+            last_progress = time.monotonic()
+            await show_broadcast_progress(bot, job)
+
+    if running:
+        async with session_pool() as session:
+            await finish_broadcast_job(session, job.id, BROADCAST_STATUS_DONE)
+    async with session_pool() as session:
+        job = await get_broadcast_job(session, job.id)
+    log.info(
+        'event=broadcast.finish job_id=%s status=%s sent=%s failed=%s '
+        'blocked=%s',
+        job.id,
+        job.status,
+        job.sent,
+        job.failed,
+        job.blocked,
+    )
+    await show_broadcast_progress(bot, job)
+
+
+async def run_broadcast_jobs(
+    bot: Bot,
+    session_pool: async_sessionmaker,
+) -> int:
+    """Send every queued or interrupted job, oldest first."""
+    async with session_pool() as session:
+        jobs = await get_unfinished_broadcast_jobs(session)
+    for job in jobs:
+        try:
+            await run_broadcast_job(bot, session_pool, job)
+        except Exception as e:
+            # Left running: resumed from its cursor on the next run.
+            log.error(
+                'event=broadcast.failed job_id=%s', job.id, exc_info=e
+            )
+    return len(jobs)
@@ -1,9 +1,6 @@
-import logging
-from urllib.parse import urlsplit, parse_qs, unquote
-
 import yaml
 
-log = logging.getLogger(__name__)
+from bot.misc.VPN.parsed_link import ParsedLink
 
 _RU_BYPASS_RULES = [
     "GEOIP,RU,DIRECT",
@@ -11,51 +8,43 @@ _RU_BYPASS_RULES = [
 ]
 
 
-def _parse_vless_uri(uri: str) -> dict | None:
-    try:
-        parts = urlsplit(uri)
-        if parts.scheme != "vless":
-            return None
-
-        params = {k: v[0] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
-        name = unquote(parts.fragment) if parts.fragment else f"{parts.hostname}:{parts.port}"
-        security = params.get("security", "")
+def _clash_proxy(link: ParsedLink) -> dict | None:
+    if link.scheme != "vless" or link.port is None:
+        return None
+    security = link.param("security")
 
-        proxy: dict = {
-            "name": name,
-            "type": "vless",
-            "server": parts.hostname,
-            "port": int(parts.port),
-            "uuid": parts.username,
-            "network": params.get("type", "tcp"),
-            "tls": security in ("tls", "reality"),
-            "udp": True,
-        }
+    proxy: dict = {
+        "name": link.label or f"{link.hostname}:{link.port}",
+        "type": "vless",
+        "server": link.hostname,
+        "port": link.port,
+        "uuid": link.username,
+        "network": link.param("type", "tcp"),
+        "tls": security in ("tls", "reality"),
+        "udp": True,
+    }
 
-        if flow := params.get("flow"):
-            proxy["flow"] = flow
-        if fp := params.get("fp"):
-            proxy["client-fingerprint"] = fp
-        if sni := params.get("sni"):
-            proxy["servername"] = sni
+    if flow := link.param("flow"):
+        proxy["flow"] = flow
+    if fp := link.param("fp"):
+        proxy["client-fingerprint"] = fp
+    if sni := link.param("sni"):
+        proxy["servername"] = sni
 
-        if security == "reality":
-            reality_opts = {}
-            if pbk := params.get("pbk"):
-                reality_opts["public-key"] = pbk
-            if sid := params.get("sid"):
-                reality_opts["short-id"] = sid
-            if reality_opts:
-                proxy["reality-opts"] = reality_opts
+    if security == "reality":
+        reality_opts = {}
+        if pbk := link.param("pbk"):
+            reality_opts["public-key"] = pbk
+        if sid := link.param("sid"):
+            reality_opts["short-id"] = sid
+        if reality_opts:
+            proxy["reality-opts"] = reality_opts
 
-        return proxy
-    except Exception:
-        log.warning("Failed to parse VLESS URI: %s", uri[:80], exc_info=True)
-        return None
+    return proxy
 
 
-def build_clash_config(vless_uris: list[str]) -> str:
-    proxies = [p for uri in vless_uris if (p := _parse_vless_uri(uri)) is not None]
+def build_clash_config(links: list[ParsedLink]) -> str:
+    proxies = [p for link in links if (p := _clash_proxy(link)) is not None]
     if not proxies:
         return ""
 
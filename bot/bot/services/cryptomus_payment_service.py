@@ -1,13 +1,22 @@
 import logging
 
+from aiogram import Bot
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from bot.database.methods.get import _get_person
-from bot.database.methods.insert import add_payment as db_add_payment
-from bot.database.methods.update import update_payment_status
-from bot.database.models.main import Payments
+from bot.database.methods.get import _get_person, get_payment_step
+from bot.database.methods.insert import (
+    add_payment as db_add_payment,
+    stage_payment_step,
+)
+from bot.database.models.main import (
+    Payments,
+    PAYMENT_STATUS_CONFIRMED,
+    PAYMENT_STATUS_PENDING,
+    PAYMENT_STEP_KEY_EXTENDED,
+)
 from bot.misc.util import can_send_alert
+from bot.services.payment_reconciliation_service import complete_invoice
 from bot.services.subscription_mutation_service import extend_subscription
 
 log = logging.getLogger(__name__)
@@ -15,11 +24,17 @@ log = logging.getLogger(__name__)
 
 async def handle_cryptomus_webhook(
     session: AsyncSession,
-    webhook_data: dict
+    webhook_data: dict,
+    bot: Bot | None = None
 ) -> bool:
     """
     Handle Cryptomus webhook payload in an idempotent way.
 
+    The payment is completed through ``complete_invoice``, the same claim
+    the reconciliation sweep uses, so the two never both fulfil it.  An
+    invoice registered by ``to_pay`` replays its stored order (this needs
+    ``bot``); other orders extend the subscription by ``month_count``.
+
     This helper is currently exercised in tests and runbooks, but it is not
     mounted as a live FastAPI route in the production webhook app.
     """
@@ -44,7 +59,7 @@ async def handle_cryptomus_webhook(
         result = await session.execute(stmt)
         existing_payment = result.scalar_one_or_none()
 
-        if existing_payment and existing_payment.status == 'confirmed':
+        if existing_payment and existing_payment.status == PAYMENT_STATUS_CONFIRMED:
             log.info(
                 'event=cryptomus_webhook status=duplicate action=idempotent',
                 extra={'order_id': order_id}
@@ -84,33 +99,55 @@ async def handle_cryptomus_webhook(
                 float(amount),
                 'Cryptomus',
                 id_payment=order_id,
-                month_count=month_count
+                month_count=month_count,
+                status=PAYMENT_STATUS_PENDING
             )
 
-        days = month_count * 30
-        extended_key = await extend_subscription(
-            user_id,
-            days,
-            'payment:cryptomus',
-            session,
-            id_payment=order_id
-        )
+        extended = []
+        if existing_payment is not None and existing_payment.expires_at is not None:
+            if bot is None:
+                log.info(
+                    'event=cryptomus_webhook status=deferred_to_sweep order_id=%s',
+                    order_id
+                )
+                return False
+            completed = await complete_invoice(bot, session, order_id)
+        else:
+            async def extend() -> None:
+                if await get_payment_step(
+                    session, order_id, PAYMENT_STEP_KEY_EXTENDED
+                ) is not None:
+                    return
+                # Committed together with the extension below.
+                stage_payment_step(session, order_id, PAYMENT_STEP_KEY_EXTENDED)
+                key = await extend_subscription(
+                    user_id,
+                    month_count * 30,
+                    'payment:cryptomus',
+                    session,
+                    id_payment=order_id
+                )
+                if key is None:
+                    raise RuntimeError('extend_subscription returned no key')
+                extended.append(key)
 
-        if extended_key is None:
-            log.error(
-                'event=cryptomus_webhook action=extend_subscription status=failed',
-                extra={'user_id': user_id, 'order_id': order_id}
+            completed = await complete_invoice(
+                bot, session, order_id, fulfil=extend
             )
-            return False
 
-        await update_payment_status(session, order_id, 'confirmed')
+        if not completed:
+            # Claimed by the sweep or another delivery: success once that
+            # fulfilment is confirmed, otherwise the provider retries.
+            stmt = select(Payments.status).filter(Payments.id_payment == order_id)
+            status = (await session.execute(stmt)).scalar_one_or_none()
+            return status == PAYMENT_STATUS_CONFIRMED
 
         log.info(
             'event=cryptomus_webhook status=success action=payment_confirmed',
             extra={
                 'user_id': user_id,
                 'order_id': order_id,
-                'key_id': extended_key.id,
+                'key_id': extended[0].id if extended else None,
                 'amount': amount,
                 'months': month_count,
             }
@@ -0,0 +1,167 @@
+"""
+Pushes subscription changes to the panels that track expiry (Remnawave,
+Marzban).
+
+``add_time_key`` and ``new_time_key`` do not call the panel.  They mark the
+key (``Keys.expiry_sync_due``) in the same commit as the new
+``subscription``, so a pending sync is exactly as durable as the change, and
+any number of changes to one key collapse into one push of its latest value.
+The ``expiry_sync`` job then, on whichever replica holds its lock:
+
+1. loads up to ``EXPIRY_SYNC_BATCH`` due keys;
+2. drops the mark of keys with nothing to push (no server any more, or a
+   backend without expiry);
+3. pushes the rest grouped by server, ``EXPIRY_SYNC_SERVER_CONCURRENCY``
+   servers at a time, through one ServerManager (``update_expire_bulk``)
+   per server, so a bulk extension costs one login per server instead of
+   one per key;
+4. clears the mark only if ``subscription`` still holds the value pushed;
+   a failed push of a key not changed meanwhile is retried after ``EXPIRY_SYNC_BACKOFF_SEC * 2**attempts``
+   (at most ``EXPIRY_SYNC_MAX_BACKOFF_SEC``) and given up after
+   ``EXPIRY_SYNC_MAX_ATTEMPTS``, leaving the drift to ``panel_reconcile``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.database.methods.get import get_due_expiry_syncs, get_server_dto
+from bot.database.methods.update import (
+    finish_expiry_syncs,
+    reschedule_expiry_syncs,
+)
+from bot.misc.VPN.ServerManager import ServerManager
+from bot.misc.util import CONFIG
+
+log = logging.getLogger(__name__)
+
+EXPIRY_SYNC_INTERVAL_SEC = 10
+EXPIRY_SYNC_BATCH = 1000
+EXPIRY_SYNC_SERVER_CONCURRENCY = 4
+EXPIRY_SYNC_BACKOFF_SEC = 30
+EXPIRY_SYNC_MAX_BACKOFF_SEC = 60 * 60
+EXPIRY_SYNC_MAX_ATTEMPTS = 10
+
+EXPIRY_TYPES = frozenset({
+    CONFIG.TypeVpn.REMNAWAVE.value,
+    CONFIG.TypeVpn.MARZBAN.value,
+})
+
+
+def _expire_at(subscription: int) -> datetime:
+    return datetime.fromtimestamp(
+        subscription, tz=timezone(timedelta(hours=CONFIG.UTC_time))
+    )
+
+
+def retry_delay(attempts: int) -> int:
+    return min(
+        EXPIRY_SYNC_BACKOFF_SEC * 2 ** max(attempts - 1, 0),
+        EXPIRY_SYNC_MAX_BACKOFF_SEC,
+    )
+
+
+async def _push_server(
+    session_pool: async_sessionmaker,
+    server_id: int,
+    rows: list,
+) -> tuple[dict[int, int], dict[int, str]]:
+    """Push one server's due keys; returns (synced, failed) by key id."""
+    async with session_pool() as session:
+        server = await get_server_dto(session, server_id)
+    if server is None:
+        return {row['id']: row['subscription'] for row in rows}, {}
+    by_item = {(row['user_tgid'], row['id']): row for row in rows}
+    try:
+        manager = ServerManager(server)
+        await manager.login()
+        result = await manager.update_expire_bulk({
+            item: _expire_at(row['subscription'])
+            for item, row in by_item.items()
+        })
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+        return {}, {row['id']: error for row in rows}
+    synced = {
+        by_item[item]['id']: by_item[item]['subscription']
+        for item in result.succeeded
+    }
+    failed = {by_item[item]['id']: error for item, error in result.failed.items()}
+    return synced, failed
+
+
+async def sync_expiries(session_pool: async_sessionmaker) -> int:
+    """One pass over the due expiry syncs; returns the keys pushed."""
+    now = int(time.time())
+    async with session_pool() as session:
+        due = await get_due_expiry_syncs(session, now, EXPIRY_SYNC_BATCH)
+    if not due:
+        return 0
+
+    synced: dict[int, int] = {}
+    by_server = defaultdict(list)
+    for row in due:
+        if row['server'] is None or row['type_vpn'] not in EXPIRY_TYPES:
+            synced[row['id']] = row['subscription']
+        else:
+            by_server[row['server']].append(row)
+    dropped = len(synced)
+
+    semaphore = asyncio.Semaphore(EXPIRY_SYNC_SERVER_CONCURRENCY)
+
+    async def _one(server_id, rows):
+        async with semaphore:
+            return await _push_server(session_pool, server_id, rows)
+
+    failed: dict[int, str] = {}
+    for server_synced, server_failed in await asyncio.gather(
+        *(_one(server_id, rows) for server_id, rows in by_server.items())
+    ):
+        synced.update(server_synced)
+        failed.update(server_failed)
+
+    rows = {row['id']: row for row in due}
+    attempts = {row['id']: (row['expiry_sync_attempts'] or 0) + 1 for row in due}
+    retry = []
+    for key_id, error in failed.items():
+        read = {
+            'id': key_id,
+            'subscription': rows[key_id]['subscription'],
+            'due': rows[key_id]['expiry_sync_due'],
+        }
+        if attempts[key_id] >= EXPIRY_SYNC_MAX_ATTEMPTS:
+            log.error(
+                'event=expiry_sync.gave_up key_id=%s attempts=%d error=%s',
+                key_id,
+                attempts[key_id],
+                error,
+            )
+            retry.append(dict(
+                read, expiry_sync_due=None, expiry_sync_attempts=0
+            ))
+        else:
+            retry.append(dict(
+                read,
+                expiry_sync_due=now + retry_delay(attempts[key_id]),
+                expiry_sync_attempts=attempts[key_id],
+            ))
+    async with session_pool() as session:
+        await finish_expiry_syncs(session, synced)
+        await reschedule_expiry_syncs(session, retry)
+    pushed = len(synced) - dropped
+    log.info(
+        'event=expiry_sync.flush due=%d servers=%d pushed=%d failed=%d '
+        'dropped=%d',
+        len(due),
+        len(by_server),
+        pushed,
+        len(failed),
+        dropped,
+    )
+    return pushed
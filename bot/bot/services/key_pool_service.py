@@ -0,0 +1,215 @@
+"""
+Pre-created panel clients for instant key issuance.
+
+Creating a client on a 3x-ui panel (login, addClient, reading the inbound
+back to render the link) is the slow part of handing a user a key.  The
+``key_pool`` scheduler job keeps ``CONFIG.key_pool_size`` spare clients per
+server that supports it (``SUPPORTS_POOL``: the 3x-ui VLESS, Trojan and
+Shadowsocks inbounds) and takes new keys by the rules of
+``get_free_servers``, each stored in ``PooledClient`` with its panel entry
+and rendered link.
+
+Issuing a key (``issue_pooled_key``) marks the oldest spare of the key's
+server taken and renames it to the key's client name with one
+``updateClient`` request; the stored link stays valid because it does not
+depend on the client's name.  The row is dropped after the rename, or after
+the spare was deleted from the panel when the rename failed.  With no spare,
+or if the rename fails, the caller falls back to creating the client as
+before.  Rows still taken after ``TAKEN_TIMEOUT_SEC`` (the issuer crashed, or
+the spare could not be deleted) are released by the job: their spare is
+deleted from the panel if it is still there, then the row is dropped.
+
+A spare's link is rendered from the inbound as it was when the spare was
+made.  Spares are retired (marked taken long ago, so the next run releases
+them and makes fresh ones) when the server is edited through the bot, and
+after ``SPARE_MAX_AGE_SEC`` for inbound edits made on the panel itself.
+
+Spares are named ``pool.<token>.<postfix>`` so panel reconciliation never
+takes them for orphaned keys.
+"""
+
+from __future__ import annotations
+
+import logging
+import secrets
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.database.methods.delete import drop_pooled_clients
+from bot.database.methods.get import (
+    get_key_pool_levels,
+    get_name_location_server,
+    get_pool_servers,
+    get_servers_for_reconcile,
+    get_stale_pooled_clients,
+)
+from bot.database.methods.insert import add_pooled_clients
+from bot.database.methods.update import (
+    retire_pooled_clients,
+    take_pooled_client,
+)
+from bot.misc.VPN.ServerManager import ServerManager
+from bot.misc.util import CONFIG
+
+log = logging.getLogger(__name__)
+
+KEY_POOL_INTERVAL_SEC = 30
+# Spares created per server and run, so one run stays short.
+KEY_POOL_BATCH = 20
+# Longer than an issuer needs between taking a spare and dropping its row.
+TAKEN_TIMEOUT_SEC = 10 * 60
+# Bounds how long a spare can outlive an inbound edit made on the panel.
+SPARE_MAX_AGE_SEC = 24 * 60 * 60
+
+
+def _pool_types() -> list[int]:
+    return [
+        type_vpn
+        for type_vpn, vpn in ServerManager.VPN_TYPES.items()
+        if getattr(vpn, 'SUPPORTS_POOL', False)
+    ]
+
+
+async def _top_up_server(session: AsyncSession, server, count: int) -> int:
+    name_location = await get_name_location_server(session, server.id)
+    server_manager = ServerManager(server)
+    await server_manager.login()
+    names = [
+        server_manager.pool_client_name(secrets.token_hex(6))
+        for _ in range(count)
+    ]
+    result = await server_manager.add_pool_clients(names, name_location)
+    await add_pooled_clients(session, server.id, result.succeeded)
+    if result.failed:
+        log.warning(
+            'event=key_pool.partial server_id=%s failed=%d',
+            server.id,
+            len(result.failed),
+        )
+    return len(result.succeeded)
+
+
+async def _release_stale(session_pool: async_sessionmaker) -> None:
+    async with session_pool() as session:
+        await retire_pooled_clients(
+            session,
+            created_before=datetime.now() - timedelta(
+                seconds=SPARE_MAX_AGE_SEC
+            ),
+        )
+        stale = await get_stale_pooled_clients(
+            session, datetime.now() - timedelta(seconds=TAKEN_TIMEOUT_SEC)
+        )
+        if not stale:
+            return
+        by_server = defaultdict(list)
+        for pooled in stale:
+            by_server[pooled.server].append(pooled)
+        servers = await get_servers_for_reconcile(session, list(by_server))
+    for server in servers:
+        rows = by_server[server.id]
+        try:
+            server_manager = ServerManager(server)
+            await server_manager.login()
+            # A spare that was renamed to its key is gone under this name,
+            # which deletes as a success too.
+            result = await server_manager.delete_pool_clients(
+                [pooled.name for pooled in rows]
+            )
+        except Exception as e:
+            log.warning(
+                'event=key_pool.release_failed server_id=%s error=%s',
+                server.id,
+                type(e).__name__,
+            )
+            continue
+        released = [
+            pooled.id for pooled in rows if pooled.name in result.succeeded
+        ]
+        async with session_pool() as session:
+            await drop_pooled_clients(session, released)
+        log.info(
+            'event=key_pool.released server_id=%s count=%d',
+            server.id,
+            len(released),
+        )
+
+
+async def top_up_key_pools(session_pool: async_sessionmaker) -> int:
+    """Release stale taken and retired spares, then bring every
+    pool-capable server that takes new keys up to the pool size."""
+    if CONFIG.key_pool_size <= 0:
+        return 0
+    await _release_stale(session_pool)
+    async with session_pool() as session:
+        servers = await get_pool_servers(session, _pool_types())
+        levels = await get_key_pool_levels(session)
+    added = 0
+    for server in servers:
+        deficit = min(
+            CONFIG.key_pool_size - levels.get(server.id, 0), KEY_POOL_BATCH
+        )
+        if deficit <= 0:
+            continue
+        try:
+            async with session_pool() as session:
+                count = await _top_up_server(session, server, deficit)
+        except Exception as e:
+            log.error(
+                'event=key_pool.top_up_failed server_id=%s', server.id,
+                exc_info=e,
+            )
+            continue
+        added += count
+        log.info(
+            'event=key_pool.topped_up server_id=%s added=%d level=%d',
+            server.id,
+            count,
+            levels.get(server.id, 0) + count,
+        )
+    return added
+
+
+async def issue_pooled_key(
+    session: AsyncSession,
+    server_manager: ServerManager,
+    key,
+    limit_gb: int | None = None
+) -> str | None:
+    """The key's config from a spare client of its server, or None if the
+    caller has to create the client itself.
+
+    *server_manager* must be logged in to ``key.server``.
+    """
+    if not server_manager.supports_pool:
+        return None
+    pooled = await take_pooled_client(session, key.server)
+    if pooled is None:
+        log.info('event=key_pool.empty server_id=%s', key.server)
+        return None
+    try:
+        await server_manager.claim_pool_client(
+            pooled.client, key.user_tgid, key.id, limit_gb
+        )
+    except Exception as e:
+        log.warning(
+            'event=key_pool.claim_failed server_id=%s key_id=%s error=%s',
+            key.server,
+            key.id,
+            type(e).__name__,
+        )
+        try:
+            result = await server_manager.delete_pool_clients([pooled.name])
+        except Exception:
+            # Left taken: the key_pool job deletes it later.
+            return None
+        if pooled.name in result.succeeded:
+            await drop_pooled_clients(session, [pooled.id])
+        return None
+    await drop_pooled_clients(session, [pooled.id])
+    log.info(
+        'event=key_pool.issued server_id=%s key_id=%s', key.server, key.id
+    )
+    return pooled.config
@@ -0,0 +1,273 @@
+"""
+Admin dashboard figures, computed together and read from one row.
+
+``compute_metrics`` gathers every figure of the dashboard screens (main
+dashboard, users, subscriptions, servers, revenue, referrals, growth) in two
+statements:
+
+1. one pass over ``users`` left-joined to a per-user aggregate of ``keys``
+   (latest expiry and flags such as "has an active paid key" or "has an
+   active key in Finland"), every figure a ``COUNT(CASE ...)`` column;
+2. one pass over ``payments`` for revenue and paid referrals, with the small
+   tables (locations, VDS, protocols, static users, metrics, withdrawals)
+   counted as scalar subqueries of the same statement.
+
+The ``metrics_snapshot`` job stores the result in ``MetricsSnapshot`` every
+``METRICS_SNAPSHOT_INTERVAL_SEC``; the screens only read that row
+(``get_metrics_snapshot``).  A missing snapshot, or one older than
+``METRICS_SNAPSHOT_MAX_AGE_SEC`` (job not running), is recomputed on read,
+and the dashboard's refresh button recomputes it on demand.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, case, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.database.models.main import (
+    Keys,
+    Location,
+    Metric,
+    MetricsSnapshot,
+    Payments,
+    Persons,
+    Servers,
+    StaticPersons,
+    Vds,
+    WithdrawalRequests,
+)
+
+log = logging.getLogger(__name__)
+
+METRICS_SNAPSHOT_INTERVAL_SEC = 60
+METRICS_SNAPSHOT_MAX_AGE_SEC = 10 * 60
+SNAPSHOT_ID = 1
+
+SUCCESS_PAYMENT_STATUSES = ("confirmed", "paid", "success", "succeeded")
+FINLAND_ALIASES = ("finland", "финлянд")
+POLAND_ALIASES = ("poland", "польш", "warsaw", "варшав")
+
+
+def _utc_now() -> datetime:
+    # Payments.data / Persons.date_registered are naive UTC timestamps.
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _to_ts(value: datetime) -> int:
+    return int(value.replace(tzinfo=timezone.utc).timestamp())
+
+
+def _flag(condition):
+    return func.max(case((condition, 1), else_=0))
+
+
+def _count_if(condition):
+    return func.count(case((condition, 1)))
+
+
+def _sum_if(condition, value):
+    return func.coalesce(func.sum(case((condition, value), else_=0.0)), 0.0)
+
+
+def _location_match(aliases) -> object:
+    return or_(*[func.lower(Location.name).contains(alias) for alias in aliases])
+
+
+def _users_statement(now: datetime):
+    now_ts = _to_ts(now)
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def day_ts(days: int) -> int:
+        return _to_ts(day_start + timedelta(days=days))
+
+    paid = and_(Keys.free_key.is_(False), Keys.trial_period.is_(False))
+    active = Keys.subscription > now_ts
+
+    def paid_expiring(start: int, end: int):
+        return and_(paid, Keys.subscription >= start, Keys.subscription < end)
+
+    keys = (
+        select(
+            Keys.user_tgid.label("user_tgid"),
+            func.max(Keys.subscription).label("expire"),
+            _flag(and_(paid, active)).label("paid_active"),
+            _flag(paid_expiring(day_ts(0), day_ts(1))).label("paid_today"),
+            _flag(paid_expiring(day_ts(1), day_ts(4))).label("paid_next_3"),
+            _flag(paid_expiring(day_ts(3), day_ts(4))).label("paid_day_3"),
+            _flag(paid_expiring(day_ts(7), day_ts(8))).label("paid_day_7"),
+            _flag(and_(active, _location_match(FINLAND_ALIASES))).label("finland"),
+            _flag(and_(active, _location_match(POLAND_ALIASES))).label("poland"),
+        )
+        .outerjoin(Servers, Servers.id == Keys.server)
+        .outerjoin(Vds, Vds.id == Servers.vds)
+        .outerjoin(Location, Location.id == Vds.location)
+        .group_by(Keys.user_tgid)
+        .subquery()
+    )
+    listed = Persons.blocked.is_(False)
+    return (
+        select(
+            _count_if(listed).label("total_users"),
+            _count_if(and_(listed, keys.c.expire > now_ts)).label("active_users"),
+            _count_if(and_(
+                listed,
+                or_(keys.c.expire.is_(None), keys.c.expire <= now_ts),
+            )).label("users_without_subscription"),
+            _count_if(and_(listed, keys.c.expire <= now_ts)).label("expired_users"),
+            _count_if(and_(
+                listed,
+                Persons.date_registered >= day_start,
+                Persons.date_registered < day_start + timedelta(days=1),
+            )).label("new_users_today"),
+            _count_if(and_(
+                listed, Persons.date_registered >= now - timedelta(days=7)
+            )).label("new_users_7_days"),
+            _count_if(and_(
+                listed, Persons.date_registered >= now - timedelta(days=30)
+            )).label("new_users_30_days"),
+            _count_if(and_(listed, keys.c.paid_active == 1)).label("active_subscriptions"),
+            _count_if(and_(listed, keys.c.paid_today == 1)).label("expiring_today"),
+            _count_if(and_(listed, keys.c.paid_next_3 == 1)).label("expiring_in_3_days"),
+            _count_if(and_(listed, keys.c.paid_day_3 == 1)).label("expire_in_3_days"),
+            _count_if(and_(listed, keys.c.paid_day_7 == 1)).label("expire_in_7_days"),
+            _count_if(and_(listed, keys.c.finland == 1)).label("finland_users"),
+            _count_if(and_(listed, keys.c.poland == 1)).label("poland_users"),
+            _count_if(
+                Persons.date_registered >= now - timedelta(days=30)
+            ).label("users_30_days"),
+            _count_if(Persons.metric.is_not(None)).label("users_with_metric"),
+            _count_if(
+                Persons.referral_user_tgid.is_not(None)
+            ).label("invited_users"),
+            func.count(
+                func.distinct(Persons.referral_user_tgid)
+            ).label("total_referrers"),
+        )
+        .select_from(Persons)
+        .outerjoin(keys, keys.c.user_tgid == Persons.tgid)
+    )
+
+
+def _payments_statement(now: datetime):
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    paid = and_(
+        Payments.data.is_not(None),
+        Payments.status.in_(SUCCESS_PAYMENT_STATUSES),
+    )
+    today = and_(
+        paid,
+        Payments.data >= day_start,
+        Payments.data < day_start + timedelta(days=1),
+    )
+
+    def count(model, *conditions):
+        return select(func.count(model.id)).where(*conditions).scalar_subquery()
+
+    return (
+        select(
+            _count_if(today).label("successful_payments_today"),
+            _sum_if(today, Payments.amount).label("revenue_today"),
+            _sum_if(
+                and_(paid, Payments.data >= now - timedelta(days=7)),
+                Payments.amount,
+            ).label("revenue_7_days"),
+            _sum_if(
+                and_(paid, Payments.data >= now - timedelta(days=30)),
+                Payments.amount,
+            ).label("revenue_30_days"),
+            func.count(func.distinct(case((
+                and_(
+                    Payments.status.in_(SUCCESS_PAYMENT_STATUSES),
+                    Persons.referral_user_tgid.is_not(None),
+                ),
+                Persons.id,
+            )))).label("paid_referrals"),
+            count(Location).label("total_locations"),
+            count(Location, Location.work.is_(True)).label("active_locations"),
+            count(Vds).label("total_vds"),
+            count(Vds, Vds.work.is_(True)).label("active_vds"),
+            count(Servers).label("total_protocols"),
+            count(
+                Servers, Servers.work.is_(True), Servers.auto_work.is_(True)
+            ).label("active_protocols"),
+            count(
+                Servers, Servers.work.is_(True), Servers.auto_work.is_(False)
+            ).label("hidden_protocols"),
+            count(StaticPersons).label("static_users"),
+            count(Metric).label("metrics_count"),
+            count(
+                WithdrawalRequests, WithdrawalRequests.check_payment.is_(False)
+            ).label("pending_withdrawals"),
+        )
+        .select_from(Payments)
+        .outerjoin(Persons, Persons.id == Payments.user)
+    )
+
+
+async def compute_metrics(session: AsyncSession) -> dict:
+    """Every dashboard figure, by name, in two aggregate statements."""
+    now = _utc_now()
+    metrics = {}
+    for statement in (_users_statement(now), _payments_statement(now)):
+        row = (await session.execute(statement)).one()
+        metrics.update(row._mapping)
+    for name, value in metrics.items():
+        if isinstance(value, float) or name.startswith("revenue"):
+            metrics[name] = float(value or 0.0)
+        else:
+            metrics[name] = int(value or 0)
+    metrics["expire_today"] = metrics["expiring_today"]
+    metrics["referrals_attached"] = metrics["invited_users"]
+    return metrics
+
+
+async def refresh_metrics_snapshot(session: AsyncSession) -> MetricsSnapshot:
+    start = time.perf_counter()
+    metrics = await compute_metrics(session)
+    snapshot = await session.merge(MetricsSnapshot(
+        id=SNAPSHOT_ID,
+        metrics=metrics,
+        refreshed_at=_utc_now(),
+        duration_ms=int((time.perf_counter() - start) * 1000),
+    ))
+    await session.commit()
+    log.info(
+        'event=metrics_snapshot.refreshed duration_ms=%d', snapshot.duration_ms
+    )
+    return snapshot
+
+
+async def refresh_dashboard_metrics(session_pool: async_sessionmaker) -> None:
+    async with session_pool() as session:
+        await refresh_metrics_snapshot(session)
+
+
+async def get_metrics_snapshot(
+    session: AsyncSession,
+    force: bool = False,
+) -> MetricsSnapshot:
+    """The stored snapshot; recomputed if *force*, missing or stale."""
+    snapshot = None if force else await session.get(MetricsSnapshot, SNAPSHOT_ID)
+    if snapshot is None or (
+        _utc_now() - snapshot.refreshed_at
+        > timedelta(seconds=METRICS_SNAPSHOT_MAX_AGE_SEC)
+    ):
+        snapshot = await refresh_metrics_snapshot(session)
+    return snapshot
+
+
+def snapshot_age_seconds(snapshot: MetricsSnapshot) -> int:
+    return max(0, int((_utc_now() - snapshot.refreshed_at).total_seconds()))
+
+
+def metrics_as(cls, snapshot: MetricsSnapshot):
+    """Build the stats dataclass *cls* from the snapshot's figures."""
+    return cls(**{
+        field.name: snapshot.metrics[field.name]
+        for field in dataclasses.fields(cls)
+    })
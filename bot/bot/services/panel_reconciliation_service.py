@@ -0,0 +1,357 @@
+"""
+Fleet-wide reconciliation of panel clients against ``Keys``.
+
+Every server, whatever its backend in ``ServerManager.VPN_TYPES``, gets one
+pass:
+
+1. the panel's clients are listed once (``BaseVpn.list_clients``:
+   client name -> expiry);
+2. the server's ``Keys`` rows are streamed and checked off that listing;
+3. the difference is classified:
+
+   - missing: an active key whose client is not on the panel;
+   - orphaned: a bot-made client (``<tgid>.<key_id>.<postfix>``, or a
+     WireGuard peer) that no key refers to on this server or on any other
+     server row listing the same panel clients (``_panel_listing``: a
+     Marzban panel, a Remnawave panel outside a squad, an x-ui inbound).
+     Static users (key id 0 / their WireGuard keys) are never orphans;
+   - expiry drift: a client whose panel expiry (Remnawave, Marzban) is more
+     than ``EXPIRY_TOLERANCE_SEC`` away from ``Keys.subscription``;
+
+4. with *apply*, the selected kinds are repaired with the bulk panel
+   operations (``add_clients_bulk``, ``delete_clients_bulk``; expiry
+   updates run ``BULK_CONCURRENCY`` at a time) and ``actual_space`` is
+   refreshed, so orphans stop skewing server selection.
+
+``RECONCILE_CONCURRENCY`` servers are processed at once.  Orphans are
+checked against the database again right before they are reported, and a
+server whose orphans exceed ``MAX_ORPHAN_SHARE`` of its clients is reported
+but not cleaned up: that points at a wrong key listing, not at the panel.
+WireGuard peers cannot be recreated with their old key pair, so missing
+WireGuard keys are only reported.
+
+Runs as the ``panel_reconcile`` job and from ``scripts/reconcile_panels.py``
+(dry-run by default, prints the JSON report).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import re
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.database.methods.get import (
+    get_server_client_refs,
+    get_servers_for_reconcile,
+    stream_server_keys,
+)
+from bot.database.methods.update import server_space_update
+from bot.misc.VPN.ServerManager import ServerManager
+from bot.misc.util import CONFIG
+
+log = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL_SEC = 60 * 60
+RECONCILE_CONCURRENCY = 4
+EXPIRY_TOLERANCE_SEC = 5 * 60
+# Above this share of the panel's clients, orphans are not deleted.
+MAX_ORPHAN_SHARE = 0.5
+
+REPAIR_MISSING = 'missing'
+REPAIR_ORPHANED = 'orphaned'
+REPAIR_EXPIRY = 'expiry'
+REPAIR_ALL = frozenset({REPAIR_MISSING, REPAIR_ORPHANED, REPAIR_EXPIRY})
+
+_BOT_CLIENT = re.compile(r'^(\d+)\.(\d+)\.([a-z]+)$')
+
+
+@dataclass(slots=True)
+class ServerReport:
+    server_id: int
+    type_vpn: int
+    panel_clients: int = 0
+    keys: int = 0
+    missing: list[int] = field(default_factory=list)
+    orphaned: list[str] = field(default_factory=list)
+    expiry_drift: list[int] = field(default_factory=list)
+    repaired: dict[str, int] = field(default_factory=dict)
+    failed: dict[str, str] = field(default_factory=dict)
+    orphan_cleanup_skipped: bool = False
+    # Other server rows whose clients this server's panel listing includes.
+    shared_with: list[int] = field(default_factory=list)
+    error: str | None = None
+
+
+def _panel_listing(server) -> tuple:
+    """What ``list_clients`` covers for a server row, and the Remnawave
+    squad it is narrowed to (None: the whole panel)."""
+    type_vpn = server.type_vpn
+    if type_vpn == CONFIG.TypeVpn.MARZBAN.value:
+        return ('marzban', (server.panel or '').rstrip('/')), None
+    if type_vpn == CONFIG.TypeVpn.REMNAWAVE.value:
+        return ('remnawave', server.ip), server.remnawave_squad_id
+    if type_vpn in (
+        CONFIG.TypeVpn.VLESS.value,
+        CONFIG.TypeVpn.SHADOW_SOCKS.value,
+        CONFIG.TypeVpn.WIREGUARD.value,
+        CONFIG.TypeVpn.TROJAN.value,
+    ):
+        return ('xui', server.ip, server.inbound_id), None
+    return ('server', server.id), None
+
+
+def shared_panel_servers(servers) -> dict[int, list[int]]:
+    """For each server id, the other rows whose clients appear in its
+    panel listing."""
+    shared = {}
+    for server in servers:
+        listing, squad = _panel_listing(server)
+        shared[server.id] = [
+            other.id for other in servers
+            if other.id != server.id
+            and _panel_listing(other)[0] == listing
+            and (squad is None or _panel_listing(other)[1] == squad)
+        ]
+    return shared
+
+
+def _expire_at(timestamp: int) -> datetime:
+    """Panel expiry for a subscription, as ServerManager.get_key sets it."""
+    return datetime.fromtimestamp(
+        timestamp, tz=timezone(timedelta(hours=CONFIG.UTC_time))
+    )
+
+
+async def _diff(
+    session_pool: async_sessionmaker,
+    server,
+    manager: ServerManager,
+    report: ServerReport,
+) -> tuple[dict[int, tuple], dict[str, tuple]]:
+    """Fill the report's findings.
+
+    Returns the missing/drifted key rows by id and the orphans as
+    ``(name, key_id)`` items for ServerManager, by client name.
+    """
+    panel = await manager.client.list_clients()
+    report.panel_clients = len(panel)
+    wireguard = server.type_vpn == CONFIG.TypeVpn.WIREGUARD.value
+    post_fix = manager.client.POST_FIX
+    now = int(time.time())
+    rows = {}
+    async with session_pool() as session:
+        async for key in stream_server_keys(session, server.id):
+            report.keys += 1
+            if wireguard:
+                name = key.wg_public_key
+            else:
+                name = f'{key.user_tgid}.{key.id}.{post_fix}'
+            present = name in panel
+            expire = panel.pop(name, None)
+            if not key.subscription or key.subscription < now:
+                continue
+            if not present:
+                report.missing.append(key.id)
+                rows[key.id] = key
+            elif (
+                expire is not None
+                and abs(expire - key.subscription) > EXPIRY_TOLERANCE_SEC
+            ):
+                report.expiry_drift.append(key.id)
+                rows[key.id] = key
+
+        if wireguard:
+            candidates = {name: (name, 0) for name in panel}
+        else:
+            candidates = {}
+            for name in panel:
+                match = _BOT_CLIENT.match(name)
+                if match and match.group(3) == post_fix and int(match.group(2)):
+                    candidates[name] = (int(match.group(1)), int(match.group(2)))
+        # Keys created or moved here since the stream started, keys of the
+        # rows sharing this panel, and static WireGuard users are not
+        # orphans.
+        key_ids, public_keys = await get_server_client_refs(
+            session,
+            [server.id, *report.shared_with],
+            [] if wireguard else [item[1] for item in candidates.values()],
+            list(candidates) if wireguard else [],
+        )
+    orphans = {
+        name: item for name, item in candidates.items()
+        if name not in public_keys and item[1] not in key_ids
+    }
+    report.orphaned = sorted(orphans)
+    return rows, orphans
+
+
+async def _update_expiry(manager: ServerManager, rows: list) -> list[int]:
+    semaphore = asyncio.Semaphore(manager.client.BULK_CONCURRENCY)
+
+    async def _one(key):
+        async with semaphore:
+            result = await manager.update_user_expire(
+                key.user_tgid, key.id, _expire_at(key.subscription)
+            )
+        return key.id if result is not None else None
+
+    updated = await asyncio.gather(*(_one(key) for key in rows))
+    return [key_id for key_id in updated if key_id is not None]
+
+
+async def _repair(
+    manager: ServerManager,
+    server,
+    report: ServerReport,
+    rows: dict[int, tuple],
+    orphans: dict[str, tuple],
+    repair: frozenset,
+) -> None:
+    wireguard = server.type_vpn == CONFIG.TypeVpn.WIREGUARD.value
+    expiry_rows = []
+    if REPAIR_EXPIRY in repair:
+        expiry_rows.extend(rows[key_id] for key_id in report.expiry_drift)
+
+    if REPAIR_MISSING in repair and report.missing and not wireguard:
+        created = 0
+        for free_key in (False, True):
+            items = [
+                (rows[key_id].user_tgid, key_id)
+                for key_id in report.missing
+                if bool(rows[key_id].free_key) == free_key
+            ]
+            if not items:
+                continue
+            result = await manager.add_clients_bulk(
+                items,
+                limit_gb=CONFIG.limit_gb_free if free_key else CONFIG.limit_GB,
+            )
+            created += len(result.succeeded)
+            for (_, key_id), error in result.failed.items():
+                report.failed[str(key_id)] = error
+            # New clients start with the panel's default expiry.
+            expiry_rows.extend(rows[key_id] for _, key_id in result.succeeded)
+        report.repaired[REPAIR_MISSING] = created
+
+    if (
+        REPAIR_ORPHANED in repair
+        and report.orphaned
+        and not report.orphan_cleanup_skipped
+    ):
+        result = await manager.delete_clients_bulk(list(orphans.values()))
+        report.repaired[REPAIR_ORPHANED] = len(result.succeeded)
+        for (name, key_id), error in result.failed.items():
+            report.failed[f'{name}.{key_id}'] = error
+
+    if expiry_rows:
+        updated = await _update_expiry(manager, expiry_rows)
+        report.repaired[REPAIR_EXPIRY] = len(updated)
+
+
+async def reconcile_server(
+    session_pool: async_sessionmaker,
+    server,
+    apply: bool = False,
+    repair: frozenset = REPAIR_ALL,
+    shared_with=(),
+) -> ServerReport:
+    report = ServerReport(
+        server_id=server.id,
+        type_vpn=server.type_vpn,
+        shared_with=list(shared_with),
+    )
+    try:
+        manager = ServerManager(server)
+        await manager.login()
+        rows, orphans = await _diff(session_pool, server, manager, report)
+        orphan_limit = MAX_ORPHAN_SHARE * max(report.panel_clients, 1)
+        if len(report.orphaned) > orphan_limit:
+            report.orphan_cleanup_skipped = True
+            log.warning(
+                'event=panel_reconcile.orphans_skipped server_id=%s '
+                'orphaned=%d panel_clients=%d',
+                server.id,
+                len(report.orphaned),
+                report.panel_clients,
+            )
+        if apply:
+            await _repair(manager, server, report, rows, orphans, repair)
+            if report.repaired.get(REPAIR_MISSING) or report.repaired.get(
+                REPAIR_ORPHANED
+            ):
+                users_count = await manager.count_users(fresh=True)
+                if users_count is not None:
+                    async with session_pool() as session:
+                        await server_space_update(
+                            session, server.id, users_count
+                        )
+    except Exception as e:
+        report.error = f'{type(e).__name__}: {e}'
+        log.error(
+            'event=panel_reconcile.server_failed server_id=%s',
+            server.id,
+            exc_info=e,
+        )
+    log.info(
+        'event=panel_reconcile.server server_id=%s type_vpn=%s keys=%d '
+        'panel_clients=%d missing=%d orphaned=%d expiry_drift=%d repaired=%s',
+        report.server_id,
+        report.type_vpn,
+        report.keys,
+        report.panel_clients,
+        len(report.missing),
+        len(report.orphaned),
+        len(report.expiry_drift),
+        report.repaired or '-',
+    )
+    return report
+
+
+async def reconcile_panels(
+    session_pool: async_sessionmaker,
+    apply: bool = True,
+    server_ids=None,
+    types_vpn=None,
+    repair: frozenset = REPAIR_ALL,
+) -> list[ServerReport]:
+    """Reconcile every matching server; see the module docstring."""
+    async with session_pool() as session:
+        fleet = await get_servers_for_reconcile(session)
+    # Sharing is worked out over the whole fleet, not just the selection.
+    shared = shared_panel_servers(fleet)
+    servers = [
+        server for server in fleet
+        if (not server_ids or server.id in server_ids)
+        and (not types_vpn or server.type_vpn in types_vpn)
+    ]
+    semaphore = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+
+    async def _one(server):
+        async with semaphore:
+            return await reconcile_server(
+                session_pool, server, apply, repair, shared[server.id]
+            )
+
+    return list(await asyncio.gather(*(_one(server) for server in servers)))
+
+
+def report_to_dict(reports: list[ServerReport], apply: bool) -> dict:
+    return {
+        'apply': apply,
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'totals': {
+            'servers': len(reports),
+            'errors': sum(report.error is not None for report in reports),
+            'missing': sum(len(report.missing) for report in reports),
+            'orphaned': sum(len(report.orphaned) for report in reports),
+            'expiry_drift': sum(
+                len(report.expiry_drift) for report in reports
+            ),
+        },
+        'servers': [asdict(report) for report in reports],
+    }
@@ -0,0 +1,300 @@
+"""
+Completes provider invoices from one scheduled sweep.
+
+``PaymentSystem.to_pay`` only creates the invoice, shows the pay button and
+stores the order as a ``pending`` Payments row (``register_invoice``).  This
+job then, on whichever replica holds ``job:payment_reconcile``:
+
+1. loads up to ``RECONCILE_BATCH`` pending invoices, soonest expiry first;
+2. asks every provider for the status of its pending invoices, overdue ones
+   included, in one call per provider (``paid_invoices``: a real batch
+   lookup for CryptoBot, bounded parallel lookups for the others);
+3. expires the overdue invoices that were not reported paid (pay button
+   removed, provider invoice cancelled where supported); those of a
+   provider whose lookup failed stay pending for the next sweep;
+4. completes each paid invoice through ``complete_invoice``;
+5. retries invoices whose fulfilment was claimed more than
+   ``CLAIM_LEASE_SEC`` ago and never confirmed.
+
+``complete_invoice`` is the shared completion path: ``claim_pending_payment``
+flips the row to ``claimed`` with a conditional UPDATE, so an invoice is
+fulfilled once even if a webhook or another replica sees it paid as well, and
+the order is replayed through ``PaymentSystem.successful_payment``.  Only
+then is the row ``confirmed``; if fulfilment raises or the process dies, the
+claim lapses and step 5 fulfils the invoice again.  An ``expired`` invoice
+can still be claimed, for a payment the provider confirms late (a Cryptomus
+webhook after ``CHECK_PERIOD``).  Steps that already took
+effect (referral bonus, key extension, new key) are recorded in
+``payment_steps`` and skipped by the retry.  After
+``MAX_FULFIL_ATTEMPTS`` failed claims the invoice is parked ``failed`` and
+the admin is told.  State lives only in the database, so open invoices
+survive restarts.
+"""
+
+from __future__ import annotations
+
+import logging
+from collections import defaultdict
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.database.methods.get import (
+    get_payment,
+    get_pending_payments,
+    get_stale_claimed_payments,
+)
+from bot.database.methods.update import (
+    claim_pending_payment,
+    confirm_claimed_payment,
+    expire_pending_payments,
+    fail_claimed_payment,
+)
+from bot.database.models.main import Payments
+from bot.misc.language import Localization
+from bot.misc.util import CONFIG
+from bot.webhooks.util import get_message
+
+log = logging.getLogger(__name__)
+
+_ = Localization.text
+
+RECONCILE_INTERVAL_SEC = 10
+RECONCILE_BATCH = 500
+# Longer than any fulfilment (panel calls included) takes to finish.
+CLAIM_LEASE_SEC = 300
+# Claims of one invoice before it is parked for the admin.
+MAX_FULFIL_ATTEMPTS = 5
+
+
+def payment_providers() -> dict:
+    """Polled providers by ``Payments.payment_system`` name."""
+    from bot.misc.Payment.CryptoBot import CryptoBot
+    from bot.misc.Payment.Cryptomus import Cryptomus, Heleket
+    from bot.misc.Payment.KassaSmart import KassaSmart
+    from bot.misc.Payment.Lava import Lava
+    from bot.misc.Payment.Tinkoff import TinkoffPay
+    return {
+        provider.NAME: provider
+        for provider in (CryptoBot, Cryptomus, Heleket, KassaSmart, Lava, TinkoffPay)
+    }
+
+
+async def _delete_pay_button(bot: Bot, payment: Payments) -> None:
+    if payment.message_id is None or payment.payment_id is None:
+        return
+    try:
+        await bot.delete_message(payment.payment_id.tgid, payment.message_id)
+    except Exception as e:
+        log.debug(
+            'event=payment.pay_button_delete_failed id_payment=%s error=%s',
+            payment.id_payment,
+            type(e).__name__,
+        )
+
+
+async def _replay_order(bot: Bot, session: AsyncSession, id_payment: str):
+    from bot.misc.Payment.payment_systems import PaymentSystem
+
+    payment = await get_payment(session, id_payment)
+    telegram_id = payment.payment_id.tgid
+    await _delete_pay_button(bot, payment)
+    provider = payment_providers().get(payment.payment_system)
+    message = await get_message(bot, telegram_id, payment.message_id or 1)
+    payment_system = PaymentSystem(
+        session=session,
+        message=message,
+        user_id=telegram_id,
+        donate=payment.type_pay,
+        key_id=payment.key_id,
+        id_prot=payment.id_prot,
+        id_loc=payment.id_loc,
+        price=int(payment.amount),
+        month_count=payment.month_count,
+    )
+    payment_system.INVOICE_ID = payment.id_payment
+    await payment_system.successful_payment(
+        int(payment.amount),
+        payment.payment_system,
+        id_payment=(
+            payment.id_payment
+            if provider is not None and provider.RECURRING else None
+        ),
+    )
+    return payment
+
+
+async def complete_invoice(
+    bot: Bot,
+    session: AsyncSession,
+    id_payment: str,
+    fulfil: Callable[[], Awaitable[None]] | None = None,
+) -> bool:
+    """Fulfil the order stored with a paid invoice, exactly once.
+
+    ``fulfil`` replaces the stored-order replay for invoices that were
+    never registered through ``to_pay``.  An exception leaves the invoice
+    claimed, so it is retried once the claim lapses, unless this was
+    attempt ``MAX_FULFIL_ATTEMPTS``: then it is parked ``failed``.
+    """
+    attempt = await claim_pending_payment(session, id_payment, CLAIM_LEASE_SEC)
+    if not attempt:
+        log.info(
+            'event=payment.invoice_already_claimed id_payment=%s', id_payment
+        )
+        return False
+    try:
+        if fulfil is None:
+            await _replay_order(bot, session, id_payment)
+        else:
+            await fulfil()
+    except Exception:
+        # Drop a step staged by the write that failed.
+        await session.rollback()
+        if attempt >= MAX_FULFIL_ATTEMPTS:
+            await _park_invoice(bot, session, id_payment, attempt)
+        else:
+            log.error(
+                'event=payment.fulfil_failed id_payment=%s attempt=%d '
+                'retry_after_sec=%d',
+                id_payment,
+                attempt,
+                CLAIM_LEASE_SEC,
+            )
+        raise
+    await confirm_claimed_payment(session, id_payment)
+    log.info('event=payment.invoice_completed id_payment=%s', id_payment)
+    return True
+
+
+async def _park_invoice(
+    bot: Bot,
+    session: AsyncSession,
+    id_payment: str,
+    attempts: int,
+) -> None:
+    if not await fail_claimed_payment(session, id_payment):
+        return
+    log.error(
+        'event=payment.fulfil_parked id_payment=%s attempts=%d',
+        id_payment,
+        attempts,
+    )
+    try:
+        await bot.send_message(
+            CONFIG.admin_tg_id,
+            _('admin_payment_fulfil_failed', CONFIG.languages).format(
+                id_payment=id_payment,
+                attempts=attempts,
+            ),
+        )
+    except Exception as e:
+        log.warning(
+            'event=payment.fulfil_parked_alert_failed id_payment=%s',
+            id_payment,
+            exc_info=e,
+        )
+
+
+async def _expire(
+    bot: Bot,
+    session: AsyncSession,
+    overdue: list[Payments],
+    providers: dict,
+) -> int:
+    expired_ids = set(
+        await expire_pending_payments(session, [p.id for p in overdue])
+    )
+    by_provider = defaultdict(list)
+    for payment in overdue:
+        if payment.id not in expired_ids:
+            continue
+        await _delete_pay_button(bot, payment)
+        by_provider[payment.payment_system].append(payment.id_payment)
+    for name, invoice_ids in by_provider.items():
+        provider = providers.get(name)
+        if provider is None:
+            continue
+        try:
+            await provider.cancel_invoices(CONFIG, invoice_ids)
+        except Exception as e:
+            log.warning(
+                'event=payment.cancel_failed payment=%s count=%d',
+                name,
+                len(invoice_ids),
+                exc_info=e,
+            )
+    return len(expired_ids)
+
+
+async def reconcile_payments(
+    bot: Bot,
+    session_pool: async_sessionmaker,
+) -> None:
+    """One sweep over the open invoices; see the module docstring."""
+    providers = payment_providers()
+    now = datetime.now()
+    async with session_pool() as session:
+        pending = await get_pending_payments(session, RECONCILE_BATCH)
+
+    open_invoices = defaultdict(list)
+    for payment in pending:
+        if payment.payment_system in providers:
+            open_invoices[payment.payment_system].append(payment.id_payment)
+
+    paid = set()
+    unchecked = set()
+    for name, invoice_ids in open_invoices.items():
+        try:
+            paid |= await providers[name].paid_invoices(CONFIG, invoice_ids)
+        except Exception as e:
+            unchecked.add(name)
+            log.warning(
+                'event=payment.status_sweep_failed payment=%s count=%d',
+                name,
+                len(invoice_ids),
+                exc_info=e,
+            )
+
+    # Never expire an invoice the provider could not be asked about: it
+    # may have been paid.
+    overdue = [
+        p for p in pending
+        if p.expires_at <= now
+        and p.id_payment not in paid
+        and p.payment_system not in unchecked
+    ]
+    expired = 0
+    if overdue:
+        async with session_pool() as session:
+            expired = await _expire(bot, session, overdue, providers)
+
+    async with session_pool() as session:
+        retried = await get_stale_claimed_payments(
+            session,
+            datetime.now() - timedelta(seconds=CLAIM_LEASE_SEC),
+            RECONCILE_BATCH,
+        )
+
+    completed = 0
+    for id_payment in [*paid, *retried]:
+        try:
+            async with session_pool() as session:
+                completed += await complete_invoice(bot, session, id_payment)
+        except Exception as e:
+            log.error(
+                'event=payment.invoice_complete_failed id_payment=%s',
+                id_payment,
+                exc_info=e,
+            )
+    if pending or retried:
+        log.info(
+            'event=payment.reconcile pending=%d expired=%d retried=%d '
+            'completed=%d',
+            len(pending),
+            expired,
+            len(retried),
+            completed,
+        )
@@ -1,53 +1,146 @@
+"""
+Admin report files (XLSX or CSV) for Telegram.
+
+Rows are written page by page in a worker thread, into an openpyxl
+write-only workbook (or a CSV writer) backed by a spooled temporary file:
+the file stays in memory up to ``EXPORT_SPOOL_BYTES`` and moves to disk
+beyond that, so neither the event loop nor memory grows with the report.
+"""
+
+import asyncio
+import csv
 import io
+import tempfile
+from typing import AsyncIterable, Iterable, Sequence
 
-from aiogram.types import BufferedInputFile
+from aiogram import Bot
+from aiogram.types import InputFile
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Alignment, Font
+from openpyxl.utils import get_column_letter
 from openpyxl.workbook import Workbook
-from openpyxl.worksheet.worksheet import Worksheet
+
+from bot.misc.util import CONFIG
+
+EXPORT_SPOOL_BYTES = 8 * 1024 * 1024
+COLUMN_WIDTH = 23
+SHEET_TITLE = 'BotMetrics'
+
+HEADER_FONT = Font(bold=True)
+HEADER_ALIGNMENT = Alignment(horizontal='center')
+ROW_ALIGNMENT = Alignment(
+    horizontal='center',
+    wrapText=True,
+    vertical='center',
+)
+
+
+class ExportFile(InputFile):
+    """A finished report kept in a spooled temporary file."""
+
+    def __init__(self, file, filename: str, rows: int):
+        super().__init__(filename=filename)
+        self.file = file
+        self.rows = rows
+
+    async def read(self, bot: Bot):
+        await asyncio.to_thread(self.file.seek, 0)
+        while chunk := await asyncio.to_thread(
+            self.file.read, self.chunk_size
+        ):
+            yield chunk
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class _XlsxWriter:
+    def __init__(self, columns: Sequence[str], file):
+        self.file = file
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet(SHEET_TITLE)
+        for index in range(1, len(columns) + 1):
+            letter = get_column_letter(index)
+            self.sheet.column_dimensions[letter].width = COLUMN_WIDTH
+        header = []
+        for value in columns:
+            cell = WriteOnlyCell(self.sheet, value)
+            cell.font = HEADER_FONT
+            cell.alignment = HEADER_ALIGNMENT
+            header.append(cell)
+        self.sheet.append(header)
+        # Resolving the alignment once and sharing the style ids is about
+        # twice as fast as setting ``alignment`` on every cell.
+        template = WriteOnlyCell(self.sheet)
+        template.alignment = ROW_ALIGNMENT
+        self.row_style = template._style
+
+    def write(self, rows: Iterable[Sequence]) -> None:
+        for row in rows:
+            cells = []
+            for value in row:
+                cell = WriteOnlyCell(self.sheet, value)
+                cell._style = self.row_style
+                cells.append(cell)
+            self.sheet.append(cells)
+
+    def finish(self) -> None:
+        self.workbook.save(self.file)
+
+
+class _CsvWriter:
+    def __init__(self, columns: Sequence[str], file):
+        # BOM, so Excel opens the UTF-8 file with the right encoding.
+        self.text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+        self.writer = csv.writer(self.text)
+        self.writer.writerow(columns)
+
+    def write(self, rows: Iterable[Sequence]) -> None:
+        self.writer.writerows(rows)
+
+    def finish(self) -> None:
+        self.text.flush()
+        self.text.detach()
+
+
+_WRITERS = {
+    'xlsx': _XlsxWriter,
+    'csv': _CsvWriter,
+}
+
+
+async def export_rows(
+    columns: Sequence[str],
+    pages: AsyncIterable[Sequence[Sequence]] | Iterable[Sequence[Sequence]],
+    name_file: str,
+    file_format: str | None = None,
+) -> ExportFile:
+    """Write *pages* of rows under *columns*; ``ExportFile.rows`` is the
+    number of data rows, so callers can tell an empty report."""
+    file_format = file_format or CONFIG.export_format
+    file = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    rows = 0
+    try:
+        writer = await asyncio.to_thread(_WRITERS[file_format], columns, file)
+        if isinstance(pages, AsyncIterable):
+            async for page in pages:
+                await asyncio.to_thread(writer.write, page)
+                rows += len(page)
+        else:
+            for page in pages:
+                await asyncio.to_thread(writer.write, page)
+                rows += len(page)
+        await asyncio.to_thread(writer.finish)
+    except BaseException:
+        file.close()
+        raise
+    return ExportFile(file, f'{name_file}.{file_format}', rows)
 
 
 async def get_excel_file(
     columns: list[str],
     field: list[list[str]],
     name_file: str,
-) -> BufferedInputFile:
-    """Build an XLSX file in memory and return it as Telegram input file."""
-    workbook = Workbook()
-    worksheet = workbook.active
-    worksheet.title = 'BotMetrics'
-    worksheet.append(columns)
-    for data in field:
-        worksheet.append(data)
-    await document_setup(23, len(columns), worksheet)
-    buffer = io.BytesIO()
-    workbook.save(buffer)
-    buffer.seek(0)
-    file_content = buffer.getvalue()
-    return BufferedInputFile(file_content, f'{name_file}.xlsx')
-
-
-async def document_setup(
-    width: int,
-    length: int,
-    worksheet: Worksheet,
-) -> None:
-    for cell in worksheet[1]:
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal='center')
-
-    for column in worksheet.columns:
-        col_letter = column[0].column_letter
-        worksheet.column_dimensions[col_letter].width = width
-
-    for row in worksheet.iter_rows(
-        min_row=2,
-        max_row=worksheet.max_row,
-        min_col=1,
-        max_col=length,
-    ):
-        for cell in row:
-            cell.alignment = Alignment(
-                horizontal='center',
-                wrapText=True,
-                vertical='center',
-            )
+) -> ExportFile:
+    """Build an XLSX file from prepared rows."""
+    return await export_rows(columns, [field], name_file, 'xlsx')
@@ -1,14 +1,39 @@
+"""
+Fleet health sweep, run every 15 minutes by ``server_control_manager``.
+
+Every server of every location is probed at once, bounded only by
+``CONFIG.server_check_concurrency``.  A probe is ``login`` +
+``count_users(fresh=True)`` through ServerManager, whose panel clients are
+pooled per server, so a still-valid panel session is reused instead of
+logging in again.
+
+Results are applied in one pass:
+
+- ``actual_space`` of answering servers and ``auto_work`` flips are written
+  with a single executemany UPDATE (``bulk_update_server_health``), only
+  for rows whose value changed;
+- admins are told about servers that went down or came back, and about
+  VDS close to ``max_space`` (using the fresh user counts).
+
+Metrics
+-------
+server_probe_seconds{server_id, type_vpn, result}   Histogram
+    result = ok | timeout | error
+"""
+
 import asyncio
 import logging
 import time
+from dataclasses import dataclass
 from time import perf_counter
 
 from aiogram import Bot, html
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from prometheus_client import Histogram
+from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from bot.database.methods.get import get_all_location
-from bot.database.methods.update import server_auto_work_update, server_space_update
-from bot.database.models.main import Location, Servers
+from bot.database.methods.update import bulk_update_server_health
+from bot.database.models.main import Location, Servers, Vds
 from bot.misc.VPN.ServerManager import ServerManager
 from bot.misc.language import Localization
 from bot.misc.util import CONFIG, can_send_alert
@@ -17,6 +42,107 @@ log = logging.getLogger(__name__)
 
 _ = Localization.text
 
+PROBE_SECONDS = Histogram(
+    'server_probe_seconds',
+    'Panel health probe latency per server',
+    ['server_id', 'type_vpn', 'result'],
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0),
+)
+
+
+@dataclass(slots=True)
+class ProbeResult:
+    location: Location
+    vds: Vds
+    server: Servers
+    users: int | None
+    result: str
+    duration_ms: int
+
+    @property
+    def working(self) -> bool:
+        return self.users is not None
+
+
+async def probe_server(
+    location: Location,
+    vds: Vds,
+    server: Servers,
+    sem: asyncio.Semaphore,
+) -> ProbeResult:
+    async def _fetch():
+        manager = ServerManager(server)
+        await manager.login()
+        return await manager.count_users(fresh=True)
+
+    async with sem:
+        start = time.monotonic()
+        users = None
+        try:
+            found = await asyncio.wait_for(
+                _fetch(),
+                timeout=CONFIG.server_check_timeout_sec,
+            )
+            result = 'error' if found is None else 'ok'
+            users = found
+        except asyncio.TimeoutError:
+            result = 'timeout'
+        except Exception:
+            result = 'error'
+            log.error(
+                "event=server_check status=error server_id=%s",
+                server.id,
+                exc_info=True,
+            )
+        elapsed = time.monotonic() - start
+    PROBE_SECONDS.labels(
+        server_id=str(server.id),
+        type_vpn=str(server.type_vpn),
+        result=result,
+    ).observe(elapsed)
+    probe = ProbeResult(
+        location=location,
+        vds=vds,
+        server=server,
+        users=users,
+        result=result,
+        duration_ms=int(elapsed * 1000),
+    )
+    if probe.working:
+        log.info('event=server_check status=ok', extra={
+            'server_id': server.id,
+            'location_name': location.name,
+            'vds_ip': vds.ip,
+            'duration_ms': probe.duration_ms,
+            'connected_users': users,
+        })
+    else:
+        log.warning('event=server_check status=failed', extra={
+            'server_id': server.id,
+            'location_name': location.name,
+            'vds_ip': vds.ip,
+            'duration_ms': probe.duration_ms,
+            'timeout': result == 'timeout',
+            'error': result == 'error',
+        })
+    return probe
+
+
+def health_changes(probes: list[ProbeResult]) -> list[dict]:
+    """Rows for bulk_update_server_health: only values that changed."""
+    rows = []
+    for probe in probes:
+        server = probe.server
+        row = {}
+        if probe.working and server.actual_space != probe.users:
+            row['actual_space'] = probe.users
+        if bool(server.auto_work) != probe.working:
+            row['auto_work'] = probe.working
+        if row:
+            row['id'] = server.id
+            rows.append(row)
+    return rows
+
 
 async def server_control_manager(
     bot: Bot,
@@ -35,15 +161,29 @@ async def server_control_manager(
         async with session_pool() as session:
             all_locations = await get_all_location(session)
             sem = asyncio.Semaphore(CONFIG.server_check_concurrency)
+            probes = await asyncio.gather(*(
+                probe_server(location, vds, server, sem)
+                for location in all_locations
+                for vds in location.vds
+                for server in vds.servers
+            ))
+            # Read everything the alerts need before the rows are updated.
+            transitions = [
+                p for p in probes if bool(p.server.auto_work) != p.working
+            ]
             for location in all_locations:
-                await check_space_server(bot, location, session)
-                loc_counts = await check_work_location(bot, session, location, sem)
-                if loc_counts is None:
-                    continue
-                totals['total_servers_checked'] += loc_counts.get('checked') or 0
-                totals['total_timeouts'] += loc_counts.get('timeouts') or 0
-                totals['total_errors'] += loc_counts.get('errors') or 0
-                totals['total_space_updates'] += loc_counts.get('space_updates') or 0
+                await check_space_server(bot, location, probes)
+            changes = health_changes(probes)
+            await bulk_update_server_health(session, changes)
+
+        totals['total_servers_checked'] = len(probes)
+        totals['total_timeouts'] = sum(p.result == 'timeout' for p in probes)
+        totals['total_errors'] = sum(p.result == 'error' for p in probes)
+        totals['total_space_updates'] = sum(
+            'actual_space' in row for row in changes
+        )
+        for probe in transitions:
+            await notify_server_state(bot, probe)
     except Exception as e:
         log.error(f"Error in server_control_manager: {e}", exc_info=True)
     finally:
@@ -57,116 +197,18 @@ async def server_control_manager(
         })
 
 
-async def check_work_location(
-    bot: Bot,
-    session: AsyncSession,
-    location: Location,
-    sem: asyncio.Semaphore,
-):
-    for vds in location.vds:
-        servers = list(vds.servers)
-
-        async def _network_check(server: Servers):
-            start_ms = time.monotonic() * 1000
-
-            async def _fetch():
-                manager = ServerManager(server)
-                await manager.login()
-                return await manager.get_all_user()
-
-            await sem.acquire()
-            try:
-                try:
-                    users = await asyncio.wait_for(
-                        _fetch(),
-                        timeout=CONFIG.server_check_timeout_sec,
-                    )
-                    duration_ms = int((time.monotonic() * 1000) - start_ms)
-                    return (server, users, False, False, duration_ms)
-                except asyncio.TimeoutError:
-                    duration_ms = int((time.monotonic() * 1000) - start_ms)
-                    log.warning(
-                        "event=server_check status=timeout server_id=%s duration_ms=%s",
-                        server.id,
-                        duration_ms,
-                    )
-                    return (server, None, True, False, duration_ms)
-                except Exception:
-                    duration_ms = int((time.monotonic() * 1000) - start_ms)
-                    log.error(
-                        "event=server_check status=error server_id=%s duration_ms=%s",
-                        server.id,
-                        duration_ms,
-                        exc_info=True,
-                    )
-                    return (server, None, False, True, duration_ms)
-            finally:
-                try:
-                    sem.release()
-                except Exception:
-                    pass
-
-        tasks = [asyncio.create_task(_network_check(s)) for s in servers]
-        results = await asyncio.gather(*tasks, return_exceptions=False)
-
-        loc_counts = {'checked': 0, 'timeouts': 0, 'errors': 0, 'space_updates': 0}
-        for server, users, was_timeout, was_error, duration_ms in results:
-            loc_counts['checked'] += 1
-            if was_timeout:
-                loc_counts['timeouts'] += 1
-            if was_error:
-                loc_counts['errors'] += 1
-
-            server_work = False
-            if users is not None:
-                try:
-                    space = len(users)
-                    await server_space_update(session, server.id, space)
-                    server_work = True
-                    loc_counts['space_updates'] += 1
-                    log.info('event=server_check status=ok', extra={
-                        'server_id': server.id,
-                        'location_name': location.name,
-                        'vds_ip': vds.ip,
-                        'duration_ms': duration_ms,
-                        'connected_users': space,
-                    })
-                except Exception as e:
-                    loc_counts['errors'] += 1
-                    log.error(
-                        "Failed to update server space for id=%s: %s",
-                        server.id,
-                        e,
-                        exc_info=True,
-                    )
-            else:
-                log.warning('event=server_check status=failed', extra={
-                    'server_id': server.id,
-                    'location_name': location.name,
-                    'vds_ip': vds.ip,
-                    'duration_ms': duration_ms,
-                    'timeout': was_timeout,
-                    'error': was_error,
-                })
-
-            if server_work:
-                await handle_working_server(bot, session, server, location.name, vds.ip)
-            else:
-                await handle_non_working_server(bot, session, server, location.name, vds.ip)
-
-        return loc_counts
-
-
 async def check_space_server(
     bot: Bot,
     location: Location,
-    session: AsyncSession,
+    probes: list[ProbeResult],
 ):
+    fresh_space = {p.server.id: p.users for p in probes if p.working}
     for vds in location.vds:
         sum_actual_space = 0
         for server in vds.servers:
-            if server.actual_space is not None:
-                sum_actual_space += server.actual_space
+            space = fresh_space.get(server.id, server.actual_space)
+            if space is not None:
+                sum_actual_space += space
         if sum_actual_space >= vds.max_space - CONFIG.alert_server_space:
             text = _('space_message', CONFIG.languages).format(
                 vds_ip=html.quote(vds.ip),
@@ -178,85 +220,24 @@ async def check_space_server(
                 await notify_admin(bot, text)
 
 
-async def check_work_server(
-    server: Servers,
-    session: AsyncSession,
-    sem: asyncio.Semaphore,
-) -> bool:
-    async def _fetch_users():
-        server_manager = ServerManager(server)
-        await server_manager.login()
-        return await server_manager.get_all_user()
-
-    await sem.acquire()
-    try:
-        try:
-            all_user_server = await asyncio.wait_for(
-                _fetch_users(),
-                timeout=CONFIG.server_check_timeout_sec,
-            )
-        except asyncio.TimeoutError:
-            log.warning(
-                "Timeout while checking server id=%s type=%s",
-                server.id,
-                getattr(server, "type_vpn", None),
-            )
-            return False
-
-        if all_user_server is None:
-            return False
-
-        space = len(all_user_server)
-        await server_space_update(session, server.id, space)
-        return True
-    except Exception as e:
-        log.error(f"Error checking server {server.id}: {e}", exc_info=True)
-        return False
-    finally:
-        try:
-            sem.release()
-        except Exception:
-            pass
-
-
-async def handle_working_server(
-    bot: Bot,
-    session: AsyncSession,
-    server: Servers,
-    location_name: str,
-    vds_ip: str,
-) -> None:
-    if not server.auto_work:
-        await server_auto_work_update(session, server.id, True)
-        if can_send_alert(f'alert_server_recovered_{server.id}', cooldown_sec=3600):
-            await notify_admin(
-                bot,
-                _('message_server_auto_show', CONFIG.languages).format(
-                    type_vpn=ServerManager.VPN_TYPES.get(server.type_vpn).NAME_VPN,
-                    vds_ip=html.quote(str(vds_ip)),
-                    location_name=html.quote(location_name),
-                ),
-            )
-
-
-async def handle_non_working_server(
-    bot: Bot,
-    session: AsyncSession,
-    server: Servers,
-    location_name: str,
-    vds_ip: str,
-) -> None:
-    if server.auto_work:
-        await server_auto_work_update(session, server.id, False)
-        if can_send_alert(f'alert_server_failed_{server.id}', cooldown_sec=3600):
-            await notify_admin(
-                bot,
-                _('message_server_auto_hidden', CONFIG.languages).format(
-                    type_vpn=ServerManager.VPN_TYPES.get(server.type_vpn).NAME_VPN,
-                    vds_ip=html.quote(str(vds_ip)),
-                    location_name=html.quote(location_name),
-                ),
-            )
+async def notify_server_state(bot: Bot, probe: ProbeResult) -> None:
+    """Tell the admin a server was hidden from or returned to users."""
+    server = probe.server
+    if probe.working:
+        alert_key = f'alert_server_recovered_{server.id}'
+        text_key = 'message_server_auto_show'
+    else:
+        alert_key = f'alert_server_failed_{server.id}'
+        text_key = 'message_server_auto_hidden'
+    if can_send_alert(alert_key, cooldown_sec=3600):
+        await notify_admin(
+            bot,
+            _(text_key, CONFIG.languages).format(
+                type_vpn=ServerManager.VPN_TYPES.get(server.type_vpn).NAME_VPN,
+                vds_ip=html.quote(str(probe.vds.ip)),
+                location_name=html.quote(probe.location.name),
+            ),
+        )
 
 
 async def notify_admin(bot: Bot, message: str) -> None:
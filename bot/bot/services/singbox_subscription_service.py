@@ -1,58 +1,43 @@
 import json
-import logging
-from urllib.parse import urlsplit, parse_qs, unquote
 
-log = logging.getLogger(__name__)
+from bot.misc.VPN.parsed_link import ParsedLink
 
 
-def _parse_vless_uri(uri: str) -> dict | None:
-    try:
-        parts = urlsplit(uri)
-        if parts.scheme != "vless":
-            return None
+def _singbox_outbound(link: ParsedLink) -> dict | None:
+    if link.scheme != "vless" or link.port is None:
+        return None
+    security = link.param("security")
+
+    outbound: dict = {
+        "type": "vless",
+        "tag": f"{link.hostname}-{link.port}",
+        "server": link.hostname,
+        "server_port": link.port,
+        "uuid": link.username,
+    }
 
-        params = {k: v[0] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
-        security = params.get("security", "")
-        sni = params.get("sni", "")
-        fp = params.get("fp", "chrome")
-        pbk = params.get("pbk", "")
-        sid = params.get("sid", "")
-        flow = params.get("flow", "")
-        tag = f"{parts.hostname}-{parts.port}"
+    if flow := link.param("flow"):
+        outbound["flow"] = flow
 
-        outbound: dict = {
-            "type": "vless",
-            "tag": tag,
-            "server": parts.hostname,
-            "server_port": int(parts.port),
-            "uuid": parts.username,
+    if security in ("tls", "reality"):
+        tls: dict = {
+            "enabled": True,
+            "server_name": link.param("sni"),
+            "utls": {"enabled": True, "fingerprint": link.param("fp", "chrome")},
         }
-
-        if flow:
-            outbound["flow"] = flow
-
-        if security in ("tls", "reality"):
-            tls: dict = {
+        if security == "reality":
+            tls["reality"] = {
                 "enabled": True,
-                "server_name": sni,
-                "utls": {"enabled": True, "fingerprint": fp},
+                "public_key": link.param("pbk"),
+                "short_id": link.param("sid"),
             }
-            if security == "reality":
-                tls["reality"] = {
-                    "enabled": True,
-                    "public_key": pbk,
-                    "short_id": sid,
-                }
-            outbound["tls"] = tls
+        outbound["tls"] = tls
 
-        return outbound
-    except Exception:
-        log.warning("Failed to parse VLESS URI for sing-box: %s", uri[:80], exc_info=True)
-        return None
+    return outbound
 
 
-def build_singbox_config(vless_uris: list[str]) -> str:
-    proxies = [o for uri in vless_uris if (o := _parse_vless_uri(uri)) is not None]
+def build_singbox_config(links: list[ParsedLink]) -> str:
+    proxies = [o for link in links if (o := _singbox_outbound(link)) is not None]
     if not proxies:
         return ""
 
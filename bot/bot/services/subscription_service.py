@@ -3,57 +3,34 @@ import base64
 import hashlib
 import hmac
 import time
-from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
 from httpx import HTTPStatusError
 
-from bot.database.methods.get import get_key_id, get_name_location_server
+from bot.database.cache import (
+    RenderedSubscription,
+    read_through,
+    subscription_cache_key,
+)
+from bot.database.main import subscription_region
+from bot.database.methods.get import (
+    get_key_id,
+    get_key_revision,
+    get_name_location_server,
+)
 from bot.misc.VPN.Marzban import Marzban
+from bot.misc.VPN.parsed_link import ParsedLink
 from bot.misc.VPN.ServerManager import ServerManager
 from bot.misc.util import CONFIG
+from bot.services.clash_subscription_service import build_clash_config
+from bot.services.singbox_subscription_service import build_singbox_config
 
 log = logging.getLogger(__name__)
 
 _TOKEN_TTL_SEC = 60 * 60 * 24 * 30
 
 
-def _preserve_reality_params(raw_link: str, normalized_link: str) -> str:
-    """
-    Ensure REALITY-critical params survive normalization.
-
-    In production we observed rare cases where exported links could end up with
-    an empty `sid` in clean subscription output. Preserve `sid`/`pbk` from the
-    raw Marzban link as a safety net.
-    """
-    try:
-        raw_parts = urlsplit(raw_link)
-        raw_q = dict(parse_qsl(raw_parts.query, keep_blank_values=True))
-        out_parts = urlsplit(normalized_link)
-        out_q = dict(parse_qsl(out_parts.query, keep_blank_values=True))
-        changed = False
-        for key in ("sid", "pbk"):
-            raw_value = str(raw_q.get(key, "") or "").strip()
-            out_value = str(out_q.get(key, "") or "").strip()
-            if raw_value and not out_value:
-                out_q[key] = raw_value
-                changed = True
-        if not changed:
-            return normalized_link
-        return urlunsplit(
-            (
-                out_parts.scheme,
-                out_parts.netloc,
-                out_parts.path,
-                urlencode(out_q, doseq=True),
-                out_parts.fragment,
-            )
-        )
-    except Exception:
-        return normalized_link
-
-
 def _token_signature(payload: str) -> str:
     return hmac.new(
         CONFIG.subscription_signing_key.encode("utf-8"),
@@ -118,7 +95,7 @@ async def get_clean_marzban_links(
     session: AsyncSession,
     key_id: int,
     user_id: int,
-) -> list[str]:
+) -> list[ParsedLink]:
     key = await get_key_id(session, key_id)
     if (
         key is None
@@ -135,7 +112,8 @@ async def get_clean_marzban_links(
             key_id=key.id,
             subscription_timestamp=key.subscription,
         )
-        return [subscription_link] if isinstance(subscription_link, str) and subscription_link.strip() else []
+        parsed = ParsedLink.parse(subscription_link)
+        return [parsed] if parsed is not None else []
 
     marzban_username = f"{user_id}.{key.id}.{server_manager.client.POST_FIX}"
     try:
@@ -153,28 +131,76 @@ async def get_clean_marzban_links(
             subscription_timestamp=key.subscription,
         )
         user = await server_manager.client.get_client(marzban_username)
-    links = user.get("links") or []
-    clean_links = []
-    for raw_link in links:
-        if not isinstance(raw_link, str) or not raw_link.strip():
-            continue
-        normalized = server_manager.client.normalize_export_link(raw_link)
-        normalized = _preserve_reality_params(raw_link, normalized)
-        if server_manager.client._is_degraded_export_link(normalized):
-            continue
-        clean_links.append(normalized)
-    return clean_links
-
-
-async def render_clean_subscription_payload(
+    # Each link is parsed once; empty `sid`/`pbk` duplicates are dropped
+    # while parsing (REALITY clients fail without them).
+    return [
+        link
+        for link in server_manager.client.parse_export_links(user.get("links"))
+        if not server_manager.client.is_degraded_link(link)
+    ]
+
+
+def _etag(body: str | None) -> str | None:
+    if body is None:
+        return None
+    return '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def render_subscription(links: list[ParsedLink]) -> RenderedSubscription:
+    plain = "\n".join(link.text for link in links)
+    clash = build_clash_config(links) or None
+    singbox = build_singbox_config(links) or None
+    return RenderedSubscription(
+        links=tuple(link.text for link in links),
+        plain=plain,
+        clash=clash,
+        singbox=singbox,
+        etags={
+            name: _etag(body)
+            for name, body in (
+                ("plain", plain), ("clash", clash), ("singbox", singbox)
+            )
+            if body is not None
+        },
+    )
+
+
+async def get_rendered_subscription(
     session: AsyncSession,
     key_id: int,
     user_id: int,
-) -> str:
-    links = await get_clean_marzban_links(session=session, key_id=key_id, user_id=user_id)
-    if not links:
+) -> RenderedSubscription:
+    """The key's subscription, rendered once per key revision.
+
+    Only a primary-key read of the key happens per request; the panel is
+    asked again after the key is switched or extended (see database/cache.py).
+    """
+    revision = await get_key_revision(session, key_id)
+    if (
+        revision is None
+        or revision.server is None
+        or int(revision.user_tgid or 0) != int(user_id)
+    ):
         raise HTTPException(status_code=404, detail="subscription_not_found")
-    return "\n".join(links)
+
+    async def _render():
+        links = await get_clean_marzban_links(
+            session=session, key_id=key_id, user_id=user_id
+        )
+        if not links:
+            # Raised rather than cached: the panel may have the links later.
+            raise HTTPException(status_code=404, detail="subscription_not_found")
+        return render_subscription(links)
+
+    cache_key = await subscription_cache_key(
+        key_id, revision.server, revision.subscription
+    )
+    return await read_through(
+        "subscription",
+        cache_key,
+        _render,
+        region=subscription_region,
+    )
 
 
 async def get_user_subscription_link(
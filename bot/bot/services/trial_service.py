@@ -4,6 +4,7 @@ from datetime import datetime, timedelta
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from bot.database.cache import invalidate_person
 from bot.database.methods.get import _get_person, get_free_server_id
 from bot.database.methods.insert import add_key
 from bot.database.models.main import Keys
@@ -84,6 +85,8 @@ async def activate_trial(user_id: int, session: AsyncSession) -> Keys | None:
             trial_period=True,
             server_id=server_id,
         )
+        # add_key committed the trial flags set above with the key.
+        await invalidate_person(user_id)
         log.info(
             'event=trial_activation status=success',
             extra={
@@ -94,6 +97,7 @@ async def activate_trial(user_id: int, session: AsyncSession) -> Keys | None:
         )
         return trial_key
     except Exception as e:
+        await session.rollback()
         log.error(
             'event=trial_activation status=failed',
             extra={'user_id': user_id},
@@ -4,25 +4,27 @@ from contextlib import asynccontextmanager
 
 import httpx
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
 import logging
 from sqlalchemy import text
 
-from bot.services.clash_subscription_service import build_clash_config
-from bot.services.singbox_subscription_service import build_singbox_config
+from bot.misc.util import CONFIG
 from bot.services.subscription_service import (
+    get_rendered_subscription,
     parse_clean_subscription_token,
-    render_clean_subscription_payload,
-    get_clean_marzban_links,
 )
+from bot.webhooks.hook_telegram import telegram_router
 from bot.webhooks.hook_wata import wata_router
 from bot.webhooks.hook_yoomoney import yoomoney_router
 from bot.webhooks.metrics import metrics_endpoint, prometheus_middleware
 
 log = logging.getLogger(__name__)
 
-# Paths that must not open a DB session (liveness probes, metrics scrape)
-_NO_SESSION_PATHS = frozenset({"/health", "/healthz", "/metrics"})
+# Paths that must not open a DB session (liveness probes, metrics scrape,
+# Telegram updates that are only queued to NATS)
+_NO_SESSION_PATHS = frozenset(
+    {"/health", "/healthz", "/metrics", CONFIG.webhook_path}
+)
 
 
 @asynccontextmanager
@@ -146,69 +148,96 @@ async def metrics(request: Request):
     return await metrics_endpoint(request)
 
 
+# Clients poll these URLs: let them revalidate with If-None-Match and keep
+# the body for a short while; the rendered bodies are cached server-side.
+SUBSCRIPTION_MAX_AGE_SEC = 60
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in ("*", etag):
+            return True
+    return False
+
+
+def _subscription_response(
+    request: Request,
+    body: str,
+    etag: str,
+    media_type: str,
+    disposition: str,
+) -> Response:
+    headers = {
+        "Cache-Control": f"private, max-age={SUBSCRIPTION_MAX_AGE_SEC}",
+        "ETag": etag,
+    }
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    headers["Content-Disposition"] = disposition
+    return PlainTextResponse(body, media_type=media_type, headers=headers)
+
+
 @app.get("/subscriptions/{token}", include_in_schema=False)
 async def clean_subscription(token: str, request: Request):
     user_id, key_id = parse_clean_subscription_token(token)
-    payload = await render_clean_subscription_payload(
+    rendered = await get_rendered_subscription(
         session=request.state.session,
         key_id=key_id,
         user_id=user_id,
     )
-    return PlainTextResponse(
-        payload,
-        media_type="text/plain; charset=utf-8",
-        headers={
-            "Cache-Control": "no-store",
-            "Content-Disposition": f'inline; filename="vpnhub-sub-{user_id}-{key_id}.txt"',
-        },
+    return _subscription_response(
+        request,
+        rendered.plain,
+        rendered.etags["plain"],
+        "text/plain; charset=utf-8",
+        f'inline; filename="vpnhub-sub-{user_id}-{key_id}.txt"',
     )
 
 
 @app.get("/subscriptions/{token}/clash", include_in_schema=False)
 async def clash_subscription(token: str, request: Request):
     user_id, key_id = parse_clean_subscription_token(token)
-    links = await get_clean_marzban_links(
+    rendered = await get_rendered_subscription(
         session=request.state.session,
         key_id=key_id,
         user_id=user_id,
     )
-    if not links:
-        raise HTTPException(status_code=404, detail="subscription_not_found")
-    yaml_content = build_clash_config(links)
-    if not yaml_content:
+    if rendered.clash is None:
         raise HTTPException(status_code=404, detail="no_parseable_proxies")
-    return PlainTextResponse(
-        yaml_content,
-        media_type="text/yaml; charset=utf-8",
-        headers={
-            "Cache-Control": "no-store",
-            "Content-Disposition": f'attachment; filename="vpnhub-{user_id}.yaml"',
-        },
+    return _subscription_response(
+        request,
+        rendered.clash,
+        rendered.etags["clash"],
+        "text/yaml; charset=utf-8",
+        f'attachment; filename="vpnhub-{user_id}.yaml"',
     )
 
 
 @app.get("/subscriptions/{token}/singbox", include_in_schema=False)
 async def singbox_subscription(token: str, request: Request):
     user_id, key_id = parse_clean_subscription_token(token)
-    links = await get_clean_marzban_links(
+    rendered = await get_rendered_subscription(
         session=request.state.session,
         key_id=key_id,
         user_id=user_id,
     )
-    if not links:
-        raise HTTPException(status_code=404, detail="subscription_not_found")
-    json_content = build_singbox_config(links)
-    if not json_content:
+    if rendered.singbox is None:
         raise HTTPException(status_code=404, detail="no_parseable_proxies")
-    return PlainTextResponse(
-        json_content,
-        media_type="application/json; charset=utf-8",
-        headers={
-            "Cache-Control": "no-store",
-            "Content-Disposition": f'attachment; filename="vpnhub-{user_id}.json"',
-        },
+    return _subscription_response(
+        request,
+        rendered.singbox,
+        rendered.etags["singbox"],
+        "application/json; charset=utf-8",
+        f'attachment; filename="vpnhub-{user_id}.json"',
     )
 
 
 app.include_router(wata_router)
 app.include_router(yoomoney_router)
+if CONFIG.telegram_mode == "webhook":
+    app.include_router(telegram_router)
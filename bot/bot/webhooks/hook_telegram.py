@@ -0,0 +1,47 @@
+import hmac
+import json
+import logging
+from http import HTTPStatus
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+
+from bot.misc.update_stream import publish_update
+from bot.misc.util import CONFIG
+
+log = logging.getLogger(__name__)
+
+telegram_router = APIRouter()
+
+
+@telegram_router.post(CONFIG.webhook_path, include_in_schema=False)
+async def telegram_webhook(request: Request):
+    """Accept a Telegram update and queue it on its user's shard.
+
+    Handling happens in ShardedUpdateConsumer; answering only after the
+    publish is acked means a failed publish is retried by Telegram.
+    """
+    request_id = getattr(request.state, "request_id", "unknown")
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not hmac.compare_digest(secret, CONFIG.webhook_secret):
+        log.warning(
+            "event=telegram.webhook.rejected request_id=%s reason=bad_secret",
+            request_id,
+        )
+        raise HTTPException(status_code=HTTPStatus.UNAUTHORIZED)
+    raw_body = await request.body()
+    try:
+        payload = json.loads(raw_body)
+        int(payload["update_id"])
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST)
+    try:
+        await publish_update(request.app.state.nats_js, payload, raw_body)
+    except Exception:
+        log.exception(
+            "event=telegram.webhook.publish_failed request_id=%s update_id=%s",
+            request_id,
+            payload["update_id"],
+        )
+        raise HTTPException(status_code=HTTPStatus.SERVICE_UNAVAILABLE)
+    return Response(status_code=HTTPStatus.OK)
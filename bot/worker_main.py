@@ -21,6 +21,7 @@ from bot.database import engine
 from bot.misc.nats_connect import connect_to_nats
 from bot.misc.remove_key_servise.consumer import RemoveKeyConsumer
 from bot.misc.util import CONFIG
+from bot.misc.VPN.ServerManager import close_panel_clients
 
 log = logging.getLogger("worker")
 HEARTBEAT_FILE = Path("/tmp/nats_worker_heartbeat")
@@ -94,6 +95,7 @@ async def main() -> None:
         await consumer.stop()
         await nc.drain()
         await engine_instance.dispose()
+        await close_panel_clients()
         log.info("event=worker.stopped")
 
 
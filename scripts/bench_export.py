@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark: peak RSS and wall time of the admin user export per 100k rows.
+
+Compares the legacy pipeline (every row built in memory, an in-memory
+openpyxl ``Workbook`` restyled cell by cell, then serialised to bytes)
+against ``report_export_service.export_rows`` (pages of rows into a
+write-only workbook or CSV in a worker thread, spooled temporary file).
+Rows are synthetic, shaped like ``user_export_pages`` output; each mode
+runs in its own process so peak RSS is not shared between them.
+
+USAGE
+-----
+    # From repo root (needs the bot env vars, e.g. via bot/.env):
+    python scripts/bench_export.py [--rows 100000] [--page 1000]
+
+    # Inside the bot container:
+    docker compose exec vpn_hub_bot python /app/scripts/bench_export.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+# Allow running from repo root without installing the package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bot"))
+
+MODES = ("legacy", "xlsx", "csv")
+COLUMNS = ["№", "fullname", "username", "tgid", "lang", "balance", "group",
+           "keys"]
+
+
+def _row(number: int) -> list:
+    return [number, f"User {number}", f"user{number}", 100000000 + number,
+            "ru", number % 500, "", number % 3]
+
+
+def legacy_export(rows: int) -> int:
+    """The pre-streaming ``get_excel_file``, kept here as the baseline."""
+    from openpyxl.styles import Alignment, Font
+    from openpyxl.workbook import Workbook
+
+    field = [_row(number) for number in range(1, rows + 1)]
+    workbook = Workbook()
+    worksheet = workbook.active
+    worksheet.title = "BotMetrics"
+    worksheet.append(COLUMNS)
+    for data in field:
+        worksheet.append(data)
+    for cell in worksheet[1]:
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal="center")
+    for column in worksheet.columns:
+        worksheet.column_dimensions[column[0].column_letter].width = 23
+    for row in worksheet.iter_rows(
+        min_row=2, max_row=worksheet.max_row, min_col=1, max_col=len(COLUMNS)
+    ):
+        for cell in row:
+            cell.alignment = Alignment(
+                horizontal="center", wrapText=True, vertical="center"
+            )
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return len(buffer.getvalue())
+
+
+async def streaming_export(rows: int, page: int, file_format: str) -> int:
+    from bot.services.report_export_service import export_rows
+
+    async def pages():
+        for start in range(1, rows + 1, page):
+            yield [
+                _row(number)
+                for number in range(start, min(start + page, rows + 1))
+            ]
+
+    file = await export_rows(COLUMNS, pages(), "All Users", file_format)
+    try:
+        return sum([len(chunk) async for chunk in file.read(None)])
+    finally:
+        file.close()
+
+
+def run_mode(mode: str, rows: int, page: int) -> dict:
+    start = time.perf_counter()
+    if mode == "legacy":
+        size = legacy_export(rows)
+    else:
+        size = asyncio.run(streaming_export(rows, page, mode))
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in KiB on Linux.
+    peak_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"mode": mode, "seconds": elapsed, "peak_rss_kib": peak_kib,
+            "bytes": size}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--page", type=int, default=1000)
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.rows, args.page)))
+        return 0
+
+    per = 100_000 / args.rows
+    print(f"rows            {args.rows}")
+    print(f"{'mode':8}{'s/100k rows':>14}{'peak RSS MiB':>14}{'file KiB':>12}")
+    for mode in MODES:
+        out = subprocess.run(
+            [sys.executable, __file__, "--mode", mode,
+             "--rows", str(args.rows), "--page", str(args.page)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        print(
+            f"{mode:8}{result['seconds'] * per:14.2f}"
+            f"{result['peak_rss_kib'] / 1024:14.1f}"
+            f"{result['bytes'] / 1024:12.0f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
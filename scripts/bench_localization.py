@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: cost of rendering the main menu keyboard per update.
+
+Compares the legacy ``Localization.text`` pipeline (``gettext.translation``,
+``str.maketrans`` and the font regex on every string) against the current
+one (catalogs preloaded, ``(key, lang, font)`` lookups memoized).
+
+USAGE
+-----
+    # From repo root (needs the bot env vars, e.g. via bot/.env):
+    python scripts/bench_localization.py [--iterations 2000] [--lang ru]
+
+    # Inside the bot container:
+    docker compose exec vpn_hub_bot python /app/scripts/bench_localization.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gettext
+import os
+import re
+import sys
+import time
+
+# Allow running from repo root without installing the package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bot"))
+
+from bot.keyboards.inline import user_inline  # noqa: E402
+from bot.misc.language import Localization, default_font  # noqa: E402
+from bot.misc.util import CONFIG  # noqa: E402
+
+
+def legacy_text(key_text, language=CONFIG.languages, font=True):
+    """The pre-cache implementation, kept here as the baseline."""
+    lang = gettext.translation(
+        "bot", localedir=Localization.PATH, languages=[language]
+    )
+    text = lang.gettext(key_text)
+    if not font:
+        return text
+    font_map = str.maketrans(default_font, CONFIG.font_template or default_font)
+
+    def replace(match):
+        content = match.group(0)
+        if content.startswith("<") and content.endswith(">"):
+            return content
+        if content.startswith("{") and content.endswith("}"):
+            return content
+        return content.translate(font_map)
+
+    return re.sub(r"<[^>]*>|{[^}]*}|[^<{]+", replace, text)
+
+
+async def _measure(iterations: int, lang: str) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await user_inline.user_menu(lang, CONFIG.admin_tg_id)
+    return (time.perf_counter() - start) / iterations
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--lang", default=CONFIG.languages)
+    args = parser.parse_args()
+
+    current = user_inline._
+    user_inline._ = legacy_text
+    try:
+        before = await _measure(args.iterations, args.lang)
+    finally:
+        user_inline._ = current
+
+    Localization.clear_cache()
+    Localization.preload()
+    after = await _measure(args.iterations, args.lang)
+
+    print(f"iterations      {args.iterations}")
+    print(f"legacy  per menu {before * 1e6:10.1f} us")
+    print(f"cached  per menu {after * 1e6:10.1f} us")
+    print(f"speedup          {before / after:10.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
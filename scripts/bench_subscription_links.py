@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: CPU per subscription render of a Marzban user's links.
+
+Compares the legacy pipeline (``normalize_export_link``, REALITY parameter
+repair and the degraded-node filter each re-parsing the link string, then
+the Clash and sing-box converters parsing it again) against the current one
+(``Marzban.parse_export_links``: one ``ParsedLink`` per link shared by the
+filter and every renderer).  Both produce the plain, Clash and sing-box
+bodies of the same links.
+
+The corpus defaults to links shaped like the panel's exports (REALITY,
+``host``/``sni`` with ``:443``, branded and degraded nodes); pass real ones
+with ``--corpus``, one exported link per line.
+
+USAGE
+-----
+    # From repo root (needs the bot env vars, e.g. via bot/.env):
+    python scripts/bench_subscription_links.py [--renders 2000] [--corpus links.txt]
+
+    # Inside the bot container:
+    docker compose exec vpn_hub_bot python /app/scripts/bench_subscription_links.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from urllib.parse import parse_qs, parse_qsl, quote, unquote, urlencode, urlsplit, urlunsplit
+
+import yaml
+
+# Allow running from repo root without installing the package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bot"))
+
+from bot.misc.VPN.Marzban import Marzban  # noqa: E402
+from bot.services import clash_subscription_service as clash  # noqa: E402
+from bot.services.clash_subscription_service import build_clash_config  # noqa: E402
+from bot.services.singbox_subscription_service import build_singbox_config  # noqa: E402
+
+NODES = (
+    ("65.108.91.192", "Finland-Node-1"),
+    ("78.40.209.162", "QWINS-Node-1"),
+    ("95.216.10.20", "Finland-2"),
+    ("138.124.64.192", "Poland-Node-1"),
+    ("45.77.176.143", "Tokyo-Node-2"),
+)
+
+
+def sample_corpus() -> list[str]:
+    return [
+        f"vless://0f6c1a52-8d5e-4f7a-9f0e-3c2b1a0d9e8f@{host}:443?"
+        "security=reality&type=tcp&headerType=&path=&host=github.com%3A443&"
+        "sni=github.com%3A443&fp=chrome&pbk=Zx3kP9mQ2wR7tY1uI5oL8aS4dF6gH0jK&"
+        f"sid=6ba85179e30d4fc2&spx=%2F&flow=xtls-rprx-vision#{quote(label)}"
+        "%20%2876149983_60_mz%29%20%5BVLESS-tcp%5D"
+        for host, label in NODES
+    ]
+
+
+# ── Legacy pipeline, kept here as the baseline ───────────────────────────────
+
+def legacy_normalize(link: str) -> str:
+    parts = urlsplit(link)
+    query = dict(parse_qsl(parts.query, keep_blank_values=True))
+    if "encryption" not in query or not str(query.get("encryption") or "").strip():
+        query["encryption"] = "none"
+    for key in ("host", "sni"):
+        if key in query:
+            query[key] = Marzban._strip_default_port(query[key])
+    fragment = str(parts.fragment or "")
+    if fragment:
+        decoded_fragment = unquote(fragment)
+        for old_value, new_value in Marzban.EXPORT_LABEL_RENAMES.items():
+            decoded_fragment = decoded_fragment.replace(old_value, new_value)
+        fragment = quote(decoded_fragment, safe="()[] -_")
+    return urlunsplit((parts.scheme, parts.netloc, parts.path,
+                       urlencode(query, doseq=True), fragment))
+
+
+def legacy_preserve(raw_link: str, normalized_link: str) -> str:
+    raw_q = dict(parse_qsl(urlsplit(raw_link).query, keep_blank_values=True))
+    out_parts = urlsplit(normalized_link)
+    out_q = dict(parse_qsl(out_parts.query, keep_blank_values=True))
+    changed = False
+    for key in ("sid", "pbk"):
+        raw_value = str(raw_q.get(key, "") or "").strip()
+        if raw_value and not str(out_q.get(key, "") or "").strip():
+            out_q[key] = raw_value
+            changed = True
+    if not changed:
+        return normalized_link
+    return urlunsplit((out_parts.scheme, out_parts.netloc, out_parts.path,
+                       urlencode(out_q, doseq=True), out_parts.fragment))
+
+
+def legacy_degraded(link: str) -> bool:
+    parts = urlsplit(link)
+    host = str(parts.hostname or "").strip().lower()
+    if host in Marzban.DEGRADED_EXPORT_HOSTS:
+        return True
+    fragment = str(parts.fragment or "").strip().lower()
+    return any(marker in fragment for marker in Marzban.DEGRADED_EXPORT_FRAGMENTS)
+
+
+def legacy_clash_proxy(uri: str) -> dict | None:
+    parts = urlsplit(uri)
+    if parts.scheme != "vless":
+        return None
+    params = {k: v[0] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+    security = params.get("security", "")
+    proxy = {
+        "name": unquote(parts.fragment) if parts.fragment else f"{parts.hostname}:{parts.port}",
+        "type": "vless",
+        "server": parts.hostname,
+        "port": int(parts.port),
+        "uuid": parts.username,
+        "network": params.get("type", "tcp"),
+        "tls": security in ("tls", "reality"),
+        "udp": True,
+    }
+    if flow := params.get("flow"):
+        proxy["flow"] = flow
+    if fp := params.get("fp"):
+        proxy["client-fingerprint"] = fp
+    if sni := params.get("sni"):
+        proxy["servername"] = sni
+    if security == "reality":
+        reality_opts = {}
+        if pbk := params.get("pbk"):
+            reality_opts["public-key"] = pbk
+        if sid := params.get("sid"):
+            reality_opts["short-id"] = sid
+        if reality_opts:
+            proxy["reality-opts"] = reality_opts
+    return proxy
+
+
+def legacy_singbox_outbound(uri: str) -> dict | None:
+    parts = urlsplit(uri)
+    if parts.scheme != "vless":
+        return None
+    params = {k: v[0] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+    security = params.get("security", "")
+    outbound = {
+        "type": "vless",
+        "tag": f"{parts.hostname}-{parts.port}",
+        "server": parts.hostname,
+        "server_port": int(parts.port),
+        "uuid": parts.username,
+    }
+    if flow := params.get("flow", ""):
+        outbound["flow"] = flow
+    if security in ("tls", "reality"):
+        tls = {
+            "enabled": True,
+            "server_name": params.get("sni", ""),
+            "utls": {"enabled": True, "fingerprint": params.get("fp", "chrome")},
+        }
+        if security == "reality":
+            tls["reality"] = {"enabled": True, "public_key": params.get("pbk", ""),
+                              "short_id": params.get("sid", "")}
+        outbound["tls"] = tls
+    return outbound
+
+
+def legacy_render(raw_links: list[str]) -> tuple[str, str, str]:
+    links = []
+    for raw_link in raw_links:
+        normalized = legacy_preserve(raw_link, legacy_normalize(raw_link))
+        if not legacy_degraded(normalized):
+            links.append(normalized)
+    proxies = [p for uri in links if (p := legacy_clash_proxy(uri)) is not None]
+    outbounds = [o for uri in links if (o := legacy_singbox_outbound(uri)) is not None]
+    return "\n".join(links), _clash_body(proxies), _singbox_body(outbounds)
+
+
+def _clash_body(proxies: list[dict]) -> str:
+    names = [p["name"] for p in proxies]
+    config = {
+        "mixed-port": 7890,
+        "allow-lan": False,
+        "mode": "rule",
+        "log-level": "info",
+        "dns": {
+            "enable": True,
+            "enhanced-mode": "fake-ip",
+            "nameserver": ["8.8.8.8", "1.1.1.1"],
+            "fallback": ["tls://1.1.1.1", "tls://8.8.8.8"],
+            "fallback-filter": {"geoip": True, "geoip-code": "RU", "geosite": ["ru"]},
+        },
+        "proxies": proxies,
+        "proxy-groups": [{"name": "🚀 VPN", "type": "select", "proxies": names}],
+        "rules": clash._RU_BYPASS_RULES + ["MATCH,🚀 VPN"],
+    }
+    return yaml.dump(config, allow_unicode=True, default_flow_style=False, sort_keys=False)
+
+
+def _singbox_body(outbounds: list[dict]) -> str:
+    config = {
+        "outbounds": outbounds + [{"type": "direct", "tag": "direct"},
+                                  {"type": "block", "tag": "block"}],
+        "route": {"final": outbounds[0]["tag"]},
+    }
+    return json.dumps(config, ensure_ascii=False, indent=2)
+
+
+def current_render(raw_links: list[str]) -> tuple[str, str, str]:
+    links = [
+        link for link in Marzban.parse_export_links(raw_links)
+        if not Marzban.is_degraded_link(link)
+    ]
+    return (
+        "\n".join(link.text for link in links),
+        build_clash_config(links),
+        build_singbox_config(links),
+    )
+
+
+def _parse_only(render) -> float:
+    """Seconds of one render spent outside YAML/JSON serialisation."""
+    dump, dumps = yaml.dump, json.dumps
+    yaml.dump = lambda *a, **k: ""
+    json.dumps = lambda *a, **k: ""
+    try:
+        start = time.process_time()
+        render()
+        return time.process_time() - start
+    finally:
+        yaml.dump, json.dumps = dump, dumps
+
+
+def _measure(render, corpus: list[str], renders: int) -> tuple[float, float]:
+    start = time.process_time()
+    for _ in range(renders):
+        render(corpus)
+    total = (time.process_time() - start) / renders
+    links = sum(_parse_only(lambda: render(corpus)) for _ in range(renders))
+    return total, links / renders
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--renders", type=int, default=2000)
+    parser.add_argument("--corpus", help="file with one exported link per line")
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            corpus = [line.strip() for line in f if line.strip()]
+    else:
+        corpus = sample_corpus()
+
+    if current_render(corpus) != legacy_render(corpus):
+        print("warning: bodies differ between pipelines", file=sys.stderr)
+
+    print(f"links/render    {len(corpus)}")
+    print(f"renders         {args.renders}")
+    print(f"{'pipeline':10}{'CPU us/render':>16}{'links only us':>16}")
+    results = {}
+    for name, render in (("legacy", legacy_render), ("current", current_render)):
+        total, links = _measure(render, corpus, args.renders)
+        results[name] = links
+        print(f"{name:10}{total * 1e6:16.1f}{links * 1e6:16.1f}")
+    if results["current"]:
+        print(f"link handling speedup  x{results['legacy'] / results['current']:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
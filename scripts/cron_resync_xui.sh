@@ -2,7 +2,8 @@
 # Weekly maintenance: resync xui clients from DB to panels and reload xray.
 #
 # What it does:
-#   1. Copies the latest resync_xui_clients.py into vpn_hub_bot container.
+#   1. Copies the latest resync_xui_clients.py (and reconcile_panels.py,
+#      which does the work) into vpn_hub_bot container.
 #   2. Runs the script with --apply for VLESS xui servers (1=NL, 3=FI).
 #   3. Restarts x-ui on FI and NL so xray re-reads config.json from x-ui.db.
 #
@@ -18,6 +19,8 @@ set -uo pipefail
 REPO="/home/control/vpnhub"
 SCRIPT_LOCAL="$REPO/scripts/resync_xui_clients.py"
 SCRIPT_IN_CONTAINER="/app/resync_xui_clients.py"
+ENGINE_LOCAL="$REPO/scripts/reconcile_panels.py"
+ENGINE_IN_CONTAINER="/app/reconcile_panels.py"
 LOG_FILE="$HOME/cron-logs/resync_xui.log"
 TS() { date -u +'%Y-%m-%dT%H:%M:%SZ'; }
 
@@ -33,6 +36,7 @@ mkdir -p "$(dirname "$LOG_FILE")"
 
     echo "[$(TS)] copying script into vpn_hub_bot"
     docker cp "$SCRIPT_LOCAL" "vpn_hub_bot:$SCRIPT_IN_CONTAINER"
+    docker cp "$ENGINE_LOCAL" "vpn_hub_bot:$ENGINE_IN_CONTAINER"
 
     echo "[$(TS)] running --apply --server 1 --server 3"
     docker exec vpn_hub_bot python "$SCRIPT_IN_CONTAINER" \
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Reconcile panel clients with ``Keys`` on every server (all VPN types).
+
+Reports, per server, active keys missing from the panel, bot-made panel
+clients no key refers to (orphans) and Remnawave/Marzban expiry drift; with
+--apply it repairs them with bulk panel calls.  The same engine runs hourly
+as the ``panel_reconcile`` job (services/panel_reconciliation_service.py).
+
+USAGE
+-----
+    # Dry-run over the whole fleet, JSON report on stdout:
+    docker compose exec vpn_hub_bot python /app/scripts/reconcile_panels.py
+
+    # Repair only missing clients on two servers, report to a file:
+    python scripts/reconcile_panels.py --server 1 --server 3 \\
+        --repair missing --apply --output /tmp/reconcile.json
+
+Exit status is 1 if any server could not be reconciled.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+
+# Allow running from repo root or /app without installing the package.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "bot"))
+sys.path.insert(0, "/app")
+
+from sqlalchemy.ext.asyncio import async_sessionmaker  # noqa: E402
+
+from bot.database import engine  # noqa: E402
+from bot.misc.VPN.ServerManager import close_panel_clients  # noqa: E402
+from bot.services.panel_reconciliation_service import (  # noqa: E402
+    REPAIR_ALL,
+    reconcile_panels,
+    report_to_dict,
+)
+
+
+async def run(
+    apply: bool,
+    server_ids: list[int] | None,
+    types_vpn: list[int] | None,
+    repair: frozenset,
+) -> dict:
+    eng = engine()
+    session_pool = async_sessionmaker(eng, expire_on_commit=False)
+    try:
+        reports = await reconcile_panels(
+            session_pool,
+            apply=apply,
+            server_ids=server_ids,
+            types_vpn=types_vpn,
+            repair=repair,
+        )
+    finally:
+        await close_panel_clients()
+        await eng.dispose()
+    return report_to_dict(reports, apply)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--server", type=int, action="append", default=None,
+        help="Limit to server id (repeatable). Default: every server.",
+    )
+    parser.add_argument(
+        "--type", dest="types_vpn", type=int, action="append", default=None,
+        help="Limit to Servers.type_vpn (repeatable).",
+    )
+    parser.add_argument(
+        "--repair", action="append", choices=sorted(REPAIR_ALL),
+        default=None,
+        help="What --apply may repair (repeatable). Default: everything.",
+    )
+    parser.add_argument(
+        "--apply", action="store_true",
+        help="Repair what was found. Default is dry-run.",
+    )
+    parser.add_argument(
+        "--output", default=None,
+        help="Write the JSON report here instead of stdout.",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s %(message)s",
+        stream=sys.stderr,
+    )
+    args = parse_args(argv)
+    report = asyncio.run(
+        run(
+            args.apply,
+            args.server,
+            args.types_vpn,
+            frozenset(args.repair) if args.repair else REPAIR_ALL,
+        )
+    )
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+    return 1 if report["totals"]["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import os
+import sys
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+import pytest_asyncio
+
+
+@pytest.fixture
+def base_env():
+    """Fixture with test environment variables."""
+    return {
+        "ADMIN_TG_ID": "123",
+        "TG_TOKEN": "test_token",
+        "NAME": "testbot",
+        "CHECK_FOLLOW": "0",
+        "LANGUAGES": "en,ru",
+        "PRICE_SWITCH_LOCATION": "10",
+        "MONTH_COST": "100,200,300,400",
+        "TRIAL_PERIOD": "604800",
+        "FREE_SWITCH_LOCATION": "1",
+        "UTC_TIME": "0",
+        "REFERRAL_DAY": "1",
+        "REFERRAL_PERCENT": "10",
+        "MINIMUM_WITHDRAWAL_AMOUNT": "100",
+        "FREE_SERVER": "0",
+        "LIMIT_IP": "0",
+        "LIMIT_GB": "0",
+        "IMPORT_DB": "0",
+        "SHOW_DONATE": "1",
+        "IS_WORK_EDIT_KEY": "1",
+        "POSTGRES_DB": "testdb",
+        "POSTGRES_USER": "testuser",
+        "POSTGRES_PASSWORD": "testpass",
+        "PGADMIN_DEFAULT_EMAIL": "admin@test.com",
+        "PGADMIN_DEFAULT_PASSWORD": "adminpass",
+    }
+
+
+def fake_prometheus():
+    metric = SimpleNamespace(
+        labels=lambda *a, **k: metric,
+        inc=lambda *a, **k: None,
+        observe=lambda *a, **k: None,
+        set=lambda *a, **k: None,
+    )
+    return SimpleNamespace(
+        CONTENT_TYPE_LATEST="text/plain",
+        Counter=lambda *args, **kwargs: metric,
+        Gauge=lambda *args, **kwargs: metric,
+        Histogram=lambda *args, **kwargs: metric,
+        generate_latest=lambda *args, **kwargs: b"",
+    )
+
+
+@pytest.fixture
+def cleanup_bot_modules():
+    """Clean up bot module imports before and after test."""
+    for m in list(sys.modules.keys()):
+        if m.startswith('bot'):
+            del sys.modules[m]
+    # Bot modules are re-imported per test; a fake client keeps their
+    # metrics from colliding in the global Prometheus registry.
+    with patch.dict(sys.modules, {"prometheus_client": fake_prometheus()}):
+        yield
+    for m in list(sys.modules.keys()):
+        if m.startswith('bot'):
+            del sys.modules[m]
+
+
+@pytest.fixture
+def bot_env(base_env, cleanup_bot_modules, monkeypatch):
+    """Only ``base_env`` in the environment, and bot modules imported
+    afresh.  Tests add variables with ``monkeypatch.setenv``."""
+    for name in list(os.environ):
+        monkeypatch.delenv(name)
+    for name, value in base_env.items():
+        monkeypatch.setenv(name, value)
+    return base_env
+
+
+@pytest_asyncio.fixture
+async def sqlite_pool():
+    """``await sqlite_pool(Model, ...)`` returns a session pool over an
+    in-memory SQLite database holding just those models' tables."""
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    engines = []
+
+    async def make(*models):
+        engine = create_async_engine('sqlite+aiosqlite://')
+        engines.append(engine)
+        async with engine.begin() as conn:
+            await conn.run_sync(lambda sync: models[0].metadata.create_all(
+                sync, tables=[model.__table__ for model in models]
+            ))
+        return async_sessionmaker(engine, expire_on_commit=False)
+
+    yield make
+    for engine in engines:
+        await engine.dispose()
@@ -0,0 +1,86 @@
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_user_export_streams_pages_into_spooled_file(
+    bot_env,
+    sqlite_pool,
+):
+    """User exports are built from paged SQL rows with paid keys counted
+    in the query, as XLSX or CSV, without loading ORM users."""
+    import csv
+    import io
+    from openpyxl import load_workbook
+    from bot.database.methods.get import stream_users_for_export
+    from bot.database.models.main import (
+        Groups, Keys, Location, Metric, Persons, Servers, Vds,
+    )
+    from bot.services.admin_user_export_service import user_export_pages
+    from bot.services.report_export_service import export_rows
+
+    session_pool = await sqlite_pool(Groups, Metric, Persons, Location, Vds, Servers, Keys)
+    async with session_pool() as session:
+        session.add(Groups(name='vip'))
+        session.add_all([
+            Persons(tgid=10, fullname='Ann', username='ann', group='vip'),
+            Persons(tgid=11, fullname='Bob', username='bob', lang_tg='en'),
+            Persons(tgid=12, fullname='Cid', username='cid', group='vip'),
+        ])
+        session.add_all([
+            Keys(user_tgid=10, subscription=1),
+            Keys(user_tgid=10, subscription=1),
+            Keys(user_tgid=10, subscription=1, free_key=True),
+            Keys(user_tgid=11, subscription=1, trial_period=True),
+        ])
+        await session.commit()
+
+    columns = ['№', 'name', 'username', 'tgid', 'lang', 'balance', 'group',
+               'keys']
+    async with session_pool() as session:
+        file = await export_rows(
+            columns,
+            user_export_pages(stream_users_for_export(session, batch=2)),
+            'All Users',
+            'xlsx',
+        )
+    assert file.filename == 'All Users.xlsx'
+    assert file.rows == 3
+    content = b''.join([chunk async for chunk in file.read(None)])
+    file.close()
+    sheet = load_workbook(io.BytesIO(content)).active
+    assert sheet.title == 'BotMetrics'
+    assert [cell.value for cell in sheet[1]] == columns
+    assert sheet['A1'].font.bold
+    assert [[cell.value for cell in row] for row in sheet.iter_rows(
+        min_row=2
+    )] == [
+        [1, 'Ann', 'ann', 10, '❌', 0, 'vip', 2],
+        [2, 'Bob', 'bob', 11, 'en', 0, None, 0],
+        [3, 'Cid', 'cid', 12, '❌', 0, 'vip', 0],
+    ]
+
+    async with session_pool() as session:
+        file = await export_rows(
+            columns,
+            user_export_pages(
+                stream_users_for_export(session, subscribed=True)
+            ),
+            'Subscribe Users',
+            'csv',
+        )
+    content = b''.join([chunk async for chunk in file.read(None)])
+    file.close()
+    rows = list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))
+    assert rows == [columns, ['1', 'Ann', 'ann', '10', '❌', '0', 'vip', '2']]
+
+    async with session_pool() as session:
+        file = await export_rows(
+            columns,
+            user_export_pages(
+                stream_users_for_export(session, group_name='nobody')
+            ),
+            'Users Group',
+        )
+    assert file.rows == 0
+    file.close()
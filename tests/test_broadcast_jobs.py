@@ -0,0 +1,139 @@
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_broadcast_audience_is_selected_in_sql_by_keyset_pages(
+    bot_env,
+    sqlite_pool,
+):
+    """Segments are SQL filters: counted without loading users and
+    read page by page as (id, tgid, lang) rows."""
+    from bot.database.models.main import (
+        Groups, Keys, Location, Metric, Persons, Servers, Vds,
+    )
+    from bot.services import broadcast_service
+
+    session_pool = await sqlite_pool(Groups, Metric, Persons, Location, Vds, Servers, Keys)
+    now = int(time.time())
+    async with session_pool() as session:
+        session.add_all([
+            Servers(id=1, type_vpn=1, vds=1),
+            Servers(id=2, type_vpn=6, vds=1),
+        ])
+        session.add_all([
+            Persons(tgid=10, lang='ru'),
+            Persons(tgid=11, lang='en'),
+            Persons(tgid=12, lang='ru'),
+            Persons(tgid=13, lang='ru'),
+            Persons(tgid=14, lang='ru', blocked=True),
+        ])
+        session.add_all([
+            Keys(user_tgid=10, subscription=now + 3600, server=2),
+            Keys(user_tgid=10, subscription=now - 3600, server=1),
+            Keys(user_tgid=11, subscription=now - 3600, server=1),
+            Keys(user_tgid=12, subscription=now - 3600, server=2),
+            Keys(user_tgid=14, subscription=now + 3600, server=2),
+        ])
+        await session.commit()
+
+    expected = {
+        broadcast_service.BROADCAST_SEGMENT_ALL: [10, 11, 12, 13],
+        broadcast_service.BROADCAST_SEGMENT_ACTIVE: [10],
+        broadcast_service.BROADCAST_SEGMENT_NO_SUB: [11, 12, 13],
+        broadcast_service.BROADCAST_SEGMENT_EXPIRED_LEGACY: [11],
+        'unknown': [],
+    }
+    async with session_pool() as session:
+        for segment, tgids in expected.items():
+            assert await broadcast_service.count_broadcast_users(
+                session, segment
+            ) == len(tgids)
+            rows, after_id = [], 0
+            while page := await broadcast_service.get_broadcast_page(
+                session, segment, after_id, limit=2
+            ):
+                rows.extend(page)
+                after_id = page[-1].id
+            assert [row.tgid for row in rows] == tgids
+        rows = await broadcast_service.get_broadcast_page(
+            session, broadcast_service.BROADCAST_SEGMENT_NO_SUB
+        )
+        assert [tuple(row) for row in rows] == [
+            (2, 11, 'en'), (3, 12, 'ru'), (4, 13, 'ru'),
+        ]
+
+
+@pytest.mark.asyncio
+async def test_broadcast_job_resumes_from_cursor_and_marks_blocked(
+    bot_env,
+    sqlite_pool,
+):
+    """An interrupted job continues after its cursor, checkpoints every
+    chunk, bulk-marks blocked users and skips cancelled jobs."""
+    from aiogram.exceptions import TelegramForbiddenError
+    from sqlalchemy import select
+    from bot.database.methods.insert import add_broadcast_job
+    from bot.database.models.main import (
+        BroadcastJob, Groups, Keys, Metric, Persons,
+    )
+    from bot.keyboards import admin_keyboard
+    from bot.misc.notify_dispatcher import NotificationDispatcher, TokenBucket
+    from bot.services import broadcast_job_service as jobs
+
+    session_pool = await sqlite_pool(Groups, Metric, Persons, Keys, BroadcastJob)
+    async with session_pool() as session:
+        session.add_all([Persons(tgid=tgid) for tgid in (10, 11, 12, 13, 14)])
+        await session.commit()
+        interrupted = await add_broadcast_job(
+            session, 'all', 'hello', created_by=1, total=5,
+            chat_id=1, message_id=2,
+        )
+        interrupted.status = 'running'
+        interrupted.cursor = 1
+        interrupted.sent = 1
+        cancelled = await add_broadcast_job(
+            session, 'all', 'bye', created_by=1, total=5,
+        )
+        cancelled.status = 'cancelled'
+        await session.commit()
+
+    async def send_message(chat_id, text):
+        if chat_id == 12:
+            raise TelegramForbiddenError(method=MagicMock(), message='blocked')
+
+    bot = SimpleNamespace(
+        send_message=AsyncMock(side_effect=send_message),
+        edit_message_text=AsyncMock(),
+    )
+    jobs._ = admin_keyboard._ = lambda key, lang: key
+    jobs.BROADCAST_CHUNK_SIZE = 2
+    dispatcher = NotificationDispatcher(
+        concurrency=2, bucket=TokenBucket(rate=1000), per_chat_interval=0,
+    )
+    async with session_pool() as session:
+        job = await session.get(BroadcastJob, interrupted.id)
+    await jobs.run_broadcast_job(bot, session_pool, job, dispatcher)
+
+    assert sorted(call.args[0] for call in bot.send_message.await_args_list) \
+        == [11, 12, 13, 14]
+    assert {call.args[1] for call in bot.send_message.await_args_list} \
+        == {'hello'}
+    async with session_pool() as session:
+        job = await session.get(BroadcastJob, interrupted.id)
+        blocked = (await session.execute(
+            select(Persons.tgid).filter(Persons.blocked.is_(True))
+        )).scalars().all()
+        assert (await jobs.get_unfinished_broadcast_jobs(session)) == []
+    assert (job.status, job.cursor) == ('done', 5)
+    assert (job.sent, job.failed, job.blocked) == (4, 0, 1)
+    assert job.finished_at is not None
+    assert blocked == [12]
+    assert bot.edit_message_text.await_args.kwargs['message_id'] == 2
+
+    bot.send_message.reset_mock()
+    assert await jobs.run_broadcast_jobs(bot, session_pool) == 0
+    bot.send_message.assert_not_awaited()
@@ -0,0 +1,156 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_person_cache_hits_until_update_invalidates(bot_env):
+    """A cached person is served without a query until update_lang drops it."""
+    from dogpile.cache import make_region
+    from bot.database import cache as cache_module
+    from bot.database.methods import get as get_module
+    from bot.database.methods import update as update_module
+
+    region = make_region().configure('dogpile.cache.memory', expiration_time=30)
+    row = SimpleNamespace(
+        id=1, tgid=42, username='u', fullname='U', lang='en', lang_tg=None,
+        blocked=False, banned=False, group=None, status=0,
+        trial_period=False, trial_used=False, migration_status='none',
+    )
+    session = AsyncMock()
+    session.execute.return_value = MagicMock(
+        scalar_one_or_none=MagicMock(return_value=row)
+    )
+    with patch.object(cache_module, 'cache_region', region), \
+            patch.object(update_module, '_get_person', new=AsyncMock(return_value=row)):
+        first = await get_module.get_person_dto(session, 42)
+        assert await get_module.get_person_lang(session, 42) == 'en'
+        assert session.execute.await_count == 1
+        assert isinstance(first, cache_module.PersonDTO)
+
+        await update_module.update_lang(session, 'ru', 42)
+        row.lang = 'ru'
+        assert await get_module.get_person_lang(session, 42) == 'ru'
+        assert session.execute.await_count == 2
+
+
+
+@pytest.mark.asyncio
+async def test_cache_calls_do_not_block_the_event_loop(bot_env):
+    """A slow cache backend delays only the lookup waiting for it."""
+    import asyncio
+    import time
+    from dogpile.cache.api import NO_VALUE
+    from bot.database import cache as cache_module
+
+    class SlowRegion:
+        def get(self, key):
+            time.sleep(0.3)
+            return NO_VALUE
+
+        def set(self, key, value):
+            time.sleep(0.3)
+
+        def delete_multi(self, keys):
+            time.sleep(0.3)
+
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    with patch.object(cache_module, 'cache_region', SlowRegion()):
+        assert await cache_module.read_through(
+            'person', 'person:1', AsyncMock(return_value=7)
+        ) == 7
+        await cache_module.invalidate('person:1')
+    task.cancel()
+    assert ticks > 20
+
+
+@pytest.mark.asyncio
+async def test_trial_activation_drops_the_cached_person(bot_env, sqlite_pool):
+    """Trial flags written by activate_trial are visible at once, not after
+    the cache entry expires."""
+    from dogpile.cache import make_region
+    from bot.database import cache as cache_module
+    from bot.database.methods.get import get_person_dto
+    from bot.database.models.main import (
+        Groups, Keys, Location, Metric, Persons, Servers, Vds,
+    )
+    from bot.services import trial_service
+
+    session_pool = await sqlite_pool(
+        Groups, Metric, Persons, Location, Vds, Servers, Keys
+    )
+    async with session_pool() as session:
+        session.add(Persons(tgid=42))
+        await session.commit()
+
+    region = make_region().configure('dogpile.cache.memory', expiration_time=30)
+    with patch.object(cache_module, 'cache_region', region), \
+            patch.object(trial_service, 'get_free_server_id',
+                         new=AsyncMock(return_value=None)):
+        async with session_pool() as session:
+            assert (await get_person_dto(session, 42)).trial_used is False
+            assert await trial_service.activate_trial(42, session) is not None
+            person = await get_person_dto(session, 42)
+    assert person.trial_used is True and person.trial_period is True
+
+
+def test_localization_loads_each_catalog_once(bot_env):
+    """Repeated lookups reuse the parsed catalog and the memoized text."""
+    import gettext
+    from bot.misc.language import Localization
+
+    Localization.clear_cache()
+    real_translation = gettext.translation
+    with patch('gettext.translation', side_effect=real_translation) as loader:
+        first = Localization.text('vpn_connect_btn', 'ru')
+        for _ in range(50):
+            assert Localization.text('vpn_connect_btn', 'ru') == first
+        Localization.text('help_btn', 'ru', font=False)
+        buttons = Localization.get_reply_button('vpn_connect_btn')
+
+    assert loader.call_count == len(Localization.ALL_Languages)
+    assert first in buttons
+    assert len(buttons) == len(Localization.ALL_Languages)
+
+
+@pytest.mark.asyncio
+async def test_follow_cache_serves_hits_and_refreshes_in_background(
+    bot_env,
+    monkeypatch,
+):
+    """Cached members cost no API call; stale ones refresh off the hot path."""
+    monkeypatch.setenv('FOLLOW_CACHE_REDIS', '0')
+    monkeypatch.setenv('FOLLOW_CACHE_TTL', '100')
+
+    import asyncio
+    from bot.misc import channel_membership as membership
+
+    bot = MagicMock()
+    bot.get_chat_member = AsyncMock(
+        return_value=SimpleNamespace(status='member')
+    )
+    clock = [1000.0]
+    with patch.object(membership.time, 'time', lambda: clock[0]):
+        assert await membership.is_channel_member(bot, 5) is True
+        assert await membership.is_channel_member(bot, 5) is True
+        assert bot.get_chat_member.await_count == 1
+
+        clock[0] += 60
+        bot.get_chat_member.return_value = SimpleNamespace(status='left')
+        assert await membership.is_channel_member(bot, 5) is True
+        await asyncio.gather(*membership._background)
+        assert bot.get_chat_member.await_count == 2
+        assert await membership.is_channel_member(bot, 5) is False
+
+        await membership.remember(5, True)
+        assert await membership.is_channel_member(bot, 5) is True
+    assert bot.get_chat_member.await_count == 2
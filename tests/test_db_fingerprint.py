@@ -0,0 +1,121 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_db_statements_fingerprinted_into_metrics_and_top_report(
+    bot_env,
+):
+    """Calls of one query share a fingerprint whatever their parameters;
+    time, rows and pool waits reach Prometheus and the admin top report."""
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from bot.database import db_logging
+    from bot.handlers import admin_db_stats
+
+    assert db_logging.statement_fingerprint(
+        "SELECT keys.id FROM keys WHERE keys.user_tgid = $1 "
+        "AND keys.id IN ($2, $3) AND name = 'a'"
+    ) == db_logging.statement_fingerprint(
+        "SELECT keys.id FROM keys WHERE keys.user_tgid = $1 "
+        "AND keys.id IN ($2) AND name = 'b'"
+    )
+
+    seconds, rows, checkout = MagicMock(), MagicMock(), MagicMock()
+    engine = create_async_engine('sqlite+aiosqlite://')
+    with patch.object(db_logging, 'DB_STATEMENT_SECONDS', seconds), \
+            patch.object(db_logging, 'DB_STATEMENT_ROWS', rows), \
+            patch.object(db_logging, 'DB_POOL_CHECKOUT_SECONDS', checkout):
+        db_logging.reset_statement_stats()
+        db_logging.instrument_engine(engine)
+        async with engine.connect() as conn:
+            await conn.execute(text('create table t (id integer, name text)'))
+            for value in range(3):
+                await conn.execute(
+                    text('insert into t values (:id, :name)'),
+                    {'id': value, 'name': f'n{value}'},
+                )
+            for limit in (1, 3):
+                await conn.execute(text(f'select id from t where id < {limit}'))
+    await engine.dispose()
+
+    top = db_logging.top_statements()
+    by_sql = {totals.sql: totals for totals in top}
+    select = by_sql['select id from t where id < ?']
+    insert = by_sql['insert into t values (?, ?)']
+    assert (select.calls, select.rows) == (2, 4)
+    assert (insert.calls, insert.rows) == (3, 3)
+    assert top[0].total_ms >= top[-1].total_ms
+    seconds.labels.assert_any_call(
+        fingerprint=insert.fingerprint, operation='INSERT'
+    )
+    rows.labels.return_value.inc.assert_any_call(3)
+    assert checkout.observe.called
+
+    templates = {
+        'admin_db_top_title': '{count}/{minutes}',
+        'admin_db_top_line': '{rank} {fingerprint} {calls} {sql}',
+    }
+    with patch.object(
+        admin_db_stats, '_', lambda key, lang: templates.get(key, key)
+    ):
+        report = admin_db_stats.db_top_text('en')
+    assert report.startswith('3/60')
+    assert f'{insert.fingerprint} 3 insert into t' in report
+    assert 'id &lt; ?' in report
+    db_logging.reset_statement_stats()
+    assert db_logging.top_statements() == []
+
+
+def test_asyncpg_bind_casts_do_not_split_fingerprints(bot_env):
+    """asyncpg renders ``$1::INTEGER``; IN lists and VALUES batches of any
+    length still share one fingerprint, and label values are capped."""
+    from sqlalchemy import (
+        BigInteger, Column, DateTime, Integer, MetaData, String, Table,
+        insert, select,
+    )
+    from sqlalchemy.dialects.postgresql import asyncpg
+    from bot.database import db_logging
+
+    table = Table(
+        'keys', MetaData(),
+        Column('id', Integer, primary_key=True),
+        Column('user_tgid', BigInteger),
+        Column('name', String(20)),
+        Column('created', DateTime),
+    )
+    dialect = asyncpg.dialect()
+
+    def fingerprint(statement):
+        sql = str(statement.compile(
+            dialect=dialect, compile_kwargs={'render_postcompile': True}
+        ))
+        assert '::' in sql
+        return db_logging.statement_fingerprint(sql)
+
+    lookups = {
+        fingerprint(select(table.c.id).where(
+            table.c.id.in_(list(range(size))), table.c.name == 'x',
+        ))
+        for size in (1, 2, 3, 50)
+    }
+    batches = {
+        fingerprint(insert(table).values([
+            {'id': n, 'user_tgid': n, 'name': 'n', 'created': None}
+            for n in range(size)
+        ]))
+        for size in (1, 2, 7)
+    }
+    assert len(lookups) == 1 and len(batches) == 1
+    [(_, operation, sql)] = batches
+    assert operation == 'INSERT'
+    assert sql.endswith('VALUES (?, ?, ?, ?)')
+
+    with patch.object(db_logging, 'MAX_FINGERPRINT_LABELS', 2), \
+            patch.object(db_logging, '_labelled', set()):
+        labels = [
+            db_logging.fingerprint_label(value)
+            for value in ('a', 'b', 'c', 'a')
+        ]
+    assert labels == ['a', 'b', db_logging.OTHER_FINGERPRINT, 'a']
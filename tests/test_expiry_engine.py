@@ -0,0 +1,65 @@
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_expiry_engine_flags_every_unnotified_key(bot_env):
+    """The expiry tick queries every unflagged key up to ``now``."""
+    from bot.misc import loop as loop_module
+
+    keys = [
+        SimpleNamespace(id=1, subscription=1_000, person=None),
+        SimpleNamespace(id=2, subscription=1_500, person=None),
+    ]
+    counters = {'keys_scanned': 0, 'keys_notified': 0}
+    query = AsyncMock(return_value=keys)
+    with patch.object(loop_module, 'get_keys_crossed_expiry', new=query), \
+            patch.object(loop_module, 'keys_notified_bulk', new=AsyncMock()):
+        await loop_module.process_crossed_expiry(
+            AsyncMock(), AsyncMock(), 2_000, counters
+        )
+    assert query.await_args.kwargs == {
+        'until': 2_000, 'limit': loop_module.EXPIRY_BATCH_SIZE,
+    }
+    assert counters == {'keys_scanned': 2, 'keys_notified': 2}
+
+
+@pytest.mark.asyncio
+async def test_long_expired_key_is_flagged_again_after_reset(
+    bot_env,
+    sqlite_pool,
+):
+    """``add_time_key`` on a key that stays expired resets its flag; the
+    key must be picked up however long ago it ended."""
+    from bot.database.methods.get import get_keys_crossed_expiry
+    from bot.database.methods.update import add_time_key
+    from bot.database.models.main import (
+        Keys,
+        Location,
+        Persons,
+        Servers,
+        Vds,
+    )
+
+    session_pool = await sqlite_pool(Persons, Location, Vds, Servers, Keys)
+    now = int(time.time())
+    async with session_pool() as session:
+        session.add_all([
+            Keys(
+                id=1, user_tgid=7, subscription=now - 10 * 86400,
+                notified_expired=True, free_key=False,
+            ),
+            Keys(
+                id=2, user_tgid=8, subscription=now - 60,
+                notified_expired=True, free_key=False,
+            ),
+        ])
+        await session.commit()
+        assert await get_keys_crossed_expiry(session, until=now) == []
+
+        await add_time_key(session, 1, 86400)
+        keys = await get_keys_crossed_expiry(session, until=now)
+    assert [key.id for key in keys] == [1]
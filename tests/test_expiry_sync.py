@@ -0,0 +1,119 @@
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_expiry_sync_coalesces_and_batches_per_server(
+    bot_env,
+    sqlite_pool,
+):
+    """Extensions only mark keys; one flush pushes the latest value of each
+    key with one login per server and retries failures with backoff."""
+    from sqlalchemy import select
+    from bot.database.methods import update as update_module
+    from bot.database.models.main import Keys, Location, Servers, Vds
+    from bot.misc.VPN.BaseVpn import BulkResult
+    from bot.services import expiry_sync_service as expiry_sync
+
+    session_pool = await sqlite_pool(Location, Vds, Servers, Keys)
+    base = int(time.time()) + 86400
+    async with session_pool() as session:
+        session.add_all([
+            Servers(id=1, type_vpn=6, vds=1, ip='http://rw'),
+            Servers(id=2, type_vpn=1, vds=1, ip='x', inbound_id=1),
+        ])
+        session.add_all([
+            Keys(id=1, user_tgid=7, subscription=base, server=1),
+            Keys(id=2, user_tgid=8, subscription=base, server=1),
+            Keys(id=3, user_tgid=9, subscription=base, server=2),
+        ])
+        await session.commit()
+        for key_id in (1, 1, 2, 3):
+            await update_module.add_time_key(session, key_id, 100)
+
+    managers = []
+
+    class FakeManager:
+        def __init__(self, server):
+            self.server = server
+            self.login = AsyncMock()
+            self.update_expire_bulk = AsyncMock(
+                side_effect=lambda expiries: BulkResult(
+                    succeeded={i: True for i in expiries if i[1] != 2},
+                    failed={i: 'boom' for i in expiries if i[1] == 2},
+                )
+            )
+            managers.append(self)
+
+    with patch.object(expiry_sync, 'ServerManager', FakeManager):
+        assert await expiry_sync.sync_expiries(session_pool) == 1
+        # Nothing else is due until the retry delay has passed.
+        assert await expiry_sync.sync_expiries(session_pool) == 0
+
+    [manager] = managers
+    manager.login.assert_awaited_once()
+    pushed = manager.update_expire_bulk.await_args.args[0]
+    assert sorted(pushed) == [(7, 1), (8, 2)]
+    assert int(pushed[(7, 1)].timestamp()) == base + 200
+    async with session_pool() as session:
+        keys = {k.id: k for k in (await session.scalars(select(Keys))).all()}
+    assert keys[1].expiry_sync_due is None
+    assert keys[3].expiry_sync_due is None
+    assert keys[2].expiry_sync_attempts == 1
+    assert keys[2].expiry_sync_due >= int(time.time()) + 29
+
+
+@pytest.mark.asyncio
+async def test_expiry_sync_failure_keeps_a_newer_mark(bot_env, sqlite_pool):
+    """A key extended while its push was failing stays due now with fresh
+    attempts, both on retry and when the job gives up."""
+    from sqlalchemy import select
+    from bot.database.methods import update as update_module
+    from bot.database.models.main import Keys, Location, Servers, Vds
+    from bot.services import expiry_sync_service as expiry_sync
+
+    session_pool = await sqlite_pool(Location, Vds, Servers, Keys)
+    base = int(time.time()) + 86400
+    async with session_pool() as session:
+        session.add(Servers(id=1, type_vpn=6, vds=1, ip='http://rw'))
+        session.add_all([
+            Keys(id=1, user_tgid=7, subscription=base, server=1),
+            Keys(id=2, user_tgid=8, subscription=base, server=1),
+        ])
+        await session.commit()
+        for key_id in (1, 2):
+            await update_module.add_time_key(session, key_id, 100)
+        await session.execute(update_module.update(Keys).values(
+            expiry_sync_due=int(time.time()) - 5
+        ))
+        # Key 2 is on its last attempt.
+        await session.execute(update_module.update(Keys).where(
+            Keys.id == 2
+        ).values(
+            expiry_sync_attempts=expiry_sync.EXPIRY_SYNC_MAX_ATTEMPTS - 1
+        ))
+        await session.commit()
+
+    class FakeManager:
+        def __init__(self, server):
+            self.login = AsyncMock()
+
+        async def update_expire_bulk(self, expiries):
+            # The user extends both keys while the panel call is in flight.
+            async with session_pool() as session:
+                for key_id in (1, 2):
+                    await update_module.add_time_key(session, key_id, 50)
+            raise ConnectionError('panel down')
+
+    with patch.object(expiry_sync, 'ServerManager', FakeManager):
+        assert await expiry_sync.sync_expiries(session_pool) == 0
+
+    async with session_pool() as session:
+        keys = (await session.scalars(select(Keys).order_by(Keys.id))).all()
+    for key in keys:
+        assert key.subscription == base + 150
+        assert key.expiry_sync_attempts == 0
+        assert key.expiry_sync_due is not None
+        assert key.expiry_sync_due <= int(time.time())
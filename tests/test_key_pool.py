@@ -0,0 +1,293 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_key_pool_tops_up_and_issues_spare_clients(bot_env, sqlite_pool):
+    """Working pool-capable servers are filled up to KEY_POOL_SIZE; a key
+    takes the oldest spare, and a refused rename drops it and falls back."""
+    from bot.database.methods.get import get_key_pool_levels
+    from bot.database.models.main import (
+        Location, PooledClient, Servers, Vds,
+    )
+    from bot.misc.VPN.BaseVpn import BulkResult
+    from bot.misc.VPN.ServerManager import ServerManager
+    from bot.misc.util import CONFIG
+    from bot.services import key_pool_service
+
+    session_pool = await sqlite_pool(Location, Vds, Servers, PooledClient)
+    async with session_pool() as session:
+        session.add(Location(id=1, name='Finland', work=True))
+        session.add(Vds(
+            id=1, name='fi', ip='1.1.1.1', location=1, max_space=100
+        ))
+        session.add_all([
+            Servers(id=1, type_vpn=1, vds=1, work=True),
+            Servers(id=2, type_vpn=6, vds=1, work=True),
+            Servers(id=3, type_vpn=5, vds=1, work=False),
+        ])
+        session.add(PooledClient(
+            server=1, name='pool.old.vless', client={'id': 'old'},
+            config='vless://old',
+        ))
+        await session.commit()
+
+    added, claimed, deleted = [], [], []
+
+    class FakeManager:
+        VPN_TYPES = ServerManager.VPN_TYPES
+        supports_pool = True
+        refuse = False
+
+        def __init__(self, server):
+            self.server = server
+
+        async def login(self):
+            return None
+
+        def pool_client_name(self, token):
+            return f'pool.{token}.vless'
+
+        async def add_pool_clients(self, names, name_key):
+            added.append((self.server.id, len(names), name_key))
+            result = BulkResult()
+            for name in names:
+                result.add_success(name, ({'id': name}, f'vless://{name}'))
+            return result
+
+        async def claim_pool_client(self, client, name, key_id, limit_gb=None):
+            claimed.append((client, name, key_id, limit_gb))
+            if self.refuse:
+                raise LookupError('rejected by panel')
+
+        async def delete_pool_clients(self, names):
+            deleted.extend(names)
+            return BulkResult(succeeded={name: True for name in names})
+
+    CONFIG.key_pool_size = 3
+    with patch.object(key_pool_service, 'ServerManager', FakeManager):
+        assert await key_pool_service.top_up_key_pools(session_pool) == 2
+        assert await key_pool_service.top_up_key_pools(session_pool) == 0
+    # Remnawave has no pool, the Trojan server is not working.
+    assert added == [(1, 2, 'Finland')]
+
+    key = SimpleNamespace(id=7, server=1, user_tgid=42)
+    manager = FakeManager(None)
+    async with session_pool() as session:
+        config = await key_pool_service.issue_pooled_key(
+            session, manager, key, 30
+        )
+        assert config == 'vless://old'
+        assert claimed == [({'id': 'old'}, 42, 7, 30)]
+
+        manager.refuse = True
+        assert await key_pool_service.issue_pooled_key(
+            session, manager, key
+        ) is None
+        assert len(deleted) == 1 and deleted[0].startswith('pool.')
+        assert await get_key_pool_levels(session) == {1: 1}
+
+        manager.supports_pool = False
+        assert await key_pool_service.issue_pooled_key(
+            session, manager, key
+        ) is None
+
+
+@pytest.mark.asyncio
+async def test_xui_claim_pool_client_renames_in_one_request(bot_env):
+    """A spare is renamed and re-limited by its client id, keeping its
+    credentials."""
+    import json
+    from bot.misc.VPN.Xui.Trojan import Trojan
+    from bot.misc.VPN.Xui.Vless import Vless
+
+    server = SimpleNamespace(
+        connection_method=False,
+        ip='127.0.0.1:2053',
+        inbound_id=4,
+        login='admin',
+        password='admin',
+        free_server=False,
+    )
+    for vpn, client, client_id in (
+        (Vless, {'id': 'uuid-1', 'email': 'pool.a.vless'}, 'uuid-1'),
+        (Trojan, {'password': 'secret', 'email': 'pool.b.tr'}, 'secret'),
+    ):
+        panel = vpn(server, 5)
+        panel.xui.request = AsyncMock(return_value={'success': True})
+        await panel.claim_pool_client(client, '42.7.vless', limit_gb=2)
+
+        kwargs = panel.xui.request.await_args.kwargs
+        assert kwargs['endpoint'] == (
+            f'/panel/api/inbounds/updateClient/{client_id}'
+        )
+        assert kwargs['json']['id'] == 4
+        entry = json.loads(kwargs['json']['settings'])['clients'][0]
+        assert entry == dict(
+            client, email='42.7.vless', totalGB=2 * 1073741824
+        )
+
+        panel.xui.request = AsyncMock(
+            return_value={'success': False, 'msg': 'Duplicate email'}
+        )
+        with pytest.raises(LookupError):
+            await panel.claim_pool_client(client, '42.7.vless')
+
+
+@pytest.mark.asyncio
+async def test_key_pool_releases_spares_left_taken(bot_env, sqlite_pool):
+    """A spare taken by an issuer that died before the rename, or whose
+    failed rename could not be undone, stays tracked and is deleted from
+    the panel by the key_pool job once TAKEN_TIMEOUT_SEC has passed."""
+    from datetime import datetime, timedelta
+    from sqlalchemy import select, update
+    from bot.database.methods.get import get_key_pool_levels
+    from bot.database.methods.update import take_pooled_client
+    from bot.database.models.main import (
+        Location, PooledClient, Servers, Vds,
+    )
+    from bot.misc.VPN.BaseVpn import BulkResult
+    from bot.misc.VPN.ServerManager import ServerManager
+    from bot.misc.util import CONFIG
+    from bot.services import key_pool_service
+
+    session_pool = await sqlite_pool(Location, Vds, Servers, PooledClient)
+    async with session_pool() as session:
+        session.add(Location(id=1, name='Finland', work=True))
+        session.add(Vds(id=1, name='fi', ip='1.1.1.1', location=1))
+        session.add(Servers(id=1, type_vpn=1, vds=1, work=True))
+        session.add_all([
+            PooledClient(server=1, name=f'pool.{token}.vless',
+                         client={'id': token}, config=f'vless://{token}')
+            for token in ('a', 'b', 'c')
+        ])
+        await session.commit()
+
+    deleted = []
+
+    class FakeManager:
+        VPN_TYPES = ServerManager.VPN_TYPES
+        supports_pool = True
+        fail_delete = True
+
+        def __init__(self, server):
+            self.server = server
+
+        async def login(self):
+            return None
+
+        async def claim_pool_client(self, client, name, key_id, limit_gb=None):
+            raise LookupError('rejected by panel')
+
+        async def delete_pool_clients(self, names):
+            if self.fail_delete:
+                raise ConnectionError('panel down')
+            deleted.extend(names)
+            return BulkResult(succeeded={name: True for name in names})
+
+    async with session_pool() as session:
+        # The issuer crashed right after taking 'a'.
+        assert (await take_pooled_client(session, 1)).name == 'pool.a.vless'
+        # The rename of 'b' failed and so did deleting it.
+        key = SimpleNamespace(id=7, server=1, user_tgid=42)
+        assert await key_pool_service.issue_pooled_key(
+            session, FakeManager(None), key
+        ) is None
+        assert await get_key_pool_levels(session) == {1: 1}
+
+    CONFIG.key_pool_size = 1
+    FakeManager.fail_delete = False
+    with patch.object(key_pool_service, 'ServerManager', FakeManager):
+        await key_pool_service.top_up_key_pools(session_pool)
+        assert deleted == []
+        async with session_pool() as session:
+            await session.execute(update(PooledClient).where(
+                PooledClient.taken_at.is_not(None)
+            ).values(taken_at=datetime.now() - timedelta(
+                seconds=key_pool_service.TAKEN_TIMEOUT_SEC + 1
+            )))
+            await session.commit()
+        await key_pool_service.top_up_key_pools(session_pool)
+
+    assert sorted(deleted) == ['pool.a.vless', 'pool.b.vless']
+    async with session_pool() as session:
+        names = (await session.scalars(select(PooledClient.name))).all()
+    assert names == ['pool.c.vless']
+
+
+@pytest.mark.asyncio
+async def test_key_pool_follows_server_eligibility_and_edits(
+    bot_env, sqlite_pool
+):
+    """Only servers new keys can go to get spares, and editing a server
+    retires its spares so the next run replaces them."""
+    from sqlalchemy import select
+    from bot.database.methods.get import get_key_pool_levels
+    from bot.database.methods.update import server_work_update
+    from bot.database.models.main import (
+        Location, PooledClient, Servers, Vds,
+    )
+    from bot.misc.VPN.BaseVpn import BulkResult
+    from bot.misc.VPN.ServerManager import ServerManager
+    from bot.misc.util import CONFIG
+    from bot.services import key_pool_service
+
+    session_pool = await sqlite_pool(Location, Vds, Servers, PooledClient)
+    async with session_pool() as session:
+        session.add(Location(id=1, name='Finland', work=True))
+        session.add(Vds(
+            id=1, name='fi', ip='1.1.1.1', location=1, max_space=10
+        ))
+        session.add_all([
+            Servers(id=1, type_vpn=1, vds=1, work=True, auto_work=False),
+            Servers(id=2, type_vpn=1, vds=1, work=True, actual_space=10),
+            Servers(id=3, type_vpn=1, vds=1, work=True, actual_space=3),
+        ])
+        await session.commit()
+
+    added, deleted = [], []
+
+    class FakeManager:
+        VPN_TYPES = ServerManager.VPN_TYPES
+
+        def __init__(self, server):
+            self.server = server
+
+        async def login(self):
+            return None
+
+        def pool_client_name(self, token):
+            return f'pool.{token}.vless'
+
+        async def add_pool_clients(self, names, name_key):
+            added.append(self.server.id)
+            result = BulkResult()
+            for name in names:
+                result.add_success(name, ({'id': name}, f'vless://{name}'))
+            return result
+
+        async def delete_pool_clients(self, names):
+            deleted.extend(names)
+            return BulkResult(succeeded={name: True for name in names})
+
+    CONFIG.key_pool_size = 2
+    with patch.object(key_pool_service, 'ServerManager', FakeManager):
+        assert await key_pool_service.top_up_key_pools(session_pool) == 2
+        assert added == [3]
+        async with session_pool() as session:
+            first = set((await session.scalars(
+                select(PooledClient.name)
+            )).all())
+            await server_work_update(session, 3, True)
+            assert await get_key_pool_levels(session) == {}
+
+        assert await key_pool_service.top_up_key_pools(session_pool) == 2
+
+    assert set(deleted) == first
+    async with session_pool() as session:
+        names = set((await session.scalars(
+            select(PooledClient.name)
+        )).all())
+    assert len(names) == 2 and not names & first
@@ -0,0 +1,137 @@
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_dashboard_metrics_snapshot_matches_seeded_data(
+    bot_env,
+    sqlite_pool,
+):
+    """Every admin statistics screen reads one snapshot row computed by
+    two aggregate statements; stale or forced snapshots are recomputed."""
+    from datetime import datetime, timedelta, timezone
+    from bot.database.models.main import (
+        Groups, Keys, Location, Metric, MetricsSnapshot, Payments,
+        Persons, Servers, StaticPersons, Vds, WithdrawalRequests,
+    )
+    from bot.services import metrics_snapshot_service as snapshots
+    from bot.services.admin_summary_service import get_referral_summary
+    from bot.services.dashboard_service import get_dashboard_metrics
+    from bot.services.server_stats_service import get_server_stats
+    from bot.services.subscription_stats_service import get_subscription_stats
+
+    session_pool = await sqlite_pool(Groups, Metric, Persons, Location, Vds, Servers, Keys, Payments, StaticPersons, WithdrawalRequests, MetricsSnapshot)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    now_ts = int(now.replace(tzinfo=timezone.utc).timestamp())
+    day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    day = 24 * 3600
+    # Keys expiring "in 7 days": noon of day +7, always inside that day.
+    day_7_ts = int(
+        (day_start + timedelta(days=7, hours=12))
+        .replace(tzinfo=timezone.utc).timestamp()
+    )
+    async with session_pool() as session:
+        session.add(Metric(id=1, code='ads'))
+        session.add_all([
+            Location(id=1, name='Finland Helsinki', work=True),
+            Location(id=2, name='Poland', work=False),
+        ])
+        session.add_all([
+            Vds(id=1, name='fi', ip='1.1.1.1', location=1),
+            Vds(id=2, name='pl', ip='2.2.2.2', location=2, work=False),
+        ])
+        session.add_all([
+            Servers(id=1, type_vpn=1, vds=1, work=True, auto_work=True),
+            Servers(id=2, type_vpn=6, vds=2, work=True, auto_work=False),
+        ])
+        session.add_all([
+            Persons(id=1, tgid=10, date_registered=now, metric=1),
+            Persons(id=2, tgid=11, date_registered=now - timedelta(days=3),
+                    referral_user_tgid=10),
+            Persons(id=3, tgid=12, date_registered=now - timedelta(days=40),
+                    referral_user_tgid=10),
+            Persons(id=4, tgid=13, date_registered=now - timedelta(days=40)),
+            Persons(id=5, tgid=14, date_registered=now, blocked=True),
+        ])
+        session.add_all([
+            Keys(user_tgid=10, subscription=day_7_ts, server=1),
+            Keys(user_tgid=10, subscription=now_ts - day, server=2),
+            Keys(user_tgid=11, subscription=now_ts + 30 * day, server=2,
+                 trial_period=True),
+            Keys(user_tgid=12, subscription=now_ts - day, server=1),
+            Keys(user_tgid=14, subscription=now_ts + day, server=1),
+        ])
+        session.add_all([
+            Payments(user=2, amount=100.0, data=now, status='confirmed'),
+            Payments(user=2, amount=50.0, data=now - timedelta(days=10),
+                     status='success'),
+            Payments(user=1, amount=999.0, data=now, status='pending'),
+        ])
+        session.add(StaticPersons(name='office'))
+        session.add(WithdrawalRequests(
+            amount=10, payment_info='card', user_tgid=10
+        ))
+        await session.commit()
+
+    async with session_pool() as session:
+        metrics = await get_dashboard_metrics(session)
+        assert (
+            metrics.total_users,
+            metrics.active_users,
+            metrics.users_without_subscription,
+            metrics.active_subscriptions,
+            metrics.finland_users,
+            metrics.poland_users,
+        ) == (4, 2, 2, 1, 1, 1)
+        assert (
+            metrics.revenue_today,
+            metrics.revenue_7_days,
+            metrics.revenue_30_days,
+        ) == (100.0, 100.0, 150.0)
+
+        subscriptions = await get_subscription_stats(session)
+        assert subscriptions.expire_in_7_days == 1
+        assert subscriptions.expire_in_3_days == 0
+
+        servers = await get_server_stats(session)
+        assert (
+            servers.total_locations,
+            servers.active_locations,
+            servers.total_vds,
+            servers.active_vds,
+            servers.active_protocols,
+            servers.hidden_protocols,
+            servers.static_users,
+        ) == (2, 1, 2, 1, 1, 1, 1)
+
+        referrals = await get_referral_summary(session)
+        assert (
+            referrals.total_referrers,
+            referrals.invited_users,
+            referrals.paid_referrals,
+            referrals.pending_withdrawals,
+        ) == (1, 2, 1, 1)
+
+        snapshot = await session.get(MetricsSnapshot, snapshots.SNAPSHOT_ID)
+        assert snapshot.metrics['users_30_days'] == 3
+        assert snapshot.metrics['new_users_today'] == 1
+
+    # Served from the stored row until forced or stale.
+    async with session_pool() as session:
+        session.add(Persons(id=6, tgid=15, date_registered=now))
+        await session.commit()
+        assert (await get_dashboard_metrics(session)).total_users == 4
+        forced = await snapshots.get_metrics_snapshot(session, force=True)
+        assert forced.metrics['total_users'] == 5
+
+        forced.refreshed_at = now - timedelta(
+            seconds=snapshots.METRICS_SNAPSHOT_MAX_AGE_SEC + 1
+        )
+        forced.metrics = dict(forced.metrics, total_users=0)
+        await session.commit()
+        assert (await get_dashboard_metrics(session)).total_users == 5
+
+    await snapshots.refresh_dashboard_metrics(session_pool)
+    async with session_pool() as session:
+        snapshot = await session.get(MetricsSnapshot, snapshots.SNAPSHOT_ID)
+        assert snapshots.snapshot_age_seconds(snapshot) < 60
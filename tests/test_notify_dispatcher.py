@@ -0,0 +1,119 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_notification_dispatcher_retries_flood_wait_and_skips_blocked(
+    bot_env,
+):
+    """RetryAfter is retried after a pause; a blocked chat is not retried."""
+    from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+    from bot.misc.notify_dispatcher import (
+        Notification,
+        NotificationDispatcher,
+        TokenBucket,
+    )
+
+    flood = AsyncMock(side_effect=[
+        TelegramRetryAfter(method=MagicMock(), message='flood', retry_after=0),
+        None,
+    ])
+    blocked = AsyncMock(side_effect=TelegramForbiddenError(
+        method=MagicMock(), message='blocked'
+    ))
+    ok = AsyncMock()
+    dispatcher = NotificationDispatcher(
+        concurrency=2,
+        bucket=TokenBucket(rate=1000),
+        per_chat_interval=0,
+    )
+    report = await dispatcher.dispatch([
+        Notification(chat_id=1, send=flood, tag=1),
+        Notification(chat_id=2, send=blocked, tag=2),
+        Notification(chat_id=3, send=ok, tag=3),
+    ])
+
+    assert sorted(report.delivered) == [1, 3]
+    assert report.blocked == [2]
+    assert report.failed == []
+    assert report.retry_after_hits == 1
+    assert flood.await_count == 2
+    assert blocked.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_redis_bucket_shares_the_budget_between_replicas(bot_env):
+    """Two replicas' buckets together grant at most the rate per second,
+    and a Redis failure falls back to the local budget."""
+    import time
+    from unittest.mock import patch
+    from bot.misc import notify_dispatcher
+
+    class FakeRedis:
+        def __init__(self):
+            self.values = {}
+
+        async def get(self, key):
+            return self.values.get(key)
+
+        async def set(self, key, value, px=None):
+            self.values[key] = value
+
+        def pipeline(self, transaction=True):
+            redis = self
+
+            class Pipe:
+                def __init__(self):
+                    self.key = None
+
+                async def __aenter__(self):
+                    return self
+
+                async def __aexit__(self, *exc):
+                    return False
+
+                def incr(self, key):
+                    self.key = key
+                    return self
+
+                def expire(self, key, seconds):
+                    return self
+
+                async def execute(self):
+                    redis.values[self.key] = redis.values.get(self.key, 0) + 1
+                    return [redis.values[self.key], True]
+
+            return Pipe()
+
+    redis = FakeRedis()
+    replicas = [
+        notify_dispatcher.RedisTokenBucket(redis, 100, 'notify:budget:1')
+        for _ in range(2)
+    ]
+    clock = [1000.25]
+    slept = []
+
+    async def fake_sleep(seconds):
+        slept.append(seconds)
+        clock[0] += seconds
+
+    with patch.object(notify_dispatcher.time, 'time', lambda: clock[0]), \
+            patch.object(notify_dispatcher.asyncio, 'sleep', fake_sleep):
+        for _ in range(60):
+            for bucket in replicas:
+                await bucket.acquire()
+    # 120 sends at 100/s: the first window is full after 100 of them.
+    assert redis.values['notify:budget:1:1000'] == 101
+    assert sum(slept) == pytest.approx(0.75)
+
+    failing = notify_dispatcher.RedisTokenBucket(
+        AsyncMock(get=AsyncMock(side_effect=ConnectionError('down'))),
+        1000,
+        'notify:budget:1',
+    )
+    started = time.monotonic()
+    for _ in range(5):
+        await failing.acquire()
+    assert failing.redis.get.await_count == 1
+    assert time.monotonic() - started < 1
@@ -0,0 +1,257 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_server_manager_reuses_pooled_panel_login(bot_env):
+    """Managers for one server share a login; an auth error re-logs in once."""
+    from bot.misc.VPN import ServerManager as sm_module
+
+    class FakePanel:
+        POST_FIX = 'fk'
+        SESSION_TTL = 900
+
+        def __init__(self, server, timeout):
+            self.logins = 0
+            self.get_client = AsyncMock(side_effect=[PermissionError(), {'ok': 1}])
+            self.close = AsyncMock()
+
+        async def login(self):
+            self.logins += 1
+
+        def is_auth_error(self, exc):
+            return isinstance(exc, PermissionError)
+
+    server = SimpleNamespace(id=7, type_vpn=99, ip='1.2.3.4', login='a')
+    with patch.dict(sm_module.ServerManager.VPN_TYPES, {99: FakePanel}):
+        first = sm_module.ServerManager(server)
+        await first.login()
+        second = sm_module.ServerManager(server)
+        await second.login()
+        assert second.client is first.client
+        assert first.client.logins == 1
+
+        assert await second.get_user(1, 2) == {'ok': 1}
+        assert first.client.logins == 2
+
+        server.login = 'b'
+        third = sm_module.ServerManager(server)
+        assert third.client is not first.client
+
+        await sm_module.close_panel_clients()
+        third.client.close.assert_awaited()
+
+
+@pytest.mark.asyncio
+async def test_relogin_keeps_the_shared_http_client_open(bot_env):
+    """Remnawave and Outline re-login on the client other callers of the
+    pooled panel may be using, instead of closing it."""
+    import json
+    from bot.misc.VPN.Outline import Outline
+    from bot.misc.VPN.Remnawave import Remnawave
+
+    remnawave = Remnawave(SimpleNamespace(
+        free_server=False, ip='https://rw.example', login='token',
+        password='https://rw.example/login?secret=1',
+        remnawave_squad_id=None,
+    ), 5)
+    with patch('httpx.AsyncClient.get', new=AsyncMock()) as login_get:
+        await remnawave.login()
+        http = remnawave.CLIENT._client
+        await remnawave.login()
+        assert remnawave.CLIENT._client is http and not http.is_closed
+        assert login_get.await_count == 2
+        await remnawave.close()
+        await remnawave.login()
+        assert remnawave.CLIENT._client is not http
+    await remnawave.close()
+
+    outline = Outline(SimpleNamespace(
+        outline_link=json.dumps({'apiUrl': 'https://o/x', 'certSha256': ''}),
+        free_server=False,
+    ), 5)
+    await outline.login()
+    session = outline.client_outline.session
+    await outline.login()
+    assert outline.client_outline.session is session and not session.closed
+    await outline.close()
+    await outline.login()
+    assert outline.client_outline.session is not session
+    await outline.close()
+
+
+@pytest.mark.asyncio
+async def test_xui_bulk_add_batches_and_reports_per_client(bot_env):
+    """One addClient call per chunk; a duplicate chunk is retried per client."""
+    import pyxui_async.errors
+    from bot.misc.VPN.Xui.Trojan import Trojan
+
+    server = SimpleNamespace(
+        connection_method=False,
+        ip='127.0.0.1:2053',
+        inbound_id=1,
+        login='admin',
+        password='admin',
+        free_server=False,
+    )
+    panel = Trojan(server, 5)
+    panel.ADD_CHUNK_SIZE = 2
+    calls = []
+
+    async def add_clients(inbound_id, client_settings):
+        emails = [client.email for client in client_settings.clients]
+        calls.append(emails)
+        if 'dup' in emails:
+            raise pyxui_async.errors.Duplicate('Duplicate email: dup')
+        return SimpleNamespace(success=True, msg='')
+
+    panel.xui.add_clients = add_clients
+    result = await panel.add_clients_bulk(['a', 'b', 'c', 'dup'], 1, 0)
+
+    assert calls[:2] == [['a', 'b'], ['c', 'dup']]
+    assert sorted(calls[2:]) == [['c'], ['dup']]
+    assert set(result.succeeded) == {'a', 'b', 'c'}
+    assert list(result.failed) == ['dup']
+    assert not result.ok
+
+
+@pytest.mark.asyncio
+async def test_xui_wireguard_adds_peers_one_by_one(bot_env):
+    """WireGuard peers need a key pair each: no batch add and no pool."""
+    from bot.misc.VPN.Xui.WireGuard import WireGuard
+    from bot.misc.VPN.Xui.XuiBase import XuiClientBase
+
+    server = SimpleNamespace(
+        connection_method=False,
+        ip='127.0.0.1:2053',
+        inbound_id=1,
+        login='admin',
+        password='admin',
+        free_server=False,
+    )
+    panel = WireGuard(server, 5)
+    assert not isinstance(panel, XuiClientBase)
+    assert not hasattr(panel, 'add_pool_clients')
+    panel.xui.add_client_wg = AsyncMock(return_value={
+        'new_peer': SimpleNamespace(publicKey='pub')
+    })
+    result = await panel.add_clients_bulk(['a', 'b'], 1, 0)
+    assert panel.xui.add_client_wg.await_count == 2
+    assert result.succeeded == {'a': 'pub', 'b': 'pub'}
+
+
+@pytest.mark.asyncio
+async def test_remove_key_consumer_batches_per_server(bot_env):
+    """A batch is grouped per server: one login, one space update, per-msg acks."""
+    import json
+    from bot.misc.remove_key_servise import consumer as consumer_module
+    from bot.misc.VPN.BaseVpn import BulkResult
+
+    def message(server_id, key_id):
+        return SimpleNamespace(
+            data=json.dumps({
+                'name_key': '100',
+                'key_id': key_id,
+                'server_id': server_id,
+                'wg_public_key': None,
+            }).encode(),
+            ack=AsyncMock(),
+            nak=AsyncMock(),
+        )
+
+    msgs = [message(1, 10), message(1, 11), message(2, 20)]
+    managers = []
+
+    class FakeManager:
+        def __init__(self, server):
+            self.server = server
+            self.login = AsyncMock()
+            self.count_users = AsyncMock(return_value=3)
+            managers.append(self)
+
+        async def delete_clients_bulk(self, items):
+            self.items = list(items)
+            return BulkResult(
+                succeeded={item: True for item in items if item[1] != 11},
+                failed={item: 'boom' for item in items if item[1] == 11},
+            )
+
+    session = AsyncMock()
+    session_pool = MagicMock()
+    session_pool.return_value.__aenter__ = AsyncMock(return_value=session)
+    session_pool.return_value.__aexit__ = AsyncMock(return_value=False)
+    consumer = consumer_module.RemoveKeyConsumer(
+        nc=None, js=None, bot=None, session_pool=session_pool,
+        subject='s', stream='st', durable_name='d',
+    )
+    servers = {
+        1: SimpleNamespace(id=1, type_vpn=1),
+        2: SimpleNamespace(id=2, type_vpn=1),
+    }
+    space_update = AsyncMock()
+    with patch.object(consumer_module, 'ServerManager', FakeManager), \
+            patch.object(
+                consumer_module, 'get_server_dto',
+                new=AsyncMock(side_effect=lambda s, server_id: servers[server_id]),
+            ), \
+            patch.object(consumer_module, 'delete_not_keys', new=AsyncMock()), \
+            patch.object(consumer_module, 'server_space_update', new=space_update):
+        await consumer.process_batch(msgs)
+
+    assert len(managers) == 2
+    assert sorted(m.server.id for m in managers) == [1, 2]
+    assert all(m.login.await_count == 1 for m in managers)
+    msgs[0].ack.assert_awaited_once()
+    msgs[1].nak.assert_awaited_once()
+    msgs[1].ack.assert_not_awaited()
+    msgs[2].ack.assert_awaited_once()
+    assert space_update.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_count_users_uses_cheap_probes_and_caches_fallback(bot_env):
+    """3x-ui counts one raw inbound; the fallback reuses a listing until a
+    client is added through ServerManager."""
+    from bot.misc.VPN.Amnezia_wg import AmneziaWG
+    from bot.misc.VPN.ServerManager import ServerManager
+    from bot.misc.VPN.Xui.Vless import Vless
+
+    server = SimpleNamespace(
+        id=None, type_vpn=1, ip='1.2.3.4', connection_method=False,
+        inbound_id=3, login='l', password='p', free_server=False,
+    )
+    vless = Vless(server, 5)
+    vless.xui.request = AsyncMock(return_value={
+        'success': True, 'obj': {'clientStats': [{}, {}, {}]},
+    })
+    vless.xui.get_inbounds = AsyncMock()
+    assert await vless.count_users() == 3
+    vless.xui.request.assert_awaited_once()
+    assert vless.xui.request.await_args.kwargs['endpoint'] == (
+        '/panel/api/inbounds/get/3'
+    )
+    vless.xui.get_inbounds.assert_not_awaited()
+
+    amnezia = AmneziaWG(
+        SimpleNamespace(
+            outline_link='{"url": "http://a", "password": "p"}',
+            free_server=False,
+        ),
+        5,
+    )
+    amnezia.client = SimpleNamespace(
+        get_clients=AsyncMock(side_effect=[[1, 2], [1, 2, 3]]),
+        create_client=AsyncMock(return_value=True),
+    )
+    assert await amnezia.count_users() == 2
+    assert await amnezia.count_users() == 2
+    assert amnezia.client.get_clients.await_count == 1
+
+    manager = ServerManager.__new__(ServerManager)
+    manager._pooled = None
+    manager.client = amnezia
+    await manager.add_client(1, 2)
+    assert await manager.count_users() == 3
+    assert amnezia.client.get_clients.await_count == 2
@@ -0,0 +1,151 @@
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_panel_reconcile_finds_and_repairs_drift(bot_env, sqlite_pool):
+    """Missing, orphaned and drifted clients are found in one pass and
+    repaired with bulk calls only when applying."""
+    from sqlalchemy import select
+    from bot.database.models.main import (
+        Keys, Location, Servers, StaticPersons, Vds,
+    )
+    from bot.misc.VPN.BaseVpn import BulkResult
+    from bot.services import panel_reconciliation_service as reconcile
+
+    session_pool = await sqlite_pool(Location, Vds, Servers, Keys, StaticPersons)
+    now = int(time.time())
+    active = now + 10 * 86400
+    async with session_pool() as session:
+        session.add(Servers(id=1, type_vpn=6, vds=1, actual_space=6))
+        session.add_all([
+            Keys(id=1, user_tgid=7, subscription=active, server=1),
+            Keys(id=2, user_tgid=7, subscription=active, server=1),
+            Keys(id=3, user_tgid=8, subscription=active, server=1),
+            Keys(id=4, user_tgid=8, subscription=now - 100, server=1),
+        ])
+        await session.commit()
+
+    class FakeManager:
+        def __init__(self, server):
+            self.client = SimpleNamespace(
+                POST_FIX='re',
+                BULK_CONCURRENCY=2,
+                list_clients=AsyncMock(return_value={
+                    '7.1.re': active,
+                    '8.3.re': active - 86400,
+                    '8.4.re': now - 100,
+                    '9.99.re': active,
+                    'static.0.re': None,
+                    'alice': None,
+                }),
+            )
+            self.login = AsyncMock()
+            self.add_clients_bulk = AsyncMock(
+                side_effect=lambda items, **kw: BulkResult(
+                    succeeded={item: True for item in items}
+                )
+            )
+            self.delete_clients_bulk = AsyncMock(
+                side_effect=lambda items: BulkResult(
+                    succeeded={item: True for item in items}
+                )
+            )
+            self.update_user_expire = AsyncMock(return_value={})
+            self.count_users = AsyncMock(return_value=5)
+            managers.append(self)
+
+    managers = []
+    with patch.object(reconcile, 'ServerManager', FakeManager):
+        [dry] = await reconcile.reconcile_panels(session_pool, apply=False)
+        [applied] = await reconcile.reconcile_panels(session_pool)
+
+    for report in (dry, applied):
+        assert report.error is None
+        assert report.keys == 4
+        assert report.missing == [2]
+        assert report.orphaned == ['9.99.re']
+        assert report.expiry_drift == [3]
+    assert dry.repaired == {}
+    dry_manager, manager = managers
+    dry_manager.add_clients_bulk.assert_not_awaited()
+    dry_manager.delete_clients_bulk.assert_not_awaited()
+
+    manager.add_clients_bulk.assert_awaited_once()
+    assert manager.add_clients_bulk.await_args.args[0] == [(7, 2)]
+    manager.delete_clients_bulk.assert_awaited_once_with([(9, 99)])
+    assert sorted(
+        call.args[1] for call in manager.update_user_expire.await_args_list
+    ) == [2, 3]
+    assert applied.repaired == {'missing': 1, 'orphaned': 1, 'expiry': 2}
+    async with session_pool() as session:
+        server = await session.scalar(select(Servers))
+    assert server.actual_space == 5
+    assert reconcile.report_to_dict([applied], True)['totals']['orphaned'] == 1
+
+
+@pytest.mark.asyncio
+async def test_panel_reconcile_keeps_clients_of_rows_sharing_the_panel(
+    bot_env,
+    sqlite_pool,
+):
+    """Two rows on one Marzban panel list each other's clients; neither
+    may delete them as orphans.  A row on another panel is not a sharer."""
+    from bot.database.models.main import (
+        Keys, Location, Servers, StaticPersons, Vds,
+    )
+    from bot.misc.VPN.BaseVpn import BulkResult
+    from bot.services import panel_reconciliation_service as reconcile
+
+    session_pool = await sqlite_pool(Location, Vds, Servers, Keys, StaticPersons)
+    active = int(time.time()) + 10 * 86400
+    async with session_pool() as session:
+        session.add_all([
+            Servers(id=1, type_vpn=7, vds=1, panel='https://mz.example/'),
+            Servers(id=2, type_vpn=7, vds=2, panel='https://mz.example'),
+            Servers(id=3, type_vpn=7, vds=3, panel='https://other.example'),
+            Keys(id=1, user_tgid=7, subscription=active, server=1),
+            Keys(id=2, user_tgid=8, subscription=active, server=2),
+            Keys(id=3, user_tgid=9, subscription=active, server=3),
+        ])
+        await session.commit()
+
+    panels = {
+        'https://mz.example': {
+            '7.1.mz': active, '8.2.mz': active, '5.50.mz': active,
+        },
+        'https://other.example': {'9.3.mz': active, '8.2.mz': active},
+    }
+    managers = {}
+
+    class FakeManager:
+        def __init__(self, server):
+            self.client = SimpleNamespace(
+                POST_FIX='mz',
+                BULK_CONCURRENCY=2,
+                list_clients=AsyncMock(
+                    return_value=dict(panels[server.panel.rstrip('/')])
+                ),
+            )
+            self.login = AsyncMock()
+            self.delete_clients_bulk = AsyncMock(
+                side_effect=lambda items: BulkResult(
+                    succeeded={item: True for item in items}
+                )
+            )
+            self.count_users = AsyncMock(return_value=None)
+            managers[server.id] = self
+
+    with patch.object(reconcile, 'ServerManager', FakeManager):
+        reports = await reconcile.reconcile_panels(session_pool)
+
+    by_id = {report.server_id: report for report in reports}
+    assert by_id[1].shared_with == [2] and by_id[2].shared_with == [1]
+    assert by_id[3].shared_with == []
+    assert by_id[1].orphaned == by_id[2].orphaned == ['5.50.mz']
+    managers[1].delete_clients_bulk.assert_awaited_once_with([(5, 50)])
+    # Key 2 lives on another panel, so its copy here is a real orphan.
+    assert by_id[3].orphaned == ['8.2.mz']
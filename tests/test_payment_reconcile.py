@@ -0,0 +1,393 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_payment_reconcile_batches_per_provider_and_expires_overdue(
+    bot_env,
+):
+    """One status call per provider per sweep; overdue invoices are expired."""
+    from datetime import datetime, timedelta
+    from types import SimpleNamespace
+    from bot.services import payment_reconciliation_service as service
+
+    now = datetime.now()
+
+    def invoice(row_id, name, id_payment, expires_in):
+        return SimpleNamespace(
+            id=row_id,
+            payment_system=name,
+            id_payment=id_payment,
+            expires_at=now + timedelta(seconds=expires_in),
+            message_id=None,
+            payment_id=SimpleNamespace(tgid=row_id),
+        )
+
+    pending = [
+        invoice(1, 'Lava', 'old', -5),
+        invoice(2, 'Lava', 'a', 60),
+        invoice(3, 'Lava', 'b', 60),
+        invoice(4, 'CryptoBot', '7', 60),
+        invoice(5, 'Wata', 'w', 60),
+    ]
+    lava = SimpleNamespace(
+        paid_invoices=AsyncMock(return_value={'b'}),
+        cancel_invoices=AsyncMock(),
+    )
+    crypto = SimpleNamespace(
+        paid_invoices=AsyncMock(return_value=set()),
+        cancel_invoices=AsyncMock(),
+    )
+    complete = AsyncMock(return_value=True)
+
+    session_pool = MagicMock()
+    session_pool.return_value.__aenter__ = AsyncMock(return_value=MagicMock())
+    session_pool.return_value.__aexit__ = AsyncMock(return_value=False)
+
+    with patch.object(service, 'payment_providers',
+                      return_value={'Lava': lava, 'CryptoBot': crypto}), \
+            patch.object(service, 'get_pending_payments',
+                         new=AsyncMock(return_value=pending)), \
+            patch.object(service, 'expire_pending_payments',
+                         new=AsyncMock(return_value=[1])), \
+            patch.object(service, 'get_stale_claimed_payments',
+                         new=AsyncMock(return_value=[])), \
+            patch.object(service, 'complete_invoice', new=complete):
+        await service.reconcile_payments(MagicMock(), session_pool)
+
+    lava.paid_invoices.assert_awaited_once()
+    assert lava.paid_invoices.await_args.args[1] == ['old', 'a', 'b']
+    crypto.paid_invoices.assert_awaited_once()
+    lava.cancel_invoices.assert_awaited_once()
+    assert lava.cancel_invoices.await_args.args[1] == ['old']
+    complete.assert_awaited_once()
+    assert complete.await_args.args[2] == 'b'
+
+
+@pytest.mark.asyncio
+async def test_payment_reconcile_checks_overdue_invoices_before_expiry(
+    bot_env,
+):
+    """An overdue invoice reported paid is completed, not expired, and an
+    overdue one whose provider could not be asked stays pending."""
+    from datetime import datetime, timedelta
+    from bot.services import payment_reconciliation_service as service
+
+    now = datetime.now()
+
+    def invoice(row_id, name, id_payment):
+        return SimpleNamespace(
+            id=row_id,
+            payment_system=name,
+            id_payment=id_payment,
+            expires_at=now - timedelta(seconds=5),
+            message_id=None,
+            payment_id=SimpleNamespace(tgid=row_id),
+        )
+
+    pending = [
+        invoice(1, 'Lava', 'late'),
+        invoice(2, 'Lava', 'unpaid'),
+        invoice(3, 'CryptoBot', '7'),
+    ]
+    lava = SimpleNamespace(
+        paid_invoices=AsyncMock(return_value={'late'}),
+        cancel_invoices=AsyncMock(),
+    )
+    crypto = SimpleNamespace(
+        paid_invoices=AsyncMock(side_effect=RuntimeError('timeout')),
+        cancel_invoices=AsyncMock(),
+    )
+    expire = AsyncMock(side_effect=lambda session, ids: list(ids))
+    complete = AsyncMock(return_value=True)
+
+    session_pool = MagicMock()
+    session_pool.return_value.__aenter__ = AsyncMock(return_value=MagicMock())
+    session_pool.return_value.__aexit__ = AsyncMock(return_value=False)
+
+    with patch.object(service, 'payment_providers',
+                      return_value={'Lava': lava, 'CryptoBot': crypto}), \
+            patch.object(service, 'get_pending_payments',
+                         new=AsyncMock(return_value=pending)), \
+            patch.object(service, 'expire_pending_payments', new=expire), \
+            patch.object(service, 'get_stale_claimed_payments',
+                         new=AsyncMock(return_value=[])), \
+            patch.object(service, 'complete_invoice', new=complete):
+        await service.reconcile_payments(MagicMock(), session_pool)
+
+    assert expire.await_args.args[1] == [2]
+    assert lava.cancel_invoices.await_args.args[1] == ['unpaid']
+    crypto.cancel_invoices.assert_not_awaited()
+    complete.assert_awaited_once()
+    assert complete.await_args.args[2] == 'late'
+
+
+@pytest.mark.asyncio
+async def test_expired_invoice_paid_late_is_completed(bot_env, sqlite_pool):
+    """A payment confirmed after the invoice expired is still fulfilled
+    once."""
+    from datetime import datetime, timedelta
+    from bot.database.methods.get import get_payment
+    from bot.database.methods.insert import add_pending_payment
+    from bot.database.methods.update import expire_pending_payments
+    from bot.database.models.main import (
+        Groups, Keys, Metric, Payments, Persons,
+    )
+    from bot.services import payment_reconciliation_service as service
+
+    session_pool = await sqlite_pool(
+        Groups, Metric, Persons, Keys, Payments
+    )
+    async with session_pool() as session:
+        session.add(Persons(tgid=42))
+        await session.commit()
+        await add_pending_payment(
+            session, 42, 100, 'Cryptomus', 'inv-1',
+            datetime.now() - timedelta(minutes=1), month_count=1,
+        )
+        payment = await get_payment(session, 'inv-1')
+        assert await expire_pending_payments(session, [payment.id])
+
+    replay = AsyncMock()
+    with patch.object(service, '_replay_order', new=replay):
+        async with session_pool() as session:
+            assert await service.complete_invoice(
+                MagicMock(), session, 'inv-1'
+            )
+            assert not await service.complete_invoice(
+                MagicMock(), session, 'inv-1'
+            )
+            payment = await get_payment(session, 'inv-1')
+
+    replay.assert_awaited_once()
+    assert payment.status == 'confirmed'
+
+
+@pytest.mark.asyncio
+async def test_invoice_stays_claimed_when_fulfilment_fails(
+    bot_env,
+    sqlite_pool,
+):
+    """A failed fulfilment keeps the claim; the sweep retries it once the
+    lease has lapsed, and only then is the invoice confirmed."""
+    from datetime import datetime, timedelta
+    from sqlalchemy import update
+    from bot.database.methods.get import get_payment
+    from bot.database.methods.insert import add_pending_payment
+    from bot.database.models.main import (
+        Groups, Keys, Metric, Payments, Persons,
+    )
+    from bot.services import payment_reconciliation_service as service
+
+    session_pool = await sqlite_pool(
+        Groups, Metric, Persons, Keys, Payments
+    )
+    async with session_pool() as session:
+        session.add(Persons(tgid=42))
+        await session.commit()
+        await add_pending_payment(
+            session, 42, 100, 'Lava', 'inv-1',
+            datetime.now() + timedelta(minutes=30), month_count=1,
+        )
+
+    replay = AsyncMock(side_effect=[RuntimeError('panel down'), None])
+    with patch.object(service, '_replay_order', new=replay):
+        async with session_pool() as session:
+            with pytest.raises(RuntimeError):
+                await service.complete_invoice(MagicMock(), session, 'inv-1')
+            assert (await get_payment(session, 'inv-1')).status == 'claimed'
+            # A webhook or replica seeing it paid meanwhile does nothing.
+            assert not await service.complete_invoice(
+                MagicMock(), session, 'inv-1'
+            )
+            await session.execute(update(Payments).values(
+                claimed_at=datetime.now() - timedelta(
+                    seconds=service.CLAIM_LEASE_SEC + 1
+                )
+            ))
+            await session.commit()
+
+        with patch.object(service, 'payment_providers', return_value={}):
+            await service.reconcile_payments(MagicMock(), session_pool)
+
+    assert replay.await_count == 2
+    async with session_pool() as session:
+        assert (await get_payment(session, 'inv-1')).status == 'confirmed'
+
+
+@pytest.mark.asyncio
+async def test_admin_errors_skip_open_invoices(bot_env, sqlite_pool):
+    """Open invoices are not payment errors; overdue ones and stale claims
+    are."""
+    from datetime import datetime, timedelta
+    from bot.database.models.main import (
+        Groups, Keys, Metric, Payments, Persons, Servers,
+    )
+    from bot.handlers import admin_errors
+
+    session_pool = await sqlite_pool(
+        Groups, Metric, Persons, Servers, Keys, Payments
+    )
+    now = datetime.now()
+    async with session_pool() as session:
+        session.add_all([
+            Payments(id_payment='open', status='pending', data=now,
+                     expires_at=now + timedelta(minutes=30)),
+            Payments(id_payment='overdue', status='pending', data=now,
+                     expires_at=now - timedelta(minutes=1)),
+            Payments(id_payment='claimed', status='claimed', data=now,
+                     claimed_at=now),
+            Payments(id_payment='stuck', status='claimed', data=now,
+                     claimed_at=now - timedelta(hours=1)),
+            Payments(id_payment='failed', status='failed', data=now),
+            Payments(id_payment='paid', status='confirmed', data=now),
+        ])
+        await session.commit()
+
+    call = MagicMock()
+    call.from_user.id = 123
+    call.answer = AsyncMock()
+    edit = AsyncMock()
+    async with session_pool() as session:
+        with patch.object(admin_errors, 'get_lang',
+                          new=AsyncMock(return_value='en')), \
+                patch.object(admin_errors, 'admin_dashboard_keyboard',
+                             new=AsyncMock()), \
+                patch.object(admin_errors, 'edit_message', new=edit), \
+                patch.object(admin_errors, '_', lambda key, lang: (
+                    '{connection_errors}/{subscription_errors}/'
+                    '{server_timeout_errors}'
+                )):
+            await admin_errors.admin_errors_stats_handler(
+                call, session, MagicMock()
+            )
+
+    assert edit.await_args.kwargs['text'] == '0/3/0'
+
+
+@pytest.mark.asyncio
+async def test_retried_fulfilment_skips_steps_already_done(
+    bot_env,
+    sqlite_pool,
+):
+    """A replay that fails after the extension and the referral bonus took
+    effect does not apply them again when the invoice is retried."""
+    from datetime import datetime, timedelta
+    from sqlalchemy import select, update
+    from bot.database.methods.get import get_payment
+    from bot.database.methods.insert import add_pending_payment
+    from bot.database.models.main import (
+        Groups, Keys, Location, Metric, Payments, PaymentStep, Persons,
+        ReferralBonus, Servers, Vds,
+    )
+    from bot.misc.Payment import payment_systems
+    from bot.services import payment_reconciliation_service as service
+
+    session_pool = await sqlite_pool(
+        Groups, Metric, Persons, Location, Vds, Servers, Keys, Payments,
+        PaymentStep, ReferralBonus,
+    )
+    base = int(datetime.now().timestamp()) + 86400
+    async with session_pool() as session:
+        session.add_all([
+            Persons(id=1, tgid=41),
+            Persons(id=2, tgid=42, referral_user_tgid=41),
+            Keys(id=1, user_tgid=41, subscription=base),
+            Keys(id=2, user_tgid=42, subscription=base),
+        ])
+        await session.commit()
+        await add_pending_payment(
+            session, 42, 100, 'Lava', 'inv-1',
+            datetime.now() + timedelta(minutes=30), month_count=1,
+            type_pay='extend_key', key_id=2,
+        )
+
+    message = MagicMock()
+    message.answer = AsyncMock(side_effect=[RuntimeError('blocked'), None])
+    message.answer_photo = AsyncMock()
+    message.bot.send_message = AsyncMock()
+    with patch.object(service, 'get_message',
+                      new=AsyncMock(return_value=message)), \
+            patch.object(payment_systems, 'get_lang',
+                         new=AsyncMock(return_value='en')), \
+            patch.object(payment_systems, 'user_menu', new=AsyncMock()), \
+            patch.object(payment_systems, '_', lambda key, lang: ''), \
+            patch.object(service, 'payment_providers', return_value={}):
+        async with session_pool() as session:
+            with pytest.raises(RuntimeError):
+                await service.complete_invoice(MagicMock(), session, 'inv-1')
+            await session.execute(update(Payments).values(
+                claimed_at=datetime.now() - timedelta(
+                    seconds=service.CLAIM_LEASE_SEC + 1
+                )
+            ))
+            await session.commit()
+            assert await service.complete_invoice(
+                MagicMock(), session, 'inv-1'
+            )
+
+    month = payment_systems.CONFIG.COUNT_SECOND_MOTH
+    async with session_pool() as session:
+        keys = {k.id: k for k in (await session.scalars(select(Keys))).all()}
+        bonuses = (await session.scalars(select(ReferralBonus))).all()
+        payment = await get_payment(session, 'inv-1')
+    assert keys[2].subscription == base + month
+    assert keys[1].subscription == base + 3 * 86400
+    assert len(bonuses) == 1
+    assert payment.status == 'confirmed'
+    assert payment.fulfil_attempts == 2
+
+
+@pytest.mark.asyncio
+async def test_invoice_parked_after_max_attempts(bot_env, sqlite_pool):
+    """An invoice whose fulfilment keeps failing is parked ``failed`` and
+    the admin is told, instead of being retried forever."""
+    from datetime import datetime, timedelta
+    from sqlalchemy import update
+    from bot.database.methods.get import get_payment
+    from bot.database.methods.insert import add_pending_payment
+    from bot.database.models.main import (
+        Groups, Keys, Metric, Payments, Persons,
+    )
+    from bot.services import payment_reconciliation_service as service
+
+    session_pool = await sqlite_pool(
+        Groups, Metric, Persons, Keys, Payments
+    )
+    async with session_pool() as session:
+        session.add(Persons(tgid=42))
+        await session.commit()
+        await add_pending_payment(
+            session, 42, 100, 'Lava', 'inv-1',
+            datetime.now() + timedelta(minutes=30), month_count=1,
+        )
+
+    bot = MagicMock()
+    bot.send_message = AsyncMock()
+    replay = AsyncMock(side_effect=RuntimeError('panel down'))
+    with patch.object(service, '_replay_order', new=replay), \
+            patch.object(service, 'MAX_FULFIL_ATTEMPTS', 2), \
+            patch.object(service, '_', lambda key, lang: ''):
+        async with session_pool() as session:
+            for _attempt in range(3):
+                with pytest.raises(RuntimeError):
+                    await service.complete_invoice(bot, session, 'inv-1')
+                await session.execute(update(Payments).values(
+                    claimed_at=datetime.now() - timedelta(
+                        seconds=service.CLAIM_LEASE_SEC + 1
+                    )
+                ))
+                await session.commit()
+                if (await get_payment(session, 'inv-1')).status == 'failed':
+                    break
+
+            # A parked invoice is not claimed again.
+            assert not await service.complete_invoice(bot, session, 'inv-1')
+            payment = await get_payment(session, 'inv-1')
+
+    assert replay.await_count == 2
+    assert payment.status == 'failed'
+    bot.send_message.assert_awaited_once()
+    assert bot.send_message.await_args.args[0] == 123
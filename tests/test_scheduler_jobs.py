@@ -0,0 +1,63 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_sharded_job_resumes_crashed_shard_from_checkpoint(
+    bot_env,
+    monkeypatch,
+):
+    """A shard interrupted mid-run restarts from its last saved cursor."""
+    monkeypatch.setenv('JOB_SHARDS', '2')
+
+    from contextlib import asynccontextmanager
+    from bot.misc import job_runner
+
+    store = {}
+
+    async def load(js, key):
+        return store.get(key)
+
+    async def save(js, key, state):
+        store[key] = state
+        return True
+
+    @asynccontextmanager
+    async def no_lock(*args, **kwargs):
+        yield
+
+    calls = []
+    crash = {'on': (1, 10)}
+
+    async def process_batch(lo, hi, after):
+        calls.append((lo, hi, after))
+        if crash['on'] == (lo, after):
+            raise RuntimeError('replica died')
+        return None if after >= 20 else after + 10
+
+    with patch.object(job_runner, 'load_job_state', load), \
+            patch.object(job_runner, 'save_job_state', save), \
+            patch.object(job_runner, 'distributed_lock', no_lock), \
+            patch.object(job_runner, 'get_max_person_id', new=AsyncMock(return_value=100)):
+        session_pool = MagicMock()
+        session_pool.return_value.__aenter__ = AsyncMock(return_value=None)
+        session_pool.return_value.__aexit__ = AsyncMock(return_value=False)
+        with pytest.raises(RuntimeError):
+            await job_runner.run_sharded(
+                object(), 'daily', '2026-01-01', session_pool, process_batch
+            )
+        assert store['daily.plan']['bounds'] == [[1, 51], [51, None]]
+        assert store['daily.shard.0'] == {
+            'run': '2026-01-01', 'cursor': 10, 'done': False,
+        }
+
+        crash['on'] = None
+        calls.clear()
+        completed = await job_runner.run_sharded(
+            object(), 'daily', '2026-01-01', session_pool, process_batch
+        )
+
+    assert completed == 2
+    assert calls[0] == (1, 51, 10)
+    assert store['daily.shard.0']['done'] and store['daily.shard.1']['done']
@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_server_sweep_probes_concurrently_and_bulk_updates(
+    bot_env,
+    sqlite_pool,
+    monkeypatch,
+):
+    """All servers are probed in one wave; only changed rows are written."""
+    monkeypatch.setenv('SERVER_CHECK_CONCURRENCY', '10')
+
+    import asyncio
+    from sqlalchemy import select
+    from bot.database.models.main import PooledClient, Servers
+    from bot.services import server_control_service as sweep
+
+    session_pool = await sqlite_pool(Servers, PooledClient)
+    async with session_pool() as session:
+        session.add_all([
+            Servers(id=1, type_vpn=1, vds=1, actual_space=3, auto_work=True),
+            Servers(id=2, type_vpn=1, vds=1, actual_space=5, auto_work=True),
+            Servers(id=3, type_vpn=1, vds=2, actual_space=0, auto_work=False),
+            Servers(id=4, type_vpn=1, vds=2, actual_space=7, auto_work=True),
+        ])
+        await session.commit()
+        servers = {s.id: s for s in (await session.scalars(select(Servers))).all()}
+
+    vds_a = SimpleNamespace(id=1, ip='a', max_space=100, servers=[servers[1], servers[2]])
+    vds_b = SimpleNamespace(id=2, ip='b', max_space=100, servers=[servers[3], servers[4]])
+    location = SimpleNamespace(name='loc', vds=[vds_a, vds_b])
+    users = {1: 3, 2: 6, 3: 2, 4: None}
+    in_flight = {'now': 0, 'peak': 0}
+
+    class FakeManager:
+        VPN_TYPES = {1: SimpleNamespace(NAME_VPN='VLESS')}
+
+        def __init__(self, server):
+            self.server = server
+
+        async def login(self):
+            pass
+
+        async def count_users(self, fresh=False):
+            assert fresh
+            in_flight['now'] += 1
+            in_flight['peak'] = max(in_flight['peak'], in_flight['now'])
+            await asyncio.sleep(0.01)
+            in_flight['now'] -= 1
+            return users[self.server.id]
+
+    notify = AsyncMock()
+    with patch.object(sweep, 'ServerManager', FakeManager), \
+            patch.object(sweep, 'get_all_location',
+                         new=AsyncMock(return_value=[location])), \
+            patch.object(sweep, 'notify_admin', new=notify), \
+            patch.object(sweep, '_', lambda key, lang: key), \
+            patch.object(sweep, 'can_send_alert', return_value=True), \
+            patch.object(sweep, 'bulk_update_server_health',
+                         wraps=sweep.bulk_update_server_health) as bulk:
+        await sweep.server_control_manager(MagicMock(), session_pool)
+
+    assert in_flight['peak'] == 4
+    bulk.assert_awaited_once()
+    assert sorted(bulk.await_args.args[1], key=lambda r: r['id']) == [
+        {'id': 2, 'actual_space': 6},
+        {'id': 3, 'actual_space': 2, 'auto_work': True},
+        {'id': 4, 'auto_work': False},
+    ]
+    async with session_pool() as session:
+        stored = {
+            s.id: (s.actual_space, s.auto_work)
+            for s in (await session.scalars(select(Servers))).all()
+        }
+    assert stored == {1: (3, True), 2: (6, True), 3: (2, True), 4: (7, False)}
+    assert notify.await_count == 2
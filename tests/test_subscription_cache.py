@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_subscription_rendered_once_per_key_revision_with_etag(bot_env):
+    """The panel is asked once per (key, server, expiry, server revision);
+    a client repeating the ETag gets 304."""
+    from dogpile.cache import make_region
+    from fastapi import HTTPException
+    from starlette.requests import Request
+    from bot.database import cache as cache_module
+    from bot.misc.VPN.parsed_link import ParsedLink
+    from bot.services import subscription_service
+    from bot.webhooks import base
+
+    region = make_region().configure('dogpile.cache.memory', expiration_time=30)
+    subscriptions = make_region().configure(
+        'dogpile.cache.memory', expiration_time=600
+    )
+    revision = SimpleNamespace(user_tgid=42, server=1, subscription=1000)
+    links = ['vless://uuid@example.com:443?security=reality&pbk=k&sid=1#fi']
+    panel = AsyncMock(return_value=[ParsedLink.parse(links[0])])
+
+    async def get_key_revision(session, key_id):
+        return revision
+
+    with patch.object(cache_module, 'cache_region', region), \
+            patch.object(cache_module, 'subscription_region', subscriptions), \
+            patch.object(subscription_service, 'subscription_region', subscriptions), \
+            patch.object(subscription_service, 'get_key_revision', get_key_revision), \
+            patch.object(subscription_service, 'get_clean_marzban_links', panel):
+        first = await subscription_service.get_rendered_subscription(None, 7, 42)
+        again = await subscription_service.get_rendered_subscription(None, 7, 42)
+        assert panel.await_count == 1
+        assert first == again and first.plain == links[0]
+        assert set(first.etags) == {'plain', 'clash', 'singbox'}
+
+        # Extension, then an edit of the server itself.
+        revision.subscription = 2000
+        await subscription_service.get_rendered_subscription(None, 7, 42)
+        assert panel.await_count == 2
+        await cache_module.invalidate_server(1)
+        await subscription_service.get_rendered_subscription(None, 7, 42)
+        assert panel.await_count == 3
+
+        with pytest.raises(HTTPException) as error:
+            await subscription_service.get_rendered_subscription(None, 7, 43)
+        assert error.value.status_code == 404
+        panel.return_value = []
+        revision.server = 2
+        for _ in range(2):
+            with pytest.raises(HTTPException):
+                await subscription_service.get_rendered_subscription(None, 7, 42)
+        assert panel.await_count == 5
+
+    def request(if_none_match=None):
+        headers = []
+        if if_none_match is not None:
+            headers.append((b'if-none-match', if_none_match.encode()))
+        return Request({'type': 'http', 'headers': headers})
+
+    etag = first.etags['plain']
+    full = base._subscription_response(
+        request(), first.plain, etag, 'text/plain', 'inline'
+    )
+    assert full.status_code == 200
+    assert full.headers['etag'] == etag
+    assert full.headers['cache-control'].startswith('private, max-age=')
+    not_modified = base._subscription_response(
+        request(f'W/"other", W/{etag}'), first.plain, etag, 'text/plain', 'inline'
+    )
+    assert not_modified.status_code == 304
+    assert not_modified.body == b''
+    assert not_modified.headers['etag'] == etag
@@ -0,0 +1,50 @@
+from unittest.mock import patch
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_marzban_links_parsed_once_for_every_renderer(bot_env):
+    """Normalization, the degraded filter and the Clash/sing-box renderers
+    share one ParsedLink per exported link."""
+    import json
+    import yaml
+    from bot.misc.VPN import parsed_link
+    from bot.misc.VPN.Marzban import Marzban
+    from bot.services.clash_subscription_service import build_clash_config
+    from bot.services.singbox_subscription_service import build_singbox_config
+
+    raw = [
+        "vless://uuid@65.108.91.192:443?security=reality&type=tcp&"
+        "host=github.com%3A443&sni=github.com%3A443&fp=chrome&pbk=key&"
+        "sid=ab12&sid=&flow=xtls-rprx-vision#Finland-Node-1%20%5BVLESS-tcp%5D",
+        "vless://uuid@45.77.176.143:443?security=reality&sni=github.com"
+        "#Tokyo-Node-2",
+        "",
+    ]
+    with patch.object(
+        parsed_link, 'urlsplit', wraps=parsed_link.urlsplit
+    ) as urlsplit:
+        links = Marzban.parse_export_links(raw)
+        kept = [link for link in links if not Marzban.is_degraded_link(link)]
+        clash = yaml.safe_load(build_clash_config(kept))
+        singbox = json.loads(build_singbox_config(kept))
+    assert urlsplit.call_count == 2
+
+    assert len(links) == 2 and len(kept) == 1
+    link = kept[0]
+    assert link.text == Marzban.normalize_export_link(raw[0])
+    assert "sni=github.com&" in link.text and "encryption=none" in link.text
+    assert "sid=ab12" in link.text
+    assert link.label == "🇫🇮 KYN | Finland - 1 [VLESS-tcp]"
+
+    proxy = clash["proxies"][0]
+    assert (proxy["name"], proxy["server"], proxy["port"]) == (
+        link.label, "65.108.91.192", 443
+    )
+    assert proxy["servername"] == "github.com"
+    assert proxy["reality-opts"] == {"public-key": "key", "short-id": "ab12"}
+    outbound = singbox["outbounds"][0]
+    assert outbound["tag"] == "65.108.91.192-443"
+    assert outbound["tls"]["reality"]["short_id"] == "ab12"
+    assert outbound["flow"] == "xtls-rprx-vision"
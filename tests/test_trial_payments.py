@@ -9,49 +9,6 @@ import pytest
 pytest_plugins = ('pytest_asyncio',)
 
 
-@pytest.fixture
-def base_env():
-    """Fixture with test environment variables."""
-    return {
-        "ADMIN_TG_ID": "123",
-        "TG_TOKEN": "test_token",
-        "NAME": "testbot",
-        "CHECK_FOLLOW": "0",
-        "LANGUAGES": "en,ru",
-        "PRICE_SWITCH_LOCATION": "10",
-        "MONTH_COST": "100,200,300,400",
-        "TRIAL_PERIOD": "604800",
-        "FREE_SWITCH_LOCATION": "1",
-        "UTC_TIME": "0",
-        "REFERRAL_DAY": "1",
-        "REFERRAL_PERCENT": "10",
-        "MINIMUM_WITHDRAWAL_AMOUNT": "100",
-        "FREE_SERVER": "0",
-        "LIMIT_IP": "0",
-        "LIMIT_GB": "0",
-        "IMPORT_DB": "0",
-        "SHOW_DONATE": "1",
-        "IS_WORK_EDIT_KEY": "1",
-        "POSTGRES_DB": "testdb",
-        "POSTGRES_USER": "testuser",
-        "POSTGRES_PASSWORD": "testpass",
-        "PGADMIN_DEFAULT_EMAIL": "admin@test.com",
-        "PGADMIN_DEFAULT_PASSWORD": "adminpass",
-    }
-
-
-@pytest.fixture
-def cleanup_bot_modules():
-    """Clean up bot module imports before and after test."""
-    for m in list(sys.modules.keys()):
-        if m.startswith('bot'):
-            del sys.modules[m]
-    yield
-    for m in list(sys.modules.keys()):
-        if m.startswith('bot'):
-            del sys.modules[m]
-
-
 def test_config_loads_with_trial_fields(base_env, cleanup_bot_modules):
     """Test that CONFIG loads with trial-related env vars."""
     os.environ.clear()
@@ -506,11 +463,16 @@ async def test_payment_webhook_idempotency(base_env, cleanup_bot_modules):
     result = MagicMock()
     result.scalar_one_or_none.return_value = None
     session.execute = AsyncMock(return_value=result)
+    session.add = MagicMock()
     
     # Mock person
     mock_person = Persons()
     mock_person.keys = []
     mock_person.tgid = 123
+
+    async def complete_with_fulfil(bot, session, id_payment, fulfil=None):
+        await fulfil()
+        return True
     
     with patch('bot.services.cryptomus_payment_service._get_person') as mock_get:
         mock_get.return_value = mock_person
@@ -519,9 +481,13 @@ async def test_payment_webhook_idempotency(base_env, cleanup_bot_modules):
             mock_key.id = 1
             mock_ext.return_value = mock_key
             with patch('bot.services.cryptomus_payment_service.db_add_payment'):
-                with patch('bot.services.cryptomus_payment_service.update_payment_status'):
+                with patch(
+                    'bot.services.cryptomus_payment_service.complete_invoice',
+                    new=complete_with_fulfil,
+                ):
                     response = await handle_cryptomus_webhook(session, webhook_data)
                     assert response is True
+                    mock_ext.assert_awaited_once()
 
 
 @pytest.mark.asyncio
@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_user_context_resolved_once_and_queries_counted(bot_env):
+    """Filters and get_lang reuse the per-update context; SQL is counted."""
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from bot.database.cache import PersonDTO
+    from bot.database.db_logging import instrument_engine
+    from bot.filters.main import IsBlocked
+    from bot.middlewares import user_context as middleware
+    from bot.misc import language
+
+    person = PersonDTO(
+        id=1, tgid=42, username='u', fullname='U', lang='en', lang_tg=None,
+        blocked=True, banned=False, group=None, status=None,
+        trial_period=False, trial_used=False, migration_status=None,
+    )
+    engine = create_async_engine('sqlite+aiosqlite://')
+    instrument_engine(engine)
+    observed = []
+    histogram = MagicMock()
+    histogram.labels.return_value.observe.side_effect = observed.append
+
+    async def handler(event, data):
+        async with engine.connect() as conn:
+            await conn.execute(text('select 1'))
+            await conn.execute(text('select 2'))
+        message = SimpleNamespace(from_user=SimpleNamespace(id=42))
+        assert await IsBlocked()(message, data['session']) is False
+        assert await language.get_lang(data['session'], 42) == 'en'
+        assert data['user_ctx'].group is None
+        return 'handled'
+
+    async def with_context(event, data):
+        return await middleware.PersonContextMiddleware()(handler, event, data)
+
+    update = SimpleNamespace(update_id=7, event_type='message')
+    load = AsyncMock(return_value=person)
+    with patch.object(middleware, 'Update', SimpleNamespace), \
+            patch.object(middleware, 'UPDATE_DB_QUERIES', histogram), \
+            patch('bot.misc.user_context.get_person_dto', new=load), \
+            patch.object(language, 'get_person_lang',
+                         new=AsyncMock(side_effect=AssertionError)):
+        result = await middleware.QueryCountMiddleware()(
+            with_context,
+            update,
+            {'event_from_user': SimpleNamespace(id=42), 'session': object()},
+        )
+    await engine.dispose()
+
+    assert result == 'handled'
+    load.assert_awaited_once()
+    assert observed == [2]
@@ -0,0 +1,43 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_webhook_updates_shard_by_user_and_always_ack(bot_env):
+    """Updates of one user share a shard; failed handlers still ack."""
+    import json
+    from bot.misc import update_stream
+
+    message = {
+        'update_id': 1,
+        'message': {
+            'message_id': 5,
+            'date': 0,
+            'chat': {'id': 77, 'type': 'private'},
+            'from': {'id': 77, 'is_bot': False, 'first_name': 'U'},
+            'text': '/start',
+        },
+    }
+    callback = {'update_id': 2, 'callback_query': {'from': {'id': 77}}}
+    other = {'update_id': 3, 'message': {'from': {'id': 78}, 'chat': {'id': 78}}}
+    assert update_stream.shard_for(message, 8) == update_stream.shard_for(callback, 8)
+    assert update_stream.shard_for(other, 8) != update_stream.shard_for(message, 8)
+
+    js = SimpleNamespace(publish=AsyncMock())
+    shard = await update_stream.publish_update(js, callback)
+    subject, data = js.publish.await_args.args
+    assert subject.endswith(f'.{shard}')
+    assert js.publish.await_args.kwargs['headers'] == {'Nats-Msg-Id': '2'}
+
+    dp = SimpleNamespace(feed_update=AsyncMock(side_effect=RuntimeError('boom')))
+    consumer = update_stream.ShardedUpdateConsumer(
+        js, dp, bot=None, workflow_data={'js': js}, shards=8
+    )
+    msg = SimpleNamespace(data=json.dumps(message).encode(), ack=AsyncMock())
+    await consumer.handle(msg)
+
+    dp.feed_update.assert_awaited_once()
+    assert dp.feed_update.await_args.kwargs == {'js': js}
+    msg.ack.assert_awaited_once()